@@ -0,0 +1,87 @@
+"""Dipendenze FastAPI per l'identificazione del chiamante tramite token di sessione.
+
+Il token `Authorization: Bearer` viene verificato in memoria (`GestoreToken`), senza
+leggere l'utente dal database. Finché i client non usano tutti le sessioni, le route
+accettano anche richieste senza token; con SESSIONE_OBBLIGATORIA=1 le rifiutano.
+"""
+
+from typing import Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from services.token_sessione import TokenNonValido, get_gestore_token
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+def _non_autorizzato(dettaglio: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=dettaglio,
+                         headers={"WWW-Authenticate": "Bearer"})
+
+
+def sessione_corrente(
+        credenziali: Optional[HTTPAuthorizationCredentials] = Depends(_bearer)
+) -> Optional[dict]:
+    """
+    Scopo: Verifica l'access token della richiesta, se presente.
+
+    Parametri:
+    - credenziali (HTTPAuthorizationCredentials, optional): Header `Authorization: Bearer`.
+
+    Valore di ritorno:
+    - dict | None: Payload del token (`sub` è l'ID utente, `role` il ruolo); None se la
+      richiesta non ha token e la sessione non è obbligatoria.
+
+    Eccezioni:
+    - HTTPException(401): Se il token non è valido, scaduto o revocato, o se manca ed è obbligatorio.
+    """
+    gestore = get_gestore_token()
+    if credenziali is None:
+        if gestore.obbligatoria:
+            raise _non_autorizzato("Token di sessione mancante")
+        return None
+    try:
+        sessione = gestore.verifica(credenziali.credentials)
+    except TokenNonValido as e:
+        raise _non_autorizzato(str(e))
+    sessione["token"] = credenziali.credentials
+    return sessione
+
+
+def sessione_richiesta(sessione: Optional[dict] = Depends(sessione_corrente)) -> dict:
+    """
+    Scopo: Come `sessione_corrente`, ma il token è sempre obbligatorio (es. logout).
+
+    Parametri:
+    - sessione (dict, optional): Payload risolto da `sessione_corrente`.
+
+    Valore di ritorno:
+    - dict: Payload del token.
+
+    Eccezioni:
+    - HTTPException(401): Se il token manca o non è valido.
+    """
+    if sessione is None:
+        raise _non_autorizzato("Token di sessione mancante")
+    return sessione
+
+
+def chiamante_autorizzato(user_id: str, sessione: Optional[dict] = Depends(sessione_corrente)) -> Optional[dict]:
+    """
+    Scopo: Controlla che il chiamante agisca sul proprio `user_id` (path), senza accessi al DB.
+
+    Parametri:
+    - user_id (str): Identificativo dell'utente nel path della route.
+    - sessione (dict, optional): Payload risolto da `sessione_corrente`.
+
+    Valore di ritorno:
+    - dict | None: Payload del token, None per le richieste senza token (se ammesse).
+
+    Eccezioni:
+    - HTTPException(401): Se il token non è valido o manca ed è obbligatorio.
+    - HTTPException(403): Se il token appartiene a un altro utente (salvo ruolo admin).
+    """
+    if sessione is not None and sessione["sub"] != user_id and sessione.get("role") != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operazione non consentita per questo utente")
+    return sessione
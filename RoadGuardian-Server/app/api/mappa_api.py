@@ -1,14 +1,19 @@
 from fastapi import APIRouter, Depends, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from services.mappa_service import MappaService # Assumendo che esista
 from schemas.mappa_schema import SegnalazioneMapDTO, UserPositionUpdate
 from db.connection import get_database # Assumendo che esista
+from services.servizi_condivisi import get_servizio
+from db.segnalazione_repository import BATCH_SIZE_DEFAULT
+from api.streaming import MEDIA_TYPE_NDJSON, risposta_ndjson
+from api.autenticazione import sessione_corrente
 
 router = APIRouter(prefix="/mappa", tags=["Gestione Mappa"])
 
 def get_mappa_service(db=Depends(get_database)):
     """
-    Scopo: Fornisce un'istanza di `MappaService` tramite Dependency Injection.
+    Scopo: Fornisce l'istanza condivisa di `MappaService` tramite Dependency Injection.
 
     Parametri:
     - db: Connessione/handle al database risolta da FastAPI.
@@ -20,11 +25,12 @@ def get_mappa_service(db=Depends(get_database)):
     - Exception: Errori di inizializzazione del service.
     """
     # La MappaService deve gestire la logica di business e l'interazione con il ControllerDBFacade (vedi ODD)
-    return MappaService(db)
+    # Istanza di processo: creata alla prima richiesta e riutilizzata dalle successive
+    return get_servizio(MappaService, db)
 
 # --- Endpoint 1: Visualizzazione Mappa e Segnalazioni Attive (RF_03, RF_13) ---
 @router.get("/segnalazioni/attive", response_model=List[SegnalazioneMapDTO])
-def get_active_incidents(
+async def get_active_incidents(
     service: MappaService = Depends(get_mappa_service)
 ):
     """
@@ -39,11 +45,11 @@ def get_active_incidents(
     Eccezioni:
     - HTTPException: Errori di business tradotti in HTTP se sollevati dal service.
     """
-    return service.get_active_incidents()
+    return await service.get_active_incidents_async()
 
 # --- Endpoint 2: Filtraggio per Tipo (RF_18) ---
 @router.get("/segnalazioni/filtrate", response_model=List[SegnalazioneMapDTO])
-def get_filtered_incidents(
+async def get_filtered_incidents(
     tipi_incidente: Optional[List[str]] = Query(None, description="Lista dei tipi di incidente su cui filtrare"),
     service: MappaService = Depends(get_mappa_service)
 ):
@@ -60,13 +66,39 @@ def get_filtered_incidents(
     Eccezioni:
     - HTTPException: Eventuali errori di validazione o business dal service.
     """
-    return service.get_filtered_incidents(tipi_incidente)
+    return await service.get_filtered_incidents_async(tipi_incidente)
+
+# --- Endpoint 2b: Segnalazioni in streaming (NDJSON) ---
+@router.get("/segnalazioni/stream", response_class=StreamingResponse,
+            responses={200: {"content": {MEDIA_TYPE_NDJSON: {}}}})
+async def stream_incidents(
+    tipi_incidente: Optional[List[str]] = Query(None, description="Lista dei tipi di incidente su cui filtrare"),
+    batch_size: int = Query(BATCH_SIZE_DEFAULT, ge=1, le=10000, description="Documenti letti dal database per batch"),
+    service: MappaService = Depends(get_mappa_service)
+):
+    """
+    Scopo: Come `/segnalazioni/filtrate` (senza tipi: tutte le attive), ma invia le segnalazioni in
+    NDJSON man mano che vengono lette, senza caricarle tutte in memoria.
+
+    Parametri:
+    - tipi_incidente (Optional[List[str]]): Categorie da includere nel risultato.
+    - batch_size (int): Documenti letti dal database per batch.
+    - service (MappaService): Service applicativo.
+
+    Valore di ritorno:
+    - StreamingResponse: Una `SegnalazioneMapDTO` JSON per riga.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return risposta_ndjson(service.stream_incidents_async(tipi_incidente, batch_size=batch_size))
 
 # --- Endpoint 3: Aggiornamento Posizione Utente (RF_XX) ---
 @router.post("/posizione", status_code=200)
 def update_user_position(
     payload: UserPositionUpdate,
     background_tasks: BackgroundTasks,
+    sessione: Optional[dict] = Depends(sessione_corrente),
     service: MappaService = Depends(get_mappa_service)
 ):
     """
@@ -75,6 +107,8 @@ def update_user_position(
     Parametri:
     - payload (UserPositionUpdate): Posizione e token FCM dell'utente.
     - background_tasks (BackgroundTasks): Coda di esecuzione non bloccante.
+    - sessione (dict, optional): Token di sessione: il dispositivo viene collegato solo
+      all'utente autenticato, mai a un ID indicato dal client.
     - service (MappaService): Service applicativo.
 
     Valore di ritorno:
@@ -84,10 +118,29 @@ def update_user_position(
     - HTTPException: Errori di validazione o esecuzione.
     """
     # Eseguiamo la logica di controllo prossimità in background per non bloccare la risposta
-    background_tasks.add_task(service.process_user_position, payload)
+    background_tasks.add_task(service.process_user_position, payload, sessione["sub"] if sessione else None)
     return {"message": "Posizione aggiornata"}
 
-"""--- Endpoint 4: Classificazione per Numero di Segnalazioni (RF_14) ---
+# --- Endpoint 4: Metriche della pipeline di notifica ---
+@router.get("/notifiche/metriche")
+def get_notification_metrics(
+    service: MappaService = Depends(get_mappa_service)
+):
+    """
+    Scopo: Espone profondità della coda e latenze di invio del dispatcher notifiche.
+
+    Parametri:
+    - service (MappaService): Service applicativo.
+
+    Valore di ritorno:
+    - dict: Snapshot delle metriche del dispatcher.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return service.notification_dispatcher.metrics()
+
+"""--- Endpoint 5: Classificazione per Numero di Segnalazioni (RF_14) ---
 @router.get("/classifica", response_model=List[SegnalazioneMapDTO])
 def get_incident_ranking(
     user_location: PosizioneGPS = Depends(),
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Query
+from monitoring.mongo_monitor import get_monitor_comandi
+
+router = APIRouter(
+    prefix="/metriche",
+    tags=["Metriche"]
+)
+
+
+@router.get("/mongo")
+def get_mongo_metrics():
+    """
+    Scopo: Espone latenza e documenti restituiti dei comandi MongoDB, per comando e funzione del repository.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - dict: Metriche del monitor dei comandi (vuoto se il monitoraggio è disattivato).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    monitor = get_monitor_comandi()
+    return monitor.metrics() if monitor is not None else {}
+
+
+@router.get("/mongo/query-lente")
+def get_mongo_slow_queries(limite: int = Query(50, ge=1, le=1000)):
+    """
+    Scopo: Route di debug con le ultime query lente (forma del filtro, senza valori).
+
+    Parametri:
+    - limite (int): Numero massimo di voci restituite.
+
+    Valore di ritorno:
+    - list[dict]: Query lente dalla più recente (vuota se il monitoraggio è disattivato).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    monitor = get_monitor_comandi()
+    return monitor.query_lente(limite) if monitor is not None else []
@@ -1,15 +1,20 @@
-from fastapi import APIRouter, Depends, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from services.profilo_utente_service import ProfiloUtenteService
-from models.user_model import UserModelDTO
-from schemas.user_schema import UserUpdateInput, UserCreateInput
+from typing import Optional
+from models.user_model import UserModelDTO, UserSessionDTO
+from schemas.user_schema import UserUpdateInput, UserCreateInput, RefreshTokenInput
 from db.connection import get_database
+from services.servizi_condivisi import get_servizio
+from services.hash_password import get_hasher_password
+from services.token_sessione import get_gestore_token
+from api.autenticazione import chiamante_autorizzato, sessione_richiesta
 
 router = APIRouter(prefix="/profilo", tags=["Profilo Utente"])
 
 
 def get_profilo_service(db=Depends(get_database)):
     """
-    Scopo: Fornisce un'istanza di `ProfiloUtenteService` tramite Dependency Injection.
+    Scopo: Fornisce l'istanza condivisa di `ProfiloUtenteService` tramite Dependency Injection.
 
     Parametri:
     - db: Handle/connessione al database fornita da FastAPI.
@@ -20,11 +25,12 @@ def get_profilo_service(db=Depends(get_database)):
     Eccezioni:
     - Exception: Errori di inizializzazione del service.
     """
-    return ProfiloUtenteService(db)
+    # Istanza di processo: creata alla prima richiesta e riutilizzata dalle successive
+    return get_servizio(ProfiloUtenteService, db)
 
 
 @router.post("/", response_model=UserModelDTO, status_code=status.HTTP_201_CREATED)
-def create_new_user(
+async def create_new_user(
         input_payload: UserCreateInput,
         service: ProfiloUtenteService = Depends(get_profilo_service)
 ):
@@ -41,7 +47,7 @@ def create_new_user(
     Eccezioni:
     - HTTPException: 400/422 per errori di validazione o email duplicata.
     """
-    return service.create_user_profile(input_payload)
+    return await service.create_user_profile_async(input_payload)
 
 
 """@router.get("/sync", response_model=List[UserOutputDTO])
@@ -61,8 +67,87 @@ def sync_user_data(
     return service.get_user_updates_since(last_sync)
 """
 
-@router.put("/{user_id}", response_model=UserModelDTO)
-def update_existing_user(
+@router.get("/password/metrics")
+async def password_hash_metrics():
+    """
+    Scopo: Espone le metriche del pool di hashing delle password (coda, rifiuti, latenze).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - dict: Snapshot delle metriche di `HasherPassword`.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return get_hasher_password().metrics()
+
+
+@router.get("/token/metrics")
+async def token_metrics():
+    """
+    Scopo: Espone i contatori dei token di sessione (emessi, verificati, rifiutati, revocati).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - dict: Snapshot delle metriche di `GestoreToken`.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return get_gestore_token().metrics()
+
+
+@router.post("/token/refresh")
+async def refresh_token(
+        input_payload: RefreshTokenInput,
+        service: ProfiloUtenteService = Depends(get_profilo_service)
+):
+    """
+    Scopo: Rinnova la sessione senza reinviare le credenziali.
+
+    Parametri:
+    - input_payload (RefreshTokenInput): Refresh token corrente (viene revocato).
+    - service (ProfiloUtenteService): Service applicativo.
+
+    Valore di ritorno:
+    - dict: Nuovi `access_token` e `refresh_token`, `token_type` ed `expires_in`.
+
+    Eccezioni:
+    - HTTPException: 401 se il refresh token non è valido, scaduto o già usato, o se il profilo
+      è stato eliminato.
+    """
+    return await service.refresh_session_async(input_payload.refresh_token)
+
+
+@router.post("/logout", response_model=str)
+async def logout(
+        input_payload: Optional[RefreshTokenInput] = None,
+        sessione: dict = Depends(sessione_richiesta),
+        service: ProfiloUtenteService = Depends(get_profilo_service)
+):
+    """
+    Scopo: Chiude la sessione revocando l'access token e, se inviato, il refresh token.
+
+    Parametri:
+    - input_payload (RefreshTokenInput, optional): Refresh token della sessione.
+    - sessione (dict): Access token verificato (header `Authorization: Bearer`).
+    - service (ProfiloUtenteService): Service applicativo.
+
+    Valore di ritorno:
+    - str: Messaggio di conferma.
+
+    Eccezioni:
+    - HTTPException: 401 se un token manca o non è valido.
+    """
+    return await service.logout_session_async(sessione["token"], input_payload.refresh_token if input_payload else None)
+
+
+@router.put("/{user_id}", response_model=UserModelDTO, dependencies=[Depends(chiamante_autorizzato)])
+async def update_existing_user(
         user_id: str,
         input_payload: UserUpdateInput, 
         service: ProfiloUtenteService = Depends(get_profilo_service)
@@ -81,44 +166,58 @@ def update_existing_user(
     Eccezioni:
     - HTTPException: 404 se l'utente non esiste.
     """
-    return service.update_user_profile(user_id, input_payload)
+    return await service.update_user_profile_async(user_id, input_payload)
 
-@router.post("/login", response_model=UserModelDTO)
-def login(
+@router.post("/login", response_model=UserSessionDTO)
+async def login(
         input_payload: UserUpdateInput,
         service: ProfiloUtenteService = Depends(get_profilo_service)
 ):
     """
-    Scopo: Autentica l'utente e restituisce i dati di profilo.
+    Scopo: Autentica l'utente e restituisce i dati di profilo con i token della sessione.
 
     Parametri:
     - input_payload (UserUpdateInput): Credenziali (email, password).
     - service (ProfiloUtenteService): Service applicativo.
 
     Valore di ritorno:
-    - UserModelDTO: Dati dell'utente autenticato.
+    - UserSessionDTO: Dati dell'utente autenticato, access token e refresh token.
 
     Eccezioni:
-    - HTTPException: 401 per credenziali errate.
+    - HTTPException: 401 per credenziali errate, 503 se il pool di hashing è saturo.
     """
-    return service.login_user(input_payload)
+    return await service.login_session_async(input_payload)
 
 @router.post("/delete/{user_id}", response_model=str)
-def delete_account(
-        input_payload: UserUpdateInput,
+async def delete_account(
+        user_id: str,
+        input_payload: Optional[UserUpdateInput] = None,
+        sessione: Optional[dict] = Depends(chiamante_autorizzato),
         service: ProfiloUtenteService = Depends(get_profilo_service)
 ):
     """
     Scopo: Disattiva/elimina l'account utente indicato.
 
+    Con un token di sessione l'account è quello del path, già verificato da
+    `chiamante_autorizzato` (il proprio, o qualsiasi per un admin): email e password non
+    servono. Senza token (client non ancora migrati) restano obbligatorie nel body.
+
     Parametri:
-    - input_payload (UserUpdateInput): Dati necessari all'operazione.
+    - user_id (str): ID dell'utente da eliminare.
+    - input_payload (UserUpdateInput, optional): Email e password, solo per le richieste senza token.
+    - sessione (dict, optional): Payload del token di sessione.
     - service (ProfiloUtenteService): Service applicativo.
 
     Valore di ritorno:
     - str: Messaggio di conferma.
 
     Eccezioni:
-    - HTTPException: 404 se utente inesistente.
+    - HTTPException: 404 se utente inesistente, 401 se password errata, 422 se mancano
+      sia il token sia le credenziali.
     """
-    return service.delete_user_profile(input_payload)
\ No newline at end of file
+    if sessione is not None:
+        return await service.delete_user_by_id_async(user_id)
+    if input_payload is None:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Token di sessione o credenziali mancanti")
+    return await service.delete_user_profile_async(input_payload)
\ No newline at end of file
@@ -1,7 +1,18 @@
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Query, status
+from fastapi.responses import StreamingResponse
+from typing import List, Literal, Optional
+from datetime import date
 from schemas.segnalazione_schema import SegnalazioneInput, SegnalazioneOutputDTO
 from db.connection import get_database
+from services.servizi_condivisi import get_servizio
 from services.segnalazione_service import SegnalazioneService
+from services.buffer_segnalazioni import buffer_attivo
+from services.archiviatore_segnalazioni import get_archiviatore
+from services.riconciliatore_statistiche import get_riconciliatore
+from db.cache_segnalazioni import get_cache_segnalazioni
+from db.segnalazione_repository import BATCH_SIZE_DEFAULT
+from api.streaming import MEDIA_TYPE_NDJSON, risposta_ndjson
+from api.autenticazione import chiamante_autorizzato
 
 router = APIRouter(
     prefix="/segnalazione",
@@ -11,7 +22,7 @@ router = APIRouter(
 
 def get_segnalazione_service(db=Depends(get_database)):
     """
-    Scopo: Fornisce un'istanza di `SegnalazioneService` tramite Dependency Injection.
+    Scopo: Fornisce l'istanza condivisa di `SegnalazioneService` tramite Dependency Injection.
 
     Parametri:
     - db: Handle della connessione al database risolta da FastAPI.
@@ -22,16 +33,18 @@ def get_segnalazione_service(db=Depends(get_database)):
     Eccezioni:
     - Exception: Errori di inizializzazione del service.
     """
-    return SegnalazioneService(db)
+    # Istanza di processo: creata alla prima richiesta e riutilizzata dalle successive
+    return get_servizio(SegnalazioneService, db)
 
 
 @router.post(
     "/creasegnalazione/{user_id}",
     response_model=SegnalazioneOutputDTO,
     status_code=status.HTTP_201_CREATED,
-    summary="Segnalazione Manuale (RF_02)"
+    summary="Segnalazione Manuale (RF_02)",
+    dependencies=[Depends(chiamante_autorizzato)]
 )
-def create_report(
+async def create_report(
     user_id: str,
     input_payload: SegnalazioneInput,
     service:SegnalazioneService=Depends(get_segnalazione_service)
@@ -51,13 +64,14 @@ def create_report(
     - HTTPException: Errori di validazione o autorizzazione tradotti in HTTP.
     """
     # Il service si occuperà di controllare la presenza di GPS, data/ora e eventualmente inserirle se non presenti
-    return service.create_report(user_id, input_payload)
+    return await service.create_report_async(user_id, input_payload)
 
 
 #  Visualizzazione Dettagli Incidente (RF_06) ---
 @router.get("/dettagli/{incident_id}", response_model=SegnalazioneOutputDTO)
-def get_incident_details(
+async def get_incident_details(
     incident_id: str,
+    storico: bool = Query(False, description="Include segnalazioni disattivate o archiviate"),
     service:SegnalazioneService=Depends(get_segnalazione_service)
 ):
     """
@@ -65,6 +79,7 @@ def get_incident_details(
 
     Parametri:
     - incident_id (str): Identificativo della segnalazione (path).
+    - storico (bool): Se True cerca anche tra le segnalazioni disattivate e archiviate (query).
     - service (SegnalazioneService): Service applicativo.
 
     Valore di ritorno:
@@ -73,11 +88,86 @@ def get_incident_details(
     Eccezioni:
     - HTTPException: 404 se la segnalazione non esiste/attiva.
     """
-    return service.get_segnalazione_details(incident_id)
+    return await service.get_segnalazione_details_async(incident_id, include_storico=storico)
+
+
+@router.get("/utente/{user_id}", response_model=List[SegnalazioneOutputDTO],
+            dependencies=[Depends(chiamante_autorizzato)])
+async def get_user_reports(
+    user_id: str,
+    storico: bool = Query(False, description="Include segnalazioni disattivate o archiviate"),
+    service:SegnalazioneService=Depends(get_segnalazione_service)
+):
+    """
+    Scopo: Elenca le segnalazioni di un utente, con lo storico se richiesto.
+
+    Parametri:
+    - user_id (str): Identificativo utente (path).
+    - storico (bool): Se True interroga anche `segnalazioni_archive` (query).
+    - service (SegnalazioneService): Service applicativo.
+
+    Valore di ritorno:
+    - List[SegnalazioneOutputDTO]: Segnalazioni dell'utente.
+
+    Eccezioni:
+    - HTTPException: Errori del service tradotti in HTTP.
+    """
+    return await service.get_segnalazioni_utente_async(user_id, include_storico=storico)
+
+@router.get("/utente/{user_id}/stream", response_class=StreamingResponse,
+            responses={200: {"content": {MEDIA_TYPE_NDJSON: {}}}}, dependencies=[Depends(chiamante_autorizzato)])
+async def stream_user_reports(
+    user_id: str,
+    storico: bool = Query(False, description="Include segnalazioni disattivate o archiviate"),
+    batch_size: int = Query(BATCH_SIZE_DEFAULT, ge=1, le=10000, description="Documenti letti dal database per batch"),
+    service:SegnalazioneService=Depends(get_segnalazione_service)
+):
+    """
+    Scopo: Come `GET /segnalazione/utente/{user_id}`, ma invia le segnalazioni in NDJSON (una per riga)
+    man mano che vengono lette, per gli utenti con uno storico molto lungo.
+
+    Parametri:
+    - user_id (str): Identificativo utente (path).
+    - storico (bool): Se True interroga anche `segnalazioni_archive` (query).
+    - batch_size (int): Documenti letti dal database per batch (query).
+    - service (SegnalazioneService): Service applicativo.
+
+    Valore di ritorno:
+    - StreamingResponse: Una `SegnalazioneOutputDTO` JSON per riga.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return risposta_ndjson(service.stream_segnalazioni_utente_async(user_id, include_storico=storico,
+                                                                    batch_size=batch_size))
+
+@router.get("/vicina", response_model=Optional[SegnalazioneOutputDTO])
+async def get_nearby_incident(
+    longitudine: float = Query(..., ge=-180.0, le=180.0),
+    latitudine: float = Query(..., ge=-90.0, le=90.0),
+    tolleranza: float = Query(30.0, gt=0, le=1000, description="Tolleranza in metri"),
+    service:SegnalazioneService=Depends(get_segnalazione_service)
+):
+    """
+    Scopo: Indica se nel punto indicato esiste già una segnalazione attiva (prima di crearne una nuova).
+
+    Parametri:
+    - longitudine (float): Longitudine della posizione (query).
+    - latitudine (float): Latitudine della posizione (query).
+    - tolleranza (float): Distanza massima in metri (query).
+    - service (SegnalazioneService): Service applicativo.
+
+    Valore di ritorno:
+    - SegnalazioneOutputDTO | None: Segnalazione attiva più vicina entro la tolleranza, null se assente.
+
+    Eccezioni:
+    - HTTPException: 422 se le coordinate non sono valide.
+    """
+    return await service.get_segnalazione_attiva_vicina_async(longitudine, latitudine, tolleranza)
 
 #  Visualizzazione Linee Guida (RF_05, RF_16) ---
 @router.get("/lineeguida/{incident_id}", response_model=str) # Assumendo che le linee guida siano una stringa per semplicità
-def get_incident_guidelines(
+async def get_incident_guidelines(
     incident_id: str,
     service:SegnalazioneService=Depends(get_segnalazione_service)
  ):
@@ -94,11 +184,11 @@ def get_incident_guidelines(
     Eccezioni:
     - HTTPException: 404 se segnalazione inesistente o non attiva.
     """
-    return service.get_guidelines_for_incident(incident_id)
+    return await service.get_guidelines_for_incident_async(incident_id)
 
 
 @router.delete("/{incident_id}",status_code=status.HTTP_204_NO_CONTENT)
-def delete_report(
+async def delete_report(
     incident_id: str,
     service:SegnalazioneService=Depends(get_segnalazione_service)
 ):
@@ -115,17 +205,18 @@ def delete_report(
     Eccezioni:
     - HTTPException: 404 se incidente inesistente.
     """
-    service.delete_segnalazione(incident_id)
+    await service.delete_segnalazione_async(incident_id)
 
 
 @router.post(
     "/createsegnalazioneveloce/{user_id}",
     response_model=SegnalazioneOutputDTO,
     status_code=status.HTTP_201_CREATED,
-    summary="Segnalazione Veloce (RF_10)"
+    summary="Segnalazione Veloce (RF_10)",
+    dependencies=[Depends(chiamante_autorizzato)]
 )
 
-def create_fast_report(
+async def create_fast_report(
     user_id: str,
     input_payload: SegnalazioneInput,
     service:SegnalazioneService=Depends(get_segnalazione_service)
@@ -144,5 +235,104 @@ def create_fast_report(
     Eccezioni:
     - HTTPException: Errori di validazione o autorizzazione tradotti in HTTP.
     """
-    # Il service si occuperà di controllare la presenza di GPS, data/ora e eventualmente inserirle se non presenti
-    return service.create_fast_report(user_id, input_payload)
+    # La segnalazione viene resa durevole nel log locale e scritta su MongoDB in background
+    return await service.create_fast_report_async(user_id, input_payload)
+
+
+@router.get("/statistiche")
+async def get_statistics(
+    dimensione: Optional[Literal["all", "category", "seriousness", "day", "region"]] = Query(
+        None, description="Dimensione da restituire (tutte se assente)"),
+    dal: Optional[date] = Query(None, description="Primo giorno incluso (dimensione day)"),
+    al: Optional[date] = Query(None, description="Ultimo giorno incluso (dimensione day)"),
+    service:SegnalazioneService=Depends(get_segnalazione_service)
+):
+    """
+    Scopo: Restituisce i contatori delle segnalazioni (totali e attive) per categoria, gravità,
+    giorno e regione, letti dalle statistiche materializzate.
+
+    Parametri:
+    - dimensione (str, optional): Dimensione da restituire (query).
+    - dal (date, optional): Primo giorno incluso (query).
+    - al (date, optional): Ultimo giorno incluso (query).
+    - service (SegnalazioneService): Service applicativo.
+
+    Valore di ritorno:
+    - dict: Dimensione -> lista di {"value", "total", "active"}.
+
+    Eccezioni:
+    - HTTPException: 422 se la dimensione o le date non sono valide.
+    """
+    return await service.get_statistiche_async(dimensione, dal, al)
+
+
+@router.get("/statistiche/metrics")
+def get_statistics_metrics():
+    """
+    Scopo: Espone i contatori della riconciliazione periodica delle statistiche.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - dict: Metriche del riconciliatore (vuoto se la riconciliazione è disattivata).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    riconciliatore = get_riconciliatore()
+    return riconciliatore.metrics() if riconciliatore is not None else {}
+
+
+@router.get("/buffer/metrics")
+def get_buffer_metrics():
+    """
+    Scopo: Espone contatori e latenze del buffer write-behind delle segnalazioni veloci.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - dict: Metriche del buffer (vuoto se nessuna segnalazione veloce è stata ancora accodata).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    buffer = buffer_attivo()
+    return buffer.metrics() if buffer is not None else {}
+
+
+@router.get("/archivio/metrics")
+def get_archive_metrics():
+    """
+    Scopo: Espone i contatori dell'archiviazione delle segnalazioni.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - dict: Metriche dell'archiviatore (vuoto se l'archiviazione è disattivata).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    archiviatore = get_archiviatore()
+    return archiviatore.metrics() if archiviatore is not None else {}
+
+
+@router.get("/cache/metrics")
+def get_cache_metrics():
+    """
+    Scopo: Espone dimensione e hit rate della cache delle segnalazioni lette per ID.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - dict: Metriche della cache (vuoto se la cache è disattivata).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    cache = get_cache_segnalazioni()
+    return cache.metrics() if cache is not None else {}
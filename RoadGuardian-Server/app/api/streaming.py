@@ -0,0 +1,34 @@
+"""Risposte HTTP in streaming per le letture a lista di grandi dimensioni."""
+
+from typing import AsyncIterator
+
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+MEDIA_TYPE_NDJSON = "application/x-ndjson"
+
+
+async def _righe_ndjson(dtos: AsyncIterator[BaseModel]) -> AsyncIterator[bytes]:
+    """Serializza ogni DTO su una riga JSON (con gli alias, come le risposte con `response_model`)."""
+    async for dto in dtos:
+        yield dto.model_dump_json(by_alias=True).encode() + b"\n"
+
+
+def risposta_ndjson(dtos: AsyncIterator[BaseModel]) -> StreamingResponse:
+    """
+    Scopo: Costruisce una risposta NDJSON (un oggetto JSON per riga) da un flusso asincrono di DTO.
+
+    Ogni DTO viene serializzato e inviato appena prodotto: la lettura dal database, la
+    conversione e l'invio al client si sovrappongono e la memoria occupata non dipende dal
+    numero di risultati.
+
+    Parametri:
+    - dtos (AsyncIterator[BaseModel]): DTO da inviare, nell'ordine.
+
+    Valore di ritorno:
+    - StreamingResponse: Risposta con media type `application/x-ndjson`.
+
+    Eccezioni:
+    - Nessuna eccezione prevista (un errore durante l'iterazione interrompe la risposta già iniziata).
+    """
+    return StreamingResponse(_righe_ndjson(dtos), media_type=MEDIA_TYPE_NDJSON)
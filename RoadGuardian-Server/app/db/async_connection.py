@@ -0,0 +1,122 @@
+"""Connessione asincrona a MongoDB.
+
+Contiene il client `AsyncMongoClient` di pymongo (stesso server e database di
+`connection.py`) usato dai repository asincroni e dalle route `async def`: le query
+non occupano un thread del threadpool di Starlette per tutta la loro durata.
+"""
+
+import asyncio
+import threading
+
+from pymongo import AsyncMongoClient
+from pymongo.errors import PyMongoError
+
+from db.connection import MONGO_URI, DB_NAME, CollezioneLazy, opzioni_client, _env_int
+from monitoring.mongo_monitor import listener_client
+from db.storage import BACKEND_MEMORIA, backend_storage, get_database_memoria_async
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_async_client() -> AsyncMongoClient:
+    """
+    Scopo: Restituire il client MongoDB asincrono condiviso dal processo, creandolo al primo uso.
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - AsyncMongoClient: Client asincrono con le stesse opzioni di pool del client sincrono
+      (la connessione viene aperta alla prima operazione).
+
+    Eccezioni:
+    - pymongo.errors.ConfigurationError: se la stringa di connessione non è valida.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = AsyncMongoClient(MONGO_URI, event_listeners=listener_client(), **opzioni_client())
+    return _client
+
+
+def get_async_database():
+    """
+    Scopo: Restituire il database MongoDB accessibile tramite il client asincrono.
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - AsyncDatabase: Database `DB_NAME` del client asincrono, oppure la vista asincrona
+      del database in memoria con STORAGE_BACKEND=memory.
+
+    Eccezioni:
+    - pymongo.errors.ConfigurationError: se la stringa di connessione non è valida.
+    """
+    if backend_storage() == BACKEND_MEMORIA:
+        return get_database_memoria_async(DB_NAME)
+    return get_async_client()[DB_NAME]
+
+
+def collezione_async(nome: str) -> CollezioneLazy:
+    """
+    Scopo: Restituire un riferimento lazy alla collection indicata sul client asincrono.
+
+    Parametri:
+    - nome (str): Nome della collection.
+
+    Valore di ritorno:
+    - CollezioneLazy: Oggetto che inoltra ogni chiamata alla `AsyncCollection` reale
+      (con il write concern configurato per la collection).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return CollezioneLazy(nome, database=get_async_database)
+
+
+async def riscalda_pool_async(connessioni: int | None = None) -> None:
+    """
+    Scopo: Apre in anticipo le connessioni del client asincrono con ping concorrenti.
+
+    Un server non raggiungibile non blocca l'avvio: l'errore viene loggato.
+
+    Parametri:
+    - connessioni (int, optional): Ping concorrenti; default come `connection.riscalda_pool`.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    if connessioni is None:
+        connessioni = _env_int("MONGO_WARMUP_CONNECTIONS", opzioni_client().get("minPoolSize", 0))
+    if backend_storage() == BACKEND_MEMORIA:
+        return
+    admin = get_async_client().admin
+    try:
+        await admin.command("ping")
+        if connessioni > 1:
+            await asyncio.gather(*(admin.command("ping") for _ in range(connessioni)))
+    except PyMongoError as e:
+        print(f"MongoDB: riscaldamento del pool asincrono fallito: {e}")
+
+
+async def close_async_client() -> None:
+    """
+    Scopo: Chiudere il client asincrono, se è stato creato (shutdown applicazione).
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        await client.close()
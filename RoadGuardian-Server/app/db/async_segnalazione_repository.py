@@ -0,0 +1,480 @@
+"""Versione asincrona di `segnalazione_repository`: stesse funzioni e stessi risultati, eseguite con `await`."""
+
+from .async_connection import collezione_async
+from .segnalazione_repository import (BATCH_SIZE_DEFAULT, TOLLERANZA_POSIZIONE_METRI, _filtro_data,
+                                      _filtro_data_e_ora, _filtro_fascia_oraria, _filtro_orario, _filtro_vicinanza,
+                                      _solo_attive)
+from .async_statistiche_repository import registra_disattivata, registra_inserite
+from db.cache_segnalazioni import get_cache_segnalazioni, invalida_segnalazioni
+from pymongo import ReturnDocument
+from models.incident_model import IncidentModel
+from bson import ObjectId
+import datetime
+from typing import AsyncIterator
+
+# Otteniamo la collezione specifica (risolta al primo accesso, non all'import)
+segnalazione_collection = collezione_async("segnalazioni")  # "segnalazioni" è il nome della collection che vedrai su Compass
+archive_collection = collezione_async("segnalazioni_archive")  # segnalazioni disattivate o più vecchie della retention
+
+async def _con_storico(filtro: dict) -> list[dict]:
+    """Esegue il filtro sulla collection attiva e sull'archivio, scartando le copie di un lotto in corso di archiviazione."""
+    risultati = await segnalazione_collection.find(filtro).to_list()
+    visti = {documento["_id"] for documento in risultati}
+    archiviate = await archive_collection.find(filtro).to_list()
+    risultati.extend(documento for documento in archiviate if documento["_id"] not in visti)
+    return risultati
+
+async def _cerca(filtro: dict, include_storico: bool = False) -> list[dict]:
+    """Letture a lista: solo le segnalazioni attive oppure, con lo storico, anche disattivate e archiviate."""
+    if include_storico:
+        return await _con_storico(filtro)
+    return await segnalazione_collection.find(_solo_attive(filtro)).to_list()
+
+async def create_segnalazione(segnalazione: IncidentModel) -> dict:
+    """
+    Scopo: Inserisce una segnalazione nella collection `segnalazioni` del DB.
+
+    Parametri:
+    - segnalazione (IncidentModel): Istanza del modello segnalazione.
+
+    Valore di ritorno:
+    - dict: Dizionario della segnalazione salvata con campo `id` valorizzato.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se l'inserimento fallisce.
+    """
+    segnalazione_dict = segnalazione.to_mongo() #chiama il metodo interno alla classe del model
+    result = await segnalazione_collection.insert_one(segnalazione_dict)
+    await registra_inserite([segnalazione_dict])
+    
+    # Recuperiamo l'ID generato e lo assegniamo all'oggetto
+    segnalazione_dict["id"] = str(result.inserted_id)
+    return segnalazione_dict
+
+async def get_segnalazione_by_id(segnalazione_id: str, include_storico: bool = False) -> dict | None:
+    """
+    Scopo: Cercare e restituire una segnalazione per ID Mongo (passando dalla cache LRU
+    condivisa, vedi `cache_segnalazioni`).
+
+    Parametri:
+    - segnalazione_id (str): ID della segnalazione in formato stringa.
+    - include_storico (bool): Se True cerca anche nell'archivio (`segnalazioni_archive`).
+
+    Valore di ritorno:
+    - dict | None: Documento segnalazione se trovato, altrimenti None.
+
+    Eccezioni:
+    - bson.errors.InvalidId: se `segnalazione_id` non è un ObjectId valido.
+    - pymongo.errors.PyMongoError: errori nella query.
+    """
+    try:
+        oid = ObjectId(segnalazione_id)
+        cache = get_cache_segnalazioni()
+        if cache is not None:
+            segnalazione = cache.leggi(str(oid), include_storico)
+            if segnalazione is not None:
+                return segnalazione
+            generazione = cache.generazione()
+        segnalazione = await segnalazione_collection.find_one({"_id": oid})
+        if segnalazione is None and include_storico:
+            segnalazione = await archive_collection.find_one({"_id": oid})
+        if segnalazione is not None and cache is not None:
+            cache.scrivi(str(oid), segnalazione, generazione, include_storico)
+        return segnalazione
+    except:
+        return None
+    
+async def get_segnalazione_by_position(incident_longitude: float, incident_latitude: float,
+                                       tolleranza_metri: float = TOLLERANZA_POSIZIONE_METRI) -> dict | None:
+    """
+    Scopo: Recuperare la segnalazione attiva più vicina alla posizione indicata, entro una tolleranza in metri.
+
+    Parametri:
+    - incident_longitude (float): Longitudine della segnalazione.
+    - incident_latitude (float): Latitudine della segnalazione.
+    - tolleranza_metri (float): Distanza massima dal punto indicato.
+
+    Valore di ritorno:
+    - dict | None: Documento segnalazione se trovato, altrimenti None.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+
+    return await segnalazione_collection.find_one(_filtro_vicinanza(incident_longitude, incident_latitude,
+                                                                    tolleranza_metri))
+
+async def get_segnalazione_list_by_position(incident_longitude: float, incident_latitude: float,
+                                            tolleranza_metri: float = TOLLERANZA_POSIZIONE_METRI) -> list[dict]:
+    """
+    Scopo: Recuperare tutte le segnalazioni attive entro una tolleranza in metri da una posizione.
+
+    Parametri:
+    - incident_longitude (float): Longitudine della posizione.
+    - incident_latitude (float): Latitudine della posizione.
+    - tolleranza_metri (float): Distanza massima dal punto indicato.
+
+    Valore di ritorno:
+    - list[dict]: Lista di documenti segnalazione corrispondenti, dalla più vicina.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+
+    return await segnalazione_collection.find(_filtro_vicinanza(incident_longitude, incident_latitude,
+                                                                tolleranza_metri)).to_list()
+
+async def get_segnalazione_by_category(category: str, include_storico: bool = False) -> list[dict]:
+    """
+    Scopo: Ottenere segnalazioni attive appartenenti a una categoria.
+
+    Parametri:
+    - category (str): Nome della categoria di segnalazione.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
+
+    Valore di ritorno:
+    - list[dict]: Lista di documenti segnalazione della categoria.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return await _cerca({"category": category}, include_storico)
+
+async def get_segnalazione_by_user(user_id: str, include_storico: bool = False) -> list[dict]:
+    """
+    Scopo: Recuperare tutte le segnalazioni attive create da un utente.
+
+    Parametri:
+    - user_id (str): ID dell'utente che ha creato le segnalazioni.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
+
+    Valore di ritorno:
+    - list[dict]: Lista di documenti segnalazione dell'utente.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return await _cerca({"user_id": user_id}, include_storico)
+
+async def get_segnalazione_by_status(status: bool, include_storico: bool = False) -> list[dict]:
+    """
+    Scopo: Ottenere segnalazioni filtrate per stato (attivo/inattivo).
+
+    Parametri:
+    - status (bool): Stato della segnalazione (True = attiva, False = inattiva).
+    - include_storico (bool): Se True cerca anche nell'archivio (dove finiscono le segnalazioni disattivate).
+
+    Valore di ritorno:
+    - list[dict]: Lista di documenti segnalazione con lo stato richiesto.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return await _cerca({"status": status}, include_storico)
+
+async def get_segnalazione_by_date(target_date: datetime.date, include_storico: bool = False) -> list[dict]:
+    """
+    Scopo: Cercare segnalazioni per data (intervallo 00:00 - 23:59 dello stesso giorno).
+
+    Parametri:
+    - target_date (datetime.date): Data da cercare.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
+
+    Valore di ritorno:
+    - list[dict]: Lista di documenti segnalazione trovati nella fascia di data.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return await _cerca(_filtro_data(target_date), include_storico)
+
+async def get_segnalazione_by_time(target_time: datetime.time) -> list[dict]:
+    """
+    Scopo: Cercare segnalazioni per orario (confronto ora:minuti).
+
+    Parametri:
+    - target_time (datetime.time): Orario da cercare.
+
+    Valore di ritorno:
+    - list[dict]: Lista di documenti segnalazione corrispondenti all'orario.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return await _cerca(_filtro_orario(target_time))
+
+async def get_segnalazione_by_fascia_oraria(inizio: datetime.time, fine: datetime.time,
+                                            giorni_settimana: list[int] | None = None) -> list[dict]:
+    """
+    Scopo: Cercare segnalazioni attive avvenute in una fascia oraria (es. ore di punta), con una scansione di intervallo sull'indice.
+
+    Parametri:
+    - inizio (datetime.time): Inizio della fascia (incluso, al minuto).
+    - fine (datetime.time): Fine della fascia (inclusa, al minuto); se precede `inizio` la fascia attraversa la mezzanotte.
+    - giorni_settimana (list[int], optional): Giorni da includere (1 = lunedì ... 7 = domenica).
+
+    Valore di ritorno:
+    - list[dict]: Lista di documenti segnalazione nella fascia.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return await segnalazione_collection.find(_filtro_fascia_oraria(inizio, fine, giorni_settimana)).to_list()
+
+async def get_segnalazione_by_date_and_time(target_date: datetime.date, target_time: datetime.time) -> list[dict]:
+    """
+    Scopo: Cercare segnalazioni corrispondenti a data e orario esatti.
+
+    Parametri:
+    - target_date (datetime.date): Data da cercare.
+    - target_time (datetime.time): Orario da cercare.
+
+    Valore di ritorno:
+    - list[dict]: Lista di documenti segnalazione che coincidono esattamente.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return await _cerca(_filtro_data_e_ora(target_date, target_time))
+
+async def get_segnalazione_by_seriousness(seriousness: str) -> list[dict]:
+    """
+    Scopo: Cercare segnalazioni per livello di gravità.
+
+    Parametri:
+    - seriousness (str): Livello di gravità (es. 'low', 'medium', 'high').
+
+    Valore di ritorno:
+    - list[dict]: Lista di documenti segnalazione che matchano il livello.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return await _cerca({"seriousness": seriousness})
+
+# --- Letture in streaming ---
+# Varianti generatore asincrone delle letture a lista (vedi `segnalazione_repository`):
+# si consumano con `async for`.
+
+async def _itera(collection, filtro: dict, batch_size: int) -> AsyncIterator[dict]:
+    """Restituisce i documenti del filtro uno alla volta, chiudendo il cursore anche se il chiamante si interrompe."""
+    cursore = collection.find(filtro).batch_size(batch_size)
+    try:
+        async for documento in cursore:
+            yield documento
+    finally:
+        await cursore.close()
+
+async def _itera_con_storico(filtro: dict, batch_size: int) -> AsyncIterator[dict]:
+    """Come `_con_storico`, in streaming: in memoria restano solo gli `_id` già restituiti."""
+    visti = set()
+    async for documento in _itera(segnalazione_collection, filtro, batch_size):
+        visti.add(documento["_id"])
+        yield documento
+    async for documento in _itera(archive_collection, filtro, batch_size):
+        if documento["_id"] not in visti:
+            yield documento
+
+def _scorri(filtro: dict, include_storico: bool, batch_size: int) -> AsyncIterator[dict]:
+    """Come `_cerca`, in streaming."""
+    if include_storico:
+        return _itera_con_storico(filtro, batch_size)
+    return _itera(segnalazione_collection, _solo_attive(filtro), batch_size)
+
+def iter_segnalazione_list_by_position(incident_longitude: float, incident_latitude: float,
+                                       tolleranza_metri: float = TOLLERANZA_POSIZIONE_METRI,
+                                       batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[dict]:
+    """
+    Scopo: Versione in streaming (async for) di `get_segnalazione_list_by_position`.
+
+    Parametri:
+    - incident_longitude (float): Longitudine della posizione.
+    - incident_latitude (float): Latitudine della posizione.
+    - tolleranza_metri (float): Distanza massima dal punto indicato.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - AsyncIterator[dict]: Segnalazioni attive entro la tolleranza, dalla più vicina.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _itera(segnalazione_collection, _filtro_vicinanza(incident_longitude, incident_latitude, tolleranza_metri),
+                  batch_size)
+
+def iter_segnalazione_by_category(category: str, include_storico: bool = False,
+                                  batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[dict]:
+    """
+    Scopo: Versione in streaming (async for) di `get_segnalazione_by_category`.
+
+    Parametri:
+    - category (str): Categoria da cercare.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - AsyncIterator[dict]: Segnalazioni della categoria.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri({"category": category}, include_storico, batch_size)
+
+def iter_segnalazione_by_user(user_id: str, include_storico: bool = False,
+                              batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[dict]:
+    """
+    Scopo: Versione in streaming (async for) di `get_segnalazione_by_user`.
+
+    Parametri:
+    - user_id (str): ID dell'utente.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - AsyncIterator[dict]: Segnalazioni dell'utente.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri({"user_id": user_id}, include_storico, batch_size)
+
+def iter_segnalazione_by_status(status: bool, include_storico: bool = False,
+                                batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[dict]:
+    """
+    Scopo: Versione in streaming (async for) di `get_segnalazione_by_status`.
+
+    Parametri:
+    - status (bool): Stato da cercare (True = attive).
+    - include_storico (bool): Se True cerca anche nell'archivio.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - AsyncIterator[dict]: Segnalazioni con lo stato indicato.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri({"status": status}, include_storico, batch_size)
+
+def iter_segnalazione_by_date(target_date: datetime.date, include_storico: bool = False,
+                              batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[dict]:
+    """
+    Scopo: Versione in streaming (async for) di `get_segnalazione_by_date`.
+
+    Parametri:
+    - target_date (datetime.date): Data da cercare.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - AsyncIterator[dict]: Segnalazioni del giorno indicato.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri(_filtro_data(target_date), include_storico, batch_size)
+
+def iter_segnalazione_by_time(target_time: datetime.time, batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[dict]:
+    """
+    Scopo: Versione in streaming (async for) di `get_segnalazione_by_time`.
+
+    Parametri:
+    - target_time (datetime.time): Orario da cercare (ora e minuti).
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - AsyncIterator[dict]: Segnalazioni attive all'orario indicato.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri(_filtro_orario(target_time), False, batch_size)
+
+def iter_segnalazione_by_fascia_oraria(inizio: datetime.time, fine: datetime.time,
+                                       giorni_settimana: list[int] | None = None,
+                                       batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[dict]:
+    """
+    Scopo: Versione in streaming (async for) di `get_segnalazione_by_fascia_oraria`.
+
+    Parametri:
+    - inizio (datetime.time): Inizio della fascia (incluso).
+    - fine (datetime.time): Fine della fascia (inclusa); se precede `inizio` la fascia attraversa la mezzanotte.
+    - giorni_settimana (list[int], optional): Giorni ISO (1 = lunedì) a cui limitare la ricerca.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - AsyncIterator[dict]: Segnalazioni attive nella fascia oraria.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _itera(segnalazione_collection, _filtro_fascia_oraria(inizio, fine, giorni_settimana), batch_size)
+
+def iter_segnalazione_by_date_and_time(target_date: datetime.date, target_time: datetime.time,
+                                       batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[dict]:
+    """
+    Scopo: Versione in streaming (async for) di `get_segnalazione_by_date_and_time`.
+
+    Parametri:
+    - target_date (datetime.date): Data da cercare.
+    - target_time (datetime.time): Orario da cercare.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - AsyncIterator[dict]: Segnalazioni attive con data e orario esatti.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri(_filtro_data_e_ora(target_date, target_time), False, batch_size)
+
+def iter_segnalazione_by_seriousness(seriousness: str, batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[dict]:
+    """
+    Scopo: Versione in streaming (async for) di `get_segnalazione_by_seriousness`.
+
+    Parametri:
+    - seriousness (str): Livello di gravità (es. 'low', 'medium', 'high').
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - AsyncIterator[dict]: Segnalazioni attive con la gravità indicata.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri({"seriousness": seriousness}, False, batch_size)
+
+async def delete_segnalazione(segnalazione_id: str) -> bool:
+    """
+    Scopo: Effettuare la cancellazione logica di una segnalazione impostando `status` a False.
+
+    Parametri:
+    - segnalazione_id (str): ID della segnalazione in formato stringa.
+
+    Valore di ritorno:
+    - bool: True se l'operazione ha modificato il documento, False altrimenti.
+
+    Eccezioni:
+    - bson.errors.InvalidId: se `segnalazione_id` non è un ObjectId valido.
+    - pymongo.errors.PyMongoError: per errori nell'aggiornamento.
+    """
+
+    try:
+        oid = ObjectId(segnalazione_id)
+        # Il documento precedente serve a decrementare le statistiche solo se era attivo
+        prima = await segnalazione_collection.find_one_and_update(
+            {"_id": oid},
+            {"$set": {"status": False}}, #Per "eliminare" la segnalazione cambia lo status di essa in false, come avviene con la cancellazione del profilo utente
+            return_document=ReturnDocument.BEFORE)
+        if prima is None:
+            # Segnalazione attiva ma già archiviata perché più vecchia della retention
+            prima = await archive_collection.find_one_and_update(
+                {"_id": oid, "status": True}, {"$set": {"status": False}}, return_document=ReturnDocument.BEFORE)
+        invalida_segnalazioni(str(oid))
+        disattivata = prima is not None and prima.get("status", True) is not False
+        if disattivata:
+            await registra_disattivata(prima)
+        return disattivata
+    except Exception as e:
+        print(f"Errore delete_segnalazione: {e}")
+        return False
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""Versione asincrona di `sessione_repository`: stesse funzioni e stessi risultati, eseguite con `await`."""
+
+from .async_connection import collezione_async
+from .sessione_repository import documento_revoca
+from pymongo.errors import DuplicateKeyError
+
+# Otteniamo la collezione specifica (risolta al primo accesso, non all'import)
+sessioni_collection = collezione_async("sessioni_revocate")
+
+
+async def revoca_refresh(jti: str, user_id: str, scadenza: float) -> bool:
+    """
+    Scopo: Revoca un refresh token fino alla sua scadenza.
+
+    Parametri:
+    - jti (str): Identificativo univoco del token.
+    - user_id (str): Titolare del token.
+    - scadenza (float): Scadenza del token (epoch).
+
+    Valore di ritorno:
+    - bool: True se la revoca è nuova, False se il token era già revocato o usato.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la scrittura fallisce.
+    """
+    try:
+        await sessioni_collection.insert_one(documento_revoca(jti, user_id, scadenza))
+    except DuplicateKeyError:
+        return False
+    return True
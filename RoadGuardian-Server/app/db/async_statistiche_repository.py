@@ -0,0 +1,74 @@
+"""Versione asincrona di `statistiche_repository` per le scritture e le letture eseguite con `await`."""
+
+from .async_connection import collezione_async
+from .statistiche_repository import (filtro_statistiche, operazioni_incremento, variazioni_disattivata,
+                                     variazioni_inserite)
+from collections import Counter
+import datetime
+
+# Otteniamo la collezione specifica (risolta al primo accesso, non all'import)
+stats_collection = collezione_async("segnalazioni_stats")
+
+
+async def _applica(variazioni: Counter) -> None:
+    """Scrive le variazioni; un errore non fa fallire la scrittura della segnalazione (la corregge `riconcilia`)."""
+    operazioni = operazioni_incremento(variazioni)
+    if not operazioni:
+        return
+    try:
+        await stats_collection.bulk_write(operazioni, ordered=False)
+    except Exception as e:
+        print(f"Errore aggiornamento statistiche segnalazioni: {e}")
+
+
+async def registra_inserite(segnalazioni: list[dict]) -> None:
+    """
+    Scopo: Aggiorna le statistiche dopo l'inserimento di segnalazioni.
+
+    Parametri:
+    - segnalazioni (list[dict]): Documenti effettivamente inseriti.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista (gli errori vengono registrati nel log).
+    """
+    await _applica(variazioni_inserite(segnalazioni))
+
+
+async def registra_disattivata(segnalazione: dict) -> None:
+    """
+    Scopo: Aggiorna le statistiche dopo la disattivazione di una segnalazione attiva.
+
+    Parametri:
+    - segnalazione (dict): Documento com'era prima della disattivazione.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista (gli errori vengono registrati nel log).
+    """
+    await _applica(variazioni_disattivata(segnalazione))
+
+
+async def get_statistiche(dimensione: str | None = None, dal: datetime.date | None = None,
+                          al: datetime.date | None = None) -> list[dict]:
+    """
+    Scopo: Legge i contatori materializzati.
+
+    Parametri:
+    - dimensione (str, optional): Una delle `DIMENSIONI`; None per tutte.
+    - dal (datetime.date, optional): Primo giorno incluso (dimensione "day").
+    - al (datetime.date, optional): Ultimo giorno incluso (dimensione "day").
+
+    Valore di ritorno:
+    - list[dict]: Documenti con `dimension`, `value`, `total` e `active`.
+
+    Eccezioni:
+    - ValueError: Se la dimensione non è valida.
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return await stats_collection.find(filtro_statistiche(dimensione, dal, al),
+                                       {"_id": 0, "dimension": 1, "value": 1, "total": 1, "active": 1}).to_list()
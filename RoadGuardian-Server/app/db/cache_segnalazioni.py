@@ -0,0 +1,258 @@
+"""Cache LRU con scadenza delle segnalazioni lette per ID.
+
+Aprire una segnalazione nell'app chiama sia i dettagli sia le linee guida, e le
+segnalazioni più viste vengono aperte da molti utenti: `get_segnalazione_by_id` (sync e
+async) passa da questa cache, condivisa dai due repository. Le scritture del repository
+che modificano o spostano una segnalazione la invalidano esplicitamente; la scadenza
+(TTL) limita comunque la durata di un documento modificato da altri processi.
+"""
+
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from monitoring.metriche import Contatore
+
+_cache: Optional["CacheSegnalazioni"] = None
+_cache_lock = threading.Lock()
+
+
+class CacheSegnalazioni:
+    """
+    Mappa LRU limitata a `max_voci` con scadenza di `ttl` secondi per voce.
+
+    I documenti vengono copiati in scrittura e in lettura, così i chiamanti possono
+    modificarli. Per evitare che una lettura concorrente a un'invalidazione reinserisca
+    il documento vecchio, `scrivi` riceve la generazione letta prima della query e viene
+    ignorata se nel frattempo c'è stata un'invalidazione.
+    """
+
+    def __init__(self, max_voci: int = 10000, ttl: float = 30.0, orologio: Callable[[], float] = time.monotonic):
+        """
+        Scopo: Configura la cache.
+
+        Parametri:
+        - max_voci (int): Numero massimo di documenti conservati.
+        - ttl (float): Secondi di validità di un documento.
+        - orologio (Callable): Sorgente del tempo (monotona).
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self.max_voci = max_voci
+        self.ttl = ttl
+        self._orologio = orologio
+        self._lock = threading.Lock()
+        self._voci: "OrderedDict[Hashable, tuple]" = OrderedDict()  # chiave -> (scadenza, documento)
+        self._per_id: dict = {}  # id segnalazione -> chiavi in cache
+        self._generazione = 0
+
+        self.hit = Contatore()
+        self.miss = Contatore()
+        self.scadute = Contatore()
+        self.espulse = Contatore()
+        self.invalidazioni = Contatore()
+
+    def generazione(self) -> int:
+        """Contatore delle invalidazioni, da leggere prima della query e passare a `scrivi`."""
+        return self._generazione
+
+    def _rimuovi(self, chiave: Hashable) -> None:
+        """Toglie una voce e il suo riferimento nell'indice per ID (lock già acquisito)."""
+        self._voci.pop(chiave, None)
+        chiavi = self._per_id.get(chiave[0])
+        if chiavi is not None:
+            chiavi.discard(chiave)
+            if not chiavi:
+                del self._per_id[chiave[0]]
+
+    def leggi(self, segnalazione_id: str, variante: Hashable = None) -> Optional[dict]:
+        """
+        Scopo: Restituisce una copia del documento in cache.
+
+        Parametri:
+        - segnalazione_id (str): ID della segnalazione.
+        - variante (Hashable): Distingue letture diverse dello stesso ID (es. con o senza storico).
+
+        Valore di ritorno:
+        - dict | None: Copia del documento, None se assente o scaduto.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        chiave = (segnalazione_id, variante)
+        with self._lock:
+            voce = self._voci.get(chiave)
+            if voce is not None and voce[0] <= self._orologio():
+                self._rimuovi(chiave)
+                self.scadute.incrementa()
+                voce = None
+            if voce is None:
+                self.miss.incrementa()
+                return None
+            self._voci.move_to_end(chiave)
+            self.hit.incrementa()
+            documento = voce[1]
+        return copy.deepcopy(documento)
+
+    def scrivi(self, segnalazione_id: str, documento: dict, generazione: int, variante: Hashable = None) -> bool:
+        """
+        Scopo: Inserisce una copia del documento, espellendo le voci usate meno di recente.
+
+        Parametri:
+        - segnalazione_id (str): ID della segnalazione.
+        - documento (dict): Documento letto dal database.
+        - generazione (int): Valore di `generazione()` letto prima della query.
+        - variante (Hashable): Come in `leggi`.
+
+        Valore di ritorno:
+        - bool: False se il documento non è stato inserito perché nel frattempo c'è stata un'invalidazione.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        copia = copy.deepcopy(documento)
+        chiave = (segnalazione_id, variante)
+        with self._lock:
+            if generazione != self._generazione:
+                return False
+            self._voci[chiave] = (self._orologio() + self.ttl, copia)
+            self._voci.move_to_end(chiave)
+            self._per_id.setdefault(segnalazione_id, set()).add(chiave)
+            while len(self._voci) > self.max_voci:
+                self._rimuovi(next(iter(self._voci)))
+                self.espulse.incrementa()
+        return True
+
+    def invalida(self, *segnalazione_ids: str) -> None:
+        """
+        Scopo: Rimuove tutte le varianti delle segnalazioni indicate.
+
+        Parametri:
+        - segnalazione_ids (str): ID delle segnalazioni modificate.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            self._generazione += 1
+            for segnalazione_id in segnalazione_ids:
+                for chiave in list(self._per_id.get(str(segnalazione_id), ())):
+                    self._rimuovi(chiave)
+        self.invalidazioni.incrementa(len(segnalazione_ids))
+
+    def svuota(self) -> None:
+        """
+        Scopo: Rimuove tutte le voci (es. dopo un aggiornamento in blocco).
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            self._generazione += 1
+            self._voci.clear()
+            self._per_id.clear()
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone dimensione e contatori della cache.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Voci, hit, miss, hit rate, voci scadute ed espulse, invalidazioni.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        hit, miss = self.hit.valore, self.miss.valore
+        return {
+            "size": len(self._voci),
+            "max_size": self.max_voci,
+            "ttl_seconds": self.ttl,
+            "hits": hit,
+            "misses": miss,
+            "hit_rate": round(hit / (hit + miss), 4) if hit + miss else 0.0,
+            "expired": self.scadute.valore,
+            "evicted": self.espulse.valore,
+            "invalidations": self.invalidazioni.valore,
+        }
+
+
+def get_cache_segnalazioni() -> Optional[CacheSegnalazioni]:
+    """
+    Scopo: Restituisce la cache delle segnalazioni del processo, creandola al primo uso.
+
+    Configurazione: SEGNALAZIONI_CACHE_MAX (voci, 0 per disattivarla) e
+    SEGNALAZIONI_CACHE_TTL (secondi).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - CacheSegnalazioni | None: Istanza singleton, None se la cache è disattivata.
+
+    Eccezioni:
+    - ValueError: Se la configurazione d'ambiente non è valida.
+    """
+    global _cache
+    if _cache is None:
+        max_voci = int(os.environ.get("SEGNALAZIONI_CACHE_MAX", "10000"))
+        if max_voci <= 0:
+            return None
+        with _cache_lock:
+            if _cache is None:
+                _cache = CacheSegnalazioni(max_voci=max_voci,
+                                           ttl=float(os.environ.get("SEGNALAZIONI_CACHE_TTL", "30")))
+    return _cache
+
+
+def invalida_segnalazioni(*segnalazione_ids: str) -> None:
+    """
+    Scopo: Invalida le segnalazioni indicate nella cache condivisa, se è stata creata.
+
+    Parametri:
+    - segnalazione_ids (str): ID delle segnalazioni modificate.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    if _cache is not None and segnalazione_ids:
+        _cache.invalida(*segnalazione_ids)
+
+
+def shutdown_cache_segnalazioni() -> None:
+    """
+    Scopo: Rilascia la cache condivisa (alla chiusura del database, perché non sopravviva ai suoi dati).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -1,38 +1,348 @@
 """Connessione a MongoDB e utilità di accesso al database.
 
-Contiene la creazione del client MongoDB e la funzione `get_database`.
+Contiene la configurazione del client MongoDB (letta dalle variabili d'ambiente MONGO_*),
+la sua creazione/chiusura nel ciclo di vita dell'applicazione e la funzione `get_database`.
+Il client non viene più creato all'import: i repository ottengono le collection tramite
+`collezione()`, che le risolve al primo accesso sul backend scelto da STORAGE_BACKEND
+(MongoDB o motore in memoria, vedi `storage.py`).
 """
 
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-MONGO_URI = "mongodb://localhost:27017/"
-DB_NAME = "RoadGuardian_db"  # Nome del database
+from pymongo import MongoClient, WriteConcern, monitoring
+from pymongo.errors import ConnectionFailure, PyMongoError
+
+from monitoring.mongo_monitor import listener_client
+from db.cache_segnalazioni import shutdown_cache_segnalazioni
+from db.storage import BACKEND_MEMORIA, backend_storage, get_database_memoria, chiudi_database_memoria
+
+MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017/")
+DB_NAME = os.environ.get("MONGO_DB_NAME", "RoadGuardian_db")  # Nome del database
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _env_int(nome: str, default):
+    valore = os.environ.get(nome)
+    return int(valore) if valore not in (None, "") else default
+
+
+def opzioni_client() -> dict:
+    """
+    Scopo: Costruisce le opzioni del pool di connessioni dalle variabili d'ambiente.
+
+    Variabili lette (tutte facoltative): MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE,
+    MONGO_MAX_IDLE_TIME_MS, MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS, MONGO_WAIT_QUEUE_TIMEOUT_MS e MONGO_COMPRESSORS
+    (lista separata da virgole, es. "zstd,snappy,zlib").
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - dict: Argomenti per `MongoClient`/`AsyncMongoClient`.
+
+    Eccezioni:
+    - ValueError: se un valore numerico non è valido.
+    """
+    opzioni = {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", None),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 10000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", None),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 30000),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", None),
+    }
+    compressori = os.environ.get("MONGO_COMPRESSORS", "").strip()
+    if compressori:
+        opzioni["compressors"] = compressori
+    return {chiave: valore for chiave, valore in opzioni.items() if valore is not None}
+
+
+def write_concern_per(nome_collection: str) -> WriteConcern | None:
+    """
+    Scopo: Legge il write concern configurato per una collection.
+
+    La variabile è MONGO_WRITE_CONCERN_<NOME> (nome in maiuscolo, es.
+    MONGO_WRITE_CONCERN_NOTIFICHE_OUTBOX) con valore "<w>" oppure "<w>,j"
+    per richiedere anche il journaling (es. "majority,j", "1", "0").
+
+    Parametri:
+    - nome_collection (str): Nome della collection.
+
+    Valore di ritorno:
+    - WriteConcern | None: Write concern da applicare, None per quello del client.
+
+    Eccezioni:
+    - pymongo.errors.ConfigurationError: se il valore non è un write concern valido.
+    """
+    valore = os.environ.get(f"MONGO_WRITE_CONCERN_{nome_collection.upper()}", "").strip()
+    if not valore:
+        return None
+    w, _, journal = valore.partition(",")
+    w = int(w) if w.isdigit() else w
+    return WriteConcern(w=w, j=True if journal.strip() == "j" else None)
+
+
+class StatistichePool(monitoring.ConnectionPoolListener):
+    """Contatori del pool di connessioni del client sincrono, esposti da `statistiche_pool`."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.create = 0
+        self.chiuse = 0
+        self.in_uso = 0
+        self.checkout = 0
+        self.checkout_falliti = 0
+        self.pool_svuotati = 0
+
+    def _incrementa(self, campo: str, delta: int = 1) -> None:
+        with self._lock:
+            setattr(self, campo, getattr(self, campo) + delta)
+
+    # Eventi non conteggiati
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._incrementa("pool_svuotati")
+
+    def connection_created(self, event):
+        self._incrementa("create")
+
+    def connection_closed(self, event):
+        self._incrementa("chiuse")
+
+    def connection_check_out_failed(self, event):
+        self._incrementa("checkout_falliti")
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checkout += 1
+            self.in_uso += 1
+
+    def connection_checked_in(self, event):
+        self._incrementa("in_uso", -1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "connections_created": self.create,
+                "connections_closed": self.chiuse,
+                "connections_open": self.create - self.chiuse,
+                "connections_in_use": self.in_uso,
+                "checkouts": self.checkout,
+                "checkout_failures": self.checkout_falliti,
+                "pool_clears": self.pool_svuotati,
+            }
+
+
+statistiche = StatistichePool()
+
+
+def get_client() -> MongoClient:
+    """
+    Scopo: Restituire il client MongoDB del processo, creandolo al primo uso con le opzioni d'ambiente.
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - MongoClient: Client condiviso (le connessioni vengono aperte alla prima operazione o da `riscalda_pool`).
+
+    Eccezioni:
+    - pymongo.errors.ConfigurationError: se URI o opzioni non sono validi.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(MONGO_URI, event_listeners=[statistiche, *listener_client()], **opzioni_client())
+    return _client
 
-client = MongoClient(MONGO_URI)
-db = client[DB_NAME]
 
 def get_database():
     """
-    Scopo: Restituire l'istanza del database MongoDB già connessa.
+    Scopo: Restituire l'istanza del database del backend di storage configurato.
 
     Parametri: Nessuno.
 
     Valore di ritorno:
-    - Database: Oggetto database ottenuto da `pymongo.MongoClient` (es. `db`).
+    - Database: Oggetto database del client condiviso (`get_client()[DB_NAME]`), oppure il
+      `DatabaseMemoria` del processo con STORAGE_BACKEND=memory.
 
     Eccezioni:
     - Connessione fallita: possibili eccezioni derivanti da `MongoClient` se la
       stringa di connessione è errata o il server non è raggiungibile (es. `ServerSelectionTimeoutError`).
     """
-    return db
+    if backend_storage() == BACKEND_MEMORIA:
+        return get_database_memoria(DB_NAME)
+    return get_client()[DB_NAME]
+
+
+class CollezioneLazy:
+    """
+    Riferimento a una collection risolto al primo accesso.
+
+    I repository lo assegnano a livello di modulo al posto della collection: l'import non
+    crea il client, e dopo `chiudi_client()` la collection viene risolta sul nuovo client.
+    Il write concern configurato per la collection viene applicato alla risoluzione.
+    """
+
+    def __init__(self, nome: str, database=get_database):
+        self.nome = nome
+        self._database = database
+        self._collection = None
+        self._client = None
+
+    def risolvi(self):
+        database = self._database()
+        if self._collection is None or self._client is not database.client:
+            collection = database[self.nome]
+            write_concern = write_concern_per(self.nome)
+            if write_concern is not None:
+                collection = collection.with_options(write_concern=write_concern)
+            self._collection, self._client = collection, database.client
+        return self._collection
+
+    def __getattr__(self, attributo):
+        return getattr(self.risolvi(), attributo)
+
+    def __repr__(self) -> str:
+        return f"CollezioneLazy({self.nome!r})"
+
+
+def collezione(nome: str) -> CollezioneLazy:
+    """
+    Scopo: Restituire un riferimento lazy alla collection indicata del database applicativo.
+
+    Parametri:
+    - nome (str): Nome della collection.
+
+    Valore di ritorno:
+    - CollezioneLazy: Oggetto che inoltra ogni chiamata alla collection reale.
+
+    Eccezioni:
+    - Nessuna eccezione prevista (gli errori di connessione emergono alla prima operazione).
+    """
+    return CollezioneLazy(nome)
+
+
+def riscalda_pool(connessioni: int | None = None) -> int:
+    """
+    Scopo: Apre in anticipo le connessioni del pool prima di accettare traffico.
+
+    Esegue un `ping` (selezione del server e handshake) e poi `connessioni` ping concorrenti,
+    così che il pool contenga già quel numero di socket autenticati.
+
+    Parametri:
+    - connessioni (int, optional): Connessioni da aprire; default MONGO_WARMUP_CONNECTIONS
+      o, in sua assenza, MONGO_MIN_POOL_SIZE.
+
+    Valore di ritorno:
+    - int: Connessioni aperte nel pool al termine del riscaldamento.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se il server non è raggiungibile.
+    """
+    if connessioni is None:
+        connessioni = _env_int("MONGO_WARMUP_CONNECTIONS", opzioni_client().get("minPoolSize", 0))
+    admin = get_client().admin
+    admin.command("ping")
+    if connessioni > 1:
+        with ThreadPoolExecutor(max_workers=connessioni, thread_name_prefix="mongo-warmup") as pool:
+            list(pool.map(lambda _: admin.command("ping"), range(connessioni)))
+    return statistiche.snapshot()["connections_open"]
+
+
+def avvia_client() -> bool:
+    """
+    Scopo: Crea il client all'avvio dell'applicazione e ne riscalda il pool
+    (con STORAGE_BACKEND=memory prepara solo il database in memoria).
+
+    Un server non raggiungibile non blocca l'avvio: l'errore viene loggato e le
+    connessioni verranno aperte alla prima richiesta.
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - bool: True se il database è raggiungibile.
+
+    Eccezioni:
+    - pymongo.errors.ConfigurationError: se URI o opzioni non sono validi.
+    """
+    if backend_storage() == BACKEND_MEMORIA:
+        get_database_memoria(DB_NAME)
+        print("Storage: motore in memoria attivo, nessuna connessione a MongoDB")
+        return True
+    get_client()
+    try:
+        aperte = riscalda_pool()
+        print(f"MongoDB: pool pronto con {aperte} connessioni")
+        return True
+    except PyMongoError as e:
+        print(f"MongoDB: riscaldamento del pool fallito: {e}")
+        return False
+
+
+def chiudi_client() -> None:
+    """
+    Scopo: Chiude il client e tutte le connessioni del pool (shutdown applicazione);
+    con il motore in memoria salva i dati se è configurato STORAGE_MEMORIA_FILE.
+    Rilascia anche la cache delle segnalazioni, che non deve sopravvivere al database.
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+    chiudi_database_memoria()
+    shutdown_cache_segnalazioni()
+
+
+def statistiche_pool() -> dict:
+    """
+    Scopo: Espone configurazione e contatori del pool di connessioni.
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - dict: Opzioni del pool e contatori di connessioni/checkout.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return {"options": opzioni_client(), **statistiche.snapshot()}
+
 
 if __name__ == "__main__":
     try:
         # Il comando ping è il modo più rapido per verificare la connessione
-        client.admin.command('ping')
+        get_client().admin.command('ping')
         print("Connessione a MongoDB riuscita con successo!")
     except ConnectionFailure:
         print("Errore: Il server MongoDB non è raggiungibile.")
     except Exception as e:
-        print(f"Errore generico: {e}")
\ No newline at end of file
+        print(f"Errore generico: {e}")
@@ -0,0 +1,181 @@
+from .connection import collezione
+from pymongo import ASCENDING, UpdateOne
+from typing import List, Tuple
+import datetime
+
+# Otteniamo la collezione specifica (risolta al primo accesso, non all'import)
+dispositivi_collection = collezione("dispositivi")  # registro dei token FCM, _id = token
+
+def ensure_indexes() -> None:
+    """
+    Scopo: Crea gli indici per la ricerca dei dispositivi per utente, per ultimo accesso e per
+    cella del topic.
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la creazione degli indici fallisce.
+    """
+    dispositivi_collection.create_index("user_id")
+    dispositivi_collection.create_index("last_seen")
+    dispositivi_collection.create_index([("topic_cell", ASCENDING), ("topic_since", ASCENDING)])
+
+def upsert_dispositivi(dispositivi: List[Tuple[str, str | None, datetime.datetime]]) -> int:
+    """
+    Scopo: Registra o aggiorna in blocco i dispositivi (token, utente, ultimo accesso).
+
+    Parametri:
+    - dispositivi (List[Tuple[str, str | None, datetime]]): Terne (token, user_id, last_seen).
+
+    Valore di ritorno:
+    - int: Numero di documenti inseriti o modificati.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la scrittura fallisce.
+    """
+    if not dispositivi:
+        return 0
+    operazioni = []
+    for token, user_id, last_seen in dispositivi:
+        campi = {"last_seen": last_seen}
+        if user_id:
+            campi["user_id"] = user_id # collega il dispositivo al documento in `utenti`
+        operazioni.append(UpdateOne(
+            {"_id": token},
+            {"$set": campi, "$setOnInsert": {"created_at": last_seen}},
+            upsert=True
+        ))
+    result = dispositivi_collection.bulk_write(operazioni, ordered=False)
+    return result.upserted_count + result.modified_count
+
+def delete_tokens(tokens: List[str]) -> int:
+    """
+    Scopo: Rimuove in blocco i token non più validi.
+
+    Parametri:
+    - tokens (List[str]): Token FCM da eliminare.
+
+    Valore di ritorno:
+    - int: Numero di dispositivi eliminati.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la cancellazione fallisce.
+    """
+    if not tokens:
+        return 0
+    result = dispositivi_collection.delete_many({"_id": {"$in": list(tokens)}})
+    return result.deleted_count
+
+def get_dispositivi_by_user(user_id: str) -> list[dict]:
+    """
+    Scopo: Recuperare i dispositivi registrati di un utente.
+
+    Parametri:
+    - user_id (str): ID dell'utente.
+
+    Valore di ritorno:
+    - list[dict]: Documenti dei dispositivi dell'utente.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return list(dispositivi_collection.find({"user_id": user_id}))
+
+def get_dispositivi_attivi(since: datetime.datetime) -> list[dict]:
+    """
+    Scopo: Recuperare i dispositivi visti dopo un certo istante.
+
+    Parametri:
+    - since (datetime.datetime): Istante minimo di ultimo accesso.
+
+    Valore di ritorno:
+    - list[dict]: Documenti dei dispositivi attivi.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return list(dispositivi_collection.find({"last_seen": {"$gte": since}}).sort("last_seen", ASCENDING))
+
+def get_topic_celle(tokens: List[str]) -> dict:
+    """
+    Scopo: Recuperare in blocco la cella geohash del topic a cui ogni dispositivo è iscritto.
+
+    Parametri:
+    - tokens (List[str]): Token FCM dei dispositivi.
+
+    Valore di ritorno:
+    - dict: Mappa token -> cella geohash (solo per i dispositivi già iscritti).
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    if not tokens:
+        return {}
+    cursor = dispositivi_collection.find(
+        {"_id": {"$in": list(tokens)}, "topic_cell": {"$ne": None}},
+        {"topic_cell": 1}
+    )
+    return {doc["_id"]: doc["topic_cell"] for doc in cursor}
+
+def set_topic_celle(celle: List[Tuple[str, str]]) -> int:
+    """
+    Scopo: Salvare in blocco la cella geohash del topic a cui ogni dispositivo è stato iscritto,
+    con l'istante dell'iscrizione (`topic_since`).
+
+    Parametri:
+    - celle (List[Tuple[str, str]]): Coppie (token, cella geohash).
+
+    Valore di ritorno:
+    - int: Numero di dispositivi aggiornati.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la scrittura fallisce.
+    """
+    if not celle:
+        return 0
+    adesso = datetime.datetime.now(datetime.timezone.utc)
+    operazioni = [UpdateOne({"_id": token}, {"$set": {"topic_cell": cella, "topic_since": adesso}})
+                  for token, cella in celle]
+    result = dispositivi_collection.bulk_write(operazioni, ordered=False)
+    return result.modified_count
+
+def segna_annunciata(cella: str, incident_id: str, inviata_il: datetime.datetime, max_annunci: int = 50) -> int:
+    """
+    Scopo: Registrare su ogni dispositivo iscritto a una cella la segnalazione ricevuta tramite il topic.
+
+    Parametri:
+    - cella (str): Cella geohash del topic a cui è stato inviato l'annuncio.
+    - incident_id (str): ID della segnalazione annunciata.
+    - inviata_il (datetime.datetime): Istante dell'invio: chi si è iscritto dopo non ha ricevuto il messaggio.
+    - max_annunci (int): Segnalazioni annunciate ricordate per dispositivo (le più recenti).
+
+    Valore di ritorno:
+    - int: Numero di dispositivi aggiornati.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la scrittura fallisce.
+    """
+    result = dispositivi_collection.update_many(
+        {"topic_cell": cella, "topic_since": {"$lte": inviata_il}},
+        {"$push": {"topic_annunci": {"$each": [incident_id], "$slice": -max_annunci}}}
+    )
+    return result.modified_count
+
+def get_topic_annunci(token: str) -> set:
+    """
+    Scopo: Recuperare le segnalazioni già ricevute da un dispositivo tramite il topic della sua cella.
+
+    Parametri:
+    - token (str): Token FCM del dispositivo.
+
+    Valore di ritorno:
+    - set: ID delle segnalazioni annunciate (vuoto se il dispositivo non è registrato).
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    doc = dispositivi_collection.find_one({"_id": token}, {"topic_annunci": 1})
+    return set(doc.get("topic_annunci") or []) if doc else set()
@@ -0,0 +1,1131 @@
+"""Motore di storage in memoria compatibile con il sottoinsieme dell'API pymongo usato dai repository.
+
+Le collection tengono i documenti in un dizionario `_id -> documento` e mantengono:
+- indici hash (singoli o composti) per i filtri di uguaglianza e `$in`;
+- indici spaziali geohash sui campi GeoJSON Point (`create_index([("location", "2dsphere")])`)
+  per `$geoWithin/$centerSphere` e `$near/$nearSphere`.
+
+Ogni lettura restituisce copie dei documenti, come farebbe il driver: i chiamanti possono
+modificarle senza alterare lo stato del database. È usato con STORAGE_BACKEND=memory
+(test, benchmark deterministici e modalità embedded senza server MongoDB).
+"""
+
+import copy
+import datetime
+import itertools
+import math
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import bson
+from bson import ObjectId
+from pymongo import ReturnDocument, InsertOne, UpdateOne, UpdateMany, DeleteOne, DeleteMany, ReplaceOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.results import (InsertOneResult, InsertManyResult, UpdateResult, DeleteResult,
+                             BulkWriteResult)
+
+from services.geohash_index import (geohash_encode, geohash_cover_circle, haversine_km,
+                                    RAGGIO_TERRA_KM)
+
+_MANCANTE = object()
+
+# Precisione delle celle dell'indice spaziale (≈ 1.2 x 0.6 km) e massimo di celle
+# oltre il quale una ricerca per raggio ripiega sulla scansione completa
+PRECISIONE_SPAZIALE = 6
+MAX_CELLE_RICERCA = 512
+
+
+# --- Valutazione di filtri ed espressioni ---
+
+def _valore(documento: Any, campo: str) -> Any:
+    """Legge un campo (anche con notazione puntata); `_MANCANTE` se assente."""
+    for parte in campo.split("."):
+        if isinstance(documento, dict) and parte in documento:
+            documento = documento[parte]
+        else:
+            return _MANCANTE
+    return documento
+
+
+def _uguali(a: Any, b: Any) -> bool:
+    # In MongoDB un campo assente è uguale a null e un booleano non è uguale a 0/1
+    a = None if a is _MANCANTE else a
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return a == b
+
+
+def _confronta(a: Any, b: Any, operatore: str) -> bool:
+    if a is _MANCANTE or a is None or b is None:
+        return False
+    try:
+        if operatore == "$gt":
+            return a > b
+        if operatore == "$gte":
+            return a >= b
+        if operatore == "$lt":
+            return a < b
+        return a <= b
+    except TypeError:
+        return False
+
+
+def _punto(valore: Any) -> Optional[Tuple[float, float]]:
+    """Restituisce (lat, lon) di un GeoJSON Point o di una coppia legacy [lon, lat]."""
+    if isinstance(valore, dict) and valore.get("type") == "Point":
+        valore = valore.get("coordinates")
+    if isinstance(valore, (list, tuple)) and len(valore) == 2:
+        return float(valore[1]), float(valore[0])
+    return None
+
+
+def _cerchio(condizione: dict) -> Optional[Tuple[float, float, Optional[float]]]:
+    """Estrae (lat, lon, raggio_km) da `$geoWithin/$centerSphere` o `$near/$nearSphere`."""
+    if "$geoWithin" in condizione:
+        centro, raggio_rad = condizione["$geoWithin"]["$centerSphere"]
+        lat, lon = _punto(centro)
+        return lat, lon, raggio_rad * RAGGIO_TERRA_KM
+    for operatore in ("$nearSphere", "$near"):
+        if operatore in condizione:
+            specifica = condizione[operatore]
+            lat, lon = _punto(specifica.get("$geometry", specifica))
+            massimo = specifica.get("$maxDistance", condizione.get("$maxDistance"))
+            return lat, lon, massimo / 1000 if massimo is not None else None
+    return None
+
+
+def _condizione(valore: Any, condizione: Any) -> bool:
+    """Valuta la condizione di un singolo campo."""
+    if not (isinstance(condizione, dict) and condizione and all(k.startswith("$") for k in condizione)):
+        if isinstance(valore, list) and not isinstance(condizione, list):
+            return any(_uguali(v, condizione) for v in valore)
+        return _uguali(valore, condizione)
+
+    for operatore, argomento in condizione.items():
+        if operatore == "$eq":
+            ok = _condizione(valore, argomento)
+        elif operatore == "$ne":
+            ok = not _condizione(valore, argomento)
+        elif operatore in ("$gt", "$gte", "$lt", "$lte"):
+            ok = _confronta(valore, argomento, operatore)
+        elif operatore == "$in":
+            ok = any(_condizione(valore, a) for a in argomento)
+        elif operatore == "$nin":
+            ok = not any(_condizione(valore, a) for a in argomento)
+        elif operatore == "$exists":
+            ok = (valore is not _MANCANTE) == bool(argomento)
+        elif operatore in ("$geoWithin", "$near", "$nearSphere"):
+            cerchio, punto = _cerchio(condizione), _punto(valore)
+            ok = punto is not None and (cerchio[2] is None or
+                                        haversine_km(cerchio[0], cerchio[1], *punto) <= cerchio[2])
+        elif operatore in ("$maxDistance", "$minDistance"):
+            ok = True  # valutati insieme a $near
+        else:
+            raise OperationFailure(f"Operatore non supportato dal motore in memoria: {operatore}")
+        if not ok:
+            return False
+    return True
+
+
+def corrisponde(documento: dict, filtro: Optional[dict]) -> bool:
+    """
+    Scopo: Verifica se un documento soddisfa un filtro in sintassi MongoDB.
+
+    Parametri:
+    - documento (dict): Documento da verificare.
+    - filtro (dict, optional): Filtro (uguaglianze, operatori di confronto, $and/$or/$nor, $expr).
+
+    Valore di ritorno:
+    - bool: True se il documento soddisfa il filtro.
+
+    Eccezioni:
+    - pymongo.errors.OperationFailure: Per operatori non supportati.
+    """
+    for chiave, condizione in (filtro or {}).items():
+        if chiave == "$and":
+            ok = all(corrisponde(documento, f) for f in condizione)
+        elif chiave == "$or":
+            ok = any(corrisponde(documento, f) for f in condizione)
+        elif chiave == "$nor":
+            ok = not any(corrisponde(documento, f) for f in condizione)
+        elif chiave == "$expr":
+            ok = bool(valuta(condizione, documento))
+        else:
+            ok = _condizione(_valore(documento, chiave), condizione)
+        if not ok:
+            return False
+    return True
+
+
+def valuta(espressione: Any, documento: dict) -> Any:
+    """
+    Scopo: Valuta un'espressione di aggregazione ($expr, $group, $project) su un documento.
+
+    Parametri:
+    - espressione (Any): Riferimento a campo ("$campo"), letterale o operatore.
+    - documento (dict): Documento corrente.
+
+    Valore di ritorno:
+    - Any: Valore dell'espressione.
+
+    Eccezioni:
+    - pymongo.errors.OperationFailure: Per operatori non supportati.
+    """
+    if isinstance(espressione, str) and espressione.startswith("$"):
+        valore = _valore(documento, espressione[1:])
+        return None if valore is _MANCANTE else valore
+    if isinstance(espressione, list):
+        return [valuta(e, documento) for e in espressione]
+    if not isinstance(espressione, dict):
+        return espressione
+    if not (len(espressione) == 1 and next(iter(espressione)).startswith("$")):
+        return {k: valuta(v, documento) for k, v in espressione.items()}
+
+    operatore, argomento = next(iter(espressione.items()))
+    if operatore == "$literal":
+        return argomento
+    argomenti = [valuta(a, documento) for a in (argomento if isinstance(argomento, list) else [argomento])]
+    if operatore == "$and":
+        return all(argomenti)
+    if operatore == "$or":
+        return any(argomenti)
+    if operatore == "$not":
+        return not argomenti[0]
+    if operatore == "$eq":
+        return _uguali(argomenti[0], argomenti[1])
+    if operatore == "$ne":
+        return not _uguali(argomenti[0], argomenti[1])
+    if operatore in ("$gt", "$gte", "$lt", "$lte"):
+        return _confronta(argomenti[0], argomenti[1], operatore)
+    if operatore == "$add":
+        return sum(argomenti)
+    if operatore == "$multiply":
+        return None if None in argomenti else math.prod(argomenti)
+    if operatore == "$divide":
+        return None if None in argomenti else argomenti[0] / argomenti[1]
+    if operatore == "$floor":
+        return None if argomenti[0] is None else math.floor(argomenti[0])
+    if operatore == "$dateToString":
+        # Solo gli specificatori comuni a strftime (%Y, %m, %d, %H, %M, %S), in UTC come le date salvate
+        data = argomenti[0].get("date")
+        return data.strftime(argomenti[0]["format"]) if isinstance(data, datetime.datetime) else None
+    if operatore in ("$hour", "$minute", "$dayOfWeek"):
+        data = argomenti[0]
+        if not isinstance(data, datetime.datetime):
+            return None
+        if operatore == "$hour":
+            return data.hour
+        if operatore == "$minute":
+            return data.minute
+        return data.isoweekday() % 7 + 1  # MongoDB: 1 = domenica ... 7 = sabato
+    if operatore == "$ifNull":
+        return next((a for a in argomenti if a is not None), None)
+    if operatore == "$cond":
+        if isinstance(argomento, dict):
+            argomenti = [valuta(argomento[k], documento) for k in ("if", "then", "else")]
+        return argomenti[1] if argomenti[0] else argomenti[2]
+    raise OperationFailure(f"Espressione non supportata dal motore in memoria: {operatore}")
+
+
+# --- Aggiornamenti e proiezioni ---
+
+def _imposta(documento: dict, campo: str, valore: Any) -> None:
+    parti = campo.split(".")
+    for parte in parti[:-1]:
+        documento = documento.setdefault(parte, {})
+    documento[parti[-1]] = valore
+
+
+def _rimuovi(documento: dict, campo: str) -> None:
+    parti = campo.split(".")
+    for parte in parti[:-1]:
+        documento = documento.get(parte)
+        if not isinstance(documento, dict):
+            return
+    documento.pop(parti[-1], None)
+
+
+def applica_update(documento: dict, update: dict, inserimento: bool = False) -> None:
+    """
+    Scopo: Applica un update MongoDB ($set, $unset, $inc, $min, $max, $push, $setOnInsert) a un documento.
+
+    Parametri:
+    - documento (dict): Documento da modificare (sul posto).
+    - update (dict): Documento di update con operatori.
+    - inserimento (bool): True se il documento è stato appena creato da un upsert.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - pymongo.errors.OperationFailure: Per operatori non supportati o update senza operatori.
+    """
+    if not update or not all(k.startswith("$") for k in update):
+        raise OperationFailure("L'update deve contenere solo operatori")
+    for operatore, campi in update.items():
+        for campo, valore in campi.items():
+            if operatore == "$set":
+                _imposta(documento, campo, copy.deepcopy(valore))
+            elif operatore == "$setOnInsert":
+                if inserimento:
+                    _imposta(documento, campo, copy.deepcopy(valore))
+            elif operatore == "$unset":
+                _rimuovi(documento, campo)
+            elif operatore == "$inc":
+                attuale = _valore(documento, campo)
+                _imposta(documento, campo, (0 if attuale in (_MANCANTE, None) else attuale) + valore)
+            elif operatore in ("$min", "$max"):
+                attuale = _valore(documento, campo)
+                if attuale in (_MANCANTE, None) or (valore < attuale if operatore == "$min" else valore > attuale):
+                    _imposta(documento, campo, valore)
+            elif operatore == "$push":
+                attuale = _valore(documento, campo)
+                lista = [] if attuale in (_MANCANTE, None) else list(attuale)
+                if isinstance(valore, dict) and "$each" in valore:
+                    lista.extend(copy.deepcopy(valore["$each"]))
+                    if "$slice" in valore:
+                        limite = valore["$slice"]
+                        lista = lista[limite:] if limite < 0 else lista[:limite]
+                else:
+                    lista.append(copy.deepcopy(valore))
+                _imposta(documento, campo, lista)
+            else:
+                raise OperationFailure(f"Operatore di update non supportato: {operatore}")
+
+
+def proietta(documento: dict, proiezione: Optional[dict]) -> dict:
+    """Applica una proiezione di inclusione o esclusione (restituisce una copia)."""
+    if not proiezione:
+        return copy.deepcopy(documento)
+    inclusi = {k for k, v in proiezione.items() if v and k != "_id"}
+    if inclusi:
+        risultato = {}
+        for campo in inclusi:
+            valore = _valore(documento, campo)
+            if valore is not _MANCANTE:
+                _imposta(risultato, campo, copy.deepcopy(valore))
+        if proiezione.get("_id", 1) and "_id" in documento:
+            risultato["_id"] = documento["_id"]
+        return risultato
+    risultato = copy.deepcopy(documento)
+    for campo, v in proiezione.items():
+        if not v:
+            _rimuovi(risultato, campo)
+    return risultato
+
+
+def _chiave_ordinamento(valore: Any) -> tuple:
+    # Ordine tra tipi come in MongoDB (semplificato): assenti/null, numeri, stringhe, altro
+    if valore is _MANCANTE or valore is None:
+        return (0, 0)
+    if isinstance(valore, bool):
+        return (5, valore)
+    if isinstance(valore, (int, float)):
+        return (1, valore)
+    if isinstance(valore, str):
+        return (2, valore)
+    if isinstance(valore, ObjectId):
+        return (3, valore.binary)
+    if isinstance(valore, datetime.datetime):
+        return (6, valore)
+    return (7, repr(valore))
+
+
+def _ordina(documenti: List[dict], ordinamento: List[Tuple[str, int]]) -> List[dict]:
+    for campo, direzione in reversed(ordinamento):
+        documenti.sort(key=lambda d: _chiave_ordinamento(_valore(d, campo)), reverse=direzione < 0)
+    return documenti
+
+
+def _specifica_ordinamento(chiave, direzione=1) -> List[Tuple[str, int]]:
+    if isinstance(chiave, str):
+        return [(chiave, direzione)]
+    return list(chiave.items()) if isinstance(chiave, dict) else list(chiave)
+
+
+def _chiave_hash(valore: Any) -> Any:
+    """Chiave di indice: distingue booleani da interi e rende hashabili liste e dizionari."""
+    if valore is _MANCANTE:
+        return None
+    if isinstance(valore, bool):
+        return ("bool", valore)
+    if isinstance(valore, (list, dict)):
+        return ("bson", repr(valore))
+    return valore
+
+
+# --- Indici ---
+
+class IndiceHash:
+    """Indice hash (singolo o composto) sui campi indicati: tupla di valori -> insieme di _id."""
+
+    def __init__(self, nome: str, campi: List[str], unique: bool = False):
+        self.nome = nome
+        self.campi = campi
+        self.unique = unique
+        self._voci: Dict[tuple, set] = defaultdict(set)
+
+    def chiave(self, documento: dict) -> tuple:
+        return tuple(_chiave_hash(_valore(documento, campo)) for campo in self.campi)
+
+    def aggiungi(self, documento: dict) -> None:
+        chiave = self.chiave(documento)
+        if self.unique and self._voci.get(chiave) and documento["_id"] not in self._voci[chiave]:
+            raise DuplicateKeyError(f"E11000 duplicate key error index: {self.nome} dup key: {chiave}")
+        self._voci[chiave].add(documento["_id"])
+
+    def rimuovi(self, documento: dict) -> None:
+        chiave = self.chiave(documento)
+        voce = self._voci.get(chiave)
+        if voce is not None:
+            voce.discard(documento["_id"])
+            if not voce:
+                del self._voci[chiave]
+
+    def candidati(self, filtro: dict) -> Optional[set]:
+        """Insieme di _id compatibili con il filtro, o None se l'indice non è applicabile."""
+        valori_per_campo = []
+        for campo in self.campi:
+            condizione = filtro.get(campo, _MANCANTE)
+            if condizione is _MANCANTE:
+                return None
+            if isinstance(condizione, dict) and any(k.startswith("$") for k in condizione):
+                if set(condizione) == {"$in"}:
+                    valori_per_campo.append(list(condizione["$in"]))
+                elif set(condizione) == {"$eq"}:
+                    valori_per_campo.append([condizione["$eq"]])
+                else:
+                    return None
+            elif isinstance(condizione, list):
+                return None
+            else:
+                valori_per_campo.append([condizione])
+        risultato = set()
+        for combinazione in itertools.product(*valori_per_campo):
+            risultato |= self._voci.get(tuple(_chiave_hash(v) for v in combinazione), set())
+        return risultato
+
+
+class IndiceSpaziale:
+    """Indice geohash su un campo GeoJSON Point: cella -> insieme di _id."""
+
+    def __init__(self, nome: str, campo: str, precisione: int = PRECISIONE_SPAZIALE):
+        self.nome = nome
+        self.campi = [campo]
+        self.campo = campo
+        self.precisione = precisione
+        self._celle: Dict[str, set] = defaultdict(set)
+
+    def _cella(self, documento: dict) -> Optional[str]:
+        punto = _punto(_valore(documento, self.campo))
+        return geohash_encode(punto[0], punto[1], self.precisione) if punto else None
+
+    def aggiungi(self, documento: dict) -> None:
+        cella = self._cella(documento)
+        if cella is not None:
+            self._celle[cella].add(documento["_id"])
+
+    def rimuovi(self, documento: dict) -> None:
+        cella = self._cella(documento)
+        if cella is not None and cella in self._celle:
+            self._celle[cella].discard(documento["_id"])
+            if not self._celle[cella]:
+                del self._celle[cella]
+
+    def candidati(self, filtro: dict) -> Optional[set]:
+        condizione = filtro.get(self.campo)
+        if not isinstance(condizione, dict):
+            return None
+        cerchio = _cerchio(condizione)
+        if cerchio is None or cerchio[2] is None:
+            return None
+        celle = geohash_cover_circle(cerchio[0], cerchio[1], cerchio[2], self.precisione)
+        if len(celle) > MAX_CELLE_RICERCA:
+            return None
+        risultato = set()
+        for cella in celle:
+            risultato |= self._celle.get(cella, set())
+        return risultato
+
+
+# --- Collection, cursori e database ---
+
+class CursoreMemoria:
+    """Cursore sui risultati di `find`: supporta sort, skip, limit, batch_size e iterazione."""
+
+    def __init__(self, collection: "CollezioneMemoria", filtro: Optional[dict], proiezione: Optional[dict]):
+        self._collection = collection
+        self._filtro = filtro or {}
+        self._proiezione = proiezione
+        self._ordinamento: List[Tuple[str, int]] = []
+        self._skip = 0
+        self._limit = 0
+        self._risultati = None
+        self.piano: Optional[str] = None
+        self.esaminati: Optional[int] = None
+
+    def sort(self, chiave, direzione: int = 1) -> "CursoreMemoria":
+        self._ordinamento = _specifica_ordinamento(chiave, direzione)
+        return self
+
+    def skip(self, n: int) -> "CursoreMemoria":
+        self._skip = n
+        return self
+
+    def limit(self, n: int) -> "CursoreMemoria":
+        self._limit = n
+        return self
+
+    def batch_size(self, n: int) -> "CursoreMemoria":
+        return self  # i risultati sono già in memoria
+
+    def _esegui(self) -> List[dict]:
+        if self._risultati is None:
+            statistiche = {}
+            documenti, self.piano = self._collection._seleziona(self._filtro, statistiche)
+            self.esaminati = statistiche["esaminati"]
+            if self._ordinamento:
+                documenti = _ordina(documenti, self._ordinamento)
+            documenti = documenti[self._skip:]
+            if self._limit:
+                documenti = documenti[:self._limit]
+            self._risultati = [proietta(d, self._proiezione) for d in documenti]
+        return self._risultati
+
+    def __iter__(self):
+        return iter(self._esegui())
+
+    def to_list(self, length: Optional[int] = None) -> List[dict]:
+        risultati = self._esegui()
+        return list(risultati if length is None else risultati[:length])
+
+    def close(self) -> None:
+        self._risultati = []
+
+
+class CollezioneMemoria:
+    """
+    Collection in memoria con la stessa interfaccia (sottoinsieme) di `pymongo.collection.Collection`.
+
+    L'indice su `_id` è implicito; `create_index` aggiunge indici hash o spaziali ("2dsphere"),
+    usati da `find`/`update`/`delete` quando il filtro li rende applicabili.
+    """
+
+    def __init__(self, database: "DatabaseMemoria", nome: str):
+        self.database = database
+        self.name = nome
+        self._lock = threading.RLock()
+        self._documenti: Dict[Any, dict] = {}
+        self._indici: Dict[str, Any] = {}
+
+    # Indici
+
+    def create_index(self, chiavi, unique: bool = False, name: Optional[str] = None, **_opzioni) -> str:
+        """
+        Scopo: Crea un indice hash (chiavi con direzione 1/-1) o spaziale ("2dsphere").
+
+        Parametri:
+        - chiavi (str | list[tuple]): Campo o lista di coppie (campo, tipo).
+        - unique (bool): Se True rifiuta chiavi duplicate.
+        - name (str, optional): Nome dell'indice.
+
+        Valore di ritorno:
+        - str: Nome dell'indice.
+
+        Eccezioni:
+        - pymongo.errors.DuplicateKeyError: Se l'indice è unique e i documenti esistenti lo violano.
+        """
+        specifica = _specifica_ordinamento(chiavi)
+        nome = name or "_".join(f"{campo}_{tipo}" for campo, tipo in specifica)
+        with self._lock:
+            if nome in self._indici:
+                return nome
+            if any(tipo == "2dsphere" for _, tipo in specifica):
+                indice = IndiceSpaziale(nome, specifica[0][0])
+            else:
+                indice = IndiceHash(nome, [campo for campo, _ in specifica], unique=unique)
+            for documento in self._documenti.values():
+                indice.aggiungi(documento)
+            self._indici[nome] = indice
+        return nome
+
+    def index_information(self) -> dict:
+        with self._lock:
+            informazioni = {"_id_": {"key": [("_id", 1)]}}
+            for nome, indice in self._indici.items():
+                tipo = "2dsphere" if isinstance(indice, IndiceSpaziale) else 1
+                informazioni[nome] = {"key": [(campo, tipo) for campo in indice.campi]}
+                if getattr(indice, "unique", False):
+                    informazioni[nome]["unique"] = True
+            return informazioni
+
+    def drop_index(self, nome: str) -> None:
+        with self._lock:
+            self._indici.pop(nome, None)
+
+    def _indicizza(self, documento: dict) -> None:
+        aggiunti = []
+        try:
+            for indice in self._indici.values():
+                indice.aggiungi(documento)
+                aggiunti.append(indice)
+        except DuplicateKeyError:
+            for indice in aggiunti:
+                indice.rimuovi(documento)
+            raise
+
+    def _deindicizza(self, documento: dict) -> None:
+        for indice in self._indici.values():
+            indice.rimuovi(documento)
+
+    def _seleziona(self, filtro: dict, statistiche: Optional[dict] = None) -> Tuple[List[dict], str]:
+        """Documenti (non copiati) che soddisfano il filtro e descrizione del piano usato;
+        in `statistiche["esaminati"]` il numero di documenti confrontati con il filtro."""
+        with self._lock:
+            candidati, piano = None, "COLLSCAN"
+            id_filtro = filtro.get("_id", _MANCANTE)
+            if id_filtro is not _MANCANTE and not isinstance(id_filtro, dict):
+                candidati, piano = {_chiave_hash(id_filtro)}, "IDHACK"
+            elif isinstance(id_filtro, dict) and set(id_filtro) == {"$in"}:
+                candidati, piano = {_chiave_hash(v) for v in id_filtro["$in"]}, "IXSCAN _id_"
+            else:
+                for nome, indice in self._indici.items():
+                    trovati = indice.candidati(filtro)
+                    if trovati is not None and (candidati is None or len(trovati) < len(candidati)):
+                        candidati, piano = trovati, f"IXSCAN {nome}"
+            sorgente = (list(self._documenti.values()) if candidati is None
+                        else [self._documenti[c] for c in candidati if c in self._documenti])
+            if statistiche is not None:
+                statistiche["esaminati"] = len(sorgente)
+            documenti = [d for d in sorgente if corrisponde(d, filtro)]
+
+            # $near restituisce i documenti dal più vicino
+            for campo, condizione in filtro.items():
+                if isinstance(condizione, dict) and ("$near" in condizione or "$nearSphere" in condizione):
+                    lat, lon, _ = _cerchio(condizione)
+                    documenti.sort(key=lambda d: haversine_km(lat, lon, *_punto(_valore(d, campo))))
+            return documenti, piano
+
+    # Letture
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **opzioni) -> CursoreMemoria:
+        cursore = CursoreMemoria(self, filter, projection)
+        if opzioni.get("sort"):
+            cursore.sort(opzioni["sort"])
+        if opzioni.get("skip"):
+            cursore.skip(opzioni["skip"])
+        if opzioni.get("limit"):
+            cursore.limit(opzioni["limit"])
+        return cursore
+
+    def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **opzioni) -> Optional[dict]:
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        risultati = self.find(filter, projection, **opzioni).limit(1).to_list()
+        return risultati[0] if risultati else None
+
+    def count_documents(self, filter: dict, **_opzioni) -> int:
+        return len(self._seleziona(filter)[0])
+
+    def estimated_document_count(self, **_opzioni) -> int:
+        return len(self._documenti)
+
+    def distinct(self, campo: str, filter: Optional[dict] = None) -> list:
+        valori = []
+        for documento in self._seleziona(filter or {})[0]:
+            valore = _valore(documento, campo)
+            if valore is not _MANCANTE and valore not in valori:
+                valori.append(copy.deepcopy(valore))
+        return valori
+
+    # Scritture
+
+    def _inserisci(self, documento: dict) -> Any:
+        documento.setdefault("_id", ObjectId())
+        nuovo = copy.deepcopy(documento)
+        chiave = _chiave_hash(nuovo["_id"])
+        if chiave in self._documenti:
+            raise DuplicateKeyError(f"E11000 duplicate key error index: _id_ dup key: {nuovo['_id']!r}")
+        self._indicizza(nuovo)
+        self._documenti[chiave] = nuovo
+        return nuovo["_id"]
+
+    def insert_one(self, document: dict, **_opzioni) -> InsertOneResult:
+        with self._lock:
+            return InsertOneResult(self._inserisci(document), True)
+
+    def insert_many(self, documents: Iterable[dict], ordered: bool = True, **_opzioni) -> InsertManyResult:
+        inseriti, errori = [], []
+        with self._lock:
+            for indice, documento in enumerate(documents):
+                try:
+                    inseriti.append(self._inserisci(documento))
+                except DuplicateKeyError as e:
+                    errori.append({"index": indice, "code": 11000, "errmsg": str(e)})
+                    if ordered:
+                        break
+        if errori:
+            # Stesso formato di pymongo: un solo BulkWriteError con tutti gli errori di scrittura
+            raise BulkWriteError({"writeErrors": errori, "writeConcernErrors": [], "nInserted": len(inseriti),
+                                  "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0, "upserted": []})
+        return InsertManyResult(inseriti, True)
+
+    def _sostituisci(self, vecchio: dict, nuovo: dict) -> None:
+        self._deindicizza(vecchio)
+        try:
+            self._indicizza(nuovo)
+        except DuplicateKeyError:
+            self._indicizza(vecchio)
+            raise
+        self._documenti[_chiave_hash(nuovo["_id"])] = nuovo
+
+    def _upsert(self, filtro: dict, update: Optional[dict], sostituto: Optional[dict] = None) -> Any:
+        documento = {k: copy.deepcopy(v) for k, v in filtro.items()
+                     if not k.startswith("$") and not (isinstance(v, dict) and any(c.startswith("$") for c in v))}
+        if sostituto is not None:
+            documento = {**({"_id": documento["_id"]} if "_id" in documento else {}), **copy.deepcopy(sostituto)}
+        else:
+            applica_update(documento, update, inserimento=True)
+        return self._inserisci(documento)
+
+    def _aggiorna(self, filtro: dict, update: dict, multi: bool, upsert: bool,
+                  sostituto: Optional[dict] = None) -> Tuple[int, int, Any]:
+        """Restituisce (documenti trovati, documenti modificati, _id inserito dall'upsert)."""
+        with self._lock:
+            trovati = self._seleziona(filtro)[0]
+            if not multi:
+                trovati = trovati[:1]
+            if not trovati:
+                return 0, 0, (self._upsert(filtro, update, sostituto) if upsert else None)
+            modificati = 0
+            for vecchio in trovati:
+                if sostituto is not None:
+                    nuovo = {"_id": vecchio["_id"], **copy.deepcopy(sostituto)}
+                else:
+                    nuovo = copy.deepcopy(vecchio)
+                    applica_update(nuovo, update)
+                if nuovo != vecchio:
+                    self._sostituisci(vecchio, nuovo)
+                    modificati += 1
+            return len(trovati), modificati, None
+
+    @staticmethod
+    def _esito_update(trovati: int, modificati: int, upserted_id: Any) -> UpdateResult:
+        raw = {"n": trovati + (1 if upserted_id is not None else 0), "nModified": modificati, "ok": 1.0}
+        if upserted_id is not None:
+            raw["upserted"] = upserted_id
+        return UpdateResult(raw, True)
+
+    def update_one(self, filter: dict, update: dict, upsert: bool = False, **_opzioni) -> UpdateResult:
+        return self._esito_update(*self._aggiorna(filter, update, False, upsert))
+
+    def update_many(self, filter: dict, update: dict, upsert: bool = False, **_opzioni) -> UpdateResult:
+        return self._esito_update(*self._aggiorna(filter, update, True, upsert))
+
+    def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **_opzioni) -> UpdateResult:
+        return self._esito_update(*self._aggiorna(filter, None, False, upsert, sostituto=replacement))
+
+    def find_one_and_update(self, filter: dict, update: dict, projection: Optional[dict] = None,
+                            sort=None, upsert: bool = False,
+                            return_document: bool = ReturnDocument.BEFORE, **_opzioni) -> Optional[dict]:
+        with self._lock:
+            trovati = self._seleziona(filter)[0]
+            if sort:
+                trovati = _ordina(trovati, _specifica_ordinamento(sort))
+            if not trovati:
+                if not upsert:
+                    return None
+                nuovo_id = self._upsert(filter, update)
+                return (proietta(self._documenti[_chiave_hash(nuovo_id)], projection)
+                        if return_document == ReturnDocument.AFTER else None)
+            vecchio = trovati[0]
+            nuovo = copy.deepcopy(vecchio)
+            applica_update(nuovo, update)
+            if nuovo != vecchio:
+                self._sostituisci(vecchio, nuovo)
+            return proietta(nuovo if return_document == ReturnDocument.AFTER else vecchio, projection)
+
+    def _cancella(self, filtro: dict, multi: bool) -> int:
+        with self._lock:
+            trovati = self._seleziona(filtro)[0]
+            if not multi:
+                trovati = trovati[:1]
+            for documento in trovati:
+                self._deindicizza(documento)
+                del self._documenti[_chiave_hash(documento["_id"])]
+            return len(trovati)
+
+    def delete_one(self, filter: dict, **_opzioni) -> DeleteResult:
+        return DeleteResult({"n": self._cancella(filter, False), "ok": 1.0}, True)
+
+    def delete_many(self, filter: dict, **_opzioni) -> DeleteResult:
+        return DeleteResult({"n": self._cancella(filter, True), "ok": 1.0}, True)
+
+    def find_one_and_delete(self, filter: dict, projection: Optional[dict] = None, **_opzioni) -> Optional[dict]:
+        with self._lock:
+            trovati = self._seleziona(filter)[0]
+            if not trovati:
+                return None
+            documento = trovati[0]
+            self._deindicizza(documento)
+            del self._documenti[_chiave_hash(documento["_id"])]
+            return proietta(documento, projection)
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True, **_opzioni) -> BulkWriteResult:
+        """
+        Scopo: Esegue in sequenza InsertOne, UpdateOne/UpdateMany, ReplaceOne e DeleteOne/DeleteMany.
+
+        Parametri:
+        - requests (List): Operazioni pymongo.
+        - ordered (bool): Se True si ferma al primo errore.
+
+        Valore di ritorno:
+        - BulkWriteResult: Contatori aggregati delle operazioni.
+
+        Eccezioni:
+        - pymongo.errors.DuplicateKeyError: Per violazioni di chiave (con ordered=True).
+        - pymongo.errors.OperationFailure: Per operazioni non supportate.
+        """
+        esito = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "nRemoved": 0,
+                 "upserted": [], "writeErrors": [], "writeConcernErrors": []}
+        with self._lock:
+            for indice, operazione in enumerate(requests):
+                try:
+                    if isinstance(operazione, InsertOne):
+                        self._inserisci(operazione._doc)
+                        esito["nInserted"] += 1
+                        continue
+                    if isinstance(operazione, (UpdateOne, UpdateMany, ReplaceOne)):
+                        sostituto = operazione._doc if isinstance(operazione, ReplaceOne) else None
+                        trovati, modificati, upserted_id = self._aggiorna(
+                            operazione._filter, None if sostituto is not None else operazione._doc,
+                            isinstance(operazione, UpdateMany), operazione._upsert, sostituto)
+                        esito["nMatched"] += trovati
+                        esito["nModified"] += modificati
+                        if upserted_id is not None:
+                            esito["nUpserted"] += 1
+                            esito["upserted"].append({"index": indice, "_id": upserted_id})
+                    elif isinstance(operazione, (DeleteOne, DeleteMany)):
+                        esito["nRemoved"] += self._cancella(operazione._filter, isinstance(operazione, DeleteMany))
+                    else:
+                        raise OperationFailure(f"Operazione bulk non supportata: {type(operazione).__name__}")
+                except DuplicateKeyError:
+                    if ordered:
+                        raise
+                    esito["writeErrors"].append({"index": indice, "code": 11000})
+        return BulkWriteResult(esito, True)
+
+    def aggregate(self, pipeline: List[dict], **_opzioni) -> CursoreMemoria:
+        """
+        Scopo: Esegue una pipeline con gli stadi $match, $group, $sort, $limit, $skip,
+        $project, $count, $unwind, $unionWith (senza pipeline) e, come ultimo stadio, $merge/$out.
+
+        Parametri:
+        - pipeline (List[dict]): Stadi di aggregazione.
+
+        Valore di ritorno:
+        - CursoreMemoria: Cursore sui documenti risultanti (vuoto se l'ultimo stadio è $merge/$out).
+
+        Eccezioni:
+        - pymongo.errors.OperationFailure: Per stadi o accumulatori non supportati.
+        """
+        with self._lock:
+            documenti = [copy.deepcopy(d) for d in self._seleziona(
+                pipeline[0]["$match"] if pipeline and "$match" in pipeline[0] else {})[0]]
+        for stadio in pipeline[1:] if pipeline and "$match" in pipeline[0] else pipeline:
+            (nome, argomento), = stadio.items()
+            if nome == "$match":
+                documenti = [d for d in documenti if corrisponde(d, argomento)]
+            elif nome == "$group":
+                documenti = _raggruppa(documenti, argomento)
+            elif nome == "$sort":
+                documenti = _ordina(documenti, _specifica_ordinamento(argomento))
+            elif nome == "$limit":
+                documenti = documenti[:argomento]
+            elif nome == "$skip":
+                documenti = documenti[argomento:]
+            elif nome == "$project":
+                documenti = [_progetta(d, argomento) for d in documenti]
+            elif nome == "$count":
+                documenti = [{argomento: len(documenti)}]
+            elif nome == "$unwind":
+                campo = (argomento if isinstance(argomento, str) else argomento["path"])[1:]
+                documenti = [{**d, campo: elemento} for d in documenti
+                             for elemento in (_valore(d, campo) if isinstance(_valore(d, campo), list) else [])]
+            elif nome == "$unionWith":
+                origine = argomento if isinstance(argomento, str) else argomento["coll"]
+                documenti.extend(copy.deepcopy(d) for d in self.database[origine].find({}))
+            elif nome in ("$merge", "$out"):
+                self._unisci(documenti, argomento, sostituisci_tutto=nome == "$out")
+                documenti = []
+            else:
+                raise OperationFailure(f"Stadio di aggregazione non supportato: {nome}")
+        cursore = CursoreMemoria(self, {}, None)
+        cursore._risultati = documenti
+        return cursore
+
+    def _unisci(self, documenti: List[dict], destinazione, sostituisci_tutto: bool) -> None:
+        specifica = destinazione if isinstance(destinazione, dict) else {"into": destinazione}
+        into = specifica.get("into", specifica.get("coll"))
+        target = self.database[into if isinstance(into, str) else into["coll"]]
+        if sostituisci_tutto:
+            target.delete_many({})
+            target.insert_many(documenti)
+            return
+        on = specifica.get("on", "_id")
+        campi_on = [on] if isinstance(on, str) else list(on)
+        quando_presente = specifica.get("whenMatched", "merge")
+        for documento in documenti:
+            filtro = {campo: documento.get(campo) for campo in campi_on}
+            if target.find_one(filtro) is None:
+                if specifica.get("whenNotMatched", "insert") == "insert":
+                    target.insert_one(documento)
+            elif quando_presente == "replace":
+                target.replace_one(filtro, {k: v for k, v in documento.items() if k != "_id"})
+            elif quando_presente == "merge":
+                target.update_one(filtro, {"$set": {k: v for k, v in documento.items() if k != "_id"}})
+
+    def drop(self) -> None:
+        self.database.drop_collection(self.name)
+
+    def with_options(self, **_opzioni) -> "CollezioneMemoria":
+        return self  # write concern e read preference non hanno effetto in memoria
+
+
+def _progetta(documento: dict, specifica: dict) -> dict:
+    if all(v in (0, 1, True, False) for v in specifica.values()):
+        return proietta(documento, specifica)
+    risultato = {"_id": documento.get("_id")} if specifica.get("_id", 1) else {}
+    for campo, espressione in specifica.items():
+        if campo == "_id" and espressione in (0, False):
+            continue
+        if espressione in (1, True):
+            valore = _valore(documento, campo)
+            if valore is not _MANCANTE:  # come MongoDB, un campo incluso ma assente non compare
+                risultato[campo] = valore
+        else:
+            risultato[campo] = valuta(espressione, documento)
+    return risultato
+
+
+def _raggruppa(documenti: List[dict], specifica: dict) -> List[dict]:
+    gruppi: Dict[Any, dict] = {}
+    for documento in documenti:
+        chiave_gruppo = valuta(specifica["_id"], documento)
+        chiave = _chiave_hash(chiave_gruppo)
+        gruppo = gruppi.setdefault(chiave, {"_id": chiave_gruppo, "_n": {}})
+        for campo, accumulatore in specifica.items():
+            if campo == "_id":
+                continue
+            (operatore, espressione), = accumulatore.items()
+            valore = valuta(espressione, documento)
+            attuale = gruppo.get(campo, _MANCANTE)
+            if operatore == "$sum":
+                gruppo[campo] = (0 if attuale is _MANCANTE else attuale) + (valore if isinstance(valore, (int, float)) else 0)
+            elif operatore == "$avg":
+                gruppo["_n"][campo] = gruppo["_n"].get(campo, 0) + 1
+                gruppo[campo] = (0 if attuale is _MANCANTE else attuale) + valore
+            elif operatore in ("$min", "$max"):
+                if valore is not None and (attuale is _MANCANTE or
+                                           (valore < attuale if operatore == "$min" else valore > attuale)):
+                    gruppo[campo] = valore
+            elif operatore == "$first":
+                if attuale is _MANCANTE:
+                    gruppo[campo] = valore
+            elif operatore == "$last":
+                gruppo[campo] = valore
+            elif operatore == "$push":
+                gruppo.setdefault(campo, []).append(valore)
+            else:
+                raise OperationFailure(f"Accumulatore non supportato: {operatore}")
+    risultato = []
+    for gruppo in gruppi.values():
+        for campo, n in gruppo.pop("_n").items():
+            gruppo[campo] = gruppo[campo] / n
+        risultato.append(gruppo)
+    return risultato
+
+
+class DatabaseMemoria:
+    """
+    Database in memoria: crea le collection al primo accesso, come MongoDB.
+
+    Con `percorso` i dati vengono caricati all'avvio e salvati (BSON) da `salva()`,
+    così la modalità embedded sopravvive ai riavvii.
+    """
+
+    def __init__(self, nome: str, percorso: Optional[str] = None):
+        self.name = nome
+        self.percorso = percorso
+        self._collection: Dict[str, CollezioneMemoria] = {}
+        self._lock = threading.Lock()
+        if percorso and os.path.exists(percorso):
+            self.carica(percorso)
+
+    @property
+    def client(self) -> "DatabaseMemoria":
+        return self
+
+    @property
+    def admin(self) -> "DatabaseMemoria":
+        return self
+
+    def __getitem__(self, nome: str) -> CollezioneMemoria:
+        return self.get_collection(nome)
+
+    def get_collection(self, nome: str, **_opzioni) -> CollezioneMemoria:
+        with self._lock:
+            if nome not in self._collection:
+                self._collection[nome] = CollezioneMemoria(self, nome)
+            return self._collection[nome]
+
+    def list_collection_names(self) -> List[str]:
+        return list(self._collection)
+
+    def drop_collection(self, nome: str) -> None:
+        with self._lock:
+            self._collection.pop(nome, None)
+
+    def command(self, comando, *_argomenti, **_opzioni) -> dict:
+        if comando == "ping" or comando == {"ping": 1}:
+            return {"ok": 1.0}
+        raise OperationFailure(f"Comando non supportato dal motore in memoria: {comando}")
+
+    def salva(self, percorso: Optional[str] = None) -> None:
+        """
+        Scopo: Salva tutte le collection e i relativi indici in un file BSON (scrittura atomica).
+
+        Parametri:
+        - percorso (str, optional): File di destinazione; default quello del costruttore.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - OSError: Se il file non può essere scritto.
+        """
+        percorso = percorso or self.percorso
+        if not percorso:
+            return
+        temporaneo = f"{percorso}.tmp"
+        with open(temporaneo, "wb") as f:
+            for nome, collection in list(self._collection.items()):
+                with collection._lock:
+                    indici = [{"nome": n, "campi": i.campi, "spaziale": isinstance(i, IndiceSpaziale),
+                               "unique": getattr(i, "unique", False)} for n, i in collection._indici.items()]
+                    f.write(bson.encode({"collection": nome, "indici": indici}))
+                    for documento in collection._documenti.values():
+                        f.write(bson.encode({"collection": nome, "documento": documento}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporaneo, percorso)
+
+    def carica(self, percorso: str) -> None:
+        """Carica collection e indici da un file scritto da `salva`."""
+        with open(percorso, "rb") as f:
+            for voce in bson.decode_file_iter(f):
+                collection = self.get_collection(voce["collection"])
+                if "indici" in voce:
+                    for indice in voce["indici"]:
+                        tipo = "2dsphere" if indice["spaziale"] else 1
+                        collection.create_index([(campo, tipo) for campo in indice["campi"]],
+                                                unique=indice["unique"], name=indice["nome"])
+                else:
+                    collection.insert_one(voce["documento"])
+
+    def close(self) -> None:
+        self.salva()
+
+
+# --- Varianti asincrone (stessa interfaccia di AsyncCollection) ---
+
+class CursoreMemoriaAsync:
+    """Cursore asincrono: stessi metodi di `CursoreMemoria`, con `to_list` awaitable e `async for`."""
+
+    def __init__(self, cursore: CursoreMemoria):
+        self._cursore = cursore
+
+    def sort(self, chiave, direzione: int = 1) -> "CursoreMemoriaAsync":
+        self._cursore.sort(chiave, direzione)
+        return self
+
+    def skip(self, n: int) -> "CursoreMemoriaAsync":
+        self._cursore.skip(n)
+        return self
+
+    def limit(self, n: int) -> "CursoreMemoriaAsync":
+        self._cursore.limit(n)
+        return self
+
+    def batch_size(self, n: int) -> "CursoreMemoriaAsync":
+        return self
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        return self._cursore.to_list(length)
+
+    def __aiter__(self):
+        return self._itera()
+
+    async def _itera(self):
+        for documento in self._cursore:
+            yield documento
+
+    async def close(self) -> None:
+        self._cursore.close()
+
+
+class CollezioneMemoriaAsync:
+    """Adattatore asincrono di `CollezioneMemoria` (le operazioni sono in memoria, quindi non bloccanti)."""
+
+    def __init__(self, collection: CollezioneMemoria, database: "DatabaseMemoriaAsync"):
+        self._collection = collection
+        self.database = database
+        self.name = collection.name
+
+    def find(self, *argomenti, **opzioni) -> CursoreMemoriaAsync:
+        return CursoreMemoriaAsync(self._collection.find(*argomenti, **opzioni))
+
+    async def aggregate(self, *argomenti, **opzioni) -> CursoreMemoriaAsync:
+        return CursoreMemoriaAsync(self._collection.aggregate(*argomenti, **opzioni))
+
+    def with_options(self, **_opzioni) -> "CollezioneMemoriaAsync":
+        return self
+
+    def __getattr__(self, attributo):
+        metodo = getattr(self._collection, attributo)
+        if not callable(metodo):
+            return metodo
+
+        async def chiamata(*argomenti, **opzioni):
+            return metodo(*argomenti, **opzioni)
+        return chiamata
+
+
+class DatabaseMemoriaAsync:
+    """Vista asincrona di un `DatabaseMemoria`: condivide i dati con la vista sincrona."""
+
+    def __init__(self, database: DatabaseMemoria):
+        self._database = database
+        self.name = database.name
+
+    @property
+    def client(self) -> "DatabaseMemoriaAsync":
+        return self
+
+    @property
+    def admin(self) -> "DatabaseMemoriaAsync":
+        return self
+
+    def __getitem__(self, nome: str) -> CollezioneMemoriaAsync:
+        return self.get_collection(nome)
+
+    def get_collection(self, nome: str, **_opzioni) -> CollezioneMemoriaAsync:
+        return CollezioneMemoriaAsync(self._database.get_collection(nome), self)
+
+    async def command(self, comando, *argomenti, **opzioni) -> dict:
+        return self._database.command(comando, *argomenti, **opzioni)
+
+    async def close(self) -> None:
+        pass
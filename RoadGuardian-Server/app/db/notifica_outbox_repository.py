@@ -0,0 +1,257 @@
+from .connection import collezione
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from typing import List, Tuple
+import datetime
+import uuid
+
+# Otteniamo la collezione specifica (risolta al primo accesso, non all'import)
+outbox_collection = collezione("notifiche_outbox")  # coda persistente delle notifiche push
+
+# Stati di un documento dell'outbox
+STATO_PENDING = "pending"          # in attesa di (nuovo) invio
+STATO_IN_PROGRESS = "in_progress"  # reclamato da un worker fino a `claimed_until`
+STATO_SENT = "sent"                # consegnato a FCM
+STATO_DEAD = "dead"                # errore permanente o tentativi esauriti (dead-letter)
+
+SENT_TTL_SECONDS = 24 * 3600      # i documenti inviati vengono rimossi dal TTL index dopo un giorno
+DEAD_TTL_SECONDS = 7 * 24 * 3600  # i documenti in dead-letter restano ispezionabili per una settimana
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+def ensure_indexes() -> None:
+    """
+    Scopo: Crea gli indici usati dalle query di claim e la scadenza dei documenti inviati
+    e di quelli in dead-letter.
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la creazione degli indici fallisce.
+    """
+    outbox_collection.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+    outbox_collection.create_index([("status", ASCENDING), ("claimed_until", ASCENDING)])
+    outbox_collection.create_index("claim_token")
+    outbox_collection.create_index("sent_at", expireAfterSeconds=SENT_TTL_SECONDS)
+    outbox_collection.create_index("dead_at", expireAfterSeconds=DEAD_TTL_SECONDS)
+
+
+def insert_notifiche(notifiche: List[dict], claimed_by: str = None, lease_seconds: float = 60,
+                     claim_token: str = None) -> List[dict]:
+    """
+    Scopo: Scrive in blocco nuove notifiche nell'outbox.
+
+    Parametri:
+    - notifiche (List[dict]): Notifiche serializzate (token, title, body, data).
+    - claimed_by (str, optional): Se valorizzato, le notifiche vengono inserite già reclamate
+      da questo worker (invio immediato); altrimenti restano `pending`.
+    - lease_seconds (float): Durata del claim, scaduto il quale un altro worker può riprenderle.
+    - claim_token (str, optional): Token del claim, richiesto da tutte le transizioni di stato successive.
+
+    Valore di ritorno:
+    - List[dict]: Documenti inseriti con `_id` valorizzato.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se l'inserimento fallisce.
+    """
+    if not notifiche:
+        return []
+    adesso = _now()
+    documenti = []
+    for notifica in notifiche:
+        doc = dict(notifica)
+        doc.update({
+            "_id": ObjectId(),
+            "status": STATO_IN_PROGRESS if claimed_by else STATO_PENDING,
+            "attempts": 0,
+            "created_at": adesso,
+            "next_attempt_at": adesso,
+            "claimed_by": claimed_by,
+            "claim_token": claim_token if claimed_by else None,
+            "claimed_until": adesso + datetime.timedelta(seconds=lease_seconds) if claimed_by else None,
+            "last_error": None,
+        })
+        documenti.append(doc)
+    outbox_collection.insert_many(documenti, ordered=False)
+    return documenti
+
+
+def claim_batch(worker_id: str, limit: int, lease_seconds: float = 60) -> List[dict]:
+    """
+    Scopo: Reclama atomicamente un lotto di notifiche da inviare: quelle `pending` giunte
+    al tentativo successivo e quelle `in_progress` con claim scaduto (worker terminato).
+
+    Parametri:
+    - worker_id (str): Identificativo del worker che reclama il lotto.
+    - limit (int): Numero massimo di documenti.
+    - lease_seconds (float): Durata del claim.
+
+    Valore di ritorno:
+    - List[dict]: Documenti reclamati da questo worker.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se le query falliscono.
+    """
+    adesso = _now()
+    disponibili = {
+        "$or": [
+            {"status": STATO_PENDING, "next_attempt_at": {"$lte": adesso}},
+            {"status": STATO_IN_PROGRESS, "claimed_until": {"$lt": adesso}},
+        ]
+    }
+    ids = [doc["_id"] for doc in outbox_collection.find(disponibili, {"_id": 1}).sort("next_attempt_at", ASCENDING).limit(limit)]
+    if not ids:
+        return []
+
+    # Il filtro viene ripetuto nell'update: se un altro worker ha reclamato un documento
+    # nel frattempo, questo non viene più selezionato.
+    claim_token = uuid.uuid4().hex
+    outbox_collection.update_many(
+        {"_id": {"$in": ids}, **disponibili},
+        {"$set": {
+            "status": STATO_IN_PROGRESS,
+            "claimed_by": worker_id,
+            "claim_token": claim_token,
+            "claimed_until": adesso + datetime.timedelta(seconds=lease_seconds),
+        }}
+    )
+    return list(outbox_collection.find({"claim_token": claim_token}))
+
+
+def _reclamato(oid: ObjectId, claim_token: str) -> dict:
+    """Filtro di un documento ancora reclamato con `claim_token`: se il claim è scaduto ed è
+    stato ripreso da un altro worker, le transizioni del vecchio proprietario non hanno effetto."""
+    return {"_id": oid, "claim_token": claim_token, "status": STATO_IN_PROGRESS}
+
+
+def rinnova_claim(ids: List[ObjectId], claim_token: str, lease_seconds: float = 60) -> List[dict]:
+    """
+    Scopo: Prolunga il claim dei documenti ancora posseduti, subito prima dell'invio.
+
+    Parametri:
+    - ids (List[ObjectId]): Identificativi dei documenti.
+    - claim_token (str): Token del claim del chiamante.
+    - lease_seconds (float): Nuova durata del claim da adesso.
+
+    Valore di ritorno:
+    - List[dict]: Documenti ancora reclamati con `claim_token` (gli altri sono stati ripresi
+      da un altro worker e non vanno inviati).
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se le query falliscono.
+    """
+    if not ids:
+        return []
+    filtro = {"_id": {"$in": ids}, "claim_token": claim_token, "status": STATO_IN_PROGRESS}
+    outbox_collection.update_many(
+        filtro, {"$set": {"claimed_until": _now() + datetime.timedelta(seconds=lease_seconds)}}
+    )
+    return list(outbox_collection.find(filtro))
+
+
+def mark_sent(inviati: List[Tuple[ObjectId, str]]) -> int:
+    """
+    Scopo: Marca come inviate le notifiche indicate.
+
+    Parametri:
+    - inviati (List[Tuple[ObjectId, str]]): Coppie (id, claim_token).
+
+    Valore di ritorno:
+    - int: Numero di documenti aggiornati.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se l'aggiornamento fallisce.
+    """
+    if not inviati:
+        return 0
+    adesso = _now()
+    operazioni = [
+        UpdateOne(
+            _reclamato(oid, claim_token),
+            {"$set": {"status": STATO_SENT, "sent_at": adesso, "claimed_until": None},
+             "$inc": {"attempts": 1}}
+        )
+        for oid, claim_token in inviati
+    ]
+    result = outbox_collection.bulk_write(operazioni, ordered=False)
+    return result.modified_count
+
+
+def schedule_retry(retries: List[Tuple[ObjectId, str, datetime.datetime, str]]) -> int:
+    """
+    Scopo: Riprogramma in blocco le notifiche fallite per errori transitori.
+
+    Parametri:
+    - retries (List[Tuple[ObjectId, str, datetime, str]]): Quaterne (id, claim_token,
+      istante del prossimo tentativo, errore).
+
+    Valore di ritorno:
+    - int: Numero di documenti aggiornati.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la scrittura fallisce.
+    """
+    if not retries:
+        return 0
+    operazioni = [
+        UpdateOne(
+            _reclamato(oid, claim_token),
+            {"$set": {"status": STATO_PENDING, "next_attempt_at": next_attempt_at,
+                      "last_error": errore, "claimed_until": None},
+             "$inc": {"attempts": 1}}
+        )
+        for oid, claim_token, next_attempt_at, errore in retries
+    ]
+    result = outbox_collection.bulk_write(operazioni, ordered=False)
+    return result.modified_count
+
+
+def mark_dead(dead: List[Tuple[ObjectId, str, str]]) -> int:
+    """
+    Scopo: Sposta in dead-letter le notifiche con errore permanente o tentativi esauriti.
+
+    Parametri:
+    - dead (List[Tuple[ObjectId, str, str]]): Terne (id, claim_token, errore).
+
+    Valore di ritorno:
+    - int: Numero di documenti aggiornati.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la scrittura fallisce.
+    """
+    if not dead:
+        return 0
+    operazioni = [
+        UpdateOne(
+            _reclamato(oid, claim_token),
+            {"$set": {"status": STATO_DEAD, "last_error": errore, "dead_at": _now(), "claimed_until": None},
+             "$inc": {"attempts": 1}}
+        )
+        for oid, claim_token, errore in dead
+    ]
+    result = outbox_collection.bulk_write(operazioni, ordered=False)
+    return result.modified_count
+
+
+def count_by_status() -> dict:
+    """
+    Scopo: Conta i documenti dell'outbox per stato.
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - dict: Mappa stato -> numero di documenti.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se l'aggregazione fallisce.
+    """
+    return {
+        doc["_id"]: doc["count"]
+        for doc in outbox_collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+    }
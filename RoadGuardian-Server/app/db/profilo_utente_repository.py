@@ -1,13 +1,27 @@
-from pymongo import ReturnDocument
-from db.connection import get_database
+from pymongo import ReturnDocument, ASCENDING
+from db.connection import collezione
 from models.user_model import UserModel
 from bson import ObjectId
 from pydantic_extra_types.phone_numbers import PhoneNumber
 from typing import Dict, Any
 
-# Otteniamo la collezione specifica
-db = get_database()
-user_collection = db["utenti"]  # "utenti" è il nome della collection che vedrai su Compass
+# Otteniamo la collezione specifica (risolta al primo accesso, non all'import)
+user_collection = collezione("utenti")  # "utenti" è il nome della collection che vedrai su Compass
+
+def ensure_indexes() -> None:
+    """
+    Scopo: Crea gli indici per la ricerca degli utenti per email e numero di telefono (idempotente).
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la creazione degli indici fallisce.
+    """
+    user_collection.create_index([("email", ASCENDING)])
+    user_collection.create_index([("num_tel", ASCENDING)])
 
 def create_user(user: UserModel) -> UserModel:
     """
@@ -1,12 +1,60 @@
-from .connection import get_database
-from models.incident_model import IncidentModel
+from .connection import collezione
+from .statistiche_repository import registra_disattivata, registra_inserite
+from db.cache_segnalazioni import get_cache_segnalazioni, invalida_segnalazioni
+from models.incident_model import IncidentModel, campi_orari, punto_geojson
 from bson import ObjectId
-from pymongo import ReturnDocument
+from pymongo import ReturnDocument, ASCENDING, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError
 import datetime
+from typing import Iterator
 
-# Otteniamo la collezione specifica
-db = get_database()
-segnalazione_collection = db["segnalazioni"]  # "segnalazioni" è il nome della collection che vedrai su Compass
+# Otteniamo la collezione specifica (risolta al primo accesso, non all'import)
+segnalazione_collection = collezione("segnalazioni")  # "segnalazioni" è il nome della collection che vedrai su Compass
+archive_collection = collezione("segnalazioni_archive")  # segnalazioni disattivate o più vecchie della retention
+
+TOLLERANZA_POSIZIONE_METRI = 30.0  # errore tipico della posizione GPS di uno smartphone
+BATCH_SIZE_DEFAULT = 500  # documenti per batch delle letture in streaming (iter_*)
+
+def ensure_indexes() -> None:
+    """
+    Scopo: Crea gli indici usati dalle query del repository (idempotente).
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la creazione degli indici fallisce.
+    """
+    segnalazione_collection.create_index([("status", ASCENDING)])
+    segnalazione_collection.create_index([("category", ASCENDING), ("status", ASCENDING)])
+    segnalazione_collection.create_index([("user_id", ASCENDING), ("status", ASCENDING)])
+    segnalazione_collection.create_index([("seriousness", ASCENDING), ("status", ASCENDING)])
+    segnalazione_collection.create_index([("incident_date", ASCENDING), ("status", ASCENDING)])
+    segnalazione_collection.create_index([("location", "2dsphere"), ("status", ASCENDING)])
+    # Query per orario e fascia oraria (eventualmente ristrette ad alcuni giorni della settimana)
+    segnalazione_collection.create_index([("status", ASCENDING), ("minute_of_day", ASCENDING)])
+    segnalazione_collection.create_index([("status", ASCENDING), ("day_of_week", ASCENDING),
+                                          ("minute_of_day", ASCENDING)])
+    # Lo storico è interrogato senza filtro sullo stato
+    archive_collection.create_index([("user_id", ASCENDING), ("incident_date", ASCENDING)])
+    archive_collection.create_index([("category", ASCENDING), ("incident_date", ASCENDING)])
+    archive_collection.create_index([("incident_date", ASCENDING)])
+    archive_collection.create_index([("status", ASCENDING)])
+
+def _con_storico(filtro: dict) -> list[dict]:
+    """Esegue il filtro sulla collection attiva e sull'archivio, scartando le copie di un lotto in corso di archiviazione."""
+    risultati = list(segnalazione_collection.find(filtro))
+    visti = {documento["_id"] for documento in risultati}
+    risultati.extend(documento for documento in archive_collection.find(filtro) if documento["_id"] not in visti)
+    return risultati
+
+def _cerca(filtro: dict, include_storico: bool = False) -> list[dict]:
+    """Letture a lista: solo le segnalazioni attive oppure, con lo storico, anche disattivate e archiviate."""
+    if include_storico:
+        return _con_storico(filtro)
+    return list(segnalazione_collection.find(_solo_attive(filtro)))
 
 def create_segnalazione(segnalazione: IncidentModel) -> dict:
     """
@@ -23,17 +71,51 @@ def create_segnalazione(segnalazione: IncidentModel) -> dict:
     """
     segnalazione_dict = segnalazione.to_mongo() #chiama il metodo interno alla classe del model
     result = segnalazione_collection.insert_one(segnalazione_dict)
+    registra_inserite([segnalazione_dict])
     
     # Recuperiamo l'ID generato e lo assegniamo all'oggetto
     segnalazione_dict["id"] = str(result.inserted_id)
     return segnalazione_dict
 
-def get_segnalazione_by_id(segnalazione_id: str) -> dict | None:
+def insert_segnalazioni(segnalazioni: list[dict]) -> int:
+    """
+    Scopo: Inserisce in blocco segnalazioni già serializzate e con `_id` assegnato dal client.
+
+    L'inserimento è idempotente: i documenti già presenti (errore di chiave duplicata 11000,
+    ad es. un lotto reinviato dopo un timeout o un riavvio) vengono ignorati.
+
+    Parametri:
+    - segnalazioni (list[dict]): Documenti nel formato di `IncidentModel.to_mongo()`, con `_id`.
+
+    Valore di ritorno:
+    - int: Numero di documenti effettivamente inseriti.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se l'inserimento fallisce per cause diverse dai duplicati.
+    """
+    if not segnalazioni:
+        return 0
+    try:
+        segnalazione_collection.insert_many(segnalazioni, ordered=False)
+        inserite = segnalazioni
+    except BulkWriteError as e:
+        if any(errore.get("code") != 11000 for errore in e.details.get("writeErrors", [])) \
+                or e.details.get("writeConcernErrors"):
+            raise
+        duplicati = {errore["index"] for errore in e.details.get("writeErrors", [])}
+        inserite = [documento for indice, documento in enumerate(segnalazioni) if indice not in duplicati]
+    # Include le segnalazioni veloci già disattivate nel buffer (contate come non attive)
+    registra_inserite(inserite)
+    return len(inserite)
+
+def get_segnalazione_by_id(segnalazione_id: str, include_storico: bool = False) -> dict | None:
     """
-    Scopo: Cercare e restituire una segnalazione per ID Mongo.
+    Scopo: Cercare e restituire una segnalazione per ID Mongo (passando dalla cache LRU
+    condivisa, vedi `cache_segnalazioni`).
 
     Parametri:
     - segnalazione_id (str): ID della segnalazione in formato stringa.
+    - include_storico (bool): Se True cerca anche nell'archivio (`segnalazioni_archive`).
 
     Valore di ritorno:
     - dict | None: Documento segnalazione se trovato, altrimenti None.
@@ -44,17 +126,58 @@ def get_segnalazione_by_id(segnalazione_id: str) -> dict | None:
     """
     try:
         oid = ObjectId(segnalazione_id)
-        return segnalazione_collection.find_one({"_id": oid})
+        cache = get_cache_segnalazioni()
+        if cache is not None:
+            segnalazione = cache.leggi(str(oid), include_storico)
+            if segnalazione is not None:
+                return segnalazione
+            generazione = cache.generazione()
+        segnalazione = segnalazione_collection.find_one({"_id": oid})
+        if segnalazione is None and include_storico:
+            segnalazione = archive_collection.find_one({"_id": oid})
+        if segnalazione is not None and cache is not None:
+            cache.scrivi(str(oid), segnalazione, generazione, include_storico)
+        return segnalazione
     except:
         return None
     
-def get_segnalazione_by_position(incident_longitude: float, incident_latitude: float) -> dict | None:
+def _filtro_vicinanza(incident_longitude: float, incident_latitude: float, tolleranza_metri: float) -> dict:
+    """Filtro delle segnalazioni attive entro `tolleranza_metri` dal punto, ordinate dalla più vicina (indice 2dsphere)."""
+    return {
+        "location": {"$nearSphere": {"$geometry": punto_geojson(incident_longitude, incident_latitude),
+                                     "$maxDistance": tolleranza_metri}},
+        "status": True
+    }
+
+# --- Filtri delle letture, condivisi da letture a lista, in streaming e asincrone ---
+
+def _solo_attive(filtro: dict) -> dict:
+    """Restringe il filtro alle segnalazioni attive, salvo che filtri già esplicitamente sullo stato."""
+    return {"status": True, **filtro}
+
+def _filtro_data(target_date: datetime.date) -> dict:
+    """Segnalazioni del giorno indicato (intervallo 00:00 - 23:59)."""
+    return {"incident_date": {"$gte": datetime.datetime.combine(target_date, datetime.time.min),
+                              "$lte": datetime.datetime.combine(target_date, datetime.time.max)}}
+
+def _filtro_orario(target_time: datetime.time) -> dict:
+    """Segnalazioni all'orario indicato (ora e minuti)."""
+    # Uguaglianza sul campo derivato `minute_of_day`, coperta dall'indice (status, minute_of_day)
+    return {"minute_of_day": target_time.hour * 60 + target_time.minute}
+
+def _filtro_data_e_ora(target_date: datetime.date, target_time: datetime.time) -> dict:
+    """Segnalazioni con data e orario esatti."""
+    return {"incident_date": datetime.datetime.combine(target_date, target_time)}
+
+def get_segnalazione_by_position(incident_longitude: float, incident_latitude: float,
+                                 tolleranza_metri: float = TOLLERANZA_POSIZIONE_METRI) -> dict | None:
     """
-    Scopo: Recuperare una segnalazione attiva per posizione geografica esatta.
+    Scopo: Recuperare la segnalazione attiva più vicina alla posizione indicata, entro una tolleranza in metri.
 
     Parametri:
     - incident_longitude (float): Longitudine della segnalazione.
     - incident_latitude (float): Latitudine della segnalazione.
+    - tolleranza_metri (float): Distanza massima dal punto indicato.
 
     Valore di ritorno:
     - dict | None: Documento segnalazione se trovato, altrimenti None.
@@ -63,39 +186,35 @@ def get_segnalazione_by_position(incident_longitude: float, incident_latitude: f
     - pymongo.errors.PyMongoError: se la query fallisce.
     """
 
-    return segnalazione_collection.find_one({
-        "incident_longitude": incident_longitude,
-        "incident_latitude": incident_latitude,
-        "status": True
-    })
+    return segnalazione_collection.find_one(_filtro_vicinanza(incident_longitude, incident_latitude, tolleranza_metri))
 
-def get_segnalazione_list_by_position(incident_longitude: float, incident_latitude: float) -> list[dict]:
+def get_segnalazione_list_by_position(incident_longitude: float, incident_latitude: float,
+                                      tolleranza_metri: float = TOLLERANZA_POSIZIONE_METRI) -> list[dict]:
     """
-    Scopo: Recuperare tutte le segnalazioni attive per una data posizione.
+    Scopo: Recuperare tutte le segnalazioni attive entro una tolleranza in metri da una posizione.
 
     Parametri:
     - incident_longitude (float): Longitudine della posizione.
     - incident_latitude (float): Latitudine della posizione.
+    - tolleranza_metri (float): Distanza massima dal punto indicato.
 
     Valore di ritorno:
-    - list[dict]: Lista di documenti segnalazione corrispondenti.
+    - list[dict]: Lista di documenti segnalazione corrispondenti, dalla più vicina.
 
     Eccezioni:
     - pymongo.errors.PyMongoError: se la query fallisce.
     """
 
-    return list(segnalazione_collection.find({
-        "incident_longitude": incident_longitude,
-        "incident_latitude": incident_latitude,
-        "status": True
-    }))
+    return list(segnalazione_collection.find(_filtro_vicinanza(incident_longitude, incident_latitude,
+                                                               tolleranza_metri)))
 
-def get_segnalazione_by_category(category: str) -> list[dict]:
+def get_segnalazione_by_category(category: str, include_storico: bool = False) -> list[dict]:
     """
     Scopo: Ottenere segnalazioni attive appartenenti a una categoria.
 
     Parametri:
     - category (str): Nome della categoria di segnalazione.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
 
     Valore di ritorno:
     - list[dict]: Lista di documenti segnalazione della categoria.
@@ -103,16 +222,15 @@ def get_segnalazione_by_category(category: str) -> list[dict]:
     Eccezioni:
     - pymongo.errors.PyMongoError: se la query fallisce.
     """
+    return _cerca({"category": category}, include_storico)
 
-    return list(segnalazione_collection.find({"category": category,
-                                              "status": True}))
-
-def get_segnalazione_by_user(user_id: str) -> list[dict]:
+def get_segnalazione_by_user(user_id: str, include_storico: bool = False) -> list[dict]:
     """
     Scopo: Recuperare tutte le segnalazioni attive create da un utente.
 
     Parametri:
     - user_id (str): ID dell'utente che ha creato le segnalazioni.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
 
     Valore di ritorno:
     - list[dict]: Lista di documenti segnalazione dell'utente.
@@ -120,16 +238,15 @@ def get_segnalazione_by_user(user_id: str) -> list[dict]:
     Eccezioni:
     - pymongo.errors.PyMongoError: se la query fallisce.
     """
+    return _cerca({"user_id": user_id}, include_storico)
 
-    return list(segnalazione_collection.find({"user_id": user_id,
-                                              "status": True}))
-
-def get_segnalazione_by_status(status: bool) -> list[dict]:
+def get_segnalazione_by_status(status: bool, include_storico: bool = False) -> list[dict]:
     """
     Scopo: Ottenere segnalazioni filtrate per stato (attivo/inattivo).
 
     Parametri:
     - status (bool): Stato della segnalazione (True = attiva, False = inattiva).
+    - include_storico (bool): Se True cerca anche nell'archivio (dove finiscono le segnalazioni disattivate).
 
     Valore di ritorno:
     - list[dict]: Lista di documenti segnalazione con lo stato richiesto.
@@ -137,15 +254,15 @@ def get_segnalazione_by_status(status: bool) -> list[dict]:
     Eccezioni:
     - pymongo.errors.PyMongoError: se la query fallisce.
     """
+    return _cerca({"status": status}, include_storico)
 
-    return list(segnalazione_collection.find({"status": status}))
-
-def get_segnalazione_by_date(target_date: datetime.date) -> list[dict]:
+def get_segnalazione_by_date(target_date: datetime.date, include_storico: bool = False) -> list[dict]:
     """
     Scopo: Cercare segnalazioni per data (intervallo 00:00 - 23:59 dello stesso giorno).
 
     Parametri:
     - target_date (datetime.date): Data da cercare.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
 
     Valore di ritorno:
     - list[dict]: Lista di documenti segnalazione trovati nella fascia di data.
@@ -153,17 +270,7 @@ def get_segnalazione_by_date(target_date: datetime.date) -> list[dict]:
     Eccezioni:
     - pymongo.errors.PyMongoError: se la query fallisce.
     """
-    start_dt = datetime.datetime.combine(target_date, datetime.time.min)
-    end_dt = datetime.datetime.combine(target_date, datetime.time.max)
-
-    return list(segnalazione_collection.find({
-        "incident_date": {
-            "$gte": start_dt, # Maggiore o uguale a inizio giorno
-            "$lte": end_dt    # Minore o uguale a fine giorno
-        },
-        "status": True
-    }))
-    
+    return _cerca(_filtro_data(target_date), include_storico)
 
 def get_segnalazione_by_time(target_time: datetime.time) -> list[dict]:
     """
@@ -178,17 +285,37 @@ def get_segnalazione_by_time(target_time: datetime.time) -> list[dict]:
     Eccezioni:
     - pymongo.errors.PyMongoError: se la query fallisce.
     """
-    return list(segnalazione_collection.find({
-        "$expr": {
-            "$and": [
-                # Confronta l'ora del campo DB con l'ora richiesta
-                {"$eq": [{"$hour": "$incident_date"}, target_time.hour]},
-                # Confronta i minuti del campo DB con i minuti richiesti
-                {"$eq": [{"$minute": "$incident_date"}, target_time.minute]},
-            ]
-        },
-        "status": True
-    }))
+    return _cerca(_filtro_orario(target_time))
+
+def _filtro_fascia_oraria(inizio: datetime.time, fine: datetime.time, giorni_settimana: list[int] | None) -> dict:
+    """Costruisce il filtro per la fascia [inizio, fine] sui minuti dalla mezzanotte (anche a cavallo della mezzanotte)."""
+    da, a = inizio.hour * 60 + inizio.minute, fine.hour * 60 + fine.minute
+    filtro = {"status": True}
+    if giorni_settimana:
+        filtro["day_of_week"] = {"$in": list(giorni_settimana)}
+    if da <= a:
+        filtro["minute_of_day"] = {"$gte": da, "$lte": a}
+    else:
+        filtro["$or"] = [{"minute_of_day": {"$gte": da}}, {"minute_of_day": {"$lte": a}}]
+    return filtro
+
+def get_segnalazione_by_fascia_oraria(inizio: datetime.time, fine: datetime.time,
+                                      giorni_settimana: list[int] | None = None) -> list[dict]:
+    """
+    Scopo: Cercare segnalazioni attive avvenute in una fascia oraria (es. ore di punta), con una scansione di intervallo sull'indice.
+
+    Parametri:
+    - inizio (datetime.time): Inizio della fascia (incluso, al minuto).
+    - fine (datetime.time): Fine della fascia (inclusa, al minuto); se precede `inizio` la fascia attraversa la mezzanotte.
+    - giorni_settimana (list[int], optional): Giorni da includere (1 = lunedì ... 7 = domenica).
+
+    Valore di ritorno:
+    - list[dict]: Lista di documenti segnalazione nella fascia.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return list(segnalazione_collection.find(_filtro_fascia_oraria(inizio, fine, giorni_settimana)))
 
 def get_segnalazione_by_date_and_time(target_date: datetime.date, target_time: datetime.time) -> list[dict]:
     """
@@ -204,11 +331,7 @@ def get_segnalazione_by_date_and_time(target_date: datetime.date, target_time: d
     Eccezioni:
     - pymongo.errors.PyMongoError: se la query fallisce.
     """
-    dt_to_find = datetime.datetime.combine(target_date, target_time)
-    return list(segnalazione_collection.find({
-        "incident_date": dt_to_find,
-        "status": True
-    }))
+    return _cerca(_filtro_data_e_ora(target_date, target_time))
 
 def get_segnalazione_by_seriousness(seriousness: str) -> list[dict]:
     """
@@ -223,11 +346,199 @@ def get_segnalazione_by_seriousness(seriousness: str) -> list[dict]:
     Eccezioni:
     - pymongo.errors.PyMongoError: se la query fallisce.
     """
+    return _cerca({"seriousness": seriousness})
 
-    return list(segnalazione_collection.find({
-        "seriousness": seriousness,
-        "status": True
-    }))
+# --- Letture in streaming ---
+# Varianti generatore delle letture a lista: i documenti arrivano dal server a batch di
+# `batch_size` e vengono restituiti uno alla volta, così il chiamante può iniziare a
+# elaborarli prima della fine della query e la memoria resta costante.
+
+def _itera(collection, filtro: dict, batch_size: int) -> Iterator[dict]:
+    """Restituisce i documenti del filtro uno alla volta, chiudendo il cursore anche se il chiamante si interrompe."""
+    cursore = collection.find(filtro).batch_size(batch_size)
+    try:
+        yield from cursore
+    finally:
+        cursore.close()
+
+def _itera_con_storico(filtro: dict, batch_size: int) -> Iterator[dict]:
+    """Come `_con_storico`, in streaming: in memoria restano solo gli `_id` già restituiti."""
+    visti = set()
+    for documento in _itera(segnalazione_collection, filtro, batch_size):
+        visti.add(documento["_id"])
+        yield documento
+    for documento in _itera(archive_collection, filtro, batch_size):
+        if documento["_id"] not in visti:
+            yield documento
+
+def _scorri(filtro: dict, include_storico: bool, batch_size: int) -> Iterator[dict]:
+    """Come `_cerca`, in streaming."""
+    if include_storico:
+        return _itera_con_storico(filtro, batch_size)
+    return _itera(segnalazione_collection, _solo_attive(filtro), batch_size)
+
+def iter_segnalazione_list_by_position(incident_longitude: float, incident_latitude: float,
+                                       tolleranza_metri: float = TOLLERANZA_POSIZIONE_METRI,
+                                       batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[dict]:
+    """
+    Scopo: Versione in streaming di `get_segnalazione_list_by_position`.
+
+    Parametri:
+    - incident_longitude (float): Longitudine della posizione.
+    - incident_latitude (float): Latitudine della posizione.
+    - tolleranza_metri (float): Distanza massima dal punto indicato.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - Iterator[dict]: Segnalazioni attive entro la tolleranza, dalla più vicina.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _itera(segnalazione_collection, _filtro_vicinanza(incident_longitude, incident_latitude, tolleranza_metri),
+                  batch_size)
+
+def iter_segnalazione_by_category(category: str, include_storico: bool = False,
+                                  batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[dict]:
+    """
+    Scopo: Versione in streaming di `get_segnalazione_by_category`.
+
+    Parametri:
+    - category (str): Categoria da cercare.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - Iterator[dict]: Segnalazioni della categoria.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri({"category": category}, include_storico, batch_size)
+
+def iter_segnalazione_by_user(user_id: str, include_storico: bool = False,
+                              batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[dict]:
+    """
+    Scopo: Versione in streaming di `get_segnalazione_by_user`.
+
+    Parametri:
+    - user_id (str): ID dell'utente.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - Iterator[dict]: Segnalazioni dell'utente.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri({"user_id": user_id}, include_storico, batch_size)
+
+def iter_segnalazione_by_status(status: bool, include_storico: bool = False,
+                                batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[dict]:
+    """
+    Scopo: Versione in streaming di `get_segnalazione_by_status`.
+
+    Parametri:
+    - status (bool): Stato da cercare (True = attive).
+    - include_storico (bool): Se True cerca anche nell'archivio.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - Iterator[dict]: Segnalazioni con lo stato indicato.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri({"status": status}, include_storico, batch_size)
+
+def iter_segnalazione_by_date(target_date: datetime.date, include_storico: bool = False,
+                              batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[dict]:
+    """
+    Scopo: Versione in streaming di `get_segnalazione_by_date`.
+
+    Parametri:
+    - target_date (datetime.date): Data da cercare.
+    - include_storico (bool): Se True restituisce anche le segnalazioni disattivate e archiviate.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - Iterator[dict]: Segnalazioni del giorno indicato.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri(_filtro_data(target_date), include_storico, batch_size)
+
+def iter_segnalazione_by_time(target_time: datetime.time, batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[dict]:
+    """
+    Scopo: Versione in streaming di `get_segnalazione_by_time`.
+
+    Parametri:
+    - target_time (datetime.time): Orario da cercare (ora e minuti).
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - Iterator[dict]: Segnalazioni attive all'orario indicato.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri(_filtro_orario(target_time), False, batch_size)
+
+def iter_segnalazione_by_fascia_oraria(inizio: datetime.time, fine: datetime.time,
+                                       giorni_settimana: list[int] | None = None,
+                                       batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[dict]:
+    """
+    Scopo: Versione in streaming di `get_segnalazione_by_fascia_oraria`.
+
+    Parametri:
+    - inizio (datetime.time): Inizio della fascia (incluso).
+    - fine (datetime.time): Fine della fascia (inclusa); se precede `inizio` la fascia attraversa la mezzanotte.
+    - giorni_settimana (list[int], optional): Giorni ISO (1 = lunedì) a cui limitare la ricerca.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - Iterator[dict]: Segnalazioni attive nella fascia oraria.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _itera(segnalazione_collection, _filtro_fascia_oraria(inizio, fine, giorni_settimana), batch_size)
+
+def iter_segnalazione_by_date_and_time(target_date: datetime.date, target_time: datetime.time,
+                                       batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[dict]:
+    """
+    Scopo: Versione in streaming di `get_segnalazione_by_date_and_time`.
+
+    Parametri:
+    - target_date (datetime.date): Data da cercare.
+    - target_time (datetime.time): Orario da cercare.
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - Iterator[dict]: Segnalazioni attive con data e orario esatti.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri(_filtro_data_e_ora(target_date, target_time), False, batch_size)
+
+def iter_segnalazione_by_seriousness(seriousness: str, batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[dict]:
+    """
+    Scopo: Versione in streaming di `get_segnalazione_by_seriousness`.
+
+    Parametri:
+    - seriousness (str): Livello di gravità (es. 'low', 'medium', 'high').
+    - batch_size (int): Documenti letti dal server per ogni batch.
+
+    Valore di ritorno:
+    - Iterator[dict]: Segnalazioni attive con la gravità indicata.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la query fallisce (durante l'iterazione).
+    """
+    return _scorri({"seriousness": seriousness}, False, batch_size)
 
 def delete_segnalazione(segnalazione_id: str) -> bool:
     """
@@ -246,10 +557,93 @@ def delete_segnalazione(segnalazione_id: str) -> bool:
 
     try:
         oid = ObjectId(segnalazione_id)
-        result = segnalazione_collection.update_one({
-            "_id": oid},
-            {"$set": {"status": False}}) #Per "eliminare" la segnalazione cambia lo status di essa in false, come avviene con la cancellazione del profilo utente
-        return result.modified_count > 0
+        # Il documento precedente serve a decrementare le statistiche solo se era attivo
+        prima = segnalazione_collection.find_one_and_update(
+            {"_id": oid},
+            {"$set": {"status": False}}, #Per "eliminare" la segnalazione cambia lo status di essa in false, come avviene con la cancellazione del profilo utente
+            return_document=ReturnDocument.BEFORE)
+        if prima is None:
+            # Segnalazione attiva ma già archiviata perché più vecchia della retention
+            prima = archive_collection.find_one_and_update(
+                {"_id": oid, "status": True}, {"$set": {"status": False}}, return_document=ReturnDocument.BEFORE)
+        invalida_segnalazioni(str(oid))
+        disattivata = prima is not None and prima.get("status", True) is not False
+        if disattivata:
+            registra_disattivata(prima)
+        return disattivata
     except Exception as e:
         print(f"Errore delete_segnalazione: {e}")
-        return False
\ No newline at end of file
+        return False
+
+def archivia_segnalazioni(limite: int, prima_del: datetime.datetime) -> int:
+    """
+    Scopo: Sposta un lotto di segnalazioni disattivate o più vecchie di `prima_del` nella collection `segnalazioni_archive`.
+
+    Il lotto viene prima scritto nell'archivio (replace con upsert, quindi ripetibile dopo
+    un'interruzione) e poi rimosso dalla collection attiva; una segnalazione attiva
+    disattivata nel frattempo non viene rimossa e sarà archiviata al lotto successivo.
+
+    Parametri:
+    - limite (int): Numero massimo di segnalazioni da spostare.
+    - prima_del (datetime.datetime): Le segnalazioni con `incident_date` precedente vengono archiviate anche se attive.
+
+    Valore di ritorno:
+    - int: Numero di segnalazioni rimosse dalla collection attiva.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se lettura, copia o cancellazione falliscono.
+    """
+    lotto = list(segnalazione_collection.find(
+        {"$or": [{"status": False}, {"incident_date": {"$lt": prima_del}}]}).limit(limite))
+    if not lotto:
+        return 0
+    archiviata_il = datetime.datetime.now(datetime.timezone.utc)
+    for documento in lotto:
+        documento["archived_at"] = archiviata_il
+    archive_collection.bulk_write([ReplaceOne({"_id": documento["_id"]}, documento, upsert=True)
+                                   for documento in lotto], ordered=False)
+    inattive = [documento["_id"] for documento in lotto if not documento.get("status", True)]
+    attive = [documento["_id"] for documento in lotto if documento.get("status", True)]
+    result = segnalazione_collection.delete_many({"$or": [
+        {"_id": {"$in": inattive}},
+        {"_id": {"$in": attive}, "status": True},
+    ]})
+    invalida_segnalazioni(*(str(documento["_id"]) for documento in lotto))
+    return result.deleted_count
+
+def backfill_campi_derivati(dimensione_lotto: int = 1000) -> int:
+    """
+    Scopo: Valorizza i campi derivati indicizzati (`minute_of_day`, `day_of_week`, `location`)
+    nei documenti scritti prima della loro introduzione (idempotente).
+
+    Parametri:
+    - dimensione_lotto (int): Documenti aggiornati per ogni bulk_write.
+
+    Valore di ritorno:
+    - int: Numero di documenti aggiornati, su collection attiva e archivio.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se lettura o aggiornamento falliscono.
+    """
+    aggiornati = 0
+    for collection in (segnalazione_collection, archive_collection):
+        while True:
+            lotto = list(collection.find(
+                {"$or": [{"minute_of_day": {"$exists": False}}, {"location": {"$exists": False}}]},
+                {"incident_date": 1, "incident_longitude": 1, "incident_latitude": 1}).limit(dimensione_lotto))
+            if not lotto:
+                break
+            operazioni = []
+            for documento in lotto:
+                istante = documento.get("incident_date")
+                # Le date non valide ricevono campi nulli, per non essere riselezionate al lotto successivo
+                campi = campi_orari(istante) if isinstance(istante, datetime.datetime) \
+                    else {"minute_of_day": None, "day_of_week": None}
+                longitudine, latitudine = documento.get("incident_longitude"), documento.get("incident_latitude")
+                campi["location"] = punto_geojson(longitudine, latitudine) \
+                    if isinstance(longitudine, (int, float)) and isinstance(latitudine, (int, float)) else None
+                operazioni.append(UpdateOne({"_id": documento["_id"]}, {"$set": campi}))
+            collection.bulk_write(operazioni, ordered=False)
+            invalida_segnalazioni(*(str(documento["_id"]) for documento in lotto))
+            aggiornati += len(operazioni)
+    return aggiornati
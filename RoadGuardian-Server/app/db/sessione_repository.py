@@ -0,0 +1,57 @@
+"""Refresh token revocati o già usati (collection `sessioni_revocate`), condivisi da tutti i worker.
+
+Ogni documento ha per `_id` l'identificativo (`jti`) del refresh token e scade con lui
+(indice TTL su `expires_at`). L'inserimento è la rotazione: fra due rinnovi concorrenti
+con lo stesso token, anche su worker diversi, uno solo riesce.
+"""
+
+from .connection import collezione
+from pymongo.errors import DuplicateKeyError
+import datetime
+
+# Otteniamo la collezione specifica (risolta al primo accesso, non all'import)
+sessioni_collection = collezione("sessioni_revocate")
+
+
+def ensure_indexes() -> None:
+    """
+    Scopo: Crea l'indice TTL che rimuove le revoche dei token scaduti (idempotente).
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la creazione degli indici fallisce.
+    """
+    sessioni_collection.create_index("expires_at", expireAfterSeconds=0)
+
+
+def documento_revoca(jti: str, user_id: str, scadenza: float) -> dict:
+    """Documento di revoca di un refresh token (`scadenza` in epoch, come il campo `exp` del token)."""
+    return {"_id": jti, "user_id": user_id,
+            "expires_at": datetime.datetime.fromtimestamp(scadenza, datetime.timezone.utc),
+            "revoked_at": datetime.datetime.now(datetime.timezone.utc)}
+
+
+def revoca_refresh(jti: str, user_id: str, scadenza: float) -> bool:
+    """
+    Scopo: Revoca un refresh token fino alla sua scadenza.
+
+    Parametri:
+    - jti (str): Identificativo univoco del token.
+    - user_id (str): Titolare del token.
+    - scadenza (float): Scadenza del token (epoch).
+
+    Valore di ritorno:
+    - bool: True se la revoca è nuova, False se il token era già revocato o usato.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la scrittura fallisce.
+    """
+    try:
+        sessioni_collection.insert_one(documento_revoca(jti, user_id, scadenza))
+    except DuplicateKeyError:
+        return False
+    return True
@@ -0,0 +1,359 @@
+"""Statistiche materializzate delle segnalazioni (collection `segnalazioni_stats`).
+
+Ogni documento è un contatore per una coppia (dimensione, valore): totale delle
+segnalazioni create e numero di quelle attive. Le dimensioni sono il totale generale,
+categoria, gravità, giorno dell'incidente e regione (cella di una griglia di
+1/`CELLE_REGIONE_PER_GRADO` gradi, calcolata dalle coordinate: il modello non ha la
+provincia). I contatori vengono aggiornati con `$inc` a ogni creazione e disattivazione
+e ricalcolati periodicamente da `riconcilia` con una pipeline `$merge`, che corregge gli
+incrementi persi (es. un errore tra l'inserimento e l'aggiornamento delle statistiche).
+Le dashboard leggono solo questa collection, senza aggregazioni sulle segnalazioni.
+"""
+
+import datetime
+import math
+from collections import Counter
+
+from .connection import collezione
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+# Otteniamo la collezione specifica (risolta al primo accesso, non all'import)
+stats_collection = collezione("segnalazioni_stats")
+segnalazione_collection = collezione("segnalazioni")
+lease_collection = collezione("segnalazioni_stats_lease")  # un solo documento: chi riconcilia
+
+LEASE_RICONCILIAZIONE = "riconciliazione"
+
+DIMENSIONI = ("all", "category", "seriousness", "day", "region")
+CELLE_REGIONE_PER_GRADO = 4  # celle di 0.25° (circa 28 x 20 km alle nostre latitudini)
+
+
+def ensure_indexes() -> None:
+    """
+    Scopo: Crea gli indici usati dalle letture delle statistiche (idempotente).
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la creazione degli indici fallisce.
+    """
+    stats_collection.create_index([("dimension", ASCENDING), ("value", ASCENDING)])
+
+
+def _cella(coordinata) -> float | None:
+    """Estremo inferiore della cella della griglia regionale (stesso calcolo di `_espressioni`)."""
+    if not isinstance(coordinata, (int, float)):
+        return None
+    return math.floor(coordinata * CELLE_REGIONE_PER_GRADO) / CELLE_REGIONE_PER_GRADO
+
+
+def valori_dimensioni(segnalazione: dict) -> dict:
+    """
+    Scopo: Calcola il valore di ogni dimensione delle statistiche per una segnalazione.
+
+    Parametri:
+    - segnalazione (dict): Documento nel formato di `IncidentModel.to_mongo()`.
+
+    Valore di ritorno:
+    - dict: Dimensione -> valore (None se il campo manca), con le stesse regole della
+      pipeline di `riconcilia`.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    istante = segnalazione.get("incident_date")
+    return {
+        "all": None,
+        "category": segnalazione.get("category"),
+        "seriousness": segnalazione.get("seriousness"),
+        "day": istante.strftime("%Y-%m-%d") if isinstance(istante, datetime.datetime) else None,
+        "region": {"lat": _cella(segnalazione.get("incident_latitude")),
+                   "lon": _cella(segnalazione.get("incident_longitude"))},
+    }
+
+
+def _espressioni() -> dict:
+    """Espressioni di aggregazione equivalenti a `valori_dimensioni`."""
+    def cella(campo: str) -> dict:
+        return {"$divide": [{"$floor": {"$multiply": [campo, CELLE_REGIONE_PER_GRADO]}}, CELLE_REGIONE_PER_GRADO]}
+    return {
+        "all": None,
+        "category": "$category",
+        "seriousness": "$seriousness",
+        "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$incident_date"}},
+        "region": {"lat": cella("$incident_latitude"), "lon": cella("$incident_longitude")},
+    }
+
+
+def operazioni_incremento(variazioni: Counter) -> list:
+    """
+    Scopo: Traduce le variazioni dei contatori in upsert con `$inc` per `bulk_write`.
+
+    Parametri:
+    - variazioni (Counter): Chiavi (dimensione, valore hashabile, campo) -> incremento; la regione
+      è una tupla di coppie (vedi `variazioni_inserite`).
+
+    Valore di ritorno:
+    - list[UpdateOne]: Un'operazione per coppia (dimensione, valore).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    per_chiave = {}
+    for (dimensione, valore, campo), incremento in variazioni.items():
+        if incremento:
+            per_chiave.setdefault((dimensione, valore), {})[campo] = incremento
+    adesso = datetime.datetime.now(datetime.timezone.utc)
+    operazioni = []
+    for (dimensione, valore), incrementi in per_chiave.items():
+        valore = dict(valore) if isinstance(valore, tuple) else valore
+        operazioni.append(UpdateOne(
+            {"_id": {"dimension": dimensione, "value": valore}},
+            {"$inc": incrementi, "$set": {"updated_at": adesso},
+             "$setOnInsert": {"dimension": dimensione, "value": valore}},
+            upsert=True))
+    return operazioni
+
+
+def variazioni_inserite(segnalazioni: list[dict]) -> Counter:
+    """
+    Scopo: Calcola gli incrementi dovuti all'inserimento di nuove segnalazioni.
+
+    Parametri:
+    - segnalazioni (list[dict]): Documenti inseriti (anche già disattivati, es. dal buffer).
+
+    Valore di ritorno:
+    - Counter: Incrementi di `total` e `active` per ogni (dimensione, valore).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    variazioni = Counter()
+    for segnalazione in segnalazioni:
+        attiva = 1 if segnalazione.get("status", True) is not False else 0
+        for dimensione, valore in valori_dimensioni(segnalazione).items():
+            # I dict non sono hashabili: la regione viene rappresentata come tupla di coppie
+            chiave = tuple(valore.items()) if isinstance(valore, dict) else valore
+            variazioni[(dimensione, chiave, "total")] += 1
+            variazioni[(dimensione, chiave, "active")] += attiva
+    return variazioni
+
+
+def variazioni_disattivata(segnalazione: dict) -> Counter:
+    """
+    Scopo: Calcola i decrementi dovuti alla disattivazione (soft delete) di una segnalazione attiva.
+
+    Parametri:
+    - segnalazione (dict): Documento com'era prima della disattivazione.
+
+    Valore di ritorno:
+    - Counter: Decremento di `active` per ogni (dimensione, valore).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return Counter({(dimensione, tuple(valore.items()) if isinstance(valore, dict) else valore, "active"): -1
+                    for dimensione, valore in valori_dimensioni(segnalazione).items()})
+
+
+def _applica(variazioni: Counter) -> None:
+    """Scrive le variazioni; un errore non fa fallire la scrittura della segnalazione (la corregge `riconcilia`)."""
+    operazioni = operazioni_incremento(variazioni)
+    if not operazioni:
+        return
+    try:
+        stats_collection.bulk_write(operazioni, ordered=False)
+    except Exception as e:
+        print(f"Errore aggiornamento statistiche segnalazioni: {e}")
+
+
+def registra_inserite(segnalazioni: list[dict]) -> None:
+    """
+    Scopo: Aggiorna le statistiche dopo l'inserimento di segnalazioni.
+
+    Parametri:
+    - segnalazioni (list[dict]): Documenti effettivamente inseriti.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista (gli errori vengono registrati nel log).
+    """
+    _applica(variazioni_inserite(segnalazioni))
+
+
+def registra_disattivata(segnalazione: dict) -> None:
+    """
+    Scopo: Aggiorna le statistiche dopo la disattivazione di una segnalazione attiva.
+
+    Parametri:
+    - segnalazione (dict): Documento com'era prima della disattivazione.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista (gli errori vengono registrati nel log).
+    """
+    _applica(variazioni_disattivata(segnalazione))
+
+
+def filtro_statistiche(dimensione: str | None = None, dal: datetime.date | None = None,
+                       al: datetime.date | None = None) -> dict:
+    """
+    Scopo: Costruisce il filtro sulle statistiche per dimensione ed eventuale intervallo di giorni.
+
+    Parametri:
+    - dimensione (str, optional): Una delle `DIMENSIONI`; None per tutte.
+    - dal (datetime.date, optional): Primo giorno incluso (solo per la dimensione "day").
+    - al (datetime.date, optional): Ultimo giorno incluso (solo per la dimensione "day").
+
+    Valore di ritorno:
+    - dict: Filtro MongoDB.
+
+    Eccezioni:
+    - ValueError: Se la dimensione non è tra `DIMENSIONI`.
+    """
+    if dimensione is not None and dimensione not in DIMENSIONI:
+        raise ValueError(f"Dimensione non valida: {dimensione}")
+    filtro = {"dimension": dimensione} if dimensione is not None else {}
+    if dal is not None or al is not None:
+        giorni = {}
+        if dal is not None:
+            giorni["$gte"] = dal.isoformat()
+        if al is not None:
+            giorni["$lte"] = al.isoformat()
+        # L'intervallo restringe solo i giorni, le altre dimensioni restano complete
+        filtro = {**filtro, "$or": [{"dimension": {"$ne": "day"}}, {"dimension": "day", "value": giorni}]} \
+            if dimensione is None else {**filtro, "value": giorni}
+    return filtro
+
+
+def get_statistiche(dimensione: str | None = None, dal: datetime.date | None = None,
+                    al: datetime.date | None = None) -> list[dict]:
+    """
+    Scopo: Legge i contatori materializzati.
+
+    Parametri:
+    - dimensione (str, optional): Una delle `DIMENSIONI`; None per tutte.
+    - dal (datetime.date, optional): Primo giorno incluso (dimensione "day").
+    - al (datetime.date, optional): Ultimo giorno incluso (dimensione "day").
+
+    Valore di ritorno:
+    - list[dict]: Documenti con `dimension`, `value`, `total` e `active`.
+
+    Eccezioni:
+    - ValueError: Se la dimensione non è valida.
+    - pymongo.errors.PyMongoError: se la query fallisce.
+    """
+    return list(stats_collection.find(filtro_statistiche(dimensione, dal, al),
+                                      {"_id": 0, "dimension": 1, "value": 1, "total": 1, "active": 1}))
+
+
+def pipeline_riconciliazione(istante: datetime.datetime) -> list[dict]:
+    """
+    Scopo: Costruisce la pipeline che ricalcola i contatori di tutte le dimensioni con una sola
+    scansione di collection attiva e archivio e li scrive in `segnalazioni_stats` con `$merge`.
+
+    Ogni segnalazione viene proiettata in una coppia (dimensione, valore) per dimensione e
+    `$unwind` la espande prima del raggruppamento.
+
+    Parametri:
+    - istante (datetime.datetime): Marca `reconciled_at` dei documenti scritti.
+
+    Valore di ritorno:
+    - list[dict]: Stadi di aggregazione da eseguire sulla collection `segnalazioni`.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    espressioni = _espressioni()
+    return [
+        {"$unionWith": "segnalazioni_archive"},
+        {"$project": {"_id": 0, "status": 1, "chiavi": [
+            {"dimension": {"$literal": dimensione}, "value": espressioni[dimensione]} for dimensione in DIMENSIONI
+        ]}},
+        {"$unwind": "$chiavi"},
+        {"$group": {
+            "_id": "$chiavi",
+            "total": {"$sum": 1},
+            "active": {"$sum": {"$cond": [{"$ne": ["$status", False]}, 1, 0]}},
+        }},
+        {"$project": {"dimension": "$_id.dimension", "value": "$_id.value", "total": 1, "active": 1,
+                      "updated_at": {"$literal": istante}, "reconciled_at": {"$literal": istante}}},
+        {"$merge": {"into": "segnalazioni_stats", "on": "_id", "whenMatched": "replace",
+                    "whenNotMatched": "insert"}},
+    ]
+
+
+def riconcilia() -> int:
+    """
+    Scopo: Ricalcola tutti i contatori dalle segnalazioni (attive e archiviate) e rimuove
+    quelli dei valori che non compaiono più.
+
+    Gli incrementi concorrenti alla scansione possono essere sovrascritti dal valore
+    ricalcolato: la differenza viene corretta alla riconciliazione successiva. Una
+    segnalazione in corso di archiviazione (presente in entrambe le collection) può essere
+    contata due volte fino al ciclo successivo.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - int: Contatori rimossi perché non più presenti.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se l'aggregazione o la pulizia falliscono.
+    """
+    istante = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    segnalazione_collection.aggregate(pipeline_riconciliazione(istante))
+    # I contatori creati da `$inc` dopo la scansione non hanno `reconciled_at` e restano
+    return stats_collection.delete_many({"reconciled_at": {"$lt": istante}}).deleted_count
+
+
+def acquisisci_lease(titolare: str, durata: float) -> bool:
+    """
+    Scopo: Prende (o rinnova) il lease della riconciliazione, così che fra tutti i processi
+    una sola istanza ricalcoli le statistiche.
+
+    Parametri:
+    - titolare (str): Identificativo del processo richiedente.
+    - durata (float): Secondi di validità del lease da adesso.
+
+    Valore di ritorno:
+    - bool: True se il lease è del richiedente, False se è di un altro processo e non è scaduto.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la scrittura fallisce.
+    """
+    adesso = datetime.datetime.now(datetime.timezone.utc)
+    try:
+        lease_collection.update_one(
+            {"_id": LEASE_RICONCILIAZIONE, "$or": [{"holder": titolare}, {"until": {"$lt": adesso}}]},
+            {"$set": {"holder": titolare, "until": adesso + datetime.timedelta(seconds=durata)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False  # il documento esiste ed è di un altro processo: l'upsert collide sull'_id
+    return True
+
+
+def rilascia_lease(titolare: str) -> bool:
+    """
+    Scopo: Rilascia il lease della riconciliazione se è del richiedente (es. allo shutdown).
+
+    Parametri:
+    - titolare (str): Identificativo del processo.
+
+    Valore di ritorno:
+    - bool: True se il lease è stato rilasciato.
+
+    Eccezioni:
+    - pymongo.errors.PyMongoError: se la cancellazione fallisce.
+    """
+    return lease_collection.delete_one({"_id": LEASE_RICONCILIAZIONE, "holder": titolare}).deleted_count == 1
@@ -0,0 +1,122 @@
+"""Selezione del backend di storage dei repository.
+
+I repository usano le collection tramite l'interfaccia `Collezione` (il sottoinsieme
+dell'API pymongo che serve loro) e non sanno quale motore c'è dietro:
+- STORAGE_BACKEND=mongo (default): collection pymongo del client di `connection.py`;
+- STORAGE_BACKEND=memory: motore in memoria di `memoria.py`, senza server MongoDB.
+  Con STORAGE_MEMORIA_FILE i dati vengono caricati all'avvio e salvati allo shutdown.
+"""
+
+import os
+import threading
+from typing import Any, Iterable, List, Optional, Protocol
+
+from db.memoria import DatabaseMemoria, DatabaseMemoriaAsync
+
+BACKEND_MONGO = "mongo"
+BACKEND_MEMORIA = "memory"
+
+_database_memoria: Optional[DatabaseMemoria] = None
+_database_memoria_async: Optional[DatabaseMemoriaAsync] = None
+_memoria_lock = threading.Lock()
+
+
+class Collezione(Protocol):
+    """Operazioni sulle collection usate dai repository, offerte da entrambi i backend."""
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **opzioni) -> Any: ...
+    def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **opzioni) -> Optional[dict]: ...
+    def insert_one(self, document: dict, **opzioni) -> Any: ...
+    def insert_many(self, documents: Iterable[dict], ordered: bool = True, **opzioni) -> Any: ...
+    def update_one(self, filter: dict, update: dict, upsert: bool = False, **opzioni) -> Any: ...
+    def update_many(self, filter: dict, update: dict, upsert: bool = False, **opzioni) -> Any: ...
+    def find_one_and_update(self, filter: dict, update: dict, **opzioni) -> Optional[dict]: ...
+    def delete_many(self, filter: dict, **opzioni) -> Any: ...
+    def bulk_write(self, requests: List[Any], ordered: bool = True, **opzioni) -> Any: ...
+    def aggregate(self, pipeline: List[dict], **opzioni) -> Any: ...
+    def count_documents(self, filter: dict, **opzioni) -> int: ...
+    def create_index(self, keys, **opzioni) -> str: ...
+
+
+def backend_storage() -> str:
+    """
+    Scopo: Restituisce il backend di storage configurato (STORAGE_BACKEND).
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - str: BACKEND_MONGO o BACKEND_MEMORIA.
+
+    Eccezioni:
+    - ValueError: Se il backend configurato non esiste.
+    """
+    backend = os.environ.get("STORAGE_BACKEND", BACKEND_MONGO).strip().lower()
+    if backend not in (BACKEND_MONGO, BACKEND_MEMORIA):
+        raise ValueError(f"STORAGE_BACKEND non valido: {backend}")
+    return backend
+
+
+def get_database_memoria(nome: str) -> DatabaseMemoria:
+    """
+    Scopo: Restituisce il database in memoria del processo, creandolo (ed eventualmente
+    caricandolo da STORAGE_MEMORIA_FILE) al primo uso.
+
+    Parametri:
+    - nome (str): Nome del database.
+
+    Valore di ritorno:
+    - DatabaseMemoria: Database condiviso dai repository sincroni.
+
+    Eccezioni:
+    - OSError: Se il file di persistenza esiste ma non è leggibile.
+    """
+    global _database_memoria
+    if _database_memoria is None:
+        with _memoria_lock:
+            if _database_memoria is None:
+                _database_memoria = DatabaseMemoria(nome, os.environ.get("STORAGE_MEMORIA_FILE") or None)
+    return _database_memoria
+
+
+def get_database_memoria_async(nome: str) -> DatabaseMemoriaAsync:
+    """
+    Scopo: Restituisce la vista asincrona (stessi dati) del database in memoria.
+
+    Parametri:
+    - nome (str): Nome del database.
+
+    Valore di ritorno:
+    - DatabaseMemoriaAsync: Vista usata dai repository asincroni.
+
+    Eccezioni:
+    - OSError: Se il file di persistenza esiste ma non è leggibile.
+    """
+    global _database_memoria_async
+    database = get_database_memoria(nome)
+    if _database_memoria_async is None or _database_memoria_async._database is not database:
+        with _memoria_lock:
+            if _database_memoria_async is None or _database_memoria_async._database is not database:
+                _database_memoria_async = DatabaseMemoriaAsync(database)
+    return _database_memoria_async
+
+
+def chiudi_database_memoria() -> None:
+    """
+    Scopo: Salva (se configurato STORAGE_MEMORIA_FILE) e rilascia il database in memoria.
+
+    Parametri: Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna: gli errori di salvataggio vengono loggati.
+    """
+    global _database_memoria, _database_memoria_async
+    with _memoria_lock:
+        database, _database_memoria, _database_memoria_async = _database_memoria, None, None
+    if database is not None:
+        try:
+            database.close()
+        except OSError as e:
+            print(f"Storage in memoria: salvataggio fallito: {e}")
@@ -1,19 +1,96 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from api import profilo_utente_api, mappa_api, segnalazione_api
+from api import profilo_utente_api, mappa_api, segnalazione_api, metriche_api
+from db.connection import get_database, avvia_client, chiudi_client, statistiche_pool
+from db.async_connection import close_async_client, riscalda_pool_async
+import db.segnalazione_repository as segnalazione_repo
+import db.profilo_utente_repository as utente_repo
+import db.statistiche_repository as statistiche_repo
+import db.sessione_repository as sessione_repo
+from services.servizi_condivisi import get_servizio, chiudi_servizi
+from services.mappa_service import MappaService
+from services.profilo_utente_service import ProfiloUtenteService
+from services.segnalazione_service import SegnalazioneService
+from services.buffer_segnalazioni import buffer_abilitato, get_buffer_segnalazioni
+from services.archiviatore_segnalazioni import get_archiviatore
+from services.riconciliatore_statistiche import get_riconciliatore
+from services.token_sessione import get_gestore_token
+from services.hash_password import get_hasher_password
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Scopo: Gestisce il ciclo di vita dei singleton applicativi.
+
+    All'avvio verifica la configurazione dei token di sessione (senza SESSIONE_SEGRETO il
+    processo non parte), avvia il pool di processi per l'hashing delle password, crea il
+    client MongoDB con le opzioni di pool d'ambiente e ne riscalda le connessioni prima
+    di accettare traffico, riprende le segnalazioni veloci rimaste nel
+    log del buffer write-behind, poi crea le istanze condivise dei service (operazione
+    leggera: Firebase e il dispatcher delle notifiche vengono inizializzati solo al primo
+    invio) e avvia archiviatore e riconciliatore delle statistiche; allo shutdown scrive le
+    segnalazioni ancora nel buffer, ferma archiviatore e riconciliatore, svuota la coda
+    delle notifiche, ferma worker e outbox e chiude i client MongoDB.
+
+    Parametri:
+    - app (FastAPI): Applicazione in avvio.
+
+    Valore di ritorno:
+    - AsyncIterator[None]
+
+    Eccezioni:
+    - RuntimeError: Se SESSIONE_SEGRETO non è impostato.
+    """
+    # Prima di tutto il resto: con un segreto mancante non ha senso accettare traffico
+    get_gestore_token()
+    # Processi dell'hashing delle password avviati ora (forkserver), non al primo login
+    get_hasher_password().avvia()
+    if avvia_client():
+        await riscalda_pool_async()
+        try:
+            segnalazione_repo.ensure_indexes()
+            utente_repo.ensure_indexes()
+            statistiche_repo.ensure_indexes()
+            sessione_repo.ensure_indexes()
+            aggiornate = segnalazione_repo.backfill_campi_derivati()
+            if aggiornate:
+                print(f"Campi derivati valorizzati su {aggiornate} segnalazioni esistenti")
+        except Exception as e:
+            print(f"Impossibile creare gli indici o completare il backfill all'avvio: {e}")
+    if buffer_abilitato():
+        # Riprende le segnalazioni veloci accettate ma non ancora scritte prima dell'ultimo arresto
+        get_buffer_segnalazioni()
+    db = get_database()
+    for classe in (MappaService, ProfiloUtenteService, SegnalazioneService):
+        get_servizio(classe, db)
+    # Sposta periodicamente le segnalazioni disattivate o scadute in `segnalazioni_archive`
+    get_archiviatore()
+    # Ricalcola all'avvio e poi periodicamente le statistiche materializzate (`segnalazioni_stats`)
+    get_riconciliatore()
+    yield
+    chiudi_servizi()
+    await close_async_client()
+    chiudi_client()
 
 # Creazione dell'app FastAPI
-app = FastAPI(title="RoadGuardian Server")
+app = FastAPI(title="RoadGuardian Server", lifespan=lifespan)
 
 # Registrazione del router
 app.include_router(profilo_utente_api.router)
 app.include_router(mappa_api.router)
 app.include_router(segnalazione_api.router)
+app.include_router(metriche_api.router)
 
 @app.get("/")
 def root():
     return {"message": "Server RoadGuardian attivo!"}
 
+@app.get("/db/pool")
+def get_pool_metrics():
+    """Espone opzioni e contatori del pool di connessioni MongoDB."""
+    return statistiche_pool()
+
 if __name__ == "__main__":
     # Avvia il server
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
@@ -2,6 +2,36 @@ from datetime import date, time, datetime
 from typing import Optional, Literal, Any
 from pydantic import BaseModel, ConfigDict, Field, model_validator
 
+def campi_orari(istante: datetime) -> dict:
+    """Scopo: Calcolare i campi derivati dall'istante della segnalazione usati dalle query per fascia oraria.
+
+    Parametri:
+    - istante (datetime): Data e ora dell'incidente.
+
+    Valore di ritorno:
+    - dict: `minute_of_day` (0-1439, minuti dalla mezzanotte) e `day_of_week`
+        (1 = lunedì ... 7 = domenica, come `isoweekday`).
+
+    Eccezioni:
+    - AttributeError: se `istante` non è un datetime.
+    """
+    return {"minute_of_day": istante.hour * 60 + istante.minute, "day_of_week": istante.isoweekday()}
+
+def punto_geojson(longitudine: float, latitudine: float) -> dict:
+    """Scopo: Costruire il punto GeoJSON indicizzato (2dsphere) nel campo `location`.
+
+    Parametri:
+    - longitudine (float): Longitudine in gradi decimali.
+    - latitudine (float): Latitudine in gradi decimali.
+
+    Valore di ritorno:
+    - dict: Punto GeoJSON `{"type": "Point", "coordinates": [longitudine, latitudine]}`.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return {"type": "Point", "coordinates": [longitudine, latitudine]}
+
 class IncidentModel(BaseModel):
     """Rappresenta una segnalazione e gestisce conversioni per MongoDB.
 
@@ -59,7 +89,9 @@ class IncidentModel(BaseModel):
         Valore di ritorno:
         - dict: Dizionario pronto per l'inserimento in MongoDB. Combina
             `incident_date` e `incident_time` in un unico `datetime` sotto la chiave
-            `incident_date` e rimuove `incident_time` se presente.
+            `incident_date` e rimuove `incident_time` se presente; aggiunge i campi
+            indicizzati `minute_of_day` e `day_of_week` (vedi `campi_orari`) e il
+            punto GeoJSON `location`.
 
         Eccezioni:
         - TypeError: se `incident_date` o `incident_time` non sono tipi compatibili
@@ -73,6 +105,8 @@ class IncidentModel(BaseModel):
             # Rimuove il campo time separato, mantenendo solo il datetime combinato
             if 'incident_time' in data:
                 del data['incident_time']
+            data.update(campi_orari(dt))
+        data['location'] = punto_geojson(self.incident_longitude, self.incident_latitude)
 
         return data
 
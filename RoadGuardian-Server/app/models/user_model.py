@@ -87,6 +87,27 @@ class UserModelDTO(BaseModel):
 
     model_config = ConfigDict(populate_by_name = True)
 
+class UserSessionDTO(UserModelDTO):
+    """
+    Scopo: DTO di output del login: dati utente più i token della sessione.
+
+    Parametri:
+    - access_token (str): Token di breve durata da inviare come `Authorization: Bearer`.
+    - refresh_token (str): Token per ottenere una nuova coppia senza reinviare le credenziali.
+    - token_type (str): Sempre "bearer".
+    - expires_in (int): Validità dell'access token in secondi.
+
+    Valore di ritorno:
+    - UserSessionDTO: Oggetto per risposta API.
+
+    Eccezioni:
+    - ValidationError: Se i dati non sono validi.
+    """
+    access_token: str
+    refresh_token: str
+    token_type: str = "bearer"
+    expires_in: int
+
 class UserModelChangeDTO(BaseModel):
     """
     Scopo: DTO per aggiornamenti parziali o cancellazione logica dell'utente.
@@ -0,0 +1,155 @@
+"""Primitive di metrica in-process (contatori e istogrammi di latenza e di valori).
+
+Usate dai sottosistemi che devono esporre profondità delle code, latenze
+e conteggi senza dipendere da librerie esterne.
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Optional
+
+# Limiti superiori dei bucket in millisecondi
+BUCKET_MS_DEFAULT = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+
+class Contatore:
+    """Contatore monotono thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valore = 0
+
+    def incrementa(self, n: int = 1) -> None:
+        """
+        Scopo: Incrementa il contatore.
+
+        Parametri:
+        - n (int): Quantità da aggiungere.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            self._valore += n
+
+    @property
+    def valore(self) -> int:
+        return self._valore
+
+
+class Istogramma:
+    """Istogramma a bucket fissi per valori non negativi (es. documenti restituiti), con percentili approssimati."""
+
+    def __init__(self, bucket: List[float]):
+        self._bucket = list(bucket)
+        self._conteggi = [0] * (len(self._bucket) + 1)  # ultimo bucket = +inf
+        self._lock = threading.Lock()
+        self._count = 0
+        self._somma = 0.0
+        self._max = 0.0
+
+    def osserva(self, valore: float) -> None:
+        """
+        Scopo: Registra un valore.
+
+        Parametri:
+        - valore (float): Valore osservato.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        idx = bisect.bisect_left(self._bucket, valore)
+        with self._lock:
+            self._conteggi[idx] += 1
+            self._count += 1
+            self._somma += valore
+            if valore > self._max:
+                self._max = valore
+
+    def _percentile(self, q: float) -> float:
+        """Restituisce il limite superiore del bucket che contiene il quantile q (lock già acquisito)."""
+        if self._count == 0:
+            return 0.0
+        soglia = q * self._count
+        cumulato = 0
+        for idx, n in enumerate(self._conteggi):
+            cumulato += n
+            if cumulato >= soglia:
+                return self._bucket[idx] if idx < len(self._bucket) else self._max
+        return self._max
+
+    def _riepilogo(self, suffisso: str) -> Dict[str, float]:
+        with self._lock:
+            cumulato = 0
+            bucket = {}
+            for limite, n in zip(self._bucket + ["+Inf"], self._conteggi):
+                cumulato += n
+                bucket[str(limite)] = cumulato
+            return {
+                "count": self._count,
+                f"sum{suffisso}": round(self._somma, 3),
+                f"avg{suffisso}": round(self._somma / self._count, 3) if self._count else 0.0,
+                f"p50{suffisso}": self._percentile(0.50),
+                f"p95{suffisso}": self._percentile(0.95),
+                f"p99{suffisso}": self._percentile(0.99),
+                f"max{suffisso}": round(self._max, 3),
+                "buckets": bucket,
+            }
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Scopo: Restituisce un riepilogo dell'istogramma.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - Dict[str, float]: count, sum, avg, p50, p95, p99, max e bucket cumulativi.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return self._riepilogo("")
+
+
+class IstogrammaLatenza(Istogramma):
+    """Istogramma a bucket fissi per latenze, con percentili approssimati."""
+
+    def __init__(self, bucket_ms: Optional[List[float]] = None):
+        super().__init__(bucket_ms or BUCKET_MS_DEFAULT)
+
+    def osserva(self, secondi: float) -> None:
+        """
+        Scopo: Registra una misura di latenza.
+
+        Parametri:
+        - secondi (float): Durata misurata in secondi.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        super().osserva(secondi * 1000.0)
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Scopo: Restituisce un riepilogo dell'istogramma.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - Dict[str, float]: count, avg_ms, p50_ms, p95_ms, p99_ms, max_ms e bucket cumulativi.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return self._riepilogo("_ms")
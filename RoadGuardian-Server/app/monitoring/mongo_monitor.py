@@ -0,0 +1,292 @@
+"""Monitoraggio dei comandi inviati a MongoDB.
+
+`MonitorComandi` è un `CommandListener` di pymongo registrato sui client sincrono e
+asincrono: per ogni comando registra latenza e documenti restituiti in istogrammi
+raggruppati per comando e funzione del repository che l'ha inviato, e scrive nel log
+delle query lente (con la forma del filtro, senza i valori) i comandi oltre la soglia.
+Il motore in memoria (STORAGE_BACKEND=memory) non genera eventi.
+"""
+
+import json
+import os
+import sys
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+from pymongo import monitoring
+
+from monitoring.metriche import Contatore, Istogramma, IstogrammaLatenza
+
+# Comandi di handshake e autenticazione, non generati dai repository
+_COMANDI_IGNORATI = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions",
+                     "buildInfo", "getnonce", "authenticate"}
+# Campo del comando che contiene il filtro
+_CAMPI_FILTRO = {"find": "filter", "count": "query", "distinct": "query", "findAndModify": "query",
+                 "aggregate": "pipeline"}
+BUCKET_DOCUMENTI = [0, 1, 10, 100, 1000, 10000, 100000]
+
+_monitor: Optional["MonitorComandi"] = None
+_monitor_lock = threading.Lock()
+
+
+def forma_query(valore):
+    """
+    Scopo: Riduce un filtro alla sua forma, sostituendo i valori con il nome del tipo.
+
+    Parametri:
+    - valore: Filtro (o parte di filtro) da descrivere.
+
+    Valore di ritorno:
+    - Struttura con le stesse chiavi e operatori del filtro; le liste diventano l'elenco
+      delle forme distinte dei loro elementi.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    if isinstance(valore, dict):
+        return {chiave: forma_query(v) for chiave, v in valore.items()}
+    if isinstance(valore, (list, tuple)):
+        forme = []
+        for elemento in valore:
+            forma = forma_query(elemento)
+            if forma not in forme:
+                forme.append(forma)
+        return forme
+    return type(valore).__name__
+
+
+def forma_comando(nome: str, comando: dict):
+    """
+    Scopo: Descrive la forma del filtro di un comando MongoDB.
+
+    Parametri:
+    - nome (str): Nome del comando (es. "find", "update").
+    - comando (dict): Documento del comando come inviato al server.
+
+    Valore di ritorno:
+    - Forma del filtro (vedi `forma_query`), la lista delle forme dei filtri per update e
+      delete, None per i comandi senza filtro (insert, getMore, ...).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    if nome in _CAMPI_FILTRO:
+        return forma_query(comando.get(_CAMPI_FILTRO[nome], {}))
+    if nome in ("update", "delete"):
+        return forma_query([operazione.get("q", {}) for operazione in comando.get(f"{nome}s", [])])
+    return None
+
+
+def documenti_restituiti(risposta: dict) -> int:
+    """
+    Scopo: Conta i documenti restituiti (o modificati, per le scritture) da un comando.
+
+    Parametri:
+    - risposta (dict): Risposta del server.
+
+    Valore di ritorno:
+    - int: Documenti del batch per find/aggregate/getMore, 0 o 1 per findAndModify,
+      il campo `n` per count e scritture.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    cursore = risposta.get("cursor")
+    if isinstance(cursore, dict):
+        return len(cursore.get("firstBatch", cursore.get("nextBatch", [])))
+    if "value" in risposta:
+        return 1 if risposta["value"] is not None else 0
+    return int(risposta.get("n", 0))
+
+
+def _funzione_chiamante() -> str:
+    """Funzione di repository più esterna nello stack corrente, es. "segnalazione_repository.get_segnalazione_by_user"."""
+    frame, chiamante = sys._getframe(2), None
+    while frame is not None:
+        modulo = frame.f_globals.get("__name__", "")
+        if modulo.endswith("_repository"):
+            chiamante = f"{modulo.rsplit('.', 1)[-1]}.{frame.f_code.co_name}"
+        elif chiamante is not None:
+            break
+        frame = frame.f_back
+    return chiamante or "altro"
+
+
+class MonitorComandi(monitoring.CommandListener):
+    """
+    Listener dei comandi MongoDB con istogrammi per (comando, funzione chiamante) e log delle query lente.
+
+    La funzione chiamante viene ricavata dallo stack all'avvio del comando: il listener è
+    invocato nel thread (o nel task asyncio) che esegue la query.
+    """
+
+    def __init__(self, soglia_lente_ms: float = 100.0, max_lente: int = 200):
+        """
+        Scopo: Configura il listener.
+
+        Parametri:
+        - soglia_lente_ms (float): Durata oltre la quale un comando finisce nel log delle query lente.
+        - max_lente (int): Query lente conservate in memoria per la route di debug.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self.soglia_lente_ms = soglia_lente_ms
+        self._lock = threading.Lock()
+        self._in_corso: Dict[tuple, tuple] = {}
+        self._statistiche: Dict[tuple, dict] = {}
+        self._lente = deque(maxlen=max_lente)
+        self.comandi_lenti = Contatore()
+
+    def _chiave_evento(self, event) -> tuple:
+        return event.connection_id, event.request_id
+
+    def _statistiche_per(self, comando: str, chiamante: str, collection: Optional[str]) -> dict:
+        chiave = (comando, chiamante, collection)
+        with self._lock:
+            statistiche = self._statistiche.get(chiave)
+            if statistiche is None:
+                statistiche = {"latenza": IstogrammaLatenza(), "documenti": Istogramma(BUCKET_DOCUMENTI),
+                               "errori": Contatore()}
+                self._statistiche[chiave] = statistiche
+            return statistiche
+
+    def started(self, event) -> None:
+        if event.command_name in _COMANDI_IGNORATI:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = event.command.get("collection")  # getMore
+        with self._lock:
+            self._in_corso[self._chiave_evento(event)] = (
+                _funzione_chiamante(), collection, forma_comando(event.command_name, event.command))
+
+    def succeeded(self, event) -> None:
+        with self._lock:
+            avvio = self._in_corso.pop(self._chiave_evento(event), None)
+        if avvio is None:
+            return
+        chiamante, collection, forma = avvio
+        statistiche = self._statistiche_per(event.command_name, chiamante, collection)
+        statistiche["latenza"].osserva(event.duration_micros / 1e6)
+        documenti = documenti_restituiti(event.reply)
+        statistiche["documenti"].osserva(documenti)
+        durata_ms = event.duration_micros / 1000.0
+        if durata_ms >= self.soglia_lente_ms:
+            self._registra_lenta(event.command_name, chiamante, collection, forma, durata_ms, documenti)
+
+    def failed(self, event) -> None:
+        with self._lock:
+            avvio = self._in_corso.pop(self._chiave_evento(event), None)
+        if avvio is None:
+            return
+        chiamante, collection, _ = avvio
+        statistiche = self._statistiche_per(event.command_name, chiamante, collection)
+        statistiche["latenza"].osserva(event.duration_micros / 1e6)
+        statistiche["errori"].incrementa()
+
+    def _registra_lenta(self, comando: str, chiamante: str, collection: Optional[str], forma,
+                        durata_ms: float, documenti: int) -> None:
+        self.comandi_lenti.incrementa()
+        voce = {"command": comando, "caller": chiamante, "collection": collection, "shape": forma,
+                "duration_ms": round(durata_ms, 3), "documents": documenti}
+        self._lente.append(voce)
+        print(f"MongoDB: query lenta {durata_ms:.1f} ms {chiamante} {comando} {collection} "
+              f"{json.dumps(forma, default=str)}")
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone gli istogrammi per comando e funzione chiamante.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Soglia e numero delle query lente, comandi in corso e, per ogni coppia
+          (comando, chiamante), latenza, documenti restituiti ed errori, ordinati per
+          tempo totale decrescente.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            voci = list(self._statistiche.items())
+            in_corso = len(self._in_corso)
+        comandi = [{
+            "command": comando, "caller": chiamante, "collection": collection,
+            "latency": statistiche["latenza"].snapshot(), "documents": statistiche["documenti"].snapshot(),
+            "errors": statistiche["errori"].valore,
+        } for (comando, chiamante, collection), statistiche in voci]
+        comandi.sort(key=lambda voce: voce["latency"]["sum_ms"], reverse=True)
+        return {
+            "slow_threshold_ms": self.soglia_lente_ms,
+            "slow_commands": self.comandi_lenti.valore,
+            "in_flight": in_corso,
+            "commands": comandi,
+        }
+
+    def query_lente(self, limite: Optional[int] = None) -> List[dict]:
+        """
+        Scopo: Restituisce le ultime query lente registrate, dalla più recente.
+
+        Parametri:
+        - limite (int, optional): Numero massimo di voci.
+
+        Valore di ritorno:
+        - list[dict]: Comando, funzione chiamante, collection, forma del filtro, durata e documenti.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        voci = list(self._lente)[::-1]
+        return voci if limite is None else voci[:limite]
+
+
+def get_monitor_comandi() -> Optional[MonitorComandi]:
+    """
+    Scopo: Restituisce il listener dei comandi condiviso dai client MongoDB del processo.
+
+    Configurazione: MONGO_MONITORAGGIO_COMANDI (0 per disattivarlo), MONGO_SLOW_QUERY_MS
+    (soglia del log delle query lente) e MONGO_SLOW_QUERY_MAX (voci conservate).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - MonitorComandi | None: Istanza singleton, None se il monitoraggio è disattivato.
+
+    Eccezioni:
+    - ValueError: Se la configurazione d'ambiente non è valida.
+    """
+    global _monitor
+    if os.environ.get("MONGO_MONITORAGGIO_COMANDI", "1") != "1":
+        return None
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                _monitor = MonitorComandi(
+                    soglia_lente_ms=float(os.environ.get("MONGO_SLOW_QUERY_MS", "100")),
+                    max_lente=int(os.environ.get("MONGO_SLOW_QUERY_MAX", "200"))
+                )
+    return _monitor
+
+
+def listener_client() -> list:
+    """
+    Scopo: Elenca i listener dei comandi da passare a `event_listeners` dei client MongoDB.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - list: Il monitor dei comandi, oppure lista vuota se disattivato.
+
+    Eccezioni:
+    - ValueError: Se la configurazione d'ambiente non è valida.
+    """
+    monitor = get_monitor_comandi()
+    return [monitor] if monitor is not None else []
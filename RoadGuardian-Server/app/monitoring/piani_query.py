@@ -0,0 +1,481 @@
+"""Harness di regressione dei piani di esecuzione delle query dei repository.
+
+Popola un database di prova con un dataset sintetico, esegue ogni funzione di
+`segnalazione_repository` e `profilo_utente_repository` registrando le operazioni che
+invia alle collection, e per ciascuna chiede a MongoDB `explain` con verbosità
+"executionStats". Una query è in violazione se:
+- il piano vincente contiene un COLLSCAN (salvo le funzioni di manutenzione ammesse);
+- il rapporto documenti esaminati / restituiti supera la soglia;
+- il piano è diverso da quello salvato nella baseline.
+
+Con STORAGE_BACKEND=memory il harness usa `CursoreMemoria.piano`: il motore in memoria ha
+solo indici hash sull'uguaglianza di tutti i campi, quindi COLLSCAN e rapporto vengono
+riportati come avvisi e solo i cambi di piano sono violazioni.
+
+Esempio:
+    python app/monitoring/piani_query.py --segnalazioni 20000 --baseline piani_query_baseline.json \
+        --report piani_query_report.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import random
+import sys
+from typing import Callable, List, Optional
+
+from bson import ObjectId
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import db.connection as connection
+import db.profilo_utente_repository as utenti_repo
+import db.segnalazione_repository as segnalazioni_repo
+from db.storage import BACKEND_MEMORIA, backend_storage
+from models.incident_model import campi_orari, punto_geojson
+from monitoring.mongo_monitor import forma_query
+
+SOGLIA_RAPPORTO_DEFAULT = 10.0
+DATABASE_DEFAULT = "RoadGuardian_piani_query"
+
+# Operazioni a documento singolo: l'explain equivalente è un find con limit 1
+_OPERAZIONI_SINGOLE = {"find_one", "update_one", "find_one_and_update", "delete_one"}
+_OPERAZIONI_REGISTRATE = _OPERAZIONI_SINGOLE | {"update_many", "delete_many", "count_documents"}
+
+# Funzioni dei repository che non interrogano le collection (solo inserimenti e indici)
+FUNZIONI_SENZA_QUERY = {"ensure_indexes", "create_segnalazione", "insert_segnalazioni", "create_user"}
+
+# Centro di Roma: le segnalazioni sintetiche cadono entro ~5 km
+CENTRO_LAT, CENTRO_LON = 41.9028, 12.4964
+CATEGORIE = ["incidente stradale", "tamponamento", "lavori in corso", "veicolo in panne", "incendio veicolo"]
+GRAVITA = ["low", "medium", "high"]
+
+
+# --- Analisi dei piani ---
+
+def _figli(stadio: dict) -> List[dict]:
+    if "inputStage" in stadio:
+        return [stadio["inputStage"]]
+    return list(stadio.get("inputStages", []))
+
+
+def firma_piano(stadio: dict) -> str:
+    """
+    Scopo: Descrive un piano di esecuzione come stringa confrontabile tra esecuzioni.
+
+    Parametri:
+    - stadio (dict): `winningPlan` (o un suo stadio) dell'output di explain.
+
+    Valore di ritorno:
+    - str: Stadi dalla radice alle foglie, es. "FETCH > IXSCAN(category_1_status_1)";
+      gli stadi con più input (OR, SORT_MERGE) elencano i figli tra parentesi quadre.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    stadio = stadio.get("queryPlan", stadio)  # explain del motore SBE
+    nome = stadio.get("stage", "?")
+    if stadio.get("indexName"):
+        nome += f"({stadio['indexName']})"
+    figli = _figli(stadio)
+    if len(figli) == 1:
+        return f"{nome} > {firma_piano(figli[0])}"
+    if figli:
+        return f"{nome}[{', '.join(firma_piano(figlio) for figlio in figli)}]"
+    return nome
+
+
+def analizza_explain(explain: dict) -> dict:
+    """
+    Scopo: Estrae piano e statistiche di esecuzione dall'output di explain("executionStats").
+
+    Parametri:
+    - explain (dict): Risposta del comando explain.
+
+    Valore di ritorno:
+    - dict: piano (firma), restituiti, documenti_esaminati, chiavi_esaminate, tempo_ms.
+
+    Eccezioni:
+    - KeyError: Se l'output non contiene queryPlanner/executionStats.
+    """
+    statistiche = explain["executionStats"]
+    return {
+        "piano": firma_piano(explain["queryPlanner"]["winningPlan"]),
+        "restituiti": statistiche.get("nReturned", 0),
+        "documenti_esaminati": statistiche.get("totalDocsExamined", 0),
+        "chiavi_esaminate": statistiche.get("totalKeysExamined", 0),
+        "tempo_ms": statistiche.get("executionTimeMillis", 0),
+    }
+
+
+def verifica(esito: dict, soglia_rapporto: float, collscan_ammesso: bool = False,
+             piano_baseline: Optional[str] = None) -> List[str]:
+    """
+    Scopo: Elenca i problemi di una query analizzata.
+
+    Parametri:
+    - esito (dict): Risultato di `analizza_explain` (o equivalente del motore in memoria).
+    - soglia_rapporto (float): Massimo rapporto documenti esaminati / restituiti.
+    - collscan_ammesso (bool): Se True un COLLSCAN non è un problema.
+    - piano_baseline (str, optional): Piano atteso; None se la query non è nella baseline.
+
+    Valore di ritorno:
+    - list[str]: Descrizione dei problemi trovati (vuota se la query è in regola).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    problemi = []
+    if "COLLSCAN" in esito["piano"] and not collscan_ammesso:
+        problemi.append("COLLSCAN")
+    rapporto = esito["documenti_esaminati"] / max(esito["restituiti"], 1)
+    if rapporto > soglia_rapporto:
+        problemi.append(f"rapporto esaminati/restituiti {rapporto:.1f} oltre la soglia {soglia_rapporto}")
+    if piano_baseline is not None and piano_baseline != esito["piano"]:
+        problemi.append(f"piano cambiato: {piano_baseline} -> {esito['piano']}")
+    return problemi
+
+
+# --- Registrazione delle operazioni dei repository ---
+
+class CursoreRegistrato:
+    """Cursore che annota sort e limit nella query registrata e inoltra il resto."""
+
+    def __init__(self, cursore, query: dict):
+        self._cursore = cursore
+        self._query = query
+
+    def sort(self, chiave, direzione: int = 1):
+        self._query["sort"] = [(chiave, direzione)] if isinstance(chiave, str) else list(chiave)
+        self._cursore = self._cursore.sort(chiave, direzione)
+        return self
+
+    def limit(self, n: int):
+        self._query["limit"] = n
+        self._cursore = self._cursore.limit(n)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursore)
+
+    def __getattr__(self, attributo):
+        return getattr(self._cursore, attributo)
+
+
+class CollezioneRegistrata:
+    """Collection che registra filtro, sort e limit delle letture e degli aggiornamenti."""
+
+    def __init__(self, collection, nome: str, registro: list):
+        self._collection = collection
+        self._nome = nome
+        self._registro = registro
+
+    def _registra(self, operazione: str, filtro: Optional[dict], opzioni: dict) -> dict:
+        query = {"collection": self._nome, "operazione": operazione, "filtro": filtro or {},
+                 "sort": opzioni.get("sort"), "limit": 1 if operazione in _OPERAZIONI_SINGOLE else opzioni.get("limit")}
+        self._registro.append(query)
+        return query
+
+    def find(self, filter: Optional[dict] = None, *argomenti, **opzioni):
+        query = self._registra("find", filter, opzioni)
+        return CursoreRegistrato(self._collection.find(filter, *argomenti, **opzioni), query)
+
+    def __getattr__(self, attributo):
+        metodo = getattr(self._collection, attributo)
+        if attributo not in _OPERAZIONI_REGISTRATE:
+            return metodo
+
+        def chiamata(filter=None, *argomenti, **opzioni):
+            self._registra(attributo, filter, opzioni)
+            return metodo(filter, *argomenti, **opzioni)
+        return chiamata
+
+
+# --- Dataset sintetico e casi ---
+
+def genera_dataset(segnalazioni: int, utenti: int, seed: int = 42) -> dict:
+    """
+    Scopo: Genera documenti sintetici per le collection dei repository.
+
+    Circa il 20% delle segnalazioni è disattivato; un ulteriore 10% (più vecchio di 90 giorni)
+    finisce nell'archivio, come dopo il passaggio dell'archiviatore.
+
+    Parametri:
+    - segnalazioni (int): Segnalazioni nella collection attiva.
+    - utenti (int): Utenti registrati.
+    - seed (int): Seme del generatore, per dataset ripetibili.
+
+    Valore di ritorno:
+    - dict: Liste di documenti per "segnalazioni", "segnalazioni_archive" e "utenti".
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    rng = random.Random(seed)
+    ora = datetime.datetime.now().replace(second=0, microsecond=0)
+    documenti_utenti = [{
+        "_id": ObjectId(), "email": f"utente{i}@example.com", "first_name": f"Nome{i}", "last_name": f"Cognome{i}",
+        "password": "x" * 64, "num_tel": f"+39333{i:07d}", "is_active": True, "role": "user",
+    } for i in range(utenti)]
+
+    def segnalazione(giorni_fa: float, status: bool) -> dict:
+        istante = ora - datetime.timedelta(days=giorni_fa, minutes=rng.randrange(1440))
+        longitudine = CENTRO_LON + rng.uniform(-0.06, 0.06)
+        latitudine = CENTRO_LAT + rng.uniform(-0.045, 0.045)
+        documento = {
+            "_id": ObjectId(), "user_id": str(rng.choice(documenti_utenti)["_id"]) if documenti_utenti else "utente",
+            "incident_date": istante, "incident_longitude": longitudine, "incident_latitude": latitudine,
+            "seriousness": rng.choice(GRAVITA), "status": status, "category": rng.choice(CATEGORIE),
+            "description": None, "img_url": None, "location": punto_geojson(longitudine, latitudine),
+        }
+        documento.update(campi_orari(istante))
+        return documento
+
+    return {
+        "segnalazioni": [segnalazione(rng.uniform(0, 30), rng.random() >= 0.2) for _ in range(segnalazioni)],
+        "segnalazioni_archive": [segnalazione(rng.uniform(90, 365), False) for _ in range(segnalazioni // 10)],
+        "utenti": documenti_utenti,
+    }
+
+
+def casi_repository(dataset: dict) -> List[tuple]:
+    """
+    Scopo: Elenca le chiamate da eseguire, una o più per ogni funzione dei repository.
+
+    Le funzioni che modificano i dati vengono eseguite per ultime, così le letture vedono
+    il dataset appena caricato.
+
+    Parametri:
+    - dataset (dict): Documenti generati da `genera_dataset` (già inseriti).
+
+    Valore di ritorno:
+    - list[tuple]: Terne (nome, chiamata senza argomenti, collscan_ammesso).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    attiva = next(d for d in dataset["segnalazioni"] if d["status"])
+    archiviata = dataset["segnalazioni_archive"][0] if dataset["segnalazioni_archive"] else attiva
+    utente = dataset["utenti"][0] if dataset["utenti"] else {"_id": ObjectId(), "email": "x@example.com",
+                                                             "num_tel": "+390000000000"}
+    istante = attiva["incident_date"]
+    lon, lat = attiva["incident_longitude"], attiva["incident_latitude"]
+    s, u = segnalazioni_repo, utenti_repo
+    return [
+        ("get_segnalazione_by_id", lambda: s.get_segnalazione_by_id(str(attiva["_id"])), False),
+        ("get_segnalazione_by_id[storico]",
+         lambda: s.get_segnalazione_by_id(str(archiviata["_id"]), include_storico=True), False),
+        ("get_segnalazione_by_position", lambda: s.get_segnalazione_by_position(lon, lat), False),
+        ("get_segnalazione_list_by_position",
+         lambda: s.get_segnalazione_list_by_position(lon, lat, tolleranza_metri=200), False),
+        ("get_segnalazione_by_category", lambda: s.get_segnalazione_by_category(attiva["category"]), False),
+        ("get_segnalazione_by_category[storico]",
+         lambda: s.get_segnalazione_by_category(attiva["category"], include_storico=True), False),
+        ("get_segnalazione_by_user", lambda: s.get_segnalazione_by_user(attiva["user_id"]), False),
+        ("get_segnalazione_by_user[storico]",
+         lambda: s.get_segnalazione_by_user(attiva["user_id"], include_storico=True), False),
+        ("get_segnalazione_by_status", lambda: s.get_segnalazione_by_status(False), False),
+        ("get_segnalazione_by_status[storico]", lambda: s.get_segnalazione_by_status(False, include_storico=True),
+         False),
+        ("get_segnalazione_by_date", lambda: s.get_segnalazione_by_date(istante.date()), False),
+        ("get_segnalazione_by_date[storico]",
+         lambda: s.get_segnalazione_by_date(istante.date(), include_storico=True), False),
+        ("get_segnalazione_by_time", lambda: s.get_segnalazione_by_time(istante.time()), False),
+        ("get_segnalazione_by_fascia_oraria",
+         lambda: s.get_segnalazione_by_fascia_oraria(datetime.time(7, 0), datetime.time(9, 0)), False),
+        ("get_segnalazione_by_fascia_oraria[giorni]", lambda: s.get_segnalazione_by_fascia_oraria(
+            datetime.time(7, 0), datetime.time(9, 0), giorni_settimana=[1, 2, 3, 4, 5]), False),
+        ("get_segnalazione_by_fascia_oraria[mezzanotte]",
+         lambda: s.get_segnalazione_by_fascia_oraria(datetime.time(23, 0), datetime.time(1, 0)), False),
+        ("get_segnalazione_by_date_and_time",
+         lambda: s.get_segnalazione_by_date_and_time(istante.date(), istante.time()), False),
+        ("get_segnalazione_by_seriousness", lambda: s.get_segnalazione_by_seriousness("high"), False),
+        # Varianti in streaming: stessi filtri delle letture a lista, consumate per intero
+        ("iter_segnalazione_list_by_position",
+         lambda: list(s.iter_segnalazione_list_by_position(lon, lat, tolleranza_metri=200)), False),
+        ("iter_segnalazione_by_category", lambda: list(s.iter_segnalazione_by_category(attiva["category"])), False),
+        ("iter_segnalazione_by_user[storico]",
+         lambda: list(s.iter_segnalazione_by_user(attiva["user_id"], include_storico=True)), False),
+        ("iter_segnalazione_by_status", lambda: list(s.iter_segnalazione_by_status(False)), False),
+        ("iter_segnalazione_by_date", lambda: list(s.iter_segnalazione_by_date(istante.date())), False),
+        ("iter_segnalazione_by_time", lambda: list(s.iter_segnalazione_by_time(istante.time())), False),
+        ("iter_segnalazione_by_fascia_oraria",
+         lambda: list(s.iter_segnalazione_by_fascia_oraria(datetime.time(7, 0), datetime.time(9, 0))), False),
+        ("iter_segnalazione_by_date_and_time",
+         lambda: list(s.iter_segnalazione_by_date_and_time(istante.date(), istante.time())), False),
+        ("iter_segnalazione_by_seriousness", lambda: list(s.iter_segnalazione_by_seriousness("high")), False),
+        ("get_user_by_email", lambda: u.get_user_by_email(utente["email"]), False),
+        ("get_user_by_id", lambda: u.get_user_by_id(str(utente["_id"])), False),
+        ("get_user_by_num_tel", lambda: u.get_user_by_num_tel(utente["num_tel"]), False),
+        ("update_num_tel", lambda: u.update_num_tel(str(utente["_id"]), "+390000000001"), False),
+        ("update_email", lambda: u.update_email(str(utente["_id"]), "aggiornato@example.com"), False),
+        ("update_password", lambda: u.update_password(str(utente["_id"]), "y" * 64), False),
+        ("update_user", lambda: u.update_user(str(utente["_id"]), {"first_name": "Aggiornato"}), False),
+        ("delete_segnalazione", lambda: s.delete_segnalazione(str(attiva["_id"])), False),
+        ("delete_segnalazione[archivio]", lambda: s.delete_segnalazione(str(archiviata["_id"])), False),
+        ("archivia_segnalazioni",
+         lambda: s.archivia_segnalazioni(100, datetime.datetime.now() - datetime.timedelta(days=25)), False),
+        # Manutenzione una tantum: cerca proprio i documenti privi dei campi indicizzati
+        ("backfill_campi_derivati", lambda: s.backfill_campi_derivati(), True),
+    ]
+
+
+# --- Esecuzione ---
+
+def _spiega_memoria(database, query: dict) -> dict:
+    cursore = database[query["collection"]].find(query["filtro"])
+    if query["sort"]:
+        cursore.sort(query["sort"])
+    if query["limit"]:
+        cursore.limit(query["limit"])
+    risultati = cursore.to_list()
+    return {"piano": cursore.piano, "restituiti": len(risultati), "documenti_esaminati": cursore.esaminati,
+            "chiavi_esaminate": None, "tempo_ms": None}
+
+
+def _spiega_mongo(database, query: dict) -> dict:
+    comando = {"find": query["collection"], "filter": query["filtro"]}
+    if query["sort"]:
+        comando["sort"] = dict(query["sort"])
+    if query["limit"]:
+        comando["limit"] = query["limit"]
+    return analizza_explain(database.command("explain", comando, verbosity="executionStats"))
+
+
+def _esegui_caso(chiamata: Callable) -> list:
+    registro = []
+    originali = {
+        (segnalazioni_repo, "segnalazione_collection"): segnalazioni_repo.segnalazione_collection,
+        (segnalazioni_repo, "archive_collection"): segnalazioni_repo.archive_collection,
+        (utenti_repo, "user_collection"): utenti_repo.user_collection,
+    }
+    for (modulo, attributo), collection in originali.items():
+        setattr(modulo, attributo, CollezioneRegistrata(collection, collection.nome, registro))
+    try:
+        chiamata()
+    finally:
+        for (modulo, attributo), collection in originali.items():
+            setattr(modulo, attributo, collection)
+    return registro
+
+
+def esegui(segnalazioni: int = 5000, utenti: int = 500, seed: int = 42,
+           soglia_rapporto: float = SOGLIA_RAPPORTO_DEFAULT, baseline: Optional[str] = None,
+           aggiorna_baseline: bool = False, database: str = DATABASE_DEFAULT) -> dict:
+    """
+    Scopo: Popola il database di prova, analizza ogni query dei repository e produce il report.
+
+    Il database `database` viene svuotato all'inizio e alla fine: non deve essere quello
+    dell'applicazione.
+
+    Parametri:
+    - segnalazioni (int): Segnalazioni sintetiche nella collection attiva.
+    - utenti (int): Utenti sintetici.
+    - seed (int): Seme del dataset.
+    - soglia_rapporto (float): Massimo rapporto documenti esaminati / restituiti.
+    - baseline (str, optional): File JSON con i piani attesi per query.
+    - aggiorna_baseline (bool): Se True riscrive la baseline con i piani di questa esecuzione
+      invece di confrontarli.
+    - database (str): Nome del database di prova.
+
+    Valore di ritorno:
+    - dict: Report con backend, dimensioni del dataset, dettaglio per query, violazioni,
+      avvisi ed esito ("ok" o "fallito").
+
+    Eccezioni:
+    - ValueError: Se `database` coincide con il database dell'applicazione o, con il motore
+      in memoria, se è configurata la persistenza su file (STORAGE_MEMORIA_FILE).
+    - pymongo.errors.PyMongoError: Se MongoDB non è raggiungibile.
+    """
+    backend = backend_storage()
+    if database == connection.DB_NAME:
+        raise ValueError(f"Il harness svuota il database: usare un nome diverso da {connection.DB_NAME}")
+    if backend == BACKEND_MEMORIA and os.environ.get("STORAGE_MEMORIA_FILE"):
+        raise ValueError("Il harness non va eseguito con STORAGE_MEMORIA_FILE configurato")
+
+    piani_attesi = {}
+    if baseline and os.path.exists(baseline) and not aggiorna_baseline:
+        with open(baseline, encoding="utf-8") as f:
+            piani_attesi = json.load(f).get(backend, {})
+
+    nome_originale = connection.DB_NAME
+    connection.DB_NAME = database
+    connection.chiudi_client()
+    try:
+        database_prova = connection.get_database()
+        dati = genera_dataset(segnalazioni, utenti, seed)
+        for nome, documenti in dati.items():
+            database_prova.drop_collection(nome)
+            if documenti:
+                database_prova[nome].insert_many(documenti)
+        segnalazioni_repo.ensure_indexes()
+        utenti_repo.ensure_indexes()
+
+        report_query, violazioni, avvisi = [], [], []
+        for nome, chiamata, collscan_ammesso in casi_repository(dati):
+            for indice, query in enumerate(_esegui_caso(chiamata)):
+                chiave = f"{nome}#{indice}"
+                esito = (_spiega_memoria if backend == BACKEND_MEMORIA else _spiega_mongo)(database_prova, query)
+                problemi = verifica(esito, soglia_rapporto, collscan_ammesso, piani_attesi.get(chiave))
+                voce = {"query": chiave, "collection": query["collection"], "operazione": query["operazione"],
+                        "forma": forma_query(query["filtro"]), **esito}
+                for problema in problemi:
+                    # Con il motore in memoria solo i cambi di piano sono affidabili
+                    if backend == BACKEND_MEMORIA and not problema.startswith("piano cambiato"):
+                        avvisi.append(f"{chiave}: {problema}")
+                    else:
+                        violazioni.append(f"{chiave}: {problema}")
+                voce["problemi"] = problemi
+                report_query.append(voce)
+        for nome in dati:
+            database_prova.drop_collection(nome)
+    finally:
+        connection.chiudi_client()
+        connection.DB_NAME = nome_originale
+
+    if baseline and aggiorna_baseline:
+        contenuto = {}
+        if os.path.exists(baseline):
+            with open(baseline, encoding="utf-8") as f:
+                contenuto = json.load(f)
+        contenuto[backend] = {voce["query"]: voce["piano"] for voce in report_query}
+        with open(baseline, "w", encoding="utf-8") as f:
+            json.dump(contenuto, f, indent=2, sort_keys=True)
+
+    return {
+        "backend": backend,
+        "dataset": {nome: len(documenti) for nome, documenti in dati.items()},
+        "soglia_rapporto": soglia_rapporto,
+        "baseline": baseline,
+        "query": report_query,
+        "violazioni": violazioni,
+        "avvisi": avvisi,
+        "esito": "fallito" if violazioni else "ok",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regressione dei piani di esecuzione delle query dei repository")
+    parser.add_argument("--segnalazioni", type=int, default=5000)
+    parser.add_argument("--utenti", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--soglia-rapporto", type=float, default=SOGLIA_RAPPORTO_DEFAULT)
+    parser.add_argument("--database", default=DATABASE_DEFAULT)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--aggiorna-baseline", action="store_true")
+    parser.add_argument("--report", default=None, help="File in cui salvare il report JSON")
+    args = parser.parse_args()
+    report = esegui(args.segnalazioni, args.utenti, args.seed, args.soglia_rapporto, args.baseline,
+                    args.aggiorna_baseline, args.database)
+    testo = json.dumps(report, indent=2, default=str)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(testo)
+    print(testo)
+    sys.exit(1 if report["violazioni"] else 0)
+
+
+if __name__ == "__main__":
+    main()
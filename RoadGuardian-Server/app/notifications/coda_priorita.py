@@ -0,0 +1,194 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from schemas.notifica_schema import NotificaPush
+
+# Classi di priorità, dalla più urgente; coincidono con i valori di IncidentModel.seriousness
+PRIORITA_ALTA = "high"
+PRIORITA_MEDIA = "medium"
+PRIORITA_BASSA = "low"
+CLASSI_PRIORITA = (PRIORITA_ALTA, PRIORITA_MEDIA, PRIORITA_BASSA)
+
+# Esiti di `put_sostituendo` a coda piena
+SCARTATA_NUOVA = "nuova"
+SCARTATA_IN_CODA = "in_coda"
+
+
+def rango_priorita(classe: str) -> int:
+    """Posizione della classe in CLASSI_PRIORITA (0 = più urgente); le classi sconosciute valgono 'medium'."""
+    return CLASSI_PRIORITA.index(classe if classe in CLASSI_PRIORITA else PRIORITA_MEDIA)
+
+
+def quote_default(workers: int) -> Dict[str, int]:
+    """
+    Scopo: Calcola le quote di worker per classe: la classe alta può usare tutti i worker,
+    media e bassa al più metà e un quarto, così che una parte del pool resti sempre
+    disponibile per le allerte gravi anche a sistema saturo.
+
+    Parametri:
+    - workers (int): Numero totale di thread mittenti.
+
+    Valore di ritorno:
+    - Dict[str, int]: Numero massimo di worker che possono inviare contemporaneamente ogni classe.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return {
+        PRIORITA_ALTA: workers,
+        PRIORITA_MEDIA: max(1, workers // 2),
+        PRIORITA_BASSA: max(1, workers // 4),
+    }
+
+
+class CodaPrioritaNotifiche:
+    """
+    Coda limitata a priorità per il dispatcher delle notifiche.
+
+    Le notifiche sono divise per classe di gravità; dentro una classe escono prima quelle
+    relative alle segnalazioni più recenti (a parità, in ordine di arrivo). Ogni classe ha
+    una quota massima di worker che possono inviarla contemporaneamente: un worker libero
+    serve la classe più urgente con notifiche in attesa e quota disponibile.
+    Espone `task_done`/`join` con la stessa semantica di `queue.Queue`.
+    """
+
+    def __init__(self, maxsize: int, quote: Dict[str, int]):
+        self.maxsize = maxsize
+        self.quote = dict(quote)
+        self._cond = threading.Condition()
+        # classe -> heap di (chiave, sequenza, accodata_il, notifica)
+        self._heap: Dict[str, list] = {classe: [] for classe in CLASSI_PRIORITA}
+        self._in_invio: Dict[str, int] = {classe: 0 for classe in CLASSI_PRIORITA}
+        self._sequenza = itertools.count()
+        self._non_completate = 0
+
+    def qsize(self) -> int:
+        return sum(len(h) for h in self._heap.values())
+
+    def qsize_per_classe(self) -> Dict[str, int]:
+        return {classe: len(h) for classe, h in self._heap.items()}
+
+    def _voce(self, notifica: NotificaPush, classe: str, incident_ts: Optional[float]) -> tuple:
+        adesso = time.monotonic()
+        # Segnalazioni più recenti prima: chiave crescente = timestamp decrescente
+        chiave = -(incident_ts if incident_ts is not None else time.time())
+        return (chiave, next(self._sequenza), adesso, notifica)
+
+    def _inserisci(self, classe: str, voce: tuple) -> None:
+        heapq.heappush(self._heap[classe], voce)
+        self._non_completate += 1
+        self._cond.notify_all()
+
+    def put(self, notifica: NotificaPush, classe: str, incident_ts: Optional[float] = None,
+            block: bool = True, timeout: Optional[float] = None) -> None:
+        """
+        Scopo: Accoda una notifica nella sua classe.
+
+        Parametri:
+        - notifica (NotificaPush): Notifica da accodare.
+        - classe (str): 'high', 'medium' o 'low'.
+        - incident_ts (float, optional): Istante (epoch) della segnalazione; se assente, quello attuale.
+        - block (bool): Se True attende spazio fino a `timeout`.
+        - timeout (float, optional): Secondi massimi di attesa.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - queue.Full: Se la coda è piena.
+        """
+        with self._cond:
+            if self.qsize() >= self.maxsize:
+                if not block or not self._cond.wait_for(lambda: self.qsize() < self.maxsize, timeout):
+                    raise queue.Full
+            self._inserisci(classe, self._voce(notifica, classe, incident_ts))
+
+    def put_sostituendo(self, notifica: NotificaPush, classe: str,
+                        incident_ts: Optional[float] = None) -> Optional[str]:
+        """
+        Scopo: Accoda una notifica; a coda piena scarta la voce meno urgente (classe più bassa,
+        segnalazione più vecchia, arrivo più vecchio), oppure la nuova se è lei la meno urgente.
+
+        Parametri:
+        - notifica (NotificaPush): Notifica da accodare.
+        - classe (str): Classe di priorità.
+        - incident_ts (float, optional): Istante (epoch) della segnalazione.
+
+        Valore di ritorno:
+        - Optional[str]: None se nulla è stato scartato, SCARTATA_NUOVA o SCARTATA_IN_CODA.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._cond:
+            voce = self._voce(notifica, classe, incident_ts)
+            if self.qsize() < self.maxsize:
+                self._inserisci(classe, voce)
+                return None
+            classe_vittima = next(c for c in reversed(CLASSI_PRIORITA) if self._heap[c])
+            if CLASSI_PRIORITA.index(classe_vittima) < CLASSI_PRIORITA.index(classe):
+                return SCARTATA_NUOVA  # la nuova notifica è la meno urgente
+            heap = self._heap[classe_vittima]
+            indice = max(range(len(heap)), key=lambda i: (heap[i][0], -heap[i][1]))
+            if classe_vittima == classe and voce[0] > heap[indice][0]:
+                return SCARTATA_NUOVA
+            heap[indice] = heap[-1]
+            heap.pop()
+            heapq.heapify(heap)
+            self._non_completate -= 1
+            self._inserisci(classe, voce)
+            return SCARTATA_IN_CODA
+
+    def _classe_servibile(self) -> Optional[str]:
+        for classe in CLASSI_PRIORITA:
+            if self._heap[classe] and self._in_invio[classe] < self.quote.get(classe, 1):
+                return classe
+        return None
+
+    def preleva_lotto(self, max_n: int, batch_window: float,
+                      timeout: float = 0.1) -> Tuple[Optional[str], List[Tuple[float, NotificaPush]]]:
+        """
+        Scopo: Attende una classe servibile e ne preleva un lotto, raccogliendo per `batch_window`.
+
+        Parametri:
+        - max_n (int): Dimensione massima del lotto.
+        - batch_window (float): Secondi di raccolta dopo la prima notifica.
+        - timeout (float): Secondi massimi di attesa della prima notifica.
+
+        Valore di ritorno:
+        - Tuple[Optional[str], List[Tuple[float, NotificaPush]]]: Classe servita e coppie
+          (istante di accodamento, notifica); (None, []) se non c'è nulla da inviare.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._classe_servibile() is not None, timeout):
+                return None, []
+            classe = self._classe_servibile()
+            self._in_invio[classe] += 1
+            if batch_window > 0:
+                self._cond.wait_for(lambda: len(self._heap[classe]) >= max_n, batch_window)
+            heap = self._heap[classe]
+            lotto = [heapq.heappop(heap) for _ in range(min(max_n, len(heap)))]
+            if not lotto:
+                self._in_invio[classe] -= 1
+                return None, []
+            self._cond.notify_all()
+            return classe, [(accodata_il, notifica) for _, _, accodata_il, notifica in lotto]
+
+    def task_done(self, classe: str, n: int) -> None:
+        """Segnala la fine dell'invio di un lotto della classe indicata, liberandone la quota."""
+        with self._cond:
+            self._in_invio[classe] -= 1
+            self._non_completate -= n
+            self._cond.notify_all()
+
+    def join(self) -> None:
+        """Attende che tutte le notifiche accodate siano state elaborate."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._non_completate <= 0)
@@ -0,0 +1,142 @@
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from schemas.notifica_schema import NotificaPush
+from notifications.coda_priorita import PRIORITA_ALTA, rango_priorita
+from services.geohash_index import RAGGIO_ALLERTA_KM
+from monitoring.metriche import Contatore
+
+
+class DigestNotifiche:
+    """
+    Accorpamento per dispositivo delle notifiche di prossimità.
+
+    La prima allerta per un dispositivo apre una finestra di `finestra` secondi; le allerte
+    che arrivano nel frattempo per lo stesso token vengono trattenute e, alla chiusura della
+    finestra, inviate come un'unica notifica riepilogativa ("3 segnalazioni entro 3 km")
+    con gli ID delle segnalazioni nel payload. Se nella finestra arriva una sola allerta,
+    questa viene inviata invariata. Le notifiche senza `incident_id` non vengono trattenute.
+    Un'allerta di classe immediata (di default 'high') non attende: chiude subito la finestra
+    del dispositivo, insieme alle allerte già raccolte. Il riepilogo prende la classe di
+    priorità più urgente tra quelle delle allerte che accorpa.
+    """
+
+    def __init__(self, finestra: float = 2.0, radius_km: float = RAGGIO_ALLERTA_KM,
+                 classi_immediate: Iterable[str] = (PRIORITA_ALTA,),
+                 orologio: Callable[[], float] = time.monotonic):
+        """
+        Scopo: Configura la finestra di accorpamento.
+
+        Parametri:
+        - finestra (float): Secondi per cui le allerte di un dispositivo vengono raccolte.
+        - radius_km (float): Raggio riportato nel testo del riepilogo.
+        - classi_immediate (Iterable[str]): Classi di priorità inviate senza attendere la finestra.
+        - orologio (Callable): Sorgente del tempo in secondi (iniettabile nei test).
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - ValueError: Se la finestra non è positiva.
+        """
+        if finestra <= 0:
+            raise ValueError("La finestra del digest deve essere positiva")
+        self.finestra = finestra
+        self.radius_km = radius_km
+        self.classi_immediate = frozenset(classi_immediate)
+        self._orologio = orologio
+        self._lock = threading.Lock()
+        # token -> (scadenza della finestra, allerte raccolte in ordine di arrivo)
+        self._in_attesa: Dict[str, Tuple[float, List[NotificaPush]]] = {}
+
+        self.digest_inviati = Contatore()
+        self.accorpate = Contatore()
+
+    def _riepilogo(self, allerte: List[NotificaPush]) -> NotificaPush:
+        """Costruisce la notifica riepilogativa per le allerte di un dispositivo."""
+        if len(allerte) == 1:
+            return allerte[0]
+        ids = [a.data["incident_id"] for a in allerte]
+        return NotificaPush(
+            token=allerte[0].token,
+            title="Attenzione: segnalazioni vicine!",
+            body=f"{len(ids)} segnalazioni entro {self.radius_km:g} km da te.",
+            # FCM accetta solo valori stringa nel payload dati
+            # `digest_id` identifica il riepilogo (es. per il rate limiter, che accorpa per segnalazione)
+            data={"tipo": "digest", "digest_id": uuid.uuid4().hex, "incident_ids": ",".join(ids),
+                  "count": str(len(ids))},
+            priorita=min((a.priorita for a in allerte), key=rango_priorita),
+            outbox_ids=[i for a in allerte for i in a.outbox_ids],
+        )
+
+    def filtra(self, notifiche: List[NotificaPush], forza: bool = False) -> List[NotificaPush]:
+        """
+        Scopo: Trattiene le nuove allerte e restituisce quelle (o i riepiloghi) la cui finestra è scaduta.
+
+        Parametri:
+        - notifiche (List[NotificaPush]): Nuove notifiche prelevate dalla coda.
+        - forza (bool): Se True chiude subito tutte le finestre (es. allo shutdown).
+
+        Valore di ritorno:
+        - List[NotificaPush]: Notifiche da inviare ora.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        da_inviare = []
+        with self._lock:
+            adesso = self._orologio()
+            for notifica in notifiche:
+                incident_id = (notifica.data or {}).get("incident_id")
+                if not incident_id:
+                    da_inviare.append(notifica)
+                    continue
+                _, allerte = self._in_attesa.setdefault(notifica.token, (adesso + self.finestra, []))
+                sostituite = [a for a in allerte if a.data["incident_id"] == incident_id]
+                if sostituite:
+                    # Stessa segnalazione già in attesa: resta la versione più recente, che copre
+                    # anche i documenti dell'outbox di quella sostituita
+                    allerte[:] = [a for a in allerte if a.data["incident_id"] != incident_id]
+                    notifica.outbox_ids = [i for a in sostituite for i in a.outbox_ids] + notifica.outbox_ids
+                allerte.append(notifica)
+                if notifica.priorita in self.classi_immediate:
+                    # Allerta grave: la finestra del dispositivo si chiude subito
+                    self._in_attesa[notifica.token] = (adesso, allerte)
+
+            for token in [t for t, (scadenza, _) in self._in_attesa.items() if forza or scadenza <= adesso]:
+                _, allerte = self._in_attesa.pop(token)
+                if len(allerte) > 1:
+                    self.digest_inviati.incrementa()
+                    self.accorpate.incrementa(len(allerte))
+                da_inviare.append(self._riepilogo(allerte))
+        return da_inviare
+
+    def in_attesa(self) -> int:
+        """Numero di dispositivi con una finestra di accorpamento aperta."""
+        return len(self._in_attesa)
+
+    def trattenute(self) -> List[NotificaPush]:
+        """Allerte trattenute nelle finestre di accorpamento aperte."""
+        with self._lock:
+            return [a for _, allerte in self._in_attesa.values() for a in allerte]
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone i contatori del digest.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Riepiloghi inviati, allerte accorpate e finestre aperte.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return {
+            "digests": self.digest_inviati.valore,
+            "coalesced": self.accorpate.valore,
+            "open_windows": self.in_attesa(),
+        }
@@ -0,0 +1,316 @@
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set
+
+from firebase_admin import messaging, exceptions
+
+# Distribuzioni di latenza supportate
+LATENZA_FISSA = "fixed"
+LATENZA_UNIFORME = "uniform"
+LATENZA_ESPONENZIALE = "exponential"
+LATENZA_LOGNORMALE = "lognormal"
+_DISTRIBUZIONI = (LATENZA_FISSA, LATENZA_UNIFORME, LATENZA_ESPONENZIALE, LATENZA_LOGNORMALE)
+
+
+class FakeFCMTransport:
+    """
+    Sostituto locale, in-process, del client `firebase_admin.messaging`.
+
+    Espone `send`, `send_each` e `send_each_for_multicast` con la stessa semantica di FCM
+    (una "richiesta HTTP" per chiamata, risposte `SendResponse` per messaggio, eccezioni
+    FirebaseError reali), così che `NotifyFCMAdapter(transport=...)` possa essere misurato
+    end-to-end senza rete. Latenza, errori e limiti di throughput sono configurabili;
+    tutto ciò che viene ricevuto è registrato in `ricevute`.
+    """
+
+    def __init__(self, latenza_ms: float = 0.0, distribuzione: str = LATENZA_FISSA,
+                 jitter_ms: float = 0.0, sigma: float = 0.5, error_rate: float = 0.0,
+                 unregistered_rate: float = 0.0, token_non_registrati=None,
+                 max_messaggi_al_secondo: Optional[float] = None, seed: Optional[int] = None):
+        """
+        Scopo: Configura il comportamento simulato di FCM.
+
+        Parametri:
+        - latenza_ms (float): Latenza media di una chiamata (una richiesta HTTP verso FCM).
+        - distribuzione (str): 'fixed', 'uniform', 'exponential' o 'lognormal'.
+        - jitter_ms (float): Semiampiezza dell'intervallo per la distribuzione uniforme.
+        - sigma (float): Deviazione standard del logaritmo per la distribuzione lognormale.
+        - error_rate (float): Probabilità per messaggio di un errore transitorio (UNAVAILABLE).
+        - unregistered_rate (float): Probabilità per messaggio di una risposta UNREGISTERED.
+        - token_non_registrati (Iterable[str], optional): Token sempre rifiutati come non registrati.
+        - max_messaggi_al_secondo (float, optional): Throughput massimo; i messaggi oltre il
+          limite ricevono QUOTA_EXCEEDED, come fa FCM.
+        - seed (int, optional): Seme del generatore casuale, per benchmark ripetibili.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - ValueError: Se la distribuzione non è supportata.
+        """
+        if distribuzione not in _DISTRIBUZIONI:
+            raise ValueError(f"Distribuzione di latenza non valida: {distribuzione}")
+        self.latenza_ms = latenza_ms
+        self.distribuzione = distribuzione
+        self.jitter_ms = jitter_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.unregistered_rate = unregistered_rate
+        self.token_non_registrati = set(token_non_registrati or [])
+        self.max_messaggi_al_secondo = max_messaggi_al_secondo
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._finestra_inizio = time.monotonic()
+        self._finestra_messaggi = 0
+
+        self.ricevute: List[dict] = []
+        self.chiamate = 0
+        # topic -> token iscritti
+        self.iscrizioni: Dict[str, Set[str]] = {}
+
+    @classmethod
+    def da_ambiente(cls) -> "FakeFCMTransport":
+        """
+        Scopo: Crea un trasporto finto configurato dalle variabili d'ambiente FAKE_FCM_*.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - FakeFCMTransport: Trasporto configurato.
+
+        Eccezioni:
+        - ValueError: Se la configurazione d'ambiente non è valida.
+        """
+        max_rps = os.environ.get("FAKE_FCM_MAX_RPS")
+        return cls(
+            latenza_ms=float(os.environ.get("FAKE_FCM_LATENZA_MS", "50")),
+            distribuzione=os.environ.get("FAKE_FCM_DISTRIBUZIONE", LATENZA_LOGNORMALE),
+            jitter_ms=float(os.environ.get("FAKE_FCM_JITTER_MS", "0")),
+            error_rate=float(os.environ.get("FAKE_FCM_ERROR_RATE", "0")),
+            unregistered_rate=float(os.environ.get("FAKE_FCM_UNREGISTERED_RATE", "0")),
+            max_messaggi_al_secondo=float(max_rps) if max_rps else None,
+        )
+
+    def _campiona_latenza(self) -> float:
+        """Estrae una latenza in secondi dalla distribuzione configurata."""
+        media = self.latenza_ms
+        if media <= 0:
+            return 0.0
+        with self._lock:
+            if self.distribuzione == LATENZA_UNIFORME:
+                valore = self._random.uniform(media - self.jitter_ms, media + self.jitter_ms)
+            elif self.distribuzione == LATENZA_ESPONENZIALE:
+                valore = self._random.expovariate(1.0 / media)
+            elif self.distribuzione == LATENZA_LOGNORMALE:
+                # mu scelto in modo che la media della lognormale sia `latenza_ms`
+                mu = math.log(media) - self.sigma ** 2 / 2
+                valore = self._random.lognormvariate(mu, self.sigma)
+            else:
+                valore = media
+        return max(0.0, valore) / 1000
+
+    def _entro_quota(self) -> bool:
+        """Conta un messaggio nella finestra di un secondo corrente; False se oltre il limite."""
+        if self.max_messaggi_al_secondo is None:
+            return True
+        adesso = time.monotonic()
+        if adesso - self._finestra_inizio >= 1.0:
+            self._finestra_inizio = adesso
+            self._finestra_messaggi = 0
+        self._finestra_messaggi += 1
+        return self._finestra_messaggi <= self.max_messaggi_al_secondo
+
+    def _elabora(self, message: messaging.Message) -> messaging.SendResponse:
+        """Simula l'esito FCM di un singolo messaggio e lo registra."""
+        with self._lock:
+            if not self._entro_quota():
+                errore = messaging.QuotaExceededError("Quota FCM simulata superata")
+            elif message.token is not None and (message.token in self.token_non_registrati
+                                                or self._random.random() < self.unregistered_rate):
+                errore = messaging.UnregisteredError("Token non registrato (simulato)")
+            elif self._random.random() < self.error_rate:
+                errore = exceptions.UnavailableError("FCM non disponibile (simulato)")
+            else:
+                errore = None
+            self.ricevute.append({
+                "token": message.token,
+                "topic": message.topic,
+                "title": message.notification.title if message.notification else None,
+                "body": message.notification.body if message.notification else None,
+                "data": dict(message.data or {}),
+                "ricevuto_il": time.time(),
+                "errore": type(errore).__name__ if errore else None,
+            })
+        if errore is not None:
+            return messaging.SendResponse(None, errore)
+        return messaging.SendResponse({"name": f"projects/fake/messages/{uuid.uuid4().hex}"}, None)
+
+    def _richiesta(self) -> None:
+        """Simula il costo di una richiesta HTTP verso FCM."""
+        with self._lock:
+            self.chiamate += 1
+        latenza = self._campiona_latenza()
+        if latenza > 0:
+            time.sleep(latenza)
+
+    def send(self, message: messaging.Message) -> str:
+        """
+        Scopo: Equivalente di `messaging.send`.
+
+        Parametri:
+        - message (messaging.Message): Messaggio da inviare.
+
+        Valore di ritorno:
+        - str: ID del messaggio simulato.
+
+        Eccezioni:
+        - firebase_admin.exceptions.FirebaseError: L'errore simulato per il messaggio.
+        """
+        self._richiesta()
+        risposta = self._elabora(message)
+        if risposta.exception is not None:
+            raise risposta.exception
+        return risposta.message_id
+
+    def send_each(self, messages: List[messaging.Message]) -> messaging.BatchResponse:
+        """
+        Scopo: Equivalente di `messaging.send_each` (una richiesta per l'intero lotto).
+
+        Parametri:
+        - messages (List[messaging.Message]): Messaggi da inviare (al più 500).
+
+        Valore di ritorno:
+        - messaging.BatchResponse: Esito per messaggio, nello stesso ordine.
+
+        Eccezioni:
+        - ValueError: Se il lotto supera i 500 messaggi, come per FCM.
+        """
+        if len(messages) > 500:
+            raise ValueError("messages must not contain more than 500 elements.")
+        self._richiesta()
+        return messaging.BatchResponse([self._elabora(message) for message in messages])
+
+    def send_each_for_multicast(self, multicast_message: messaging.MulticastMessage) -> messaging.BatchResponse:
+        """
+        Scopo: Equivalente di `messaging.send_each_for_multicast`.
+
+        Parametri:
+        - multicast_message (messaging.MulticastMessage): Messaggio con la lista dei token.
+
+        Valore di ritorno:
+        - messaging.BatchResponse: Esito per token, nello stesso ordine.
+
+        Eccezioni:
+        - ValueError: Se i token sono più di 500.
+        """
+        messages = [
+            messaging.Message(notification=multicast_message.notification,
+                              data=multicast_message.data, token=token)
+            for token in multicast_message.tokens
+        ]
+        return self.send_each(messages)
+
+    def _gestisci_topic(self, tokens, topic: str, iscrivi: bool) -> messaging.TopicManagementResponse:
+        tokens = [tokens] if isinstance(tokens, str) else list(tokens)
+        if len(tokens) > 1000:
+            raise ValueError("tokens must not contain more than 1000 elements.")
+        self._richiesta()
+        risultati = []
+        with self._lock:
+            iscritti = self.iscrizioni.setdefault(topic, set())
+            for token in tokens:
+                if token in self.token_non_registrati:
+                    risultati.append({"error": "NOT_FOUND"})
+                    continue
+                if iscrivi:
+                    iscritti.add(token)
+                else:
+                    iscritti.discard(token)
+                risultati.append({})
+        return messaging.TopicManagementResponse({"results": risultati})
+
+    def subscribe_to_topic(self, tokens, topic: str) -> messaging.TopicManagementResponse:
+        """
+        Scopo: Equivalente di `messaging.subscribe_to_topic`.
+
+        Parametri:
+        - tokens (str | List[str]): Token da iscrivere (al più 1000).
+        - topic (str): Nome del topic.
+
+        Valore di ritorno:
+        - messaging.TopicManagementResponse: Esito per token (NOT_FOUND per i token non registrati).
+
+        Eccezioni:
+        - ValueError: Se i token sono più di 1000.
+        """
+        return self._gestisci_topic(tokens, topic, iscrivi=True)
+
+    def unsubscribe_from_topic(self, tokens, topic: str) -> messaging.TopicManagementResponse:
+        """
+        Scopo: Equivalente di `messaging.unsubscribe_from_topic`.
+
+        Parametri:
+        - tokens (str | List[str]): Token da disiscrivere (al più 1000).
+        - topic (str): Nome del topic.
+
+        Valore di ritorno:
+        - messaging.TopicManagementResponse: Esito per token.
+
+        Eccezioni:
+        - ValueError: Se i token sono più di 1000.
+        """
+        return self._gestisci_topic(tokens, topic, iscrivi=False)
+
+    def statistiche(self) -> dict:
+        """
+        Scopo: Riassume quanto ricevuto, per i report dei benchmark.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Messaggi e chiamate ricevuti, errori per tipo e throughput osservato.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            ricevute = list(self.ricevute)
+            chiamate = self.chiamate
+        errori = {}
+        for r in ricevute:
+            if r["errore"]:
+                errori[r["errore"]] = errori.get(r["errore"], 0) + 1
+        durata = ricevute[-1]["ricevuto_il"] - ricevute[0]["ricevuto_il"] if len(ricevute) > 1 else 0.0
+        return {
+            "messaggi": len(ricevute),
+            "chiamate": chiamate,
+            "errori": errori,
+            "durata_s": durata,
+            "messaggi_al_secondo": len(ricevute) / durata if durata > 0 else None,
+        }
+
+    def reset(self) -> None:
+        """
+        Scopo: Azzera le registrazioni e la finestra di throughput.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            self.ricevute = []
+            self.chiamate = 0
+            self._finestra_inizio = time.monotonic()
+            self._finestra_messaggi = 0
@@ -0,0 +1,286 @@
+import os
+import random
+import socket
+import threading
+import time
+import datetime
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from bson import ObjectId
+
+import db.notifica_outbox_repository as outbox_repo
+from notifications.notifiche_api import NotificheAPI, ERRORI_TRANSITORI
+from schemas.notifica_schema import NotificaPush
+from monitoring.metriche import Contatore
+
+
+class NotificaOutbox:
+    """
+    Outbox persistente delle notifiche su MongoDB.
+
+    I worker del dispatcher scrivono in blocco nell'outbox ogni lotto prelevato dalla coda,
+    reclamato da questo processo con `claim_token`: le notifiche nella finestra di digest o
+    differite dal rate limiter sopravvivono a un riavvio. Finché restano trattenute il loro
+    claim viene prolungato periodicamente (`fonte_trattenute`), così l'outbox non le riprende
+    scavalcando digest e rate limiter. Prima dell'invio il claim viene confermato e
+    prolungato (`conferma`), poi vengono registrati gli esiti.
+    Un thread in background riprende i documenti da ritentare o rimasti orfani (claim
+    scaduto), applicando un backoff esponenziale con jitter e spostando in dead-letter
+    quelli non recuperabili. Ogni transizione di stato è condizionata al `claim_token`,
+    così un worker il cui claim è scaduto non sovrascrive lo stato del nuovo proprietario.
+    """
+
+    def __init__(self, adapter: NotificheAPI, batch_size: int = 500, poll_interval: float = 1.0,
+                 lease_seconds: float = 60.0, max_attempts: int = 6,
+                 base_delay: float = 2.0, max_delay: float = 300.0):
+        """
+        Scopo: Configura l'outbox e il relativo worker di ritentativo.
+
+        Parametri:
+        - adapter (NotificheAPI): Trasporto usato per i ritentativi.
+        - batch_size (int): Documenti reclamati per ciclo.
+        - poll_interval (float): Secondi di attesa quando non c'è nulla da inviare.
+        - lease_seconds (float): Durata del claim su un lotto.
+        - max_attempts (int): Tentativi oltre i quali la notifica va in dead-letter.
+        - base_delay (float): Ritardo base in secondi del backoff esponenziale.
+        - max_delay (float): Ritardo massimo in secondi tra due tentativi.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self.adapter = adapter
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        # Claim delle notifiche persistite dai worker del dispatcher di questo processo
+        self.claim_token = uuid.uuid4().hex
+        # Impostata dal dispatcher: notifiche trattenute di cui prolungare il claim
+        self.fonte_trattenute: Optional[Callable[[], List[NotificaPush]]] = None
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.persistite = Contatore()
+        self.ritentate = Contatore()
+        self.dead_letter = Contatore()
+
+    def backoff(self, attempts: int) -> float:
+        """
+        Scopo: Calcola il ritardo prima del prossimo tentativo ("full jitter").
+
+        Parametri:
+        - attempts (int): Tentativi già effettuati (incluso quello appena fallito).
+
+        Valore di ritorno:
+        - float: Secondi di attesa, casuali in [0, min(max_delay, base_delay * 2^attempts)].
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempts)))
+
+    def persisti(self, notifiche: List[NotificaPush]) -> List[dict]:
+        """
+        Scopo: Scrive in blocco nuove notifiche nell'outbox, reclamate da questo processo, e
+        ne registra gli ID in `NotificaPush.outbox_ids`.
+
+        Parametri:
+        - notifiche (List[NotificaPush]): Lotto appena prelevato dalla coda del dispatcher.
+
+        Valore di ritorno:
+        - List[dict]: Documenti dell'outbox, nello stesso ordine delle notifiche.
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se la scrittura fallisce.
+        """
+        documenti = outbox_repo.insert_notifiche(
+            [notifica.model_dump() for notifica in notifiche],
+            claimed_by=self.worker_id,
+            lease_seconds=self.lease_seconds,
+            claim_token=self.claim_token
+        )
+        for notifica, doc in zip(notifiche, documenti):
+            notifica.outbox_ids = [str(doc["_id"])]
+        self.persistite.incrementa(len(documenti))
+        return documenti
+
+    def conferma(self, notifiche: List[NotificaPush]) -> Dict[str, dict]:
+        """
+        Scopo: Prolunga il claim dei documenti delle notifiche in procinto di essere inviate.
+
+        Parametri:
+        - notifiche (List[NotificaPush]): Notifiche del lotto.
+
+        Valore di ritorno:
+        - Dict[str, dict]: ID -> documento, solo per i documenti ancora reclamati da questo
+          processo (quelli ripresi da un altro worker dopo la scadenza del claim li invia lui).
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se l'accesso all'outbox fallisce.
+        """
+        ids = [ObjectId(i) for notifica in notifiche for i in notifica.outbox_ids]
+        documenti = outbox_repo.rinnova_claim(ids, self.claim_token, self.lease_seconds)
+        return {str(doc["_id"]): doc for doc in documenti}
+
+    def rinnova_trattenute(self) -> int:
+        """
+        Scopo: Prolunga il claim delle notifiche trattenute da digest e rate limiter, perché
+        alla scadenza l'outbox non le riprenda e le invii direttamente.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - int: Numero di documenti ancora reclamati da questo processo.
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se l'accesso all'outbox fallisce.
+        """
+        if self.fonte_trattenute is None:
+            return 0
+        trattenute = [n for n in self.fonte_trattenute() if n.outbox_ids]
+        return len(self.conferma(trattenute)) if trattenute else 0
+
+    def registra_esiti(self, documenti: List[dict], esiti: List[Optional[str]]) -> None:
+        """
+        Scopo: Aggiorna l'outbox con gli esiti di invio: inviati, da ritentare o in dead-letter.
+
+        Parametri:
+        - documenti (List[dict]): Documenti dell'outbox inviati, con il `claim_token` del loro claim.
+        - esiti (List[Optional[str]]): Esito per documento (None = inviato, altrimenti codice errore).
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se la scrittura fallisce.
+        """
+        adesso = datetime.datetime.now(datetime.timezone.utc)
+        inviati, ritentativi, morti = [], [], []
+        for doc, esito in zip(documenti, esiti):
+            tentativi = doc.get("attempts", 0) + 1
+            claim_token = doc.get("claim_token")
+            if esito is None:
+                inviati.append((doc["_id"], claim_token))
+            elif esito in ERRORI_TRANSITORI and tentativi < self.max_attempts:
+                ritardo = datetime.timedelta(seconds=self.backoff(tentativi))
+                ritentativi.append((doc["_id"], claim_token, adesso + ritardo, esito))
+            else:
+                morti.append((doc["_id"], claim_token, esito))
+
+        outbox_repo.mark_sent(inviati)
+        outbox_repo.schedule_retry(ritentativi)
+        outbox_repo.mark_dead(morti)
+        self.ritentate.incrementa(len(ritentativi))
+        self.dead_letter.incrementa(len(morti))
+
+    def elabora_lotto(self) -> int:
+        """
+        Scopo: Reclama un lotto di notifiche da (ri)tentare, le invia e ne registra gli esiti.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - int: Numero di notifiche elaborate.
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se l'accesso all'outbox fallisce.
+        """
+        documenti = outbox_repo.claim_batch(self.worker_id, self.batch_size, self.lease_seconds)
+        if not documenti:
+            return 0
+        notifiche = [
+            NotificaPush(token=doc["token"], title=doc["title"], body=doc["body"], data=doc.get("data") or {})
+            for doc in documenti
+        ]
+        esiti = self.adapter.send_batch(notifiche)
+        self.registra_esiti(documenti, esiti)
+        return len(documenti)
+
+    def _loop(self) -> None:
+        """Ciclo del worker: elabora lotti finché ce ne sono, poi attende `poll_interval`.
+        Ogni terzo di `lease_seconds` prolunga il claim delle notifiche trattenute."""
+        try:
+            outbox_repo.ensure_indexes()
+        except Exception as e:
+            print(f"NotificaOutbox: impossibile creare gli indici: {e}")
+        ultimo_rinnovo = time.monotonic()
+        while not self._stop_event.is_set():
+            if time.monotonic() - ultimo_rinnovo >= self.lease_seconds / 3:
+                ultimo_rinnovo = time.monotonic()
+                try:
+                    self.rinnova_trattenute()
+                except Exception as e:
+                    print(f"NotificaOutbox: errore rinnovo claim: {e}")
+            try:
+                elaborate = self.elabora_lotto()
+            except Exception as e:
+                print(f"NotificaOutbox: errore elaborazione lotto: {e}")
+                elaborate = 0
+            if elaborate == 0:
+                self._stop_event.wait(self.poll_interval)
+
+    def start(self) -> None:
+        """
+        Scopo: Avvia il thread di ritentativo (idempotente).
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="notifiche-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Scopo: Ferma il thread di ritentativo.
+
+        Parametri:
+        - timeout (float): Secondi massimi di attesa.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone i contatori dell'outbox di questo processo.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Notifiche persistite, riprogrammate e finite in dead-letter.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return {
+            "persisted": self.persistite.valore,
+            "retried": self.ritentate.valore,
+            "dead_lettered": self.dead_letter.valore,
+        }
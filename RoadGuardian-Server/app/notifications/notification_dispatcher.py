@@ -0,0 +1,432 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from notifications.notifiche_api import NotificheAPI, ERRORE_SCONOSCIUTO
+from notifications.notify_fcm_adapter import NotifyFCMAdapter, FCM_MAX_BATCH
+from notifications.notifica_outbox import NotificaOutbox
+from notifications.fake_fcm_transport import FakeFCMTransport
+from notifications.rate_limiter import NotificationRateLimiter
+from notifications.digest import DigestNotifiche
+from notifications.coda_priorita import (
+    CodaPrioritaNotifiche, CLASSI_PRIORITA, PRIORITA_MEDIA, SCARTATA_NUOVA, quote_default, rango_priorita,
+)
+from schemas.notifica_schema import NotificaPush
+from monitoring.metriche import Contatore, IstogrammaLatenza
+from services.registro_dispositivi import registro_dispositivi
+
+# Politiche di gestione della coda piena
+OVERFLOW_DROP_NEWEST = "drop_newest"  # scarta la notifica in arrivo
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # scarta la notifica meno urgente (classe più bassa, più vecchia)
+OVERFLOW_BLOCK = "block"              # attende fino a `block_timeout`, poi scarta
+OVERFLOW_POLICIES = (OVERFLOW_DROP_NEWEST, OVERFLOW_DROP_OLDEST, OVERFLOW_BLOCK)
+
+
+class NotificationDispatcher:
+    """
+    Pipeline asincrona di invio notifiche.
+
+    Una coda limitata in-process alimenta un pool di thread mittenti che usano
+    l'adapter `NotificheAPI`: chi produce notifiche (es. MappaService) si limita ad
+    accodare e non attende mai la risposta di FCM. Ogni worker raccoglie le notifiche
+    arrivate in una breve finestra e le invia in un unico lotto (`send_batch`).
+    La coda è a priorità per gravità della segnalazione ed età, con una quota di worker
+    per classe (vedi `CodaPrioritaNotifiche`).
+    """
+
+    def __init__(self, adapter: NotificheAPI, max_queue_size: int = 1000, workers: int = 4,
+                 overflow_policy: str = OVERFLOW_DROP_OLDEST, block_timeout: float = 0.5,
+                 batch_size: int = FCM_MAX_BATCH, batch_window: float = 0.05,
+                 outbox: Optional[NotificaOutbox] = None,
+                 rate_limiter: Optional[NotificationRateLimiter] = None,
+                 digest: Optional[DigestNotifiche] = None,
+                 quote_workers: Optional[Dict[str, int]] = None):
+        """
+        Scopo: Configura il dispatcher (i worker partono con `start`).
+
+        Parametri:
+        - adapter (NotificheAPI): Trasporto usato dai worker per l'invio.
+        - max_queue_size (int): Capacità massima della coda.
+        - workers (int): Numero di thread mittenti.
+        - overflow_policy (str): Una tra 'drop_newest', 'drop_oldest', 'block'.
+        - block_timeout (float): Secondi di attesa massima con la politica 'block'.
+        - batch_size (int): Numero massimo di notifiche inviate in un'unica chiamata all'adapter.
+        - batch_window (float): Secondi per cui un worker raccoglie notifiche prima di inviare il lotto.
+        - outbox (NotificaOutbox, optional): Se presente, i worker scrivono in blocco nell'outbox
+          ogni lotto appena prelevato dalla coda (che sopravvive così a un riavvio anche se
+          trattenuto nel digest o differito) e gli errori transitori vengono ritentati dall'outbox.
+        - rate_limiter (NotificationRateLimiter, optional): Se presente, i worker inviano solo
+          le notifiche entro i limiti; le altre vengono differite e accorpate.
+        - digest (DigestNotifiche, optional): Se presente, le allerte ravvicinate per lo stesso
+          dispositivo vengono unite in un'unica notifica riepilogativa.
+        - quote_workers (Dict[str, int], optional): Worker massimi per classe di priorità
+          ('high', 'medium', 'low'); di default `quote_default(workers)`.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - ValueError: Se la politica di overflow non è riconosciuta o i parametri non sono positivi.
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Politica di overflow non valida: {overflow_policy}")
+        if max_queue_size <= 0 or workers <= 0 or batch_size <= 0:
+            raise ValueError("max_queue_size, workers e batch_size devono essere positivi")
+
+        self.adapter = adapter
+        self.max_queue_size = max_queue_size
+        self.workers = workers
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.batch_size = min(batch_size, FCM_MAX_BATCH)
+        self.batch_window = batch_window
+        self.outbox = outbox
+        self.rate_limiter = rate_limiter
+        self.digest = digest
+        if outbox is not None:
+            # Il claim delle notifiche trattenute viene prolungato finché non sono inviate
+            outbox.fonte_trattenute = self._notifiche_trattenute
+
+        self.quote_workers = quote_workers or quote_default(workers)
+        self._queue = CodaPrioritaNotifiche(max_queue_size, self.quote_workers)
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+        self._start_lock = threading.Lock()
+
+        # Metriche
+        self.accodate = Contatore()
+        self.scartate = Contatore()
+        self.inviate = Contatore()
+        self.fallite = Contatore()
+        self.lotti = Contatore()
+        self.latenza_invio = IstogrammaLatenza()
+        self.attesa_in_coda = IstogrammaLatenza()
+        self.attesa_per_classe = {classe: IstogrammaLatenza() for classe in CLASSI_PRIORITA}
+
+    @property
+    def running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self) -> None:
+        """
+        Scopo: Avvia i thread mittenti (idempotente).
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._start_lock:
+            if self.running:
+                return
+            self._stop_event.clear()
+            if self.outbox is not None:
+                self.outbox.start()
+            self._threads = [
+                threading.Thread(target=self._worker_loop, name=f"notifiche-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Scopo: Ferma i worker dopo aver svuotato la coda (entro `timeout`).
+
+        Parametri:
+        - timeout (float): Secondi massimi di attesa per ogni worker.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self.outbox is not None:
+            self.outbox.stop(timeout)
+
+    def enqueue(self, notifica: NotificaPush, seriousness: str = PRIORITA_MEDIA,
+                incident_at: Optional[datetime] = None) -> bool:
+        """
+        Scopo: Accoda una notifica per l'invio asincrono, applicando la politica di overflow.
+
+        Parametri:
+        - notifica (NotificaPush): Notifica da inviare.
+        - seriousness (str): Gravità della segnalazione ('high', 'medium', 'low'): classe di priorità.
+        - incident_at (datetime, optional): Data/ora della segnalazione; a parità di classe
+          le segnalazioni più recenti hanno la precedenza.
+
+        Valore di ritorno:
+        - bool: True se la notifica è stata accodata, False se è stata scartata.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        if not self.running:
+            self.start()
+
+        classe = seriousness if seriousness in CLASSI_PRIORITA else PRIORITA_MEDIA
+        notifica.priorita = classe
+        incident_ts = incident_at.timestamp() if isinstance(incident_at, datetime) else None
+        if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+            esito = self._queue.put_sostituendo(notifica, classe, incident_ts)
+            if esito is not None:
+                self.scartate.incrementa()
+            if esito == SCARTATA_NUOVA:
+                return False
+        else:
+            try:
+                self._queue.put(notifica, classe, incident_ts,
+                                block=self.overflow_policy == OVERFLOW_BLOCK, timeout=self.block_timeout)
+            except queue.Full:
+                self.scartate.incrementa()
+                return False
+
+        self.accodate.incrementa()
+        return True
+
+    def _persisti(self, notifiche: List[NotificaPush]) -> None:
+        """Scrive nell'outbox, con un'unica insert, le notifiche di un lotto appena prelevato dalla coda."""
+        if self.outbox is None or not notifiche:
+            return
+        try:
+            self.outbox.persisti(notifiche)
+        except Exception as e:
+            # Outbox non raggiungibile: si invia comunque, senza garanzia di consegna
+            print(f"NotificationDispatcher: outbox non disponibile: {e}")
+
+    def _notifiche_trattenute(self) -> List[NotificaPush]:
+        """Notifiche trattenute da digest e rate limiter, di cui l'outbox rinnova il claim."""
+        trattenute = []
+        if self.digest is not None:
+            trattenute.extend(self.digest.trattenute())
+        if self.rate_limiter is not None:
+            trattenute.extend(self.rate_limiter.trattenute())
+        return trattenute
+
+    def _invia_lotto(self, notifiche: List[NotificaPush]) -> List[Optional[str]]:
+        """Invia un lotto tramite l'adapter aggiornando metriche e outbox; restituisce gli esiti per notifica."""
+        posseduti = None
+        if self.outbox is not None and any(notifica.outbox_ids for notifica in notifiche):
+            try:
+                posseduti = self.outbox.conferma(notifiche)
+            except Exception as e:
+                # Outbox non raggiungibile: si invia comunque, senza registrare gli esiti
+                print(f"NotificationDispatcher: outbox non disponibile: {e}")
+            if posseduti is not None:
+                # Le notifiche il cui claim è scaduto sono state riprese (e vengono inviate) da un altro worker
+                notifiche = [n for n in notifiche if not n.outbox_ids or any(i in posseduti for i in n.outbox_ids)]
+                if not notifiche:
+                    return []
+
+        inizio = time.perf_counter()
+        try:
+            esiti = self.adapter.send_batch(notifiche)
+        except Exception as e:
+            print(f"NotificationDispatcher: errore invio lotto: {e}")
+            esiti = [ERRORE_SCONOSCIUTO] * len(notifiche)
+        self.latenza_invio.osserva(time.perf_counter() - inizio)
+        self.lotti.incrementa()
+        falliti = sum(1 for esito in esiti if esito is not None)
+        self.inviate.incrementa(len(esiti) - falliti)
+        self.fallite.incrementa(falliti)
+
+        if posseduti:
+            # Una notifica accorpata copre più documenti: l'esito vale per tutti
+            documenti, esiti_documenti = [], []
+            for notifica, esito in zip(notifiche, esiti):
+                for i in notifica.outbox_ids:
+                    if i in posseduti:
+                        documenti.append(posseduti[i])
+                        esiti_documenti.append(esito)
+            try:
+                self.outbox.registra_esiti(documenti, esiti_documenti)
+            except Exception as e:
+                # I documenti restano reclamati: verranno ripresi alla scadenza del claim
+                print(f"NotificationDispatcher: errore aggiornamento outbox: {e}")
+        return esiti
+
+    def _worker_loop(self) -> None:
+        """Ciclo dei thread mittenti: termina quando è richiesto lo stop, la coda è vuota e non restano notifiche trattenute."""
+        while True:
+            classe, lotto = self._queue.preleva_lotto(self.batch_size, self.batch_window)
+            if not lotto and self._stop_event.is_set() and self._queue.qsize() == 0 and self._trattenute() == 0:
+                return
+            try:
+                adesso = time.monotonic()
+                for accodata_il, _ in lotto:
+                    self.attesa_in_coda.osserva(adesso - accodata_il)
+                    self.attesa_per_classe[classe].osserva(adesso - accodata_il)
+                notifiche = [notifica for _, notifica in lotto]
+                self._persisti(notifiche)
+                if self.digest is not None:
+                    # Allo shutdown le finestre di accorpamento vengono chiuse subito
+                    notifiche = self.digest.filtra(notifiche, forza=self._stop_event.is_set())
+                    # I riepiloghi chiusi possono avere classi diverse dal lotto: le più urgenti
+                    # passano per prime dal rate limiter
+                    notifiche.sort(key=lambda n: rango_priorita(n.priorita))
+                if self.rate_limiter is not None:
+                    # Anche con coda vuota vengono rilasciate le notifiche differite ormai pronte
+                    notifiche = self.rate_limiter.filtra(notifiche)
+                if notifiche:
+                    self._invia_lotto(notifiche)
+            finally:
+                if lotto:
+                    self._queue.task_done(classe, len(lotto))
+
+    def _trattenute(self) -> int:
+        """Notifiche prelevate dalla coda ma trattenute da digest o rate limiter."""
+        trattenute = 0
+        if self.digest is not None:
+            trattenute += self.digest.in_attesa()
+        if self.rate_limiter is not None:
+            trattenute += self.rate_limiter.in_attesa()
+        return trattenute
+
+    def join(self) -> None:
+        """
+        Scopo: Attende che tutte le notifiche accodate siano state elaborate, comprese quelle
+        trattenute da digest e rate limiter.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self._queue.join()
+        while self._trattenute() > 0 and self.running:
+            time.sleep(0.01)
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone profondità della coda, contatori e latenze di invio.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Snapshot delle metriche del dispatcher.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return {
+            "queue_depth": self._queue.qsize(),
+            "queue_depth_by_priority": self._queue.qsize_per_classe(),
+            "worker_quotas": self.quote_workers,
+            "queue_capacity": self.max_queue_size,
+            "workers": self.workers,
+            "overflow_policy": self.overflow_policy,
+            "enqueued": self.accodate.valore,
+            "dropped": self.scartate.valore,
+            "sent": self.inviate.valore,
+            "failed": self.fallite.valore,
+            "batches": self.lotti.valore,
+            "send_latency": self.latenza_invio.snapshot(),
+            "queue_wait": self.attesa_in_coda.snapshot(),
+            "queue_wait_by_priority": {c: h.snapshot() for c, h in self.attesa_per_classe.items()},
+            "outbox": self.outbox.metrics() if self.outbox is not None else None,
+            "rate_limit": self.rate_limiter.metrics() if self.rate_limiter is not None else None,
+            "digest": self.digest.metrics() if self.digest is not None else None,
+        }
+
+
+_dispatcher: Optional[NotificationDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_notification_dispatcher() -> NotificationDispatcher:
+    """
+    Scopo: Restituisce il dispatcher condiviso dal processo, creandolo al primo uso.
+
+    La configurazione è letta dalle variabili d'ambiente NOTIFICHE_QUEUE_SIZE,
+    NOTIFICHE_WORKERS, NOTIFICHE_OVERFLOW e NOTIFICHE_BATCH_WINDOW; l'outbox persistente
+    è attivo salvo NOTIFICHE_OUTBOX=0. Con NOTIFICHE_TRANSPORT=fake l'adapter invia a
+    FakeFCMTransport (configurato dalle variabili FAKE_FCM_*) invece che a Firebase.
+    Il rate limiting (NOTIFICHE_RATE_DISPOSITIVO_MIN notifiche al minuto per dispositivo,
+    NOTIFICHE_RATE_SEGNALAZIONE e NOTIFICHE_RATE_GLOBALE al secondo) è attivo salvo
+    NOTIFICHE_RATE_LIMIT=0. Le allerte per lo stesso dispositivo vengono accorpate in
+    finestre di NOTIFICHE_DIGEST_FINESTRA secondi (0 = disattivato); quelle di gravità 'high'
+    non attendono la finestra.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - NotificationDispatcher: Istanza singleton.
+
+    Eccezioni:
+    - ValueError: Se la configurazione d'ambiente non è valida.
+    """
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                transport = None
+                if os.environ.get("NOTIFICHE_TRANSPORT", "fcm") == "fake":
+                    # FCM simulato in-process, per load test e benchmark offline
+                    transport = FakeFCMTransport.da_ambiente()
+                adapter = NotifyFCMAdapter(on_invalid_tokens=registro_dispositivi.rimuovi_token_invalidi,
+                                           transport=transport)
+                outbox = None
+                if os.environ.get("NOTIFICHE_OUTBOX", "1") == "1":
+                    outbox = NotificaOutbox(
+                        adapter,
+                        max_attempts=int(os.environ.get("NOTIFICHE_OUTBOX_MAX_ATTEMPTS", "6"))
+                    )
+                rate_limiter = None
+                if os.environ.get("NOTIFICHE_RATE_LIMIT", "1") == "1":
+                    rate_limiter = NotificationRateLimiter(
+                        device_rate=float(os.environ.get("NOTIFICHE_RATE_DISPOSITIVO_MIN", "6")) / 60,
+                        incident_rate=float(os.environ.get("NOTIFICHE_RATE_SEGNALAZIONE", "100")),
+                        global_rate=float(os.environ.get("NOTIFICHE_RATE_GLOBALE", "5000")),
+                        global_burst=float(os.environ.get("NOTIFICHE_RATE_GLOBALE", "5000"))
+                    )
+                finestra_digest = float(os.environ.get("NOTIFICHE_DIGEST_FINESTRA", "2.0"))
+                digest = DigestNotifiche(finestra=finestra_digest) if finestra_digest > 0 else None
+                _dispatcher = NotificationDispatcher(
+                    adapter,
+                    max_queue_size=int(os.environ.get("NOTIFICHE_QUEUE_SIZE", "1000")),
+                    workers=int(os.environ.get("NOTIFICHE_WORKERS", "4")),
+                    overflow_policy=os.environ.get("NOTIFICHE_OVERFLOW", OVERFLOW_DROP_OLDEST),
+                    batch_window=float(os.environ.get("NOTIFICHE_BATCH_WINDOW", "0.05")),
+                    outbox=outbox,
+                    rate_limiter=rate_limiter,
+                    digest=digest
+                )
+    return _dispatcher
+
+
+def shutdown_notification_dispatcher(timeout: float = 5.0) -> None:
+    """
+    Scopo: Ferma il dispatcher condiviso, se è stato creato, svuotando la coda e l'outbox.
+
+    Parametri:
+    - timeout (float): Secondi massimi di attesa per ciascun worker.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.stop(timeout)
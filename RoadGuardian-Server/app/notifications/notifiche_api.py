@@ -1,5 +1,22 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import Callable, Iterable, List, Optional
+from schemas.notifica_schema import NotificaPush
+
+# Codici di errore per-messaggio restituiti da `send_batch`
+ERRORE_TOKEN_NON_REGISTRATO = "UNREGISTERED"
+ERRORE_ARGOMENTO_NON_VALIDO = "INVALID_ARGUMENT"        # es. payload oltre 4 KB: non dipende dal token
+ERRORE_TOKEN_NON_VALIDO = "INVALID_REGISTRATION_TOKEN"  # INVALID_ARGUMENT riferito al token di registrazione
+ERRORE_SENDER_ID = "SENDER_ID_MISMATCH"
+ERRORE_QUOTA = "QUOTA_EXCEEDED"
+ERRORE_NON_DISPONIBILE = "UNAVAILABLE"
+ERRORE_INTERNO = "INTERNAL"
+ERRORE_AUTENTICAZIONE = "THIRD_PARTY_AUTH_ERROR"
+ERRORE_SCONOSCIUTO = "UNKNOWN"
+
+# Errori che indicano un token da non riutilizzare
+ERRORI_TOKEN_INVALIDO = frozenset({ERRORE_TOKEN_NON_REGISTRATO, ERRORE_TOKEN_NON_VALIDO, ERRORE_SENDER_ID})
+# Errori per cui ha senso ritentare l'invio più tardi
+ERRORI_TRANSITORI = frozenset({ERRORE_QUOTA, ERRORE_NON_DISPONIBILE, ERRORE_INTERNO, ERRORE_SCONOSCIUTO})
 
 class NotificheAPI(ABC):
     """
@@ -7,6 +24,30 @@ class NotificheAPI(ABC):
     Definisce i metodi che il client (RoadGuardian) si aspetta di utilizzare.
     """
 
+    # Callback invocata con i token che il provider segnala come non registrati o non validi
+    on_invalid_tokens: Optional[Callable[[List[str]], None]] = None
+
+    def segnala_token_invalidi(self, tokens: Iterable[str]) -> None:
+        """
+        Scopo: Inoltra a `on_invalid_tokens` (se impostata) i token da eliminare dal registro.
+
+        Parametri:
+            tokens (Iterable[str]): Token rifiutati dal provider.
+
+        Valore di ritorno:
+            None
+
+        Eccezioni:
+            Cattura e logga le eccezioni della callback, per non interrompere l'invio.
+        """
+        tokens = list(tokens)
+        if not tokens or self.on_invalid_tokens is None:
+            return
+        try:
+            self.on_invalid_tokens(tokens)
+        except Exception as e:
+            print(f"Errore gestione token non validi: {e}")
+
     @abstractmethod
     def send_notification(self, token: str, title: str, body: str, data: dict = None) -> bool:
         """
@@ -44,3 +85,90 @@ class NotificheAPI(ABC):
             Nessuna eccezione sollevata direttamente dall'interfaccia.
         """
         pass
+
+    def send_batch(self, notifiche: List[NotificaPush]) -> List[Optional[str]]:
+        """
+        Scopo: Invia un gruppo di notifiche eterogenee. L'implementazione di base invia
+        una notifica alla volta; gli adapter che supportano l'invio a lotti la ridefiniscono.
+
+        Parametri:
+            notifiche (List[NotificaPush]): Notifiche da inviare.
+
+        Valore di ritorno:
+            List[Optional[str]]: Per ogni notifica, None se inviata, altrimenti il codice di errore.
+
+        Eccezioni:
+            Nessuna eccezione sollevata direttamente dall'interfaccia.
+        """
+        esiti = []
+        for notifica in notifiche:
+            ok = self.send_notification(notifica.token, notifica.title, notifica.body, notifica.data)
+            esiti.append(None if ok else ERRORE_SCONOSCIUTO)
+        return esiti
+
+    def send_topic_notification(self, topic: str, title: str, body: str, data: dict = None) -> bool:
+        """
+        Scopo: Invia una notifica push a tutti i dispositivi iscritti a un topic.
+
+        Parametri:
+            topic (str): Nome del topic destinatario.
+            title (str): Il titolo della notifica.
+            body (str): Il corpo del messaggio.
+            data (dict, optional): Dati aggiuntivi.
+
+        Valore di ritorno:
+            bool: True se l'invio è riuscito, False altrimenti.
+
+        Eccezioni:
+            NotImplementedError: Se il provider non supporta i topic.
+        """
+        raise NotImplementedError("Il provider di notifiche non supporta i topic")
+
+    def subscribe_to_topic(self, tokens: List[str], topic: str) -> List[str]:
+        """
+        Scopo: Iscrive in blocco dei dispositivi a un topic.
+
+        Parametri:
+            tokens (List[str]): Token dei dispositivi da iscrivere.
+            topic (str): Nome del topic.
+
+        Valore di ritorno:
+            List[str]: Token per cui l'iscrizione è fallita.
+
+        Eccezioni:
+            NotImplementedError: Se il provider non supporta i topic.
+        """
+        raise NotImplementedError("Il provider di notifiche non supporta i topic")
+
+    def unsubscribe_from_topic(self, tokens: List[str], topic: str) -> List[str]:
+        """
+        Scopo: Disiscrive in blocco dei dispositivi da un topic.
+
+        Parametri:
+            tokens (List[str]): Token dei dispositivi da disiscrivere.
+            topic (str): Nome del topic.
+
+        Valore di ritorno:
+            List[str]: Token per cui la disiscrizione è fallita.
+
+        Eccezioni:
+            NotImplementedError: Se il provider non supporta i topic.
+        """
+        raise NotImplementedError("Il provider di notifiche non supporta i topic")
+
+    @staticmethod
+    def token_da_esiti(notifiche: List[NotificaPush], esiti: List[Optional[str]]) -> List[str]:
+        """
+        Scopo: Estrae da un lotto i token i cui esiti indicano un token non valido.
+
+        Parametri:
+            notifiche (List[NotificaPush]): Notifiche inviate.
+            esiti (List[Optional[str]]): Esiti di `send_batch`, nello stesso ordine.
+
+        Valore di ritorno:
+            List[str]: Token da rimuovere dal registro dispositivi.
+
+        Eccezioni:
+            Nessuna eccezione prevista.
+        """
+        return [n.token for n, esito in zip(notifiche, esiti) if esito in ERRORI_TOKEN_INVALIDO]
@@ -1,8 +1,75 @@
 import firebase_admin
-from firebase_admin import credentials, messaging
-from typing import List
+from firebase_admin import credentials, messaging, exceptions
+from typing import List, Optional
 import os
-from notifications.notifiche_api import NotificheAPI
+import threading
+from notifications.notifiche_api import (
+    NotificheAPI,
+    ERRORE_TOKEN_NON_REGISTRATO,
+    ERRORE_ARGOMENTO_NON_VALIDO,
+    ERRORE_TOKEN_NON_VALIDO,
+    ERRORE_SENDER_ID,
+    ERRORE_QUOTA,
+    ERRORE_NON_DISPONIBILE,
+    ERRORE_INTERNO,
+    ERRORE_AUTENTICAZIONE,
+    ERRORE_SCONOSCIUTO,
+    ERRORI_TOKEN_INVALIDO,
+)
+from schemas.notifica_schema import NotificaPush
+
+# Numero massimo di messaggi/token accettati da FCM in una singola chiamata send_each*
+FCM_MAX_BATCH = 500
+
+# Numero massimo di token per chiamata di (dis)iscrizione a un topic
+FCM_MAX_TOPIC_BATCH = 1000
+
+# Motivi di errore della gestione topic che indicano un token da non riutilizzare
+# (INVALID_ARGUMENT escluso: può riferirsi al topic e non al singolo token)
+_MOTIVI_TOKEN_INVALIDO = ("NOT_FOUND", "registration-token-not-registered", "invalid-registration-token")
+
+# Serializza l'inizializzazione lazy dell'app Firebase tra i worker
+_firebase_lock = threading.Lock()
+
+
+def _chunks(items: list, size: int = FCM_MAX_BATCH):
+    """Suddivide una lista in blocchi consecutivi di al più `size` elementi."""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _codice_errore(exc: Optional[Exception]) -> str:
+    """
+    Scopo: Traduce l'eccezione FCM di una singola risposta nel codice di errore di NotificheAPI.
+
+    Parametri:
+    - exc (Optional[Exception]): Eccezione associata alla risposta fallita.
+
+    Valore di ritorno:
+    - str: Codice di errore (es. 'UNREGISTERED', 'UNAVAILABLE'). Un INVALID_ARGUMENT diventa
+      'INVALID_REGISTRATION_TOKEN' solo se il messaggio nomina il token di registrazione:
+      gli altri (es. payload oltre 4 KB) non giustificano la rimozione del dispositivo.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    if isinstance(exc, messaging.UnregisteredError):
+        return ERRORE_TOKEN_NON_REGISTRATO
+    if isinstance(exc, messaging.SenderIdMismatchError):
+        return ERRORE_SENDER_ID
+    if isinstance(exc, messaging.QuotaExceededError):
+        return ERRORE_QUOTA
+    if isinstance(exc, messaging.ThirdPartyAuthError):
+        return ERRORE_AUTENTICAZIONE
+    if isinstance(exc, exceptions.InvalidArgumentError):
+        if "registration token" in str(exc).lower():
+            return ERRORE_TOKEN_NON_VALIDO
+        return ERRORE_ARGOMENTO_NON_VALIDO
+    if isinstance(exc, (exceptions.UnavailableError, exceptions.DeadlineExceededError)):
+        return ERRORE_NON_DISPONIBILE
+    if isinstance(exc, exceptions.InternalError):
+        return ERRORE_INTERNO
+    return ERRORE_SCONOSCIUTO
 
 class NotifyFCMAdapter(NotificheAPI):
     """
@@ -10,45 +77,80 @@ class NotifyFCMAdapter(NotificheAPI):
     Implementa l'interfaccia NotificheAPI e adatta le chiamate alla libreria firebase-admin.
     """
 
-    def __init__(self, cred_path: str = None):
+    def __init__(self, cred_path: str = None, on_invalid_tokens=None, transport=None):
         """
-        Scopo: Inizializza l'app Firebase per l'invio delle notifiche.
+        Scopo: Configura l'adapter. L'app Firebase non viene inizializzata qui ma al primo
+        invio (vedi `_assicura_firebase`), così la creazione dell'adapter non ha costi.
         
         Parametri:
             cred_path (str, optional): Percorso al file JSON delle credenziali di servizio.
                                        Se None, cerca:
                                        1. Variabile d'ambiente GOOGLE_APPLICATION_CREDENTIALS
                                        2. File 'firebase_credentials.json' nella root del progetto
+            on_invalid_tokens (Callable, optional): Callback invocata con i token che FCM
+                                       segnala come non registrati o non validi.
+            transport (optional): Client con l'interfaccia di `firebase_admin.messaging`
+                                       (send, send_each, send_each_for_multicast) da usare al
+                                       posto di FCM, es. FakeFCMTransport per i benchmark offline.
         
         Valore di ritorno:
             None
             
+        Eccezioni:
+            Nessuna eccezione prevista.
+        """
+        self.cred_path = cred_path
+        self.transport = transport
+        self.on_invalid_tokens = on_invalid_tokens
+        self._firebase_pronto = False
+
+    def _assicura_firebase(self) -> None:
+        """
+        Scopo: Inizializza l'app Firebase al primo invio (una sola volta per processo).
+
+        Parametri:
+            Nessuno.
+
+        Valore di ritorno:
+            None
+
         Eccezioni:
             ValueError: Se le credenziali non sono valide o non trovate (gestito internamente da firebase_admin).
         """
-        if not firebase_admin._apps:
-            if cred_path:
-                cred = credentials.Certificate(cred_path)
-                firebase_admin.initialize_app(cred)
-            elif os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'):
-                # Usa la variabile d'ambiente se esiste
-                firebase_admin.initialize_app()
-            else:
-                # Tenta di trovare il file nella root del progetto automaticamente
-                # La struttura delle cartelle: app/notifications/ -> app/ -> RoadGuardian-Server/ -> Root 
-                # Inserire il file key di FCM nella directory root
-                current_dir = os.path.dirname(os.path.abspath(__file__))
-                project_root = os.path.abspath(os.path.join(current_dir, '..', '..', '..'))
-                default_cred_path = os.path.join(project_root, "firebase_credentials.json")
-
-                if os.path.exists(default_cred_path):
-                    print(f"FCM Adapter: Trovate credenziali in {default_cred_path}")
-                    cred = credentials.Certificate(default_cred_path)
+        if self._firebase_pronto:
+            return
+        with _firebase_lock:
+            if not firebase_admin._apps:
+                if self.cred_path:
+                    cred = credentials.Certificate(self.cred_path)
                     firebase_admin.initialize_app(cred)
-                else:
-                    print("FCM Adapter: Nessuna credenziale trovata. L'invio notifiche potrebbe fallire.")
-                    # Inizializzazione default (fallirà se non ci sono credenziali implicite)
+                elif os.environ.get('GOOGLE_APPLICATION_CREDENTIALS'):
+                    # Usa la variabile d'ambiente se esiste
                     firebase_admin.initialize_app()
+                else:
+                    # Tenta di trovare il file nella root del progetto automaticamente
+                    # La struttura delle cartelle: app/notifications/ -> app/ -> RoadGuardian-Server/ -> Root 
+                    # Inserire il file key di FCM nella directory root
+                    current_dir = os.path.dirname(os.path.abspath(__file__))
+                    project_root = os.path.abspath(os.path.join(current_dir, '..', '..', '..'))
+                    default_cred_path = os.path.join(project_root, "firebase_credentials.json")
+
+                    if os.path.exists(default_cred_path):
+                        print(f"FCM Adapter: Trovate credenziali in {default_cred_path}")
+                        cred = credentials.Certificate(default_cred_path)
+                        firebase_admin.initialize_app(cred)
+                    else:
+                        print("FCM Adapter: Nessuna credenziale trovata. L'invio notifiche potrebbe fallire.")
+                        # Inizializzazione default (fallirà se non ci sono credenziali implicite)
+                        firebase_admin.initialize_app()
+            self._firebase_pronto = True
+
+    def _client(self):
+        """Restituisce il trasporto configurato oppure il client FCM reale (inizializzando Firebase)."""
+        if self.transport is not None:
+            return self.transport
+        self._assicura_firebase()
+        return messaging
 
     def send_notification(self, token: str, title: str, body: str, data: dict = None) -> bool:
         """
@@ -67,6 +169,7 @@ class NotifyFCMAdapter(NotificheAPI):
             Cattura tutte le eccezioni (Exception) e le logga, restituendo False.
         """
         try:
+            client = self._client()
             print("NotifyFCMAdapter: Inizio invio notifica FCM")
             message = messaging.Message(
                 notification=messaging.Notification(
@@ -76,17 +179,20 @@ class NotifyFCMAdapter(NotificheAPI):
                 data=data if data else {},
                 token=token,
             )
-            response = messaging.send(message)
+            response = client.send(message)
             print("NotifyFCMAdapter: Fine fcm")
             # Response is a message ID string
             return True
         except Exception as e:
             print(f"Errore invio notifica FCM: {e}")
+            if _codice_errore(e) in ERRORI_TOKEN_INVALIDO:
+                self.segnala_token_invalidi([token])
             return False
 
     def send_multicast_notification(self, tokens: List[str], title: str, body: str, data: dict = None) -> List[str]:
         """
         Scopo: Invia una notifica push a più dispositivi tramite FCM (Multicast).
+        I token vengono suddivisi in blocchi da 500 e inviati con `send_each_for_multicast`.
         
         Parametri:
             tokens (List[str]): Lista dei token FCM dei destinatari.
@@ -98,31 +204,156 @@ class NotifyFCMAdapter(NotificheAPI):
             List[str]: Lista dei token per cui l'invio è fallito.
             
         Eccezioni:
-            Cattura tutte le eccezioni (Exception) e le logga, restituendo la lista completa dei token come falliti.
+            Cattura tutte le eccezioni (Exception) e le logga, considerando falliti i token del blocco interessato.
         """
         if not tokens:
             return []
-            
+
+        failed_tokens = []
+        invalid_tokens = []
+        for blocco in _chunks(list(tokens)):
+            try:
+                client = self._client()
+                message = messaging.MulticastMessage(
+                    notification=messaging.Notification(
+                        title=title,
+                        body=body,
+                    ),
+                    data=data if data else {},
+                    tokens=blocco,
+                )
+                response = client.send_each_for_multicast(message)
+
+                if response.failure_count > 0:
+                    for idx, resp in enumerate(response.responses):
+                        if not resp.success:
+                            # L'ordine delle risposte corrisponde all'ordine dei token del blocco
+                            failed_tokens.append(blocco[idx])
+                            if _codice_errore(resp.exception) in ERRORI_TOKEN_INVALIDO:
+                                invalid_tokens.append(blocco[idx])
+            except Exception as e:
+                print(f"Errore invio notifica multicast FCM: {e}")
+                failed_tokens.extend(blocco) # Consideriamo tutto il blocco fallito in caso di eccezione globale
+
+        self.segnala_token_invalidi(invalid_tokens)
+        return failed_tokens
+
+    def send_batch(self, notifiche: List[NotificaPush]) -> List[Optional[str]]:
+        """
+        Scopo: Invia notifiche eterogenee (token e contenuti diversi) con `send_each`,
+        in blocchi da al più 500 messaggi per chiamata HTTP.
+
+        Parametri:
+            notifiche (List[NotificaPush]): Notifiche da inviare.
+
+        Valore di ritorno:
+            List[Optional[str]]: Per ogni notifica (stesso ordine), None se inviata,
+            altrimenti il codice di errore FCM tradotto.
+
+        Eccezioni:
+            Cattura tutte le eccezioni (Exception) e le logga, marcando il blocco come 'UNAVAILABLE'.
+        """
+        esiti: List[Optional[str]] = []
+        for blocco in _chunks(list(notifiche)):
+            messages = [
+                messaging.Message(
+                    notification=messaging.Notification(
+                        title=notifica.title,
+                        body=notifica.body,
+                    ),
+                    data=notifica.data if notifica.data else {},
+                    token=notifica.token,
+                )
+                for notifica in blocco
+            ]
+            try:
+                response = self._client().send_each(messages)
+                for resp in response.responses:
+                    esiti.append(None if resp.success else _codice_errore(resp.exception))
+            except Exception as e:
+                print(f"Errore invio batch FCM: {e}")
+                esiti.extend([ERRORE_NON_DISPONIBILE] * len(blocco))
+
+        # I token rifiutati vengono rimossi in blocco dal registro dispositivi
+        self.segnala_token_invalidi(self.token_da_esiti(notifiche, esiti))
+        return esiti
+
+    def send_topic_notification(self, topic: str, title: str, body: str, data: dict = None) -> bool:
+        """
+        Scopo: Invia una notifica a tutti i dispositivi iscritti a un topic FCM (una sola chiamata).
+
+        Parametri:
+            topic (str): Nome del topic destinatario.
+            title (str): Il titolo della notifica.
+            body (str): Il corpo del messaggio.
+            data (dict, optional): Dati aggiuntivi (payload).
+
+        Valore di ritorno:
+            bool: True se l'invio è riuscito, False in caso di errore.
+
+        Eccezioni:
+            Cattura tutte le eccezioni (Exception) e le logga, restituendo False.
+        """
         try:
-            message = messaging.MulticastMessage(
+            message = messaging.Message(
                 notification=messaging.Notification(
                     title=title,
                     body=body,
                 ),
                 data=data if data else {},
-                tokens=tokens,
+                topic=topic,
             )
-            response = messaging.send_multicast(message)
-            
-            failed_tokens = []
-            if response.failure_count > 0:
-                responses = response.responses
-                for idx, resp in enumerate(responses):
-                    if not resp.success:
-                        # The order of responses corresponds to the order of the registration tokens.
-                        failed_tokens.append(tokens[idx])
-            
-            return failed_tokens
+            self._client().send(message)
+            return True
         except Exception as e:
-            print(f"Errore invio notifica multicast FCM: {e}")
-            return tokens # Consideriamo tutti falliti in caso di eccezione globale
+            print(f"Errore invio notifica topic FCM: {e}")
+            return False
+
+    def _gestisci_topic(self, operazione: str, tokens: List[str], topic: str) -> List[str]:
+        """Esegue (dis)iscrizioni a blocchi da 1000 token; restituisce i token falliti e segnala quelli non validi."""
+        failed_tokens = []
+        invalid_tokens = []
+        for blocco in _chunks(list(tokens), FCM_MAX_TOPIC_BATCH):
+            try:
+                response = getattr(self._client(), operazione)(blocco, topic)
+                for errore in response.errors:
+                    failed_tokens.append(blocco[errore.index])
+                    if errore.reason in _MOTIVI_TOKEN_INVALIDO:
+                        invalid_tokens.append(blocco[errore.index])
+            except Exception as e:
+                print(f"Errore {operazione} FCM sul topic {topic}: {e}")
+                failed_tokens.extend(blocco)
+        self.segnala_token_invalidi(invalid_tokens)
+        return failed_tokens
+
+    def subscribe_to_topic(self, tokens: List[str], topic: str) -> List[str]:
+        """
+        Scopo: Iscrive i dispositivi a un topic FCM, a blocchi da 1000 token.
+
+        Parametri:
+            tokens (List[str]): Token dei dispositivi da iscrivere.
+            topic (str): Nome del topic.
+
+        Valore di ritorno:
+            List[str]: Token per cui l'iscrizione è fallita.
+
+        Eccezioni:
+            Cattura tutte le eccezioni (Exception) e le logga, considerando falliti i token del blocco.
+        """
+        return self._gestisci_topic("subscribe_to_topic", tokens, topic)
+
+    def unsubscribe_from_topic(self, tokens: List[str], topic: str) -> List[str]:
+        """
+        Scopo: Disiscrive i dispositivi da un topic FCM, a blocchi da 1000 token.
+
+        Parametri:
+            tokens (List[str]): Token dei dispositivi da disiscrivere.
+            topic (str): Nome del topic.
+
+        Valore di ritorno:
+            List[str]: Token per cui la disiscrizione è fallita.
+
+        Eccezioni:
+            Cattura tutte le eccezioni (Exception) e le logga, considerando falliti i token del blocco.
+        """
+        return self._gestisci_topic("unsubscribe_from_topic", tokens, topic)
@@ -0,0 +1,259 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from schemas.notifica_schema import NotificaPush
+from monitoring.metriche import Contatore
+
+
+class TokenBucket:
+    """Token bucket classico: `rate` gettoni al secondo, fino a `capacity` accumulabili (burst)."""
+
+    def __init__(self, rate: float, capacity: float, adesso: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.gettoni = capacity
+        self.aggiornato_il = adesso
+
+    def _ricarica(self, adesso: float) -> None:
+        trascorso = adesso - self.aggiornato_il
+        if trascorso > 0:
+            self.gettoni = min(self.capacity, self.gettoni + trascorso * self.rate)
+            self.aggiornato_il = adesso
+
+    def disponibile(self, adesso: float) -> bool:
+        self._ricarica(adesso)
+        return self.gettoni >= 1
+
+    def consuma(self, adesso: float) -> None:
+        self._ricarica(adesso)
+        self.gettoni -= 1
+
+    def attesa(self, adesso: float) -> float:
+        """Secondi mancanti al prossimo gettone disponibile."""
+        self._ricarica(adesso)
+        return 0.0 if self.gettoni >= 1 else (1 - self.gettoni) / self.rate
+
+    def pieno(self, adesso: float) -> bool:
+        self._ricarica(adesso)
+        return self.gettoni >= self.capacity
+
+
+class NotificationRateLimiter:
+    """
+    Limitatore delle notifiche in uscita con token bucket per dispositivo, per segnalazione
+    e globale (quota del progetto FCM).
+
+    Le notifiche oltre il limite non vengono scartate ma differite: restano in memoria fino
+    a quando tutti i bucket interessati hanno di nuovo un gettone. Le notifiche differite per
+    la stessa coppia (dispositivo, segnalazione) vengono accorpate tenendo solo la più recente;
+    i riepiloghi del digest (senza `incident_id`) sono distinti per `digest_id` e non vengono
+    mai accorpati tra loro, perché ognuno riporta segnalazioni diverse.
+    Il limitatore è applicato dai worker del dispatcher, quindi non genera backpressure
+    sui thread delle API; i broadcast sui topic geohash passano da `consenti_topic`.
+    """
+
+    def __init__(self, device_rate: float = 0.1, device_burst: float = 3,
+                 incident_rate: float = 100.0, incident_burst: float = 500,
+                 global_rate: float = 5000.0, global_burst: float = 5000,
+                 max_differite: int = 10000, orologio: Callable[[], float] = time.monotonic):
+        """
+        Scopo: Configura i tre livelli di token bucket.
+
+        Parametri:
+        - device_rate (float): Notifiche al secondo per dispositivo (0.1 = 6 al minuto).
+        - device_burst (float): Notifiche consecutive ammesse per dispositivo.
+        - incident_rate (float): Notifiche al secondo per singola segnalazione.
+        - incident_burst (float): Burst ammesso per segnalazione.
+        - global_rate (float): Notifiche al secondo per l'intero progetto FCM.
+        - global_burst (float): Burst globale ammesso.
+        - max_differite (int): Numero massimo di notifiche differite tenute in memoria;
+          oltre questa soglia viene scartata la più vecchia.
+        - orologio (Callable): Sorgente del tempo in secondi (iniettabile nei test).
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - ValueError: Se un rate o un burst non è positivo.
+        """
+        if min(device_rate, device_burst, incident_rate, incident_burst, global_rate, global_burst) <= 0:
+            raise ValueError("I rate e i burst del rate limiter devono essere positivi")
+        self.device_rate, self.device_burst = device_rate, device_burst
+        self.incident_rate, self.incident_burst = incident_rate, incident_burst
+        self.max_differite = max_differite
+        self._orologio = orologio
+
+        self._lock = threading.Lock()
+        adesso = orologio()
+        self._globale = TokenBucket(global_rate, global_burst, adesso)
+        self._per_dispositivo: Dict[str, TokenBucket] = {}
+        self._per_segnalazione: Dict[str, TokenBucket] = {}
+        # (token, incident_id o digest_id) -> (pronto_il, notifica), in ordine di prima differita
+        self._differite: "OrderedDict[Tuple[str, Optional[str]], Tuple[float, NotificaPush]]" = OrderedDict()
+        self._ultima_pulizia = adesso
+
+        self.consentite = Contatore()
+        self.differite = Contatore()
+        self.accorpate = Contatore()
+        self.scartate = Contatore()
+
+    def _bucket(self, mappa: Dict[str, TokenBucket], chiave: str, rate: float, burst: float,
+                adesso: float) -> TokenBucket:
+        bucket = mappa.get(chiave)
+        if bucket is None:
+            bucket = mappa[chiave] = TokenBucket(rate, burst, adesso)
+        return bucket
+
+    def _buckets_per(self, notifica: NotificaPush, adesso: float) -> List[TokenBucket]:
+        buckets = [self._globale,
+                   self._bucket(self._per_dispositivo, notifica.token, self.device_rate, self.device_burst, adesso)]
+        incident_id = (notifica.data or {}).get("incident_id")
+        if incident_id:
+            buckets.append(self._bucket(self._per_segnalazione, incident_id,
+                                        self.incident_rate, self.incident_burst, adesso))
+        return buckets
+
+    def _prova(self, notifica: NotificaPush, adesso: float) -> float:
+        """Consuma un gettone da ogni bucket se tutti lo consentono; altrimenti restituisce l'attesa in secondi."""
+        return self._consuma(self._buckets_per(notifica, adesso), adesso)
+
+    @staticmethod
+    def _consuma(buckets: List[TokenBucket], adesso: float) -> float:
+        attesa = max(bucket.attesa(adesso) for bucket in buckets)
+        if attesa == 0:
+            for bucket in buckets:
+                bucket.consuma(adesso)
+        return attesa
+
+    @staticmethod
+    def _chiave(notifica: NotificaPush) -> Tuple[str, Optional[str]]:
+        """Chiave di accorpamento delle differite: dispositivo e segnalazione (o riepilogo del digest)."""
+        data = notifica.data or {}
+        return notifica.token, data.get("incident_id") or data.get("digest_id")
+
+    def _differisci(self, chiave, notifica: NotificaPush, pronto_il: float) -> None:
+        if chiave in self._differite:
+            # Accorpamento: resta in coda la notifica più recente per dispositivo e segnalazione,
+            # che copre anche i documenti dell'outbox di quella sostituita
+            pronto_il, precedente = self._differite[chiave]
+            notifica.outbox_ids = precedente.outbox_ids + notifica.outbox_ids
+            self._differite[chiave] = (pronto_il, notifica)
+            self.accorpate.incrementa()
+            return
+        if len(self._differite) >= self.max_differite:
+            self._differite.popitem(last=False)
+            self.scartate.incrementa()
+        self._differite[chiave] = (pronto_il, notifica)
+        self.differite.incrementa()
+
+    def _pulisci(self, adesso: float) -> None:
+        """Rimuove periodicamente i bucket tornati pieni, per limitare la memoria."""
+        if adesso - self._ultima_pulizia < 60:
+            return
+        self._ultima_pulizia = adesso
+        for mappa in (self._per_dispositivo, self._per_segnalazione):
+            for chiave in [k for k, bucket in mappa.items() if bucket.pieno(adesso)]:
+                del mappa[chiave]
+
+    def filtra(self, notifiche: List[NotificaPush]) -> List[NotificaPush]:
+        """
+        Scopo: Restituisce le notifiche inviabili ora: prima le differite ormai pronte, poi le
+        nuove entro i limiti. Le altre vengono differite (e accorpate).
+
+        Parametri:
+        - notifiche (List[NotificaPush]): Nuove notifiche prelevate dalla coda.
+
+        Valore di ritorno:
+        - List[NotificaPush]: Notifiche da inviare subito.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            adesso = self._orologio()
+            self._pulisci(adesso)
+            da_inviare = []
+
+            for chiave, (pronto_il, notifica) in list(self._differite.items()):
+                if pronto_il > adesso:
+                    continue
+                attesa = self._prova(notifica, adesso)
+                if attesa == 0:
+                    del self._differite[chiave]
+                    da_inviare.append(notifica)
+                else:
+                    self._differite[chiave] = (adesso + attesa, notifica)
+                    if not self._globale.disponibile(adesso):
+                        break
+
+            for notifica in notifiche:
+                chiave = self._chiave(notifica)
+                if chiave in self._differite:
+                    self._differisci(chiave, notifica, adesso)
+                    continue
+                attesa = self._prova(notifica, adesso)
+                if attesa == 0:
+                    da_inviare.append(notifica)
+                else:
+                    self._differisci(chiave, notifica, adesso + attesa)
+
+            self.consentite.incrementa(len(da_inviare))
+            return da_inviare
+
+    def consenti_topic(self, incident_id: Optional[str] = None) -> float:
+        """
+        Scopo: Verifica un messaggio broadcast su un topic, che conta come un solo invio per
+        la quota globale e per la segnalazione (non per i singoli dispositivi).
+
+        Parametri:
+        - incident_id (str, optional): Segnalazione annunciata.
+
+        Valore di ritorno:
+        - float: 0 se il messaggio può partire (i gettoni vengono consumati), altrimenti i
+          secondi di attesa prima di riprovare.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            adesso = self._orologio()
+            buckets = [self._globale]
+            if incident_id:
+                buckets.append(self._bucket(self._per_segnalazione, incident_id,
+                                            self.incident_rate, self.incident_burst, adesso))
+            attesa = self._consuma(buckets, adesso)
+            if attesa == 0:
+                self.consentite.incrementa()
+            return attesa
+
+    def in_attesa(self) -> int:
+        """Numero di notifiche attualmente differite."""
+        return len(self._differite)
+
+    def trattenute(self) -> List[NotificaPush]:
+        """Notifiche attualmente differite."""
+        with self._lock:
+            return [notifica for _, notifica in self._differite.values()]
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone i contatori del rate limiter.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Notifiche consentite, differite, accorpate, scartate e ancora in attesa.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return {
+            "allowed": self.consentite.valore,
+            "deferred": self.differite.valore,
+            "coalesced": self.accorpate.valore,
+            "dropped": self.scartate.valore,
+            "pending": self.in_attesa(),
+        }
@@ -0,0 +1,361 @@
+import os
+import threading
+import datetime
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+import db.dispositivo_repository as dispositivo_repo
+from notifications.notifiche_api import NotificheAPI
+from notifications.notification_dispatcher import get_notification_dispatcher
+from notifications.rate_limiter import NotificationRateLimiter
+from services.geohash_index import geohash_encode, geohash_cover_circle, RAGGIO_ALLERTA_KM
+from monitoring.metriche import Contatore
+
+# Precisione geohash delle celle dei topic: 5 caratteri ≈ 4.9 x 4.9 km, quindi un
+# cerchio di allerta di 3 km interseca al più 9 celle
+PRECISIONE_TOPIC = 5
+TOPIC_PREFISSO = "geo_"
+
+
+def topic_per_cella(cella: str) -> str:
+    """Nome del topic FCM associato a una cella geohash."""
+    return f"{TOPIC_PREFISSO}{cella}"
+
+
+class GestoreTopicGeohash:
+    """
+    Notifiche broadcast tramite topic FCM per cella geohash.
+
+    Ogni dispositivo è iscritto al topic della cella geohash (grossolana) in cui si trova;
+    quando attraversa il confine di una cella lo spostamento viene registrato e le
+    (dis)iscrizioni vengono eseguite a blocchi da un thread in background. Alla creazione
+    di una segnalazione viene inviato un solo messaggio per ciascuna cella coperta dal
+    cerchio di allerta: il fanout passa da O(utenti) a O(celle).
+
+    Le iscrizioni sono registrate nella collezione `dispositivi` (`topic_cell`, `topic_since`).
+    Dopo l'invio riuscito di un annuncio, la segnalazione viene aggiunta a `topic_annunci` dei
+    dispositivi iscritti alla cella prima dell'invio: la notifica per dispositivo viene saltata
+    solo per loro, anche dopo un riavvio e su qualunque worker. Ogni annuncio consuma la quota
+    del rate limiter del dispatcher; se è esaurita viene rimandato alla sincronizzazione successiva.
+    """
+
+    def __init__(self, adapter: NotificheAPI, precision: int = PRECISIONE_TOPIC,
+                 radius_km: float = RAGGIO_ALLERTA_KM, flush_interval: float = 1.0,
+                 max_annunciate: int = 50, rate_limiter: Optional[NotificationRateLimiter] = None):
+        """
+        Scopo: Configura il gestore dei topic (il thread parte al primo uso).
+
+        Parametri:
+        - adapter (NotificheAPI): Provider con supporto ai topic.
+        - precision (int): Precisione geohash delle celle dei topic.
+        - radius_km (float): Raggio del cerchio di allerta delle segnalazioni.
+        - flush_interval (float): Secondi tra due sincronizzazioni delle iscrizioni.
+        - max_annunciate (int): Segnalazioni annunciate ricordate per dispositivo.
+        - rate_limiter (NotificationRateLimiter, optional): Limitatore condiviso con il dispatcher.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self.adapter = adapter
+        self.precision = precision
+        self.radius_km = radius_km
+        self.flush_interval = flush_interval
+        self.max_annunciate = max_annunciate
+        self.rate_limiter = rate_limiter
+
+        self._lock = threading.Lock()
+        self._celle: Dict[str, str] = {}           # token -> cella a cui è iscritto
+        self._spostamenti: Dict[str, str] = {}     # token -> nuova cella (in attesa di sincronizzazione)
+        self._annunci: List[Tuple[str, str, str, str, dict]] = []
+
+        self._sveglia = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.iscrizioni = Contatore()
+        self.disiscrizioni = Contatore()
+        self.messaggi_topic = Contatore()
+        self.rimandati = Contatore()
+        self.errori = Contatore()
+
+    def cella_di(self, lat: float, lon: float) -> str:
+        return geohash_encode(lat, lon, self.precision)
+
+    def aggiorna_posizione(self, token: str, lat: float, lon: float) -> bool:
+        """
+        Scopo: Registra la posizione di un dispositivo; se ha cambiato cella ne programma la reiscrizione.
+
+        Parametri:
+        - token (str): Token FCM del dispositivo.
+        - lat (float): Latitudine corrente.
+        - lon (float): Longitudine corrente.
+
+        Valore di ritorno:
+        - bool: True se è stato programmato un cambio di topic.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        cella = self.cella_di(lat, lon)
+        with self._lock:
+            if self._spostamenti.get(token, self._celle.get(token)) == cella:
+                return False
+            self._spostamenti[token] = cella
+        self._avvia()
+        return True
+
+    def annuncia_segnalazione(self, segnalazione: dict) -> List[str]:
+        """
+        Scopo: Programma un messaggio topic per ogni cella coperta dal cerchio di allerta.
+
+        Parametri:
+        - segnalazione (dict): Documento della segnalazione appena creata.
+
+        Valore di ritorno:
+        - List[str]: Celle geohash a cui verrà inviato l'annuncio (risultano annunciate solo
+          dopo l'invio riuscito, vedi `annunciate`).
+
+        Eccezioni:
+        - KeyError: Se la segnalazione non contiene le coordinate.
+        """
+        incident_id = str(segnalazione.get("_id") or segnalazione.get("id"))
+        celle = geohash_cover_circle(segnalazione["incident_latitude"], segnalazione["incident_longitude"],
+                                     self.radius_km, self.precision)
+        categoria = segnalazione.get("category", "segnalazione")
+        data = {"incident_id": incident_id, "tipo": "broadcast"}
+        with self._lock:
+            for cella in celle:
+                self._annunci.append((
+                    incident_id,
+                    cella,
+                    "Attenzione: nuova segnalazione in zona!",
+                    f"Segnalato un {categoria} entro {self.radius_km:g} km dalla tua zona.",
+                    data,
+                ))
+        self._avvia()
+        self._sveglia.set()
+        return celle
+
+    def annunciate(self, token: str) -> Set[str]:
+        """
+        Scopo: Restituisce le segnalazioni già ricevute dal dispositivo tramite il topic della sua cella.
+
+        Parametri:
+        - token (str): Token FCM del dispositivo.
+
+        Valore di ritorno:
+        - Set[str]: ID delle segnalazioni annunciate mentre il dispositivo era iscritto alla
+          cella; vuoto se il registro non è raggiungibile (meglio un doppione che un'allerta persa).
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        try:
+            return dispositivo_repo.get_topic_annunci(token)
+        except Exception as e:
+            print(f"GestoreTopicGeohash: impossibile leggere gli annunci dal registro: {e}")
+            return set()
+
+    def _sincronizza_iscrizioni(self) -> int:
+        with self._lock:
+            spostamenti, self._spostamenti = self._spostamenti, {}
+            vecchie = {token: self._celle.get(token) for token in spostamenti}
+        if not spostamenti:
+            return 0
+
+        # Dopo un riavvio la cella corrente non è in cache: la si recupera in blocco dal registro
+        sconosciuti = [token for token, cella in vecchie.items() if cella is None]
+        if sconosciuti:
+            try:
+                vecchie.update(dispositivo_repo.get_topic_celle(sconosciuti))
+            except Exception as e:
+                print(f"GestoreTopicGeohash: impossibile leggere le celle dal registro: {e}")
+
+        nuove_per_cella, vecchie_per_cella = defaultdict(list), defaultdict(list)
+        gia_iscritti = []
+        for token, cella in spostamenti.items():
+            if vecchie.get(token) == cella:
+                # Già iscritto prima del riavvio: nuova iscrizione e `topic_since` non cambiano
+                gia_iscritti.append((token, cella))
+                continue
+            nuove_per_cella[cella].append(token)
+            if vecchie.get(token) and vecchie[token] != cella:
+                vecchie_per_cella[vecchie[token]].append(token)
+
+        # Prima l'iscrizione alla nuova cella e la sua registrazione, poi la disiscrizione dalla
+        # vecchia: nessun buco di copertura, e il registro non indica mai una cella di cui il
+        # dispositivo non riceve già gli annunci
+        iscritti = []
+        for cella, tokens in nuove_per_cella.items():
+            falliti = set(self.adapter.subscribe_to_topic(tokens, topic_per_cella(cella)))
+            iscritti.extend((token, cella) for token in tokens if token not in falliti)
+            self.errori.incrementa(len(falliti))
+        with self._lock:
+            self._celle.update(gia_iscritti)
+            self._celle.update(iscritti)
+        self.iscrizioni.incrementa(len(iscritti))
+        try:
+            dispositivo_repo.set_topic_celle(iscritti)
+        except Exception as e:
+            print(f"GestoreTopicGeohash: impossibile salvare le celle nel registro: {e}")
+        for cella, tokens in vecchie_per_cella.items():
+            self.adapter.unsubscribe_from_topic(tokens, topic_per_cella(cella))
+            self.disiscrizioni.incrementa(len(tokens))
+        return len(spostamenti)
+
+    def _invia_annunci(self) -> int:
+        with self._lock:
+            annunci, self._annunci = self._annunci, []
+        rimandati = []
+        for annuncio in annunci:
+            incident_id, cella, title, body, data = annuncio
+            if self.rate_limiter is not None and self.rate_limiter.consenti_topic(incident_id) > 0:
+                rimandati.append(annuncio)
+                continue
+            # Chi si iscrive dopo questo istante non riceve il messaggio
+            inviata_il = datetime.datetime.now(datetime.timezone.utc)
+            if not self.adapter.send_topic_notification(topic_per_cella(cella), title, body, data):
+                self.errori.incrementa()
+                continue
+            self.messaggi_topic.incrementa()
+            try:
+                dispositivo_repo.segna_annunciata(cella, incident_id, inviata_il, self.max_annunciate)
+            except Exception as e:
+                print(f"GestoreTopicGeohash: impossibile registrare l'annuncio: {e}")
+        if rimandati:
+            self.rimandati.incrementa(len(rimandati))
+            with self._lock:
+                self._annunci[:0] = rimandati
+        return len(annunci) - len(rimandati)
+
+    def sincronizza(self) -> int:
+        """
+        Scopo: Esegue le (dis)iscrizioni in attesa e invia gli annunci programmati.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - int: Numero di spostamenti e annunci elaborati.
+
+        Eccezioni:
+        - Nessuna: gli errori del provider vengono loggati dall'adapter.
+        """
+        # Gli annunci hanno la precedenza: sono quelli sensibili alla latenza
+        return self._invia_annunci() + self._sincronizza_iscrizioni()
+
+    def _loop(self) -> None:
+        while not self._stop_event.is_set():
+            self._sveglia.wait(self.flush_interval)
+            self._sveglia.clear()
+            try:
+                self.sincronizza()
+            except Exception as e:
+                print(f"GestoreTopicGeohash: errore sincronizzazione: {e}")
+
+    def _avvia(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop_event.clear()
+                self._thread = threading.Thread(target=self._loop, name="notifiche-topic", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Scopo: Ferma il thread di sincronizzazione dopo un'ultima sincronizzazione.
+
+        Parametri:
+        - timeout (float): Secondi massimi di attesa.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self._stop_event.set()
+        self._sveglia.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.sincronizza()
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone i contatori di iscrizioni e messaggi topic.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Iscrizioni, disiscrizioni, messaggi topic inviati, errori e lavoro in attesa.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return {
+            "subscribed": self.iscrizioni.valore,
+            "unsubscribed": self.disiscrizioni.valore,
+            "topic_messages": self.messaggi_topic.valore,
+            "rate_limited": self.rimandati.valore,
+            "errors": self.errori.valore,
+            "pending_moves": len(self._spostamenti),
+            "pending_broadcasts": len(self._annunci),
+            "devices": len(self._celle),
+        }
+
+
+_gestore: Optional[GestoreTopicGeohash] = None
+_gestore_lock = threading.Lock()
+
+
+def get_gestore_topic() -> Optional[GestoreTopicGeohash]:
+    """
+    Scopo: Restituisce il gestore dei topic condiviso dal processo, creandolo al primo uso.
+
+    È attivo salvo NOTIFICHE_TOPIC_GEOHASH=0 e usa lo stesso adapter e rate limiter del
+    dispatcher condiviso.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - Optional[GestoreTopicGeohash]: Istanza singleton, o None se i topic sono disattivati.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    global _gestore
+    if os.environ.get("NOTIFICHE_TOPIC_GEOHASH", "1") != "1":
+        return None
+    if _gestore is None:
+        with _gestore_lock:
+            if _gestore is None:
+                dispatcher = get_notification_dispatcher()
+                _gestore = GestoreTopicGeohash(dispatcher.adapter, rate_limiter=dispatcher.rate_limiter)
+    return _gestore
+
+
+def shutdown_gestore_topic(timeout: float = 5.0) -> None:
+    """
+    Scopo: Ferma il gestore dei topic condiviso, se è stato creato.
+
+    Parametri:
+    - timeout (float): Secondi massimi di attesa.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    global _gestore
+    with _gestore_lock:
+        gestore, _gestore = _gestore, None
+    if gestore is not None:
+        gestore.stop(timeout)
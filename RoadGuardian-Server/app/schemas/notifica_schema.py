@@ -0,0 +1,33 @@
+from pydantic import BaseModel, Field
+from typing import Dict, List
+
+
+class NotificaPush(BaseModel):
+    """Notifica push in uscita verso un singolo dispositivo, accodata nel dispatcher."""
+    token: str = Field(
+        ...,
+        min_length=1,
+        description="Token FCM del dispositivo destinatario."
+    )
+    title: str = Field(
+        ...,
+        description="Titolo della notifica."
+    )
+    body: str = Field(
+        ...,
+        description="Corpo del messaggio."
+    )
+    data: Dict[str, str] = Field(
+        default_factory=dict,
+        description="Payload dati aggiuntivo (FCM accetta solo valori stringa)."
+    )
+    priorita: str = Field(
+        default="medium",
+        exclude=True,
+        description="Classe di priorità ('high', 'medium', 'low') assegnata all'accodamento; non serializzata."
+    )
+    outbox_ids: List[str] = Field(
+        default_factory=list,
+        exclude=True,
+        description="Documenti dell'outbox coperti da questa notifica (più di uno se accorpata); non serializzato."
+    )
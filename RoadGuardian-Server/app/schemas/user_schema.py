@@ -162,6 +162,16 @@ class PasswordUpdateSchema(BaseModel):
         return v
 
 
+class RefreshTokenInput(BaseModel):
+    """Schema di Input per il rinnovo della sessione e il logout con refresh token."""
+    refresh_token: str = Field(
+        ...,
+        min_length=1,
+        title="Refresh Token",
+        description="Refresh token ricevuto al login o all'ultimo rinnovo."
+    )
+
+
 # --- HELPER ---
 
 class PyObjectId(ObjectId):
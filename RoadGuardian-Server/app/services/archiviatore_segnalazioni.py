@@ -0,0 +1,207 @@
+"""Archiviazione in background delle segnalazioni non più attive.
+
+Le segnalazioni disattivate (soft delete) e quelle più vecchie della retention vengono
+spostate a lotti dalla collection `segnalazioni` a `segnalazioni_archive`: la collection
+attiva contiene solo ciò che serve a mappa, dettagli e notifiche, e i suoi indici restano
+piccoli. Lo storico resta consultabile con `include_storico=True` nelle letture del repository.
+"""
+
+import datetime
+import os
+import threading
+import time
+from typing import Optional
+
+import db.segnalazione_repository as segnalazione_repo
+from monitoring.metriche import Contatore, IstogrammaLatenza
+
+_archiviatore: Optional["ArchiviatoreSegnalazioni"] = None
+_archiviatore_lock = threading.Lock()
+
+
+class ArchiviatoreSegnalazioni:
+    """
+    Worker che sposta periodicamente le segnalazioni inattive o scadute nell'archivio.
+
+    Ogni ciclo archivia lotti di `dimensione_lotto` documenti finché ne trova, con una
+    breve pausa tra un lotto e l'altro per non competere con il traffico applicativo,
+    poi attende `intervallo` secondi.
+    """
+
+    def __init__(self, giorni_retention: float = 30, dimensione_lotto: int = 500,
+                 intervallo: float = 300.0, pausa_lotti: float = 0.1):
+        """
+        Scopo: Configura l'archiviatore.
+
+        Parametri:
+        - giorni_retention (float): Età oltre la quale anche le segnalazioni attive vengono archiviate.
+        - dimensione_lotto (int): Documenti spostati per lotto.
+        - intervallo (float): Secondi tra due cicli di archiviazione.
+        - pausa_lotti (float): Secondi di attesa tra due lotti dello stesso ciclo.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self.giorni_retention = giorni_retention
+        self.dimensione_lotto = dimensione_lotto
+        self.intervallo = intervallo
+        self.pausa_lotti = pausa_lotti
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.archiviate = Contatore()
+        self.cicli = Contatore()
+        self.errori = Contatore()
+        self.durata_ciclo = IstogrammaLatenza(bucket_ms=[10, 100, 1000, 10000, 60000, 300000])
+
+    def archivia(self) -> int:
+        """
+        Scopo: Esegue un ciclo di archiviazione completo.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - int: Segnalazioni spostate nell'archivio.
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se l'accesso al database fallisce.
+        """
+        inizio = time.perf_counter()
+        prima_del = datetime.datetime.now() - datetime.timedelta(days=self.giorni_retention)
+        totale = 0
+        while not self._stop_event.is_set():
+            spostate = segnalazione_repo.archivia_segnalazioni(self.dimensione_lotto, prima_del)
+            totale += spostate
+            self.archiviate.incrementa(spostate)
+            if spostate < self.dimensione_lotto:
+                break
+            self._stop_event.wait(self.pausa_lotti)
+        self.cicli.incrementa()
+        self.durata_ciclo.osserva(time.perf_counter() - inizio)
+        return totale
+
+    def _loop(self) -> None:
+        """Ciclo del worker: archivia, poi attende `intervallo`."""
+        while not self._stop_event.is_set():
+            try:
+                self.archivia()
+            except Exception as e:
+                self.errori.incrementa()
+                print(f"ArchiviatoreSegnalazioni: errore durante l'archiviazione: {e}")
+            self._stop_event.wait(self.intervallo)
+
+    def start(self) -> None:
+        """
+        Scopo: Avvia il thread di archiviazione (idempotente).
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="archiviatore-segnalazioni", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Scopo: Ferma il thread di archiviazione al termine del lotto in corso.
+
+        Parametri:
+        - timeout (float): Secondi massimi di attesa.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone i contatori dell'archiviatore.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Segnalazioni archiviate, cicli eseguiti, errori e durata dei cicli.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return {
+            "archived": self.archiviate.valore,
+            "runs": self.cicli.valore,
+            "errors": self.errori.valore,
+            "retention_days": self.giorni_retention,
+            "run_duration": self.durata_ciclo.snapshot(),
+        }
+
+
+def get_archiviatore() -> Optional[ArchiviatoreSegnalazioni]:
+    """
+    Scopo: Restituisce l'archiviatore del processo, creandolo e avviandolo al primo uso.
+
+    Configurazione: SEGNALAZIONI_ARCHIVIO (0 per disattivarlo), SEGNALAZIONI_ARCHIVIO_GIORNI
+    (retention delle segnalazioni attive), SEGNALAZIONI_ARCHIVIO_LOTTO e
+    SEGNALAZIONI_ARCHIVIO_INTERVALLO (secondi tra due cicli).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - ArchiviatoreSegnalazioni | None: Istanza singleton, None se l'archiviazione è disattivata.
+
+    Eccezioni:
+    - ValueError: Se la configurazione d'ambiente non è valida.
+    """
+    global _archiviatore
+    if os.environ.get("SEGNALAZIONI_ARCHIVIO", "1") != "1":
+        return None
+    if _archiviatore is None:
+        with _archiviatore_lock:
+            if _archiviatore is None:
+                archiviatore = ArchiviatoreSegnalazioni(
+                    giorni_retention=float(os.environ.get("SEGNALAZIONI_ARCHIVIO_GIORNI", "30")),
+                    dimensione_lotto=int(os.environ.get("SEGNALAZIONI_ARCHIVIO_LOTTO", "500")),
+                    intervallo=float(os.environ.get("SEGNALAZIONI_ARCHIVIO_INTERVALLO", "300"))
+                )
+                archiviatore.start()
+                _archiviatore = archiviatore
+    return _archiviatore
+
+
+def shutdown_archiviatore(timeout: float = 5.0) -> None:
+    """
+    Scopo: Ferma l'archiviatore condiviso, se è stato creato.
+
+    Parametri:
+    - timeout (float): Secondi massimi di attesa del thread.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    global _archiviatore
+    with _archiviatore_lock:
+        archiviatore, _archiviatore = _archiviatore, None
+    if archiviatore is not None:
+        archiviatore.stop(timeout)
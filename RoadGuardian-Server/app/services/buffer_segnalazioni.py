@@ -0,0 +1,539 @@
+"""Buffer write-behind per le segnalazioni veloci.
+
+La segnalazione veloce viene accettata appena è stata scritta (con fsync) in un log
+locale append-only, con l'ObjectId già assegnato dal server applicativo: la risposta
+non attende MongoDB. Un thread in background scrive le segnalazioni nella collection
+`segnalazioni` con `insert_many`, in lotti limitati per dimensione e per tempo; al
+riavvio le voci del log non ancora confermate vengono reinviate (l'inserimento è
+idempotente sull'`_id`), quindi nessuna segnalazione accettata va persa.
+
+Ogni processo (es. ogni worker uvicorn) scrive un proprio log nella cartella dati,
+bloccato con `flock` finché il processo è vivo: il troncamento del log di un worker non
+tocca i record degli altri. All'avvio un processo adotta i log dei processi terminati
+(il cui lock è libero), copiandone le segnalazioni non confermate nel proprio log prima
+di eliminarli.
+"""
+
+import os
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: nessun lock tra processi, i log orfani non vengono adottati
+    fcntl = None
+
+import bson
+from bson import ObjectId
+
+import db.segnalazione_repository as segnalazione_repo
+from monitoring.metriche import Contatore, IstogrammaLatenza
+
+# Tipi di record del log
+RECORD_SEGNALAZIONE = "add"  # segnalazione accettata, da scrivere su MongoDB
+RECORD_CONFERMA = "ok"       # lotto di `_id` scritto con successo
+
+PREFISSO_LOG = "segnalazioni_buffer."  # i log dei processi si chiamano segnalazioni_buffer.<pid>.log
+CARTELLA_DATI_DEFAULT = os.path.join(os.path.expanduser("~"), ".roadguardian", "buffer")
+
+_buffer: Optional["BufferSegnalazioni"] = None
+_buffer_lock = threading.Lock()
+
+
+def percorso_log_processo(cartella: str) -> str:
+    """Percorso del log del processo corrente nella cartella dati."""
+    return os.path.join(cartella, f"{PREFISSO_LOG}{os.getpid()}.log")
+
+
+def _blocca(f, attendi: bool = False) -> bool:
+    """Prende il lock esclusivo sul file aperto; False se è già di un altro processo."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if attendi else fcntl.LOCK_NB))
+        return True
+    except BlockingIOError:
+        return False
+
+
+def _leggi_log(dati: bytes) -> Tuple[Dict[ObjectId, dict], Set[ObjectId], int]:
+    """Decodifica i record di un log; restituisce segnalazioni (ultimo record per `_id`),
+    `_id` confermati e byte validi (un record finale incompleto viene ignorato)."""
+    segnalazioni, confermate = {}, set()
+    valido = 0
+    while valido + 4 <= len(dati):
+        lunghezza = struct.unpack_from("<i", dati, valido)[0]
+        if lunghezza < 5 or valido + lunghezza > len(dati):
+            break
+        try:
+            record = bson.decode(dati[valido:valido + lunghezza])
+        except Exception:
+            break
+        if record.get("op") == RECORD_SEGNALAZIONE:
+            segnalazioni[record["doc"]["_id"]] = record["doc"]
+        elif record.get("op") == RECORD_CONFERMA:
+            confermate.update(record.get("ids", []))
+        valido += lunghezza
+    return segnalazioni, confermate, valido
+
+
+class BufferSegnalazioni:
+    """
+    Coda write-behind delle segnalazioni con log locale crash-safe.
+
+    `accoda` scrive il documento nel log e lo aggiunge alle segnalazioni in attesa; il
+    flusher le scrive in lotti di al più `max_lotto` documenti, al riempimento del lotto
+    o dopo `intervallo_flush` secondi. Se MongoDB non risponde le segnalazioni restano
+    nel log e nella memoria e il lotto viene ritentato con backoff esponenziale, senza
+    rallentare chi accoda. Il log viene troncato quando non resta nulla da scrivere.
+    """
+
+    def __init__(self, percorso_log: str, max_lotto: int = 100, intervallo_flush: float = 0.2,
+                 max_backoff: float = 30.0, fsync: bool = True, max_byte_log: int = 64 * 1024 * 1024,
+                 inserisci: Callable[[List[dict]], int] = None):
+        """
+        Scopo: Configura il buffer e apre (o crea) il log locale, prendendone il lock esclusivo.
+
+        Parametri:
+        - percorso_log (str): File del log append-only, riservato a questo processo
+          (vedi `percorso_log_processo`).
+        - max_lotto (int): Documenti massimi per `insert_many`.
+        - intervallo_flush (float): Secondi massimi di permanenza nel buffer con MongoDB disponibile.
+        - max_backoff (float): Attesa massima in secondi tra due tentativi falliti.
+        - fsync (bool): Se True ogni segnalazione è resa durevole su disco prima della risposta.
+        - max_byte_log (int): Dimensione oltre la quale il log viene compattato alle sole segnalazioni in attesa.
+        - inserisci (Callable, optional): Funzione di scrittura in blocco; default
+          `segnalazione_repository.insert_segnalazioni`.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - OSError: se il log non può essere aperto o è già in uso da un altro processo.
+        """
+        self.percorso_log = percorso_log
+        self.max_lotto = max_lotto
+        self.intervallo_flush = intervallo_flush
+        self.max_backoff = max_backoff
+        self.fsync = fsync
+        self.max_byte_log = max_byte_log
+        self._inserisci = inserisci or segnalazione_repo.insert_segnalazioni
+
+        cartella = os.path.dirname(os.path.abspath(percorso_log))
+        os.makedirs(cartella, exist_ok=True)
+        self._log = open(percorso_log, "ab")
+        if not _blocca(self._log):
+            self._log.close()
+            raise OSError(f"Log del buffer già in uso da un altro processo: {percorso_log}")
+        # Ordine dei lock: `_flush_lock`, poi `_log_lock`, poi `_lock`
+        self._flush_lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._in_attesa: Dict[ObjectId, dict] = {}  # ordinato per arrivo
+        self._in_scrittura = 0
+
+        self._stop_event = threading.Event()
+        self._sveglia = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._errori_consecutivi = 0
+
+        self.accodate = Contatore()
+        self.scritte = Contatore()
+        self.lotti = Contatore()
+        self.errori = Contatore()
+        self.ripristinate = Contatore()
+        self.latenza_accodamento = IstogrammaLatenza()
+        self.latenza_flush = IstogrammaLatenza()
+
+    def _scrivi_record(self, record: dict) -> None:
+        """Aggiunge un record BSON al log (chiamato con `_log_lock` acquisito)."""
+        self._log.write(bson.encode(record))
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+
+    def _compatta(self) -> None:
+        """Riscrive il log con le sole segnalazioni in attesa (chiamato con `_log_lock` acquisito)."""
+        with self._lock:
+            in_attesa = list(self._in_attesa.values())
+        temporaneo = self.percorso_log + ".tmp"
+        nuovo = open(temporaneo, "wb")
+        # Il lock passa con il file: nessun altro processo può adottare il log compattato
+        _blocca(nuovo, attendi=True)
+        for documento in in_attesa:
+            nuovo.write(bson.encode({"op": RECORD_SEGNALAZIONE, "doc": documento}))
+        nuovo.flush()
+        os.fsync(nuovo.fileno())
+        os.replace(temporaneo, self.percorso_log)
+        self._log.close()
+        self._log = nuovo
+
+    def accoda(self, documento: dict) -> dict:
+        """
+        Scopo: Accetta una segnalazione: assegna l'`_id`, la registra nel log e la mette in attesa di scrittura.
+
+        Parametri:
+        - documento (dict): Segnalazione nel formato di `IncidentModel.to_mongo()`.
+
+        Valore di ritorno:
+        - dict: Lo stesso documento, con `_id` valorizzato.
+
+        Eccezioni:
+        - OSError: se la scrittura sul log fallisce (la segnalazione non è stata accettata).
+        """
+        inizio = time.perf_counter()
+        documento.setdefault("_id", ObjectId())
+        with self._log_lock:
+            self._scrivi_record({"op": RECORD_SEGNALAZIONE, "doc": documento})
+            with self._lock:
+                self._in_attesa[documento["_id"]] = documento
+                pieno = len(self._in_attesa) - self._in_scrittura >= self.max_lotto
+        if pieno:
+            self._sveglia.set()
+        self.accodate.incrementa()
+        self.latenza_accodamento.osserva(time.perf_counter() - inizio)
+        return documento
+
+    def cerca(self, segnalazione_id) -> Optional[dict]:
+        """
+        Scopo: Restituisce una segnalazione accettata ma non ancora scritta su MongoDB.
+
+        Parametri:
+        - segnalazione_id (str | ObjectId): ID della segnalazione.
+
+        Valore di ritorno:
+        - dict | None: Copia del documento in attesa, None se non è nel buffer.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        try:
+            oid = ObjectId(segnalazione_id)
+        except Exception:
+            return None
+        with self._lock:
+            documento = self._in_attesa.get(oid)
+            return dict(documento) if documento is not None else None
+
+    def disattiva(self, segnalazione_id) -> bool:
+        """
+        Scopo: Disattiva (soft delete) una segnalazione ancora nel buffer, registrando la modifica nel log.
+
+        Se il lotto che la contiene è in scrittura attende la fine del flush: in quel caso
+        la segnalazione è già su MongoDB e il metodo restituisce False.
+
+        Parametri:
+        - segnalazione_id (str | ObjectId): ID della segnalazione.
+
+        Valore di ritorno:
+        - bool: True se la segnalazione era in attesa ed è stata disattivata.
+
+        Eccezioni:
+        - OSError: se la scrittura sul log fallisce.
+        """
+        try:
+            oid = ObjectId(segnalazione_id)
+        except Exception:
+            return False
+        with self._flush_lock, self._log_lock:
+            with self._lock:
+                documento = self._in_attesa.get(oid)
+                if documento is None or not documento.get("status", True):
+                    return False
+                documento["status"] = False
+            # Al ripristino vale l'ultimo record scritto per lo stesso `_id`
+            self._scrivi_record({"op": RECORD_SEGNALAZIONE, "doc": documento})
+        return True
+
+    def ripristina(self) -> int:
+        """
+        Scopo: Rilegge il log e rimette in attesa le segnalazioni non ancora confermate, poi
+        adotta i log lasciati nella stessa cartella da processi terminati.
+
+        Un record finale incompleto (crash durante la scrittura) viene scartato e il
+        log troncato all'ultimo record valido.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - int: Segnalazioni rimesse in attesa.
+
+        Eccezioni:
+        - OSError: se il log non può essere letto.
+        """
+        with self._log_lock:
+            with open(self.percorso_log, "rb") as f:
+                dati = f.read()
+            segnalazioni, confermate, valido = _leggi_log(dati)
+            if valido < len(dati):
+                print(f"BufferSegnalazioni: scartati {len(dati) - valido} byte incompleti in coda al log")
+                self._log.truncate(valido)
+            with self._lock:
+                for oid, documento in segnalazioni.items():
+                    if oid not in confermate:
+                        self._in_attesa.setdefault(oid, documento)
+            self._adotta_orfani()
+            with self._lock:
+                ripristinate = len(self._in_attesa)
+        self.ripristinate.incrementa(ripristinate)
+        if ripristinate:
+            self._sveglia.set()
+        return ripristinate
+
+    def _adotta_orfani(self) -> None:
+        """Copia nel proprio log le segnalazioni non confermate dei log di processi terminati e
+        li elimina (chiamato con `_log_lock` acquisito)."""
+        if fcntl is None:
+            return
+        cartella = os.path.dirname(os.path.abspath(self.percorso_log))
+        proprio = os.path.abspath(self.percorso_log)
+        for nome in sorted(os.listdir(cartella)):
+            percorso = os.path.join(cartella, nome)
+            if not (nome.startswith(PREFISSO_LOG) and nome.endswith(".log")) or percorso == proprio:
+                continue
+            try:
+                with open(percorso, "rb") as f:
+                    if not _blocca(f):
+                        continue  # processo ancora attivo
+                    segnalazioni, confermate, _ = _leggi_log(f.read())
+                    adottate = [d for oid, d in segnalazioni.items() if oid not in confermate]
+                    for documento in adottate:
+                        self._scrivi_record({"op": RECORD_SEGNALAZIONE, "doc": documento})
+                    with self._lock:
+                        for documento in adottate:
+                            self._in_attesa.setdefault(documento["_id"], documento)
+                    # Eliminato solo dopo la copia nel proprio log, sotto lock
+                    os.remove(percorso)
+            except FileNotFoundError:
+                continue  # adottato nel frattempo da un altro processo
+            if adottate:
+                print(f"BufferSegnalazioni: {len(adottate)} segnalazioni adottate da {nome}")
+
+    def flush(self) -> int:
+        """
+        Scopo: Scrive su MongoDB un lotto di segnalazioni in attesa e lo conferma nel log.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - int: Segnalazioni scritte (0 se il buffer è vuoto).
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se la scrittura fallisce; il lotto resta in attesa.
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        with self._lock:
+            lotto = list(self._in_attesa.values())[:self.max_lotto]
+            self._in_scrittura = len(lotto)
+        if not lotto:
+            return 0
+        inizio = time.perf_counter()
+        try:
+            self._inserisci([dict(documento) for documento in lotto])
+        finally:
+            with self._lock:
+                self._in_scrittura = 0
+        self.latenza_flush.osserva(time.perf_counter() - inizio)
+        ids = [documento["_id"] for documento in lotto]
+        with self._log_lock:
+            with self._lock:
+                for oid in ids:
+                    self._in_attesa.pop(oid, None)
+                vuoto = not self._in_attesa
+            if vuoto:
+                # Nulla da riprendere dopo un riavvio: il log può ripartire da zero
+                self._log.truncate(0)
+                self._log.seek(0)
+            elif self._log.tell() > self.max_byte_log:
+                self._compatta()
+            else:
+                self._scrivi_record({"op": RECORD_CONFERMA, "ids": ids})
+        self.scritte.incrementa(len(lotto))
+        self.lotti.incrementa()
+        return len(lotto)
+
+    def _loop(self) -> None:
+        """Ciclo del flusher: scrive lotti finché ce ne sono, altrimenti attende riempimento o timeout."""
+        while not self._stop_event.is_set():
+            try:
+                scritte = self.flush()
+                self._errori_consecutivi = 0
+            except Exception as e:
+                self.errori.incrementa()
+                self._errori_consecutivi += 1
+                attesa = min(self.max_backoff, self.intervallo_flush * (2 ** self._errori_consecutivi))
+                print(f"BufferSegnalazioni: scrittura del lotto fallita, nuovo tentativo tra {attesa:.1f}s: {e}")
+                self._stop_event.wait(attesa)
+                continue
+            if scritte < self.max_lotto:
+                self._sveglia.wait(self.intervallo_flush)
+                self._sveglia.clear()
+
+    def start(self) -> None:
+        """
+        Scopo: Avvia il thread di scrittura (idempotente).
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="buffer-segnalazioni", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Scopo: Ferma il thread e tenta di scrivere le segnalazioni rimaste; quelle non
+        scritte restano nel log e verranno riprese al prossimo avvio.
+
+        Parametri:
+        - timeout (float): Secondi massimi di attesa del thread.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self._stop_event.set()
+        self._sveglia.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            while self.flush():
+                pass
+        except Exception as e:
+            print(f"BufferSegnalazioni: segnalazioni non scritte allo shutdown, restano nel log: {e}")
+        with self._log_lock:
+            self._log.close()
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone contatori e latenze del buffer.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Segnalazioni accodate, scritte, in attesa e ripristinate, lotti, errori e latenze.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            in_attesa = len(self._in_attesa)
+        return {
+            "accepted": self.accodate.valore,
+            "written": self.scritte.valore,
+            "pending": in_attesa,
+            "recovered": self.ripristinate.valore,
+            "batches": self.lotti.valore,
+            "flush_errors": self.errori.valore,
+            "append_latency": self.latenza_accodamento.snapshot(),
+            "flush_latency": self.latenza_flush.snapshot(),
+        }
+
+
+def buffer_abilitato() -> bool:
+    """
+    Scopo: Indica se le segnalazioni veloci passano dal buffer (disattivabile con SEGNALAZIONI_BUFFER=0).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - bool: True se il buffer write-behind è abilitato.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return os.environ.get("SEGNALAZIONI_BUFFER", "1") == "1"
+
+
+def buffer_attivo() -> Optional[BufferSegnalazioni]:
+    """
+    Scopo: Restituisce il buffer condiviso solo se è già stato creato (per letture e cancellazioni).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - BufferSegnalazioni | None: Istanza attiva, None se nessuna segnalazione è passata dal buffer.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    return _buffer
+
+
+def get_buffer_segnalazioni() -> BufferSegnalazioni:
+    """
+    Scopo: Restituisce il buffer condiviso dal processo, creandolo al primo uso.
+
+    Alla creazione riprende le segnalazioni rimaste nel log (anche in quelli dei processi
+    terminati) e avvia il flusher. La configurazione è letta da SEGNALAZIONI_BUFFER_DIR
+    (cartella dati dei log, di default ~/.roadguardian/buffer),
+    SEGNALAZIONI_BUFFER_LOTTO, SEGNALAZIONI_BUFFER_INTERVALLO (secondi) e
+    SEGNALAZIONI_BUFFER_FSYNC (0 per disattivare l'fsync per segnalazione).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - BufferSegnalazioni: Istanza singleton.
+
+    Eccezioni:
+    - OSError: se il log non può essere aperto.
+    - ValueError: se la configurazione d'ambiente non è valida.
+    """
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                buffer = BufferSegnalazioni(
+                    percorso_log_processo(os.environ.get("SEGNALAZIONI_BUFFER_DIR", CARTELLA_DATI_DEFAULT)),
+                    max_lotto=int(os.environ.get("SEGNALAZIONI_BUFFER_LOTTO", "100")),
+                    intervallo_flush=float(os.environ.get("SEGNALAZIONI_BUFFER_INTERVALLO", "0.2")),
+                    fsync=os.environ.get("SEGNALAZIONI_BUFFER_FSYNC", "1") == "1"
+                )
+                ripristinate = buffer.ripristina()
+                if ripristinate:
+                    print(f"BufferSegnalazioni: {ripristinate} segnalazioni riprese dal log")
+                buffer.start()
+                _buffer = buffer
+    return _buffer
+
+
+def shutdown_buffer_segnalazioni(timeout: float = 5.0) -> None:
+    """
+    Scopo: Ferma il buffer condiviso, se è stato creato, scrivendo le segnalazioni rimaste.
+
+    Parametri:
+    - timeout (float): Secondi massimi di attesa del flusher.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    global _buffer
+    with _buffer_lock:
+        buffer, _buffer = _buffer, None
+    if buffer is not None:
+        buffer.stop(timeout)
@@ -0,0 +1,323 @@
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+# Alfabeto base32 standard dei geohash
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+RAGGIO_TERRA_KM = 6371.0
+RAGGIO_ALLERTA_KM = 3.0  # Raggio fisso di notifica di prossimità
+PRECISIONE_DEFAULT = 6   # Celle di circa 1.2 km x 0.6 km
+
+
+def geohash_encode(lat: float, lon: float, precision: int = PRECISIONE_DEFAULT) -> str:
+    """
+    Scopo: Calcola il geohash di un punto GPS alla precisione richiesta.
+
+    Parametri:
+    - lat (float): Latitudine del punto.
+    - lon (float): Longitudine del punto.
+    - precision (int): Numero di caratteri del geohash.
+
+    Valore di ritorno:
+    - str: Geohash del punto.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bit = 0
+    ch = 0
+    even = True  # I bit pari codificano la longitudine
+    while len(geohash) < precision:
+        rng, val = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if val >= mid:
+            ch |= 1 << (4 - bit)
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        if bit < 4:
+            bit += 1
+        else:
+            geohash.append(_BASE32[ch])
+            bit = 0
+            ch = 0
+    return "".join(geohash)
+
+
+def geohash_cell_size(precision: int) -> Tuple[float, float]:
+    """
+    Scopo: Restituisce le dimensioni in gradi di una cella geohash.
+
+    Parametri:
+    - precision (int): Numero di caratteri del geohash.
+
+    Valore di ritorno:
+    - Tuple[float, float]: (altezza in gradi di latitudine, larghezza in gradi di longitudine).
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """
+    Scopo: Calcola la distanza in km tra due punti GPS con la formula di Haversine.
+
+    Parametri:
+    - lat1, lon1 (float): Coordinate del primo punto.
+    - lat2, lon2 (float): Coordinate del secondo punto.
+
+    Valore di ritorno:
+    - float: Distanza in km.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(dlon / 2) ** 2)
+    return RAGGIO_TERRA_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def geohash_cover_circle(lat: float, lon: float, radius_km: float = RAGGIO_ALLERTA_KM,
+                         precision: int = PRECISIONE_DEFAULT) -> Set[str]:
+    """
+    Scopo: Calcola l'insieme delle celle geohash che intersecano un cerchio.
+
+    Parametri:
+    - lat (float): Latitudine del centro.
+    - lon (float): Longitudine del centro.
+    - radius_km (float): Raggio del cerchio in km.
+    - precision (int): Precisione delle celle.
+
+    Valore di ritorno:
+    - Set[str]: Geohash di tutte le celle che hanno almeno un punto entro il raggio.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    cell_lat, cell_lon = geohash_cell_size(precision)
+    dlat = math.degrees(radius_km / RAGGIO_TERRA_KM)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlon = min(math.degrees(radius_km / (RAGGIO_TERRA_KM * cos_lat)), 180.0)
+
+    # Allineamento alla griglia geohash (le celle partono da -90 / -180)
+    lat_start = math.floor((max(lat - dlat, -90.0) + 90.0) / cell_lat) * cell_lat - 90.0
+    lon_start = math.floor((lon - dlon + 180.0) / cell_lon) * cell_lon - 180.0
+    lat_end = min(lat + dlat, 90.0)
+    lon_end = lon + dlon
+
+    celle = set()
+    cell_min_lat = lat_start
+    while cell_min_lat < lat_end:
+        cell_min_lon = lon_start
+        while cell_min_lon < lon_end:
+            # Punto della cella più vicino al centro del cerchio
+            near_lat = min(max(lat, cell_min_lat), cell_min_lat + cell_lat)
+            near_lon = min(max(lon, cell_min_lon), cell_min_lon + cell_lon)
+            if haversine_km(lat, lon, near_lat, near_lon) <= radius_km:
+                center_lat = min(cell_min_lat + cell_lat / 2, 90.0)
+                # Normalizza la longitudine per gestire l'antimeridiano
+                center_lon = ((cell_min_lon + cell_lon / 2 + 180.0) % 360.0) - 180.0
+                celle.add(geohash_encode(center_lat, center_lon, precision))
+            cell_min_lon += cell_lon
+        cell_min_lat += cell_lat
+    return celle
+
+
+class GeohashIndex:
+    """
+    Indice invertito cella geohash -> id segnalazioni attive.
+
+    Ogni segnalazione attiva viene registrata in tutte le celle coperte dal suo
+    cerchio di allerta, così una posizione utente risolve i candidati con un solo
+    accesso al dizionario sulla propria cella.
+    """
+
+    def __init__(self, radius_km: float = RAGGIO_ALLERTA_KM, precision: int = PRECISIONE_DEFAULT,
+                 reload_interval: float = 60.0):
+        """
+        Scopo: Inizializza un indice vuoto.
+
+        Parametri:
+        - radius_km (float): Raggio del cerchio di allerta in km.
+        - precision (int): Precisione geohash delle celle indicizzate.
+        - reload_interval (float): Secondi dopo i quali l'indice viene ricaricato dal DB,
+          per recepire segnalazioni create o cancellate da altri processi.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self.radius_km = radius_km
+        self.precision = precision
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._celle: Dict[str, Set[str]] = {}
+        self._segnalazioni: Dict[str, Tuple[dict, Set[str]]] = {}
+        self._caricato_il: Optional[float] = None
+
+    def _aggiungi(self, segnalazione: dict) -> None:
+        """Registra una segnalazione nelle celle del suo cerchio (lock già acquisito)."""
+        incident_id = str(segnalazione.get("_id") or segnalazione.get("id"))
+        self._rimuovi(incident_id)
+        celle = geohash_cover_circle(
+            segnalazione["incident_latitude"],
+            segnalazione["incident_longitude"],
+            self.radius_km,
+            self.precision
+        )
+        dati = {
+            "_id": incident_id,
+            "category": segnalazione.get("category"),
+            "seriousness": segnalazione.get("seriousness"),
+            # Usata dal dispatcher per dare priorità alle segnalazioni più recenti
+            "incident_date": segnalazione.get("incident_date"),
+            "incident_latitude": segnalazione["incident_latitude"],
+            "incident_longitude": segnalazione["incident_longitude"],
+        }
+        self._segnalazioni[incident_id] = (dati, celle)
+        for cella in celle:
+            self._celle.setdefault(cella, set()).add(incident_id)
+
+    def _rimuovi(self, incident_id: str) -> bool:
+        """Elimina una segnalazione da tutte le sue celle (lock già acquisito)."""
+        entry = self._segnalazioni.pop(incident_id, None)
+        if entry is None:
+            return False
+        for cella in entry[1]:
+            ids = self._celle.get(cella)
+            if ids is not None:
+                ids.discard(incident_id)
+                if not ids:
+                    del self._celle[cella]
+        return True
+
+    def carica(self, segnalazioni: Iterable[dict]) -> None:
+        """
+        Scopo: Ricostruisce l'indice a partire dall'elenco delle segnalazioni attive.
+
+        Parametri:
+        - segnalazioni (Iterable[dict]): Segnalazioni attive (documenti o DTO serializzati).
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - KeyError: Se una segnalazione non contiene le coordinate.
+        """
+        with self._lock:
+            self._celle = {}
+            self._segnalazioni = {}
+            for segnalazione in segnalazioni:
+                if segnalazione.get("status", True):
+                    self._aggiungi(segnalazione)
+            self._caricato_il = time.monotonic()
+
+    def aggiungi(self, segnalazione: dict) -> None:
+        """
+        Scopo: Indicizza una segnalazione appena creata (ignorata se non attiva).
+
+        Parametri:
+        - segnalazione (dict): Documento della segnalazione con `_id` o `id` e coordinate.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - KeyError: Se la segnalazione non contiene le coordinate.
+        """
+        if not segnalazione.get("status", True):
+            return
+        with self._lock:
+            self._aggiungi(segnalazione)
+
+    def rimuovi(self, incident_id: str) -> bool:
+        """
+        Scopo: Rimuove dall'indice una segnalazione cancellata.
+
+        Parametri:
+        - incident_id (str): Identificativo della segnalazione.
+
+        Valore di ritorno:
+        - bool: True se la segnalazione era indicizzata.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            return self._rimuovi(str(incident_id))
+
+    def da_ricaricare(self) -> bool:
+        """
+        Scopo: Indica se l'indice non è mai stato caricato o è più vecchio di `reload_interval`.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - bool: True se serve una ricarica dal DB.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        caricato_il = self._caricato_il
+        return caricato_il is None or time.monotonic() - caricato_il > self.reload_interval
+
+    def assicura_caricato(self, loader: Callable[[], Iterable[dict]]) -> None:
+        """
+        Scopo: Carica l'indice tramite `loader` solo se necessario.
+
+        Parametri:
+        - loader (Callable): Funzione che restituisce le segnalazioni attive.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Eventuali eccezioni propagate da `loader`.
+        """
+        if self.da_ricaricare():
+            self.carica(loader())
+
+    def candidati(self, lat: float, lon: float) -> List[dict]:
+        """
+        Scopo: Restituisce le segnalazioni il cui cerchio copre la cella della posizione.
+
+        Parametri:
+        - lat (float): Latitudine della posizione utente.
+        - lon (float): Longitudine della posizione utente.
+
+        Valore di ritorno:
+        - List[dict]: Segnalazioni candidate, da verificare con la distanza esatta.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        cella = geohash_encode(lat, lon, self.precision)
+        with self._lock:
+            ids = self._celle.get(cella)
+            if not ids:
+                return []
+            return [dict(self._segnalazioni[i][0]) for i in ids]
+
+    def __len__(self) -> int:
+        return len(self._segnalazioni)
+
+
+# Istanza condivisa dal processo: aggiornata dal SegnalazioneService e letta dal MappaService
+indice_segnalazioni = GeohashIndex()
@@ -0,0 +1,394 @@
+"""Hash delle password con scrypt in un pool di processi limitato.
+
+scrypt è volutamente costoso in CPU e memoria: calcolato nel thread della richiesta
+bloccherebbe i worker (o l'event loop) per decine di millisecondi. `HasherPassword`
+lo esegue in un `ProcessPoolExecutor` con un numero massimo di richieste in attesa:
+oltre il limite (es. durante un attacco di credential stuffing) rifiuta subito con
+`CodaHashPiena`, così le latenze degli altri endpoint restano stabili.
+
+I processi del pool sono creati con il metodo "forkserver" (o "spawn" dove non è
+disponibile), mai con un fork del processo del server: un fork mentre altri thread
+tengono un lock (client MongoDB, logging, dispatcher) può bloccare il figlio. Il pool
+viene avviato dal lifespan dell'applicazione, prima di accettare traffico.
+
+Formato degli hash: `scrypt$<n>$<r>$<p>$<salt base64>$<hash base64>`. Gli hash SHA-256
+esadecimali senza salt delle versioni precedenti vengono ancora verificati e vanno
+ricalcolati al primo login riuscito (vedi `da_aggiornare`).
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+from monitoring.metriche import Contatore, IstogrammaLatenza
+
+PREFISSO_SCRYPT = "scrypt"
+LUNGHEZZA_SALT = 16
+LUNGHEZZA_HASH = 32
+
+_hasher: Optional["HasherPassword"] = None
+_hasher_lock = threading.Lock()
+
+
+class CodaHashPiena(RuntimeError):
+    """Troppe richieste di hash in attesa: la richiesta va rifiutata (503) invece di accodarla."""
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # maxmem: scrypt usa circa 128 * n * r byte più 128 * r * p; il default (32 MiB) è troppo basso per n alti
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=n, r=r, p=p, dklen=LUNGHEZZA_HASH,
+                          maxmem=128 * r * (n + p + 2))
+
+
+def calcola_hash(password: str, n: int, r: int, p: int) -> str:
+    """
+    Scopo: Calcola l'hash scrypt di una password con un salt casuale (eseguito nel pool di processi).
+
+    Parametri:
+    - password (str): Password in chiaro.
+    - n (int): Costo CPU/memoria (potenza di 2).
+    - r (int): Dimensione del blocco.
+    - p (int): Parallelismo.
+
+    Valore di ritorno:
+    - str: Hash codificato con parametri e salt.
+
+    Eccezioni:
+    - ValueError: Se i parametri non sono validi.
+    """
+    salt = secrets.token_bytes(LUNGHEZZA_SALT)
+    digest = _scrypt(password, salt, n, r, p)
+    return "$".join([PREFISSO_SCRYPT, str(n), str(r), str(p),
+                     base64.b64encode(salt).decode("ascii"), base64.b64encode(digest).decode("ascii")])
+
+
+def _legacy(codificato: str) -> bool:
+    """True per gli hash SHA-256 esadecimali senza salt delle versioni precedenti."""
+    return len(codificato) == 64 and all(c in "0123456789abcdef" for c in codificato)
+
+
+def verifica_hash(password: str, codificato: str) -> bool:
+    """
+    Scopo: Verifica una password rispetto a un hash scrypt o SHA-256 legacy (eseguito nel pool di processi).
+
+    Parametri:
+    - password (str): Password in chiaro.
+    - codificato (str): Hash salvato.
+
+    Valore di ritorno:
+    - bool: True se la password corrisponde; False anche per hash in formato sconosciuto.
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    if not isinstance(codificato, str):
+        return False
+    if _legacy(codificato):
+        atteso = hashlib.sha256(password.encode("utf-8")).hexdigest()
+        return hmac.compare_digest(atteso, codificato)
+    try:
+        prefisso, n, r, p, salt, digest = codificato.split("$")
+        if prefisso != PREFISSO_SCRYPT:
+            return False
+        calcolato = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(calcolato, base64.b64decode(digest))
+    except (ValueError, TypeError):
+        return False
+
+
+def _contesto_processi():
+    """Contesto multiprocessing del pool: forkserver dove disponibile, altrimenti spawn."""
+    metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(metodo)
+
+
+def _pronto() -> None:
+    """Lavoro vuoto usato per avviare in anticipo i processi del pool."""
+
+
+def _attendi(future: Future):
+    """Risultato di un future del pool in un chiamante sincrono."""
+    return future.result()
+
+
+class HasherPassword:
+    """
+    Pool di processi per calcolo e verifica degli hash, con coda limitata e metriche.
+
+    Le richieste oltre `processi + max_in_coda` vengono rifiutate con `CodaHashPiena`.
+    Il pool viene creato da `avvia` (chiamato dal lifespan) o, in mancanza, al primo uso.
+    """
+
+    def __init__(self, processi: int = 2, max_in_coda: int = 64, n: int = 2 ** 14, r: int = 8, p: int = 1):
+        """
+        Scopo: Configura il pool e i parametri di costo di scrypt.
+
+        Parametri:
+        - processi (int): Processi del pool (hash calcolati in parallelo).
+        - max_in_coda (int): Richieste che possono attendere un processo libero.
+        - n (int): Costo CPU/memoria di scrypt (potenza di 2).
+        - r (int): Dimensione del blocco di scrypt.
+        - p (int): Parallelismo di scrypt.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - ValueError: Se `n` non è una potenza di 2 maggiore di 1.
+        """
+        if n < 2 or n & (n - 1):
+            raise ValueError("n deve essere una potenza di 2 maggiore di 1")
+        self.processi = processi
+        self.max_in_coda = max_in_coda
+        self.n, self.r, self.p = n, r, p
+
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._in_corso = 0
+
+        self.hash_calcolati = Contatore()
+        self.verifiche = Contatore()
+        self.verifiche_fallite = Contatore()
+        self.rifiutate = Contatore()
+        self.latenza = IstogrammaLatenza(bucket_ms=[5, 10, 25, 50, 100, 250, 500, 1000, 5000])
+
+    def _crea_executor(self) -> ProcessPoolExecutor:
+        """Crea il pool di processi (lock già acquisito)."""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.processi, mp_context=_contesto_processi())
+        return self._executor
+
+    def avvia(self) -> None:
+        """
+        Scopo: Crea il pool e ne avvia subito tutti i processi (idempotente), così il
+        primo login non paga l'avvio e nessun processo nasce durante le richieste.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            executor = self._crea_executor()
+        for future in [executor.submit(_pronto) for _ in range(self.processi)]:
+            future.result()
+
+    def _sottometti(self, funzione, *argomenti) -> Future:
+        """Invia un calcolo al pool, o rifiuta se la coda è piena."""
+        with self._lock:
+            if self._in_corso >= self.processi + self.max_in_coda:
+                self.rifiutate.incrementa()
+                raise CodaHashPiena("Troppe richieste di autenticazione in attesa")
+            self._crea_executor()
+            self._in_corso += 1
+        inizio = time.perf_counter()
+        try:
+            future = self._executor.submit(funzione, *argomenti)
+        except Exception:
+            self._completato(inizio)
+            raise
+        future.add_done_callback(lambda _: self._completato(inizio))
+        return future
+
+    def _completato(self, inizio: float) -> None:
+        with self._lock:
+            self._in_corso -= 1
+        self.latenza.osserva(time.perf_counter() - inizio)
+
+    def _conta_verifica(self, valida: bool) -> bool:
+        self.verifiche.incrementa()
+        if not valida:
+            self.verifiche_fallite.incrementa()
+        return valida
+
+    def hash(self, password: str) -> str:
+        """
+        Scopo: Calcola l'hash scrypt di una password attendendo il pool (chiamanti sincroni).
+
+        Parametri:
+        - password (str): Password in chiaro.
+
+        Valore di ritorno:
+        - str: Hash codificato.
+
+        Eccezioni:
+        - CodaHashPiena: Se il pool è saturo.
+        """
+        codificato = _attendi(self._sottometti(calcola_hash, password, self.n, self.r, self.p))
+        self.hash_calcolati.incrementa()
+        return codificato
+
+    async def hash_async(self, password: str) -> str:
+        """
+        Scopo: Come `hash`, senza bloccare l'event loop.
+
+        Parametri:
+        - password (str): Password in chiaro.
+
+        Valore di ritorno:
+        - str: Hash codificato.
+
+        Eccezioni:
+        - CodaHashPiena: Se il pool è saturo.
+        """
+        codificato = await asyncio.wrap_future(self._sottometti(calcola_hash, password, self.n, self.r, self.p))
+        self.hash_calcolati.incrementa()
+        return codificato
+
+    def verifica(self, password: str, codificato: str) -> bool:
+        """
+        Scopo: Verifica una password rispetto all'hash salvato attendendo il pool (chiamanti sincroni).
+
+        Parametri:
+        - password (str): Password in chiaro.
+        - codificato (str): Hash salvato (scrypt o SHA-256 legacy).
+
+        Valore di ritorno:
+        - bool: True se la password corrisponde.
+
+        Eccezioni:
+        - CodaHashPiena: Se il pool è saturo.
+        """
+        return self._conta_verifica(_attendi(self._sottometti(verifica_hash, password, codificato)))
+
+    async def verifica_async(self, password: str, codificato: str) -> bool:
+        """
+        Scopo: Come `verifica`, senza bloccare l'event loop.
+
+        Parametri:
+        - password (str): Password in chiaro.
+        - codificato (str): Hash salvato (scrypt o SHA-256 legacy).
+
+        Valore di ritorno:
+        - bool: True se la password corrisponde.
+
+        Eccezioni:
+        - CodaHashPiena: Se il pool è saturo.
+        """
+        return self._conta_verifica(await asyncio.wrap_future(self._sottometti(verifica_hash, password, codificato)))
+
+    def da_aggiornare(self, codificato: str) -> bool:
+        """
+        Scopo: Indica se un hash va ricalcolato (legacy SHA-256 o parametri di costo diversi da quelli attuali).
+
+        Parametri:
+        - codificato (str): Hash salvato.
+
+        Valore di ritorno:
+        - bool: True se al prossimo login riuscito l'hash va sostituito.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        parti = codificato.split("$") if isinstance(codificato, str) else []
+        return len(parti) != 6 or parti[0] != PREFISSO_SCRYPT or parti[1:4] != [str(self.n), str(self.r), str(self.p)]
+
+    def stop(self) -> None:
+        """
+        Scopo: Chiude il pool di processi attendendo i calcoli in corso.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone parametri, profondità della coda e latenze del pool.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Parametri scrypt, richieste in corso e in coda, hash calcolati, verifiche
+          (e fallite), richieste rifiutate e latenza dall'invio al risultato.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            in_corso = self._in_corso
+        return {
+            "scrypt": {"n": self.n, "r": self.r, "p": self.p},
+            "processes": self.processi,
+            "max_queue": self.max_in_coda,
+            "in_flight": in_corso,
+            "queued": max(0, in_corso - self.processi),
+            "hashes": self.hash_calcolati.valore,
+            "verifications": self.verifiche.valore,
+            "failed_verifications": self.verifiche_fallite.valore,
+            "rejected": self.rifiutate.valore,
+            "latency": self.latenza.snapshot(),
+        }
+
+
+def get_hasher_password() -> HasherPassword:
+    """
+    Scopo: Restituisce il pool di hashing del processo, creandolo al primo uso.
+
+    Configurazione: PASSWORD_HASH_PROCESSI (default: CPU disponibili, massimo 4),
+    PASSWORD_HASH_CODA (richieste in attesa ammesse) e i costi di scrypt
+    PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - HasherPassword: Istanza singleton.
+
+    Eccezioni:
+    - ValueError: Se la configurazione d'ambiente non è valida.
+    """
+    global _hasher
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = HasherPassword(
+                    processi=int(os.environ.get("PASSWORD_HASH_PROCESSI", str(min(4, os.cpu_count() or 1)))),
+                    max_in_coda=int(os.environ.get("PASSWORD_HASH_CODA", "64")),
+                    n=int(os.environ.get("PASSWORD_SCRYPT_N", str(2 ** 14))),
+                    r=int(os.environ.get("PASSWORD_SCRYPT_R", "8")),
+                    p=int(os.environ.get("PASSWORD_SCRYPT_P", "1"))
+                )
+    return _hasher
+
+
+def shutdown_hasher_password() -> None:
+    """
+    Scopo: Chiude il pool di hashing condiviso, se è stato creato.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    global _hasher
+    with _hasher_lock:
+        hasher, _hasher = _hasher, None
+    if hasher is not None:
+        hasher.stop()
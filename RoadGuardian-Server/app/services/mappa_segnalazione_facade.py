@@ -1,5 +1,7 @@
-from typing import List
-from db.segnalazione_repository import get_segnalazione_by_status, get_segnalazione_by_category
+from typing import AsyncIterator, Iterator, List
+from db.segnalazione_repository import (BATCH_SIZE_DEFAULT, get_segnalazione_by_status, get_segnalazione_by_category,
+                                        iter_segnalazione_by_status, iter_segnalazione_by_category)
+import db.async_segnalazione_repository as async_segnalazione_repo
 
 class MappaSegnalazioneFacade:
     """
@@ -41,3 +43,97 @@ class MappaSegnalazioneFacade:
         - Nessuna eccezione prevista.
         """
         return get_segnalazione_by_category(categoria)
+
+    async def get_segnalazioni_attive_per_mappa_async(self) -> List[dict]:
+        """
+        Scopo: Versione asincrona di `get_segnalazioni_attive_per_mappa` (driver MongoDB asincrono).
+
+        Parametri:
+        - Nessuno
+
+        Valore di ritorno:
+        - List[dict]: Lista di dizionari rappresentanti le segnalazioni attive.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return await async_segnalazione_repo.get_segnalazione_by_status(True)
+
+    async def get_segnalazioni_per_categoria_async(self, categoria: str) -> List[dict]:
+        """
+        Scopo: Versione asincrona di `get_segnalazioni_per_categoria`.
+
+        Parametri:
+        - categoria (str): La categoria di segnalazione da filtrare.
+
+        Valore di ritorno:
+        - List[dict]: Lista di dizionari rappresentanti le segnalazioni della categoria specificata.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return await async_segnalazione_repo.get_segnalazione_by_category(categoria)
+
+    def stream_segnalazioni_attive_per_mappa(self, batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[dict]:
+        """
+        Scopo: Come `get_segnalazioni_attive_per_mappa`, ma restituisce le segnalazioni una alla volta
+        man mano che arrivano dal database.
+
+        Parametri:
+        - batch_size (int): Documenti letti dal database per ogni batch.
+
+        Valore di ritorno:
+        - Iterator[dict]: Segnalazioni attive.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return iter_segnalazione_by_status(True, batch_size=batch_size)
+
+    def stream_segnalazioni_per_categoria(self, categoria: str, batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[dict]:
+        """
+        Scopo: Versione in streaming di `get_segnalazioni_per_categoria`.
+
+        Parametri:
+        - categoria (str): La categoria di segnalazione da filtrare.
+        - batch_size (int): Documenti letti dal database per ogni batch.
+
+        Valore di ritorno:
+        - Iterator[dict]: Segnalazioni della categoria specificata.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return iter_segnalazione_by_category(categoria, batch_size=batch_size)
+
+    def stream_segnalazioni_attive_per_mappa_async(self, batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[dict]:
+        """
+        Scopo: Versione asincrona di `stream_segnalazioni_attive_per_mappa`, da consumare con `async for`.
+
+        Parametri:
+        - batch_size (int): Documenti letti dal database per ogni batch.
+
+        Valore di ritorno:
+        - AsyncIterator[dict]: Segnalazioni attive.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return async_segnalazione_repo.iter_segnalazione_by_status(True, batch_size=batch_size)
+
+    def stream_segnalazioni_per_categoria_async(self, categoria: str,
+                                                batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[dict]:
+        """
+        Scopo: Versione asincrona di `stream_segnalazioni_per_categoria`, da consumare con `async for`.
+
+        Parametri:
+        - categoria (str): La categoria di segnalazione da filtrare.
+        - batch_size (int): Documenti letti dal database per ogni batch.
+
+        Valore di ritorno:
+        - AsyncIterator[dict]: Segnalazioni della categoria specificata.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return async_segnalazione_repo.iter_segnalazione_by_category(categoria, batch_size=batch_size)
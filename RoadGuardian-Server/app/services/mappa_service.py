@@ -1,17 +1,30 @@
-from typing import List
-import math
+from typing import AsyncIterator, Iterator, List, Optional
 from schemas.mappa_schema import SegnalazioneMapDTO, UserPositionUpdate
+from schemas.notifica_schema import NotificaPush
 from services.mappa_segnalazione_facade import MappaSegnalazioneFacade
-from notifications.notify_fcm_adapter import NotifyFCMAdapter
+from db.segnalazione_repository import BATCH_SIZE_DEFAULT
+from services.geohash_index import haversine_km, indice_segnalazioni
+from services.registro_dispositivi import registro_dispositivi
+from notifications.notification_dispatcher import NotificationDispatcher, get_notification_dispatcher
+from notifications.topic_geohash import get_gestore_topic
 
 class MappaService:
     """Gestisce segnalazioni su mappa e notifiche di prossimità."""
-    def __init__(self, db):
+    def __init__(self, db, notification_dispatcher: NotificationDispatcher = None):
         self.db = db
-        self.notification_adapter = NotifyFCMAdapter()
+        # Le notifiche vengono solo accodate: l'invio a FCM avviene nei worker del dispatcher.
+        # Il dispatcher condiviso viene risolto al primo uso, così gli endpoint di sola
+        # lettura non pagano alcun costo di setup delle notifiche.
+        self._notification_dispatcher = notification_dispatcher
         # Iniezione del Facade
         self.segnalazione_facade = MappaSegnalazioneFacade()
 
+    @property
+    def notification_dispatcher(self) -> NotificationDispatcher:
+        if self._notification_dispatcher is None:
+            self._notification_dispatcher = get_notification_dispatcher()
+        return self._notification_dispatcher
+
     def get_active_incidents(self) -> List[SegnalazioneMapDTO]:
         """
         Scopo: Recupera tutte le segnalazioni attive.
@@ -64,12 +77,101 @@ class MappaService:
                     result.append(segnalazione_dto)
         return result
 
-    def process_user_position(self, position_update: UserPositionUpdate):
+    async def get_active_incidents_async(self) -> List[SegnalazioneMapDTO]:
+        """
+        Scopo: Versione asincrona di `get_active_incidents`, per le route `async def`.
+
+        Parametri:
+        - Nessuno
+
+        Valore di ritorno:
+        - List[SegnalazioneMapDTO]: Lista di segnalazioni attive, formattate per la mappa.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        all_segnalazioni = await self.segnalazione_facade.get_segnalazioni_attive_per_mappa_async()
+        return [SegnalazioneMapDTO(**{**s, "_id": str(s.get("_id", ""))}) for s in all_segnalazioni]
+
+    async def get_filtered_incidents_async(self, tipi_incidente: List[str]) -> List[SegnalazioneMapDTO]:
+        """
+        Scopo: Versione asincrona di `get_filtered_incidents`.
+
+        Parametri:
+        - tipi_incidente (List[str]): Tipi di incidente da filtrare.
+
+        Valore di ritorno:
+        - List[SegnalazioneMapDTO]: Lista di segnalazioni filtrate.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        if tipi_incidente is None or len(tipi_incidente) == 0:
+            return await self.get_active_incidents_async()
+        result = []
+        for tipo in tipi_incidente:
+            segnalazioni_by_category = await self.segnalazione_facade.get_segnalazioni_per_categoria_async(tipo)
+            result.extend(SegnalazioneMapDTO(**{**s, "_id": str(s.get("_id", ""))})
+                          for s in segnalazioni_by_category)
+        return result
+
+    def stream_incidents(self, tipi_incidente: List[str] = None,
+                         batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[SegnalazioneMapDTO]:
+        """
+        Scopo: Come `get_filtered_incidents` (senza tipi: tutte le attive), ma converte in DTO una
+        segnalazione alla volta mentre le successive arrivano dal database, senza costruire la lista.
+
+        Parametri:
+        - tipi_incidente (List[str], optional): Tipi di incidente da filtrare.
+        - batch_size (int): Documenti letti dal database per ogni batch.
+
+        Valore di ritorno:
+        - Iterator[SegnalazioneMapDTO]: Segnalazioni formattate per la mappa.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        if not tipi_incidente:
+            sorgenti = [self.segnalazione_facade.stream_segnalazioni_attive_per_mappa(batch_size)]
+        else:
+            sorgenti = (self.segnalazione_facade.stream_segnalazioni_per_categoria(tipo, batch_size)
+                        for tipo in tipi_incidente)
+        for segnalazioni in sorgenti:
+            for s in segnalazioni:
+                yield SegnalazioneMapDTO(**{**s, "_id": str(s.get("_id", ""))})
+
+    async def stream_incidents_async(self, tipi_incidente: List[str] = None,
+                                     batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[SegnalazioneMapDTO]:
+        """
+        Scopo: Versione asincrona di `stream_incidents`, da consumare con `async for`.
+
+        Parametri:
+        - tipi_incidente (List[str], optional): Tipi di incidente da filtrare.
+        - batch_size (int): Documenti letti dal database per ogni batch.
+
+        Valore di ritorno:
+        - AsyncIterator[SegnalazioneMapDTO]: Segnalazioni formattate per la mappa.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        if not tipi_incidente:
+            sorgenti = [self.segnalazione_facade.stream_segnalazioni_attive_per_mappa_async(batch_size)]
+        else:
+            sorgenti = (self.segnalazione_facade.stream_segnalazioni_per_categoria_async(tipo, batch_size)
+                        for tipo in tipi_incidente)
+        for segnalazioni in sorgenti:
+            async for s in segnalazioni:
+                yield SegnalazioneMapDTO(**{**s, "_id": str(s.get("_id", ""))})
+
+    def process_user_position(self, position_update: UserPositionUpdate, user_id: Optional[str] = None):
         """
         Scopo: Elabora l'aggiornamento della posizione dell'utente. Controlla se ci sono segnalazioni attive entro 3 km e invia notifiche.
 
         Parametri:
         - position_update (UserPositionUpdate): Dati di posizione e token FCM dell'utente.
+        - user_id (str, optional): Utente autenticato (dal token di sessione) a cui collegare il
+          dispositivo; None per le richieste anonime, che non modificano il collegamento.
 
         Valore di ritorno:
         - None
@@ -80,58 +182,53 @@ class MappaService:
         if not position_update.fcm_token:
             return # Nessun token per inviare notifiche
 
-        active_incidents = self.get_active_incidents()
-        
-        for incident in active_incidents:
-            distance = self._calculate_distance(
+        # Aggiorna il registro dispositivi (scrittura su DB al più ogni `touch_interval`)
+        try:
+            registro_dispositivi.registra(position_update.fcm_token, user_id)
+        except Exception as e:
+            print(f"MappaService: errore registrazione dispositivo: {e}")
+
+        # Iscrizione al topic della cella geohash corrente (sincronizzata a blocchi in background)
+        gestore_topic = get_gestore_topic()
+        if gestore_topic is not None:
+            gestore_topic.aggiorna_posizione(position_update.fcm_token, position_update.latitudine,
+                                             position_update.longitudine)
+
+        # L'indice geohash restituisce solo le segnalazioni il cui cerchio di allerta
+        # copre la cella dell'utente: la distanza esatta si calcola solo su queste.
+        indice_segnalazioni.assicura_caricato(
+            self.segnalazione_facade.get_segnalazioni_attive_per_mappa
+        )
+        candidati = indice_segnalazioni.candidati(position_update.latitudine, position_update.longitudine)
+        annunciate = None # segnalazioni già ricevute tramite topic, lette dal registro solo se servono
+
+        for candidato in candidati:
+            incident = SegnalazioneMapDTO(**candidato)
+            # Stessa formula usata dall'indice per scegliere i candidati
+            distance = haversine_km(
                 position_update.latitudine, 
                 position_update.longitudine,
                 incident.incident_latitude,
                 incident.incident_longitude
             )
             
-            if distance <= 3.0: # 3 km
-                # Invia notifica
+            if distance <= indice_segnalazioni.radius_km: # 3 km
+                if gestore_topic is not None:
+                    if annunciate is None:
+                        annunciate = gestore_topic.annunciate(position_update.fcm_token)
+                    if incident.id in annunciate:
+                        continue # Già ricevuta tramite il broadcast sul topic della cella
+                # Accoda la notifica senza attendere la risposta di FCM
                 print("MappaService: Nelle vicinanze della segnalazione")
-                title = "Attenzione: Segnalazione vicina!"
-                body = f"C'è un {incident.category} a {distance:.1f} km da te."
-                data = {"incident_id": incident.id}
-                
-                if(self.notification_adapter.send_notification(
+                notifica = NotificaPush(
                     token=position_update.fcm_token,
-                    title=title,
-                    body=body,
-                    data=data)== True):
-                    print("MappaService: Notifica Inviata")
+                    title="Attenzione: Segnalazione vicina!",
+                    body=f"C'è un {incident.category} a {distance:.1f} km da te.",
+                    data={"incident_id": incident.id}
+                )
+                # Priorità per gravità e, a parità, per segnalazioni più recenti
+                if self.notification_dispatcher.enqueue(notifica, seriousness=incident.seriousness,
+                                                        incident_at=candidato.get("incident_date")):
+                    print("MappaService: Notifica accodata")
                     
-            print("MappaService: Posizione Aggiornata")
-
-    def _calculate_distance(self, lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-        """
-        Scopo: Calcola la distanza in km tra due punti GPS usando la formula di Haversine.
-        
-        Parametri:
-            lat1 (float): Latitudine punto 1.
-            lon1 (float): Longitudine punto 1.
-            lat2 (float): Latitudine punto 2.
-            lon2 (float): Longitudine punto 2.
-            
-        Valore di ritorno:
-            float: Distanza in km.
-            
-        Eccezioni:
-            Nessuna eccezione prevista.
-        """
-        R = 6371.0 # Raggio della Terra in km
-
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        
-        a = (math.sin(dlat / 2) * math.sin(dlat / 2) +
-             math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
-             math.sin(dlon / 2) * math.sin(dlon / 2))
-        
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        
-        distance = R * c
-        return distance
\ No newline at end of file
+        print("MappaService: Posizione Aggiornata")
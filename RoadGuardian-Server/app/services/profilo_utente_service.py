@@ -1,8 +1,11 @@
 from schemas.user_schema import EmailUpdateSchema, PhoneUpdateSchema, PasswordUpdateSchema, UserCreateInput, UserUpdateInput
 from db.profilo_utente_repository import get_user_by_email, update_email, update_num_tel, update_password, create_user, update_user
-from models.user_model import UserModel, UserModelDTO
+import db.async_profilo_utente_repository as async_utente_repo
+import db.async_sessione_repository as async_sessione_repo
+from models.user_model import UserModel, UserModelDTO, UserSessionDTO
+from services.hash_password import CodaHashPiena, get_hasher_password
+from services.token_sessione import TIPO_REFRESH, TokenNonValido, get_gestore_token
 from fastapi import HTTPException
-import hashlib
 
 class ProfiloUtenteService:
 
@@ -57,12 +60,14 @@ class ProfiloUtenteService:
 
             password_cambiata = valid_data.new_password.get_secret_value() # passa SecretStr quindi serve get_secret_value
 
-            success = update_password(user_id, password_cambiata)
+            success = update_password(user_id, self.hash_password(password_cambiata))
 
             if success:
                 return "password aggiornata"
             return "errore DB"
         
+        except HTTPException:
+            raise
         except Exception as e:
             return "bloccato dallo schema"
         
@@ -94,18 +99,94 @@ class ProfiloUtenteService:
     
     def hash_password(self, plain_password: str) -> str:
         """
-        Scopo: Calcola l'hash SHA-256 della password.
+        Scopo: Calcola l'hash scrypt (con salt) della password nel pool di processi dedicato.
 
         Parametri:
         - plain_password (str): La password in chiaro.
 
         Valore di ritorno:
-        - str: L'hash esadecimale della password.
+        - str: L'hash codificato con parametri e salt.
 
         Eccezioni:
-        - Nessuna eccezione prevista.
+        - HTTPException(503): Se il pool di hashing è saturo.
+        """
+        try:
+            return get_hasher_password().hash(plain_password)
+        except CodaHashPiena as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+    async def hash_password_async(self, plain_password: str) -> str:
+        """
+        Scopo: Versione asincrona di `hash_password` (non blocca l'event loop).
+
+        Parametri:
+        - plain_password (str): La password in chiaro.
+
+        Valore di ritorno:
+        - str: L'hash codificato con parametri e salt.
+
+        Eccezioni:
+        - HTTPException(503): Se il pool di hashing è saturo.
+        """
+        try:
+            return await get_hasher_password().hash_async(plain_password)
+        except CodaHashPiena as e:
+            raise HTTPException(status_code=503, detail=str(e))
+
+    def verify_password(self, plain_password: str, user: dict) -> None:
         """
-        return hashlib.sha256(plain_password.encode("utf-8")).hexdigest()
+        Scopo: Verifica la password di un utente; se l'hash salvato è SHA-256 legacy o ha
+        parametri di costo superati, lo sostituisce con uno nuovo.
+
+        Parametri:
+        - plain_password (str): La password in chiaro.
+        - user (dict): Documento utente con `_id` e `password`.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - HTTPException: 401 se la password è errata, 503 se il pool di hashing è saturo.
+        """
+        hasher = get_hasher_password()
+        try:
+            valida = hasher.verifica(plain_password, user.get("password"))
+        except CodaHashPiena as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        if not valida:
+            raise HTTPException(status_code=401, detail="Password errata")
+        if hasher.da_aggiornare(user["password"]):
+            try:
+                update_password(str(user["_id"]), hasher.hash(plain_password))
+            except CodaHashPiena:
+                pass  # Il ricalcolo è rimandato al prossimo login
+
+    async def verify_password_async(self, plain_password: str, user: dict) -> None:
+        """
+        Scopo: Versione asincrona di `verify_password`.
+
+        Parametri:
+        - plain_password (str): La password in chiaro.
+        - user (dict): Documento utente con `_id` e `password`.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - HTTPException: 401 se la password è errata, 503 se il pool di hashing è saturo.
+        """
+        hasher = get_hasher_password()
+        try:
+            valida = await hasher.verifica_async(plain_password, user.get("password"))
+        except CodaHashPiena as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        if not valida:
+            raise HTTPException(status_code=401, detail="Password errata")
+        if hasher.da_aggiornare(user["password"]):
+            try:
+                await async_utente_repo.update_password(str(user["_id"]), await hasher.hash_async(plain_password))
+            except CodaHashPiena:
+                pass  # Il ricalcolo è rimandato al prossimo login
 
     def clean_phone_number(self, phone_number: str) -> str:
         """
@@ -269,23 +350,15 @@ class ProfiloUtenteService:
         """
         user_dict = input_payload.model_dump()
 
-        # Hash della password fornita
-        hashed_password = self.hash_password(user_dict["password"])
-
         # Recupero utente dal DB
-        existing_user = get_user_by_email(user_dict["email"])
-        if not existing_user:
-            raise HTTPException(status_code=404, detail="Utente non trovato")
-
         existing_user = get_user_by_email(user_dict["email"])
         if not existing_user:
             raise HTTPException(status_code=404, detail="Utente non trovato")
         # Verifica se l'utente è stato cacellato
         if existing_user.get("is_active") == False:
             raise HTTPException(status_code=403, detail="Profilo utente disabilitato")
-        # Verifica della password
-        if existing_user["password"] != hashed_password:
-            raise HTTPException(status_code=401, detail="Password errata")
+        # Verifica della password (ed eventuale aggiornamento di un hash legacy)
+        self.verify_password(user_dict["password"], existing_user)
 
         # Conversione in DTO
         existing_user["_id"] = str(existing_user["_id"])
@@ -308,15 +381,234 @@ class ProfiloUtenteService:
         - HTTPException: 404 se utente non trovato, 401 se password errata.
         """
         user_dict = input_payload.model_dump() #informazioni utente da eliminare (email, password)
-        user_dict["password"] = self.hash_password(user_dict["password"])
         # Recupero utente dal DB
         existing_user = get_user_by_email(user_dict["email"])
         if not existing_user:
             raise HTTPException(status_code=404, detail="Utente non trovato")
         # Verifica della password
-        if existing_user["password"] != user_dict["password"]:
-            raise HTTPException(status_code=401, detail="Password errata")
+        self.verify_password(user_dict["password"], existing_user)
         # Esegue la soft delete (setta il flag "is_active" a False)
         update_user(str(existing_user["_id"]), {"is_active": False})
+        # Le sessioni già aperte non devono sopravvivere all'account
+        get_gestore_token().revoca_utente(str(existing_user["_id"]))
         
-        return "Profilo utente eliminato"
\ No newline at end of file
+        return "Profilo utente eliminato"
+
+    # --- Varianti asincrone (driver MongoDB asincrono), usate dalle route `async def` ---
+
+    def _user_dto(self, user_dict: dict) -> UserModelDTO:
+        """Converte l'ID in stringa, ripulisce il numero di telefono e costruisce il DTO."""
+        user_dict["_id"] = str(user_dict["_id"])
+        if "num_tel" in user_dict:
+            user_dict["num_tel"] = self.clean_phone_number(user_dict["num_tel"])
+        return UserModelDTO(**user_dict)
+
+    async def create_user_profile_async(self, input_payload: UserCreateInput) -> UserModelDTO:
+        """
+        Scopo: Versione asincrona di `create_user_profile`.
+
+        Parametri:
+        - input_payload (UserCreateInput): Dati anagrafici e password.
+
+        Valore di ritorno:
+        - UserModelDTO: Utente creato (senza password).
+
+        Eccezioni:
+        - HTTPException(400): Se l'email è già registrata o errore DB.
+        - HTTPException(422): Se c'è un errore nella creazione del modello utente.
+        """
+        user_dict = input_payload.model_dump()
+        if await async_utente_repo.get_user_by_email(user_dict["email"]):
+            raise HTTPException(status_code=400, detail="Email già registrata")
+
+        user_dict["password"] = await self.hash_password_async(user_dict["password"])
+        user_dict["num_tel"] = self.validate_prefix_phone_number(str(user_dict["num_tel"]))
+        try:
+            nuovo_utente = UserModel(**user_dict)
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=str(e))
+
+        try:
+            saved = await async_utente_repo.create_user(nuovo_utente)
+            return self._user_dto(saved.model_dump(by_alias=True))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Errore inserimento DB: {e}")
+
+    async def update_user_profile_async(self, user_id: str, input_payload: UserUpdateInput) -> UserModelDTO:
+        """
+        Scopo: Versione asincrona di `update_user_profile`.
+
+        Parametri:
+        - user_id (str): Identificativo dell'utente.
+        - input_payload (UserUpdateInput): Campi opzionali da aggiornare (body).
+
+        Valore di ritorno:
+        - UserModelDTO: Dati aggiornati dell'utente.
+
+        Eccezioni:
+        - HTTPException: 400 se non ci sono dati o l'email è in uso, 404 se l'utente non esiste.
+        """
+        update_data = input_payload.model_dump(exclude_unset=True)
+        if not update_data:
+            raise HTTPException(status_code=400, detail="Nessun dato fornito per l'aggiornamento")
+
+        for key, value in list(update_data.items()):
+            if key == "password":
+                update_data[key] = await self.hash_password_async(value)
+            elif key == "num_tel":
+                update_data[key] = self.validate_prefix_phone_number(str(value))
+            elif key == "email":
+                existing = await async_utente_repo.get_user_by_email(value)
+                if existing and str(existing["_id"]) != user_id:
+                    raise HTTPException(status_code=400, detail="La nuova email è già in uso.")
+            elif key in ("first_name", "last_name"):
+                update_data[key] = str(value)
+
+        updated_dict = await async_utente_repo.update_user(user_id, update_data)
+        if not updated_dict:
+            raise HTTPException(status_code=404, detail="Utente non trovato")
+        return self._user_dto(updated_dict)
+
+    async def login_user_async(self, input_payload: UserCreateInput) -> UserModelDTO:
+        """
+        Scopo: Versione asincrona di `login_user`.
+
+        Parametri:
+        - input_payload (UserCreateInput): Credenziali (email, password).
+
+        Valore di ritorno:
+        - UserModelDTO: Dati dell'utente autenticato.
+
+        Eccezioni:
+        - HTTPException: 404 utente inesistente, 403 profilo disabilitato, 401 password errata.
+        """
+        user_dict = input_payload.model_dump()
+
+        existing_user = await async_utente_repo.get_user_by_email(user_dict["email"])
+        if not existing_user:
+            raise HTTPException(status_code=404, detail="Utente non trovato")
+        if existing_user.get("is_active") == False:
+            raise HTTPException(status_code=403, detail="Profilo utente disabilitato")
+        await self.verify_password_async(user_dict["password"], existing_user)
+        return self._user_dto(existing_user)
+
+    async def delete_user_profile_async(self, input_payload: UserUpdateInput) -> str:
+        """
+        Scopo: Versione asincrona di `delete_user_profile` (soft delete).
+
+        Parametri:
+        - input_payload (UserUpdateInput): Dati utente per verifica (email, password).
+
+        Valore di ritorno:
+        - str: Messaggio di conferma.
+
+        Eccezioni:
+        - HTTPException: 404 se utente non trovato, 401 se password errata.
+        """
+        user_dict = input_payload.model_dump()
+        existing_user = await async_utente_repo.get_user_by_email(user_dict["email"])
+        if not existing_user:
+            raise HTTPException(status_code=404, detail="Utente non trovato")
+        await self.verify_password_async(user_dict["password"], existing_user)
+        await async_utente_repo.update_user(str(existing_user["_id"]), {"is_active": False})
+        get_gestore_token().revoca_utente(str(existing_user["_id"]))
+        return "Profilo utente eliminato"
+
+    async def delete_user_by_id_async(self, user_id: str) -> str:
+        """
+        Scopo: Elimina (soft delete) il profilo dell'utente identificato dal token di sessione,
+        senza rileggere le credenziali né ricalcolare l'hash della password.
+
+        Parametri:
+        - user_id (str): ID dell'utente, già verificato dal token (`chiamante_autorizzato`).
+
+        Valore di ritorno:
+        - str: Messaggio di conferma.
+
+        Eccezioni:
+        - HTTPException: 404 se utente non trovato.
+        """
+        if await async_utente_repo.get_user_by_id(user_id) is None:
+            raise HTTPException(status_code=404, detail="Utente non trovato")
+        await async_utente_repo.update_user(user_id, {"is_active": False})
+        get_gestore_token().revoca_utente(user_id)
+        return "Profilo utente eliminato"
+
+    # --- Sessioni: access token verificati in memoria; rinnovo e logout dei refresh token su DB ---
+
+    async def login_session_async(self, input_payload: UserCreateInput) -> UserSessionDTO:
+        """
+        Scopo: Autentica l'utente e apre una sessione con access e refresh token.
+
+        Parametri:
+        - input_payload (UserCreateInput): Credenziali (email, password).
+
+        Valore di ritorno:
+        - UserSessionDTO: Dati dell'utente autenticato e token della sessione.
+
+        Eccezioni:
+        - HTTPException: 404 utente inesistente, 403 profilo disabilitato, 401 password errata,
+          503 se il pool di hashing è saturo.
+        """
+        utente = await self.login_user_async(input_payload)
+        token = get_gestore_token().emetti(utente.id, utente.role)
+        return UserSessionDTO(**utente.model_dump(by_alias=True), **token)
+
+    async def refresh_session_async(self, refresh_token: str) -> dict:
+        """
+        Scopo: Rinnova la sessione con un refresh token, che viene revocato (vale una sola volta).
+
+        Il rinnovo legge l'utente dal DB, così un account eliminato o disabilitato non ottiene
+        nuovi token da nessun worker, e registra la rotazione in `sessioni_revocate`, condivisa
+        da tutti i worker. Solo la verifica dell'access token resta senza accessi al DB.
+
+        Parametri:
+        - refresh_token (str): Refresh token ricevuto al login o all'ultimo rinnovo.
+
+        Valore di ritorno:
+        - dict: Nuovi `access_token` e `refresh_token`, `token_type` ed `expires_in`.
+
+        Eccezioni:
+        - HTTPException: 401 se il refresh token non è valido, scaduto o revocato, o se il
+          profilo è stato eliminato o disabilitato.
+        """
+        gestore = get_gestore_token()
+        try:
+            payload = gestore.verifica(refresh_token, TIPO_REFRESH)
+            utente = await async_utente_repo.get_user_by_id(payload["sub"])
+            if utente is None or utente.get("is_active") == False:
+                raise TokenNonValido("Profilo utente eliminato o disabilitato")
+            # Fra due rinnovi concorrenti con lo stesso token, anche su worker diversi, ne riesce uno solo
+            if not await async_sessione_repo.revoca_refresh(payload["jti"], payload["sub"], payload["exp"]):
+                raise TokenNonValido("Token revocato")
+        except TokenNonValido as e:
+            raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+        return gestore.emetti(payload["sub"], utente.get("role", payload.get("role", "user")))
+
+    async def logout_session_async(self, access_token: str, refresh_token: str | None = None) -> str:
+        """
+        Scopo: Chiude la sessione revocando l'access token e, se fornito, il refresh token
+        (quest'ultimo in `sessioni_revocate`, così non vale più su nessun worker).
+
+        Parametri:
+        - access_token (str): Access token della richiesta (già verificato).
+        - refresh_token (str, optional): Refresh token della stessa sessione.
+
+        Valore di ritorno:
+        - str: Messaggio di conferma.
+
+        Eccezioni:
+        - HTTPException: 401 se il refresh token non è valido o appartiene a un altro utente.
+        """
+        gestore = get_gestore_token()
+        if refresh_token is not None:
+            try:
+                sessione = gestore.verifica(access_token)
+                payload = gestore.verifica(refresh_token, TIPO_REFRESH)
+                if payload["sub"] != sessione["sub"]:
+                    raise TokenNonValido("Il refresh token appartiene a un altro utente")
+            except TokenNonValido as e:
+                raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+            await async_sessione_repo.revoca_refresh(payload["jti"], payload["sub"], payload["exp"])
+        gestore.revoca(access_token)
+        return "Sessione chiusa"
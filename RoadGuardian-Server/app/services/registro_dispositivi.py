@@ -0,0 +1,135 @@
+import datetime
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import db.dispositivo_repository as dispositivo_repo
+
+
+class RegistroDispositivi:
+    """
+    Registro dei dispositivi (token FCM) con cache in memoria.
+
+    Gli aggiornamenti di posizione rinnovano `last_seen` in cache e scrivono su DB
+    al più una volta ogni `touch_interval` secondi per token; i token che FCM
+    segnala come non registrati o non validi vengono rimossi in blocco.
+    """
+
+    def __init__(self, touch_interval: float = 300.0):
+        """
+        Scopo: Inizializza un registro con cache vuota.
+
+        Parametri:
+        - touch_interval (float): Secondi minimi tra due scritture su DB dello stesso token.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        # token -> {"user_id": str | None, "last_seen": datetime, "persistito_il": float}
+        self._cache: Dict[str, dict] = {}
+        self._indici_creati = False
+
+    def registra(self, token: str, user_id: Optional[str] = None) -> bool:
+        """
+        Scopo: Registra l'attività di un dispositivo, persistendola solo se necessario.
+
+        Parametri:
+        - token (str): Token FCM del dispositivo.
+        - user_id (str, optional): Utente a cui collegare il dispositivo.
+
+        Valore di ritorno:
+        - bool: True se è stata effettuata una scrittura su DB.
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se la scrittura fallisce.
+        """
+        adesso = datetime.datetime.now(datetime.timezone.utc)
+        orologio = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(token)
+            da_scrivere = (
+                entry is None
+                or (user_id and entry["user_id"] != user_id)
+                or orologio - entry["persistito_il"] >= self.touch_interval
+            )
+            self._cache[token] = {
+                "user_id": user_id or (entry["user_id"] if entry else None),
+                "last_seen": adesso,
+                "persistito_il": orologio if da_scrivere else entry["persistito_il"],
+            }
+        if da_scrivere:
+            if not self._indici_creati:
+                dispositivo_repo.ensure_indexes()
+                self._indici_creati = True
+            dispositivo_repo.upsert_dispositivi([(token, user_id, adesso)])
+        return bool(da_scrivere)
+
+    def rimuovi_token_invalidi(self, tokens: Iterable[str]) -> int:
+        """
+        Scopo: Elimina da cache e DB, in un'unica operazione, i token rifiutati da FCM.
+
+        Parametri:
+        - tokens (Iterable[str]): Token non registrati o non validi.
+
+        Valore di ritorno:
+        - int: Numero di dispositivi eliminati dal DB.
+
+        Eccezioni:
+        - Nessuna: gli errori DB vengono loggati (il token verrà ripulito al prossimo fallimento).
+        """
+        tokens = list(set(tokens))
+        if not tokens:
+            return 0
+        with self._lock:
+            for token in tokens:
+                self._cache.pop(token, None)
+        try:
+            eliminati = dispositivo_repo.delete_tokens(tokens)
+            print(f"RegistroDispositivi: rimossi {eliminati} token non validi")
+            return eliminati
+        except Exception as e:
+            print(f"Errore rimozione token non validi: {e}")
+            return 0
+
+    def tokens_utente(self, user_id: str) -> List[str]:
+        """
+        Scopo: Restituisce i token registrati per un utente.
+
+        Parametri:
+        - user_id (str): ID dell'utente.
+
+        Valore di ritorno:
+        - List[str]: Token FCM dell'utente.
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se la query fallisce.
+        """
+        return [doc["_id"] for doc in dispositivo_repo.get_dispositivi_by_user(user_id)]
+
+    def tokens_attivi(self, max_age: datetime.timedelta = datetime.timedelta(days=30)) -> List[str]:
+        """
+        Scopo: Restituisce i token visti di recente, come lista destinatari per notifiche proattive.
+
+        Parametri:
+        - max_age (datetime.timedelta): Età massima dell'ultimo accesso.
+
+        Valore di ritorno:
+        - List[str]: Token FCM attivi.
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se la query fallisce.
+        """
+        since = datetime.datetime.now(datetime.timezone.utc) - max_age
+        return [doc["_id"] for doc in dispositivo_repo.get_dispositivi_attivi(since)]
+
+    def __contains__(self, token: str) -> bool:
+        return token in self._cache
+
+
+# Istanza condivisa dal processo
+registro_dispositivi = RegistroDispositivi()
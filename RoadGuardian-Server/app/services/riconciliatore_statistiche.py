@@ -0,0 +1,226 @@
+"""Riconciliazione periodica delle statistiche materializzate delle segnalazioni.
+
+I contatori di `segnalazioni_stats` sono aggiornati con `$inc` a ogni scrittura; un
+incremento perso (errore o arresto tra la scrittura della segnalazione e quella delle
+statistiche) resterebbe per sempre. Questo worker ricalcola periodicamente tutti i
+contatori con `statistiche_repository.riconcilia` (aggregazione con `$merge`).
+
+Il worker parte in ogni processo, ma riconcilia solo quello che detiene il lease su
+MongoDB (`statistiche_repository.acquisisci_lease`): con più worker uvicorn la scansione
+completa viene eseguita una volta per intervallo, non una per processo. Il titolare
+rinnova il lease a ogni ciclo; se termina, un altro processo lo prende alla scadenza.
+"""
+
+import os
+import socket
+import threading
+import time
+from typing import Optional
+
+import db.statistiche_repository as statistiche_repo
+from monitoring.metriche import Contatore, IstogrammaLatenza
+
+_riconciliatore: Optional["RiconciliatoreStatistiche"] = None
+_riconciliatore_lock = threading.Lock()
+
+
+class RiconciliatoreStatistiche:
+    """Worker che, se detiene il lease, ricalcola le statistiche all'avvio e poi ogni `intervallo` secondi."""
+
+    def __init__(self, intervallo: float = 3600.0, durata_lease: Optional[float] = None):
+        """
+        Scopo: Configura il riconciliatore.
+
+        Parametri:
+        - intervallo (float): Secondi tra due riconciliazioni.
+        - durata_lease (float, optional): Validità del lease in secondi; deve superare `intervallo`
+          perché il titolare lo rinnovi prima della scadenza (default 1.5 x `intervallo`).
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        self.intervallo = intervallo
+        self.durata_lease = durata_lease if durata_lease is not None else intervallo * 1.5
+        self.titolare = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ultima: Optional[float] = None
+
+        self.cicli = Contatore()
+        self.errori = Contatore()
+        self.rimossi = Contatore()
+        self.saltati = Contatore()  # cicli in cui il lease era di un altro processo
+        self.durata_ciclo = IstogrammaLatenza(bucket_ms=[10, 100, 1000, 10000, 60000, 300000])
+
+    def riconcilia(self) -> int:
+        """
+        Scopo: Esegue una riconciliazione completa.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - int: Contatori rimossi perché non più presenti.
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se l'accesso al database fallisce.
+        """
+        inizio = time.perf_counter()
+        rimossi = statistiche_repo.riconcilia()
+        self.rimossi.incrementa(rimossi)
+        self.cicli.incrementa()
+        self.durata_ciclo.osserva(time.perf_counter() - inizio)
+        self._ultima = time.time()
+        return rimossi
+
+    def esegui_se_titolare(self) -> bool:
+        """
+        Scopo: Prende o rinnova il lease e, se lo ottiene, esegue una riconciliazione.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - bool: True se la riconciliazione è stata eseguita da questo processo.
+
+        Eccezioni:
+        - pymongo.errors.PyMongoError: se l'accesso al database fallisce.
+        """
+        if not statistiche_repo.acquisisci_lease(self.titolare, self.durata_lease):
+            self.saltati.incrementa()
+            return False
+        self.riconcilia()
+        return True
+
+    def _loop(self) -> None:
+        """Ciclo del worker: riconcilia se detiene il lease, poi attende `intervallo`."""
+        while not self._stop_event.is_set():
+            try:
+                self.esegui_se_titolare()
+            except Exception as e:
+                self.errori.incrementa()
+                print(f"RiconciliatoreStatistiche: errore durante la riconciliazione: {e}")
+            self._stop_event.wait(self.intervallo)
+
+    def start(self) -> None:
+        """
+        Scopo: Avvia il thread di riconciliazione (idempotente).
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="riconciliatore-statistiche", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """
+        Scopo: Ferma il thread di riconciliazione.
+
+        Parametri:
+        - timeout (float): Secondi massimi di attesa.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista (un errore nel rilascio del lease viene registrato nel log).
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            statistiche_repo.rilascia_lease(self.titolare)  # un altro processo subentra senza attendere la scadenza
+        except Exception as e:
+            print(f"RiconciliatoreStatistiche: errore nel rilascio del lease: {e}")
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone i contatori del riconciliatore.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Riconciliazioni eseguite, cicli saltati (lease di un altro processo), errori,
+          contatori rimossi, istante dell'ultima riconciliazione (epoch) e durata dei cicli.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        return {
+            "runs": self.cicli.valore,
+            "skipped": self.saltati.valore,
+            "errors": self.errori.valore,
+            "removed": self.rimossi.valore,
+            "interval_seconds": self.intervallo,
+            "last_run": self._ultima,
+            "run_duration": self.durata_ciclo.snapshot(),
+        }
+
+
+def get_riconciliatore() -> Optional[RiconciliatoreStatistiche]:
+    """
+    Scopo: Restituisce il riconciliatore del processo, creandolo e avviandolo al primo uso.
+
+    Ogni processo crea il proprio worker, ma solo il titolare del lease riconcilia.
+    Configurazione: SEGNALAZIONI_STATS_RICONCILIAZIONE (0 per disattivarlo nel processo),
+    SEGNALAZIONI_STATS_INTERVALLO (secondi tra due riconciliazioni) e
+    SEGNALAZIONI_STATS_LEASE (validità del lease in secondi, default 1.5 x intervallo).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - RiconciliatoreStatistiche | None: Istanza singleton, None se la riconciliazione è disattivata.
+
+    Eccezioni:
+    - ValueError: Se la configurazione d'ambiente non è valida.
+    """
+    global _riconciliatore
+    if os.environ.get("SEGNALAZIONI_STATS_RICONCILIAZIONE", "1") != "1":
+        return None
+    if _riconciliatore is None:
+        with _riconciliatore_lock:
+            if _riconciliatore is None:
+                durata_lease = os.environ.get("SEGNALAZIONI_STATS_LEASE")
+                riconciliatore = RiconciliatoreStatistiche(
+                    intervallo=float(os.environ.get("SEGNALAZIONI_STATS_INTERVALLO", "3600")),
+                    durata_lease=float(durata_lease) if durata_lease else None
+                )
+                riconciliatore.start()
+                _riconciliatore = riconciliatore
+    return _riconciliatore
+
+
+def shutdown_riconciliatore(timeout: float = 5.0) -> None:
+    """
+    Scopo: Ferma il riconciliatore condiviso, se è stato creato.
+
+    Parametri:
+    - timeout (float): Secondi massimi di attesa del thread.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    global _riconciliatore
+    with _riconciliatore_lock:
+        riconciliatore, _riconciliatore = _riconciliatore, None
+    if riconciliatore is not None:
+        riconciliatore.stop(timeout)
@@ -1,19 +1,34 @@
 from schemas.mappa_schema import SegnalazioneMapDTO
-from db.segnalazione_repository import get_segnalazione_by_id, create_segnalazione, delete_segnalazione
+from db.segnalazione_repository import (get_segnalazione_by_id, get_segnalazione_by_user, get_segnalazione_by_position,
+                                       create_segnalazione, delete_segnalazione, iter_segnalazione_by_user,
+                                       TOLLERANZA_POSIZIONE_METRI, BATCH_SIZE_DEFAULT)
+import db.async_segnalazione_repository as async_segnalazione_repo
+import db.async_statistiche_repository as async_statistiche_repo
 from schemas.segnalazione_schema import SegnalazioneInput, SegnalazioneOutputDTO
-from models.incident_model import IncidentModel
-from datetime import datetime
+from models.incident_model import IncidentModel, campi_orari, punto_geojson
+from services.geohash_index import indice_segnalazioni
+from notifications.topic_geohash import get_gestore_topic
+from services.buffer_segnalazioni import buffer_abilitato, buffer_attivo, get_buffer_segnalazioni
+from datetime import date, datetime
+from typing import AsyncIterator, Iterator, List, Optional
+import asyncio
+import os
+
+def _tolleranza_duplicati() -> float:
+    """Distanza in metri entro cui una nuova segnalazione della stessa categoria è considerata un duplicato (0 = controllo disattivato)."""
+    return float(os.environ.get("SEGNALAZIONI_DEDUP_METRI", "0"))
 
 class SegnalazioneService: 
     """Gestisce creazione, lettura e cancellazione di segnalazioni d'incidente."""
     def __init__(self, db):
         self.db = db
-    def get_segnalazione_details(self, incident_id: str) -> SegnalazioneOutputDTO:
+    def get_segnalazione_details(self, incident_id: str, include_storico: bool = False) -> SegnalazioneOutputDTO:
         """
         Scopo: Recupera i dettagli di una segnalazione attiva dato il suo ID.
 
         Parametri:
         - incident_id (str): Identificativo univoco della segnalazione.
+        - include_storico (bool): Se True restituisce anche segnalazioni disattivate o archiviate.
 
         Valore di ritorno:
         - SegnalazioneOutputDTO: Dati normalizzati della segnalazione (ObjectId→str, data/ora separati).
@@ -21,54 +36,92 @@ class SegnalazioneService:
         Eccezioni:
         - ValueError: Se la segnalazione non esiste o non è attiva.
         """
-        segnalazione = get_segnalazione_by_id(incident_id)
-        if not segnalazione or not segnalazione.get("status", False):
-            raise ValueError("Segnalazione non trovata o non attiva")
-        
-        # Converte ObjectId in stringa e separa datetime
-        segnalazione["_id"] = str(segnalazione.get("_id", ""))
-        if isinstance(segnalazione.get("incident_date"), datetime):
-            dt = segnalazione["incident_date"]
-            segnalazione["incident_date"] = dt.date()
-            segnalazione["incident_time"] = dt.time()
-        
-        return SegnalazioneOutputDTO(**segnalazione)
+        segnalazione = self._in_buffer(incident_id) or get_segnalazione_by_id(incident_id, include_storico=include_storico)
+        return self._dettaglio(segnalazione, include_storico)
 
     def create_report(self, user_id: str, report_data: SegnalazioneInput):
         """
         Scopo: Valida, costruisce il modello e crea una nuova segnalazione manuale.
 
+        Con SEGNALAZIONI_DEDUP_METRI > 0, se entro quella distanza esiste già una
+        segnalazione attiva della stessa categoria viene restituita quella, senza
+        crearne un duplicato.
+
         Parametri:
         - user_id (str): ID dell'utente che effettua la segnalazione.
         - report_data (SegnalazioneInput): Dati della segnalazione da persistere.
 
         Valore di ritorno:
-        - SegnalazioneOutputDTO: Dati della segnalazione appena creata con campi normalizzati.
+        - SegnalazioneOutputDTO: Dati della segnalazione appena creata (o di quella già presente) con campi normalizzati.
 
         Eccezioni:
         - ValueError: Se la validazione del modello fallisce.
         - Exception: Eventuali eccezioni propagate dallo strato di persistenza.
         """
-        segnalazione_dict = report_data.model_dump()
-        segnalazione_dict["user_id"] = user_id
-        
-        # Converte dict in IncidentModel per il repository
-        try:
-            segnalazione_model = IncidentModel(**segnalazione_dict)
-        except Exception as e:
-            raise ValueError(f"Errore validazione segnalazione: {e}")
-        
-        segnalazione_data = create_segnalazione(segnalazione_model)
-        
-        # Converte ObjectId in stringa e separa datetime
-        segnalazione_data["_id"] = str(segnalazione_data.get("_id", ""))
-        if isinstance(segnalazione_data.get("incident_date"), datetime):
-            dt = segnalazione_data["incident_date"]
-            segnalazione_data["incident_date"] = dt.date()
-            segnalazione_data["incident_time"] = dt.time()
-        
-        return SegnalazioneOutputDTO(**segnalazione_data)
+        modello = self._modello(user_id, report_data)
+        tolleranza = _tolleranza_duplicati()
+        if tolleranza > 0:
+            duplicato = self._duplicato(report_data, get_segnalazione_by_position(
+                report_data.incident_longitude, report_data.incident_latitude, tolleranza))
+            if duplicato is not None:
+                return duplicato
+        return self._creata(create_segnalazione(modello))
+
+    def get_segnalazione_attiva_vicina(self, longitudine: float, latitudine: float,
+                                       tolleranza_metri: float = TOLLERANZA_POSIZIONE_METRI) -> Optional[SegnalazioneOutputDTO]:
+        """
+        Scopo: Indica se esiste già una segnalazione attiva nel punto indicato, a meno della tolleranza GPS.
+
+        Parametri:
+        - longitudine (float): Longitudine della posizione.
+        - latitudine (float): Latitudine della posizione.
+        - tolleranza_metri (float): Distanza massima in metri.
+
+        Valore di ritorno:
+        - SegnalazioneOutputDTO | None: La segnalazione attiva più vicina entro la tolleranza, None se assente.
+
+        Eccezioni:
+        - Exception: Eventuali errori propagati dal repository.
+        """
+        esistente = get_segnalazione_by_position(longitudine, latitudine, tolleranza_metri)
+        return self._output_dto(esistente) if esistente is not None else None
     
+    def get_segnalazioni_utente(self, user_id: str, include_storico: bool = False) -> List[SegnalazioneOutputDTO]:
+        """
+        Scopo: Elenca le segnalazioni create da un utente.
+
+        Parametri:
+        - user_id (str): ID dell'utente.
+        - include_storico (bool): Se True include le segnalazioni disattivate e quelle archiviate.
+
+        Valore di ritorno:
+        - List[SegnalazioneOutputDTO]: Segnalazioni dell'utente con campi normalizzati.
+
+        Eccezioni:
+        - Exception: Eventuali errori propagati dal repository.
+        """
+        return [self._output_dto(s) for s in get_segnalazione_by_user(user_id, include_storico=include_storico)]
+
+    def stream_segnalazioni_utente(self, user_id: str, include_storico: bool = False,
+                                   batch_size: int = BATCH_SIZE_DEFAULT) -> Iterator[SegnalazioneOutputDTO]:
+        """
+        Scopo: Versione in streaming di `get_segnalazioni_utente`: ogni segnalazione viene convertita
+        in DTO appena arriva dal database.
+
+        Parametri:
+        - user_id (str): ID dell'utente.
+        - include_storico (bool): Se True include le segnalazioni disattivate e quelle archiviate.
+        - batch_size (int): Documenti letti dal database per ogni batch.
+
+        Valore di ritorno:
+        - Iterator[SegnalazioneOutputDTO]: Segnalazioni dell'utente con campi normalizzati.
+
+        Eccezioni:
+        - Exception: Eventuali errori propagati dal repository durante l'iterazione.
+        """
+        for s in iter_segnalazione_by_user(user_id, include_storico=include_storico, batch_size=batch_size):
+            yield self._output_dto(s)
+
     def delete_segnalazione(self, incident_id: str):
         """
         Scopo: Esegue la cancellazione/disattivazione (soft delete) della segnalazione indicata.
@@ -82,7 +135,23 @@ class SegnalazioneService:
         Eccezioni:
         - Exception: Eventuali errori propagati dal repository durante l'operazione.
         """
-        delete_segnalazione(incident_id)
+        buffer = buffer_attivo()
+        if (buffer is not None and buffer.disattiva(incident_id)) or delete_segnalazione(incident_id):
+            self._disattivata(incident_id)
+
+    def _annuncia(self, segnalazione_data: dict) -> None:
+        """Programma il broadcast della nuova segnalazione sui topic delle celle vicine (non bloccante)."""
+        try:
+            gestore_topic = get_gestore_topic()
+            if gestore_topic is not None:
+                gestore_topic.annuncia_segnalazione(segnalazione_data)
+        except Exception as e:
+            print(f"SegnalazioneService: errore broadcast segnalazione: {e}")
+
+    def _in_buffer(self, incident_id: str) -> dict | None:
+        """Restituisce la segnalazione se è ancora nel buffer write-behind (lettura delle proprie scritture)."""
+        buffer = buffer_attivo()
+        return buffer.cerca(incident_id) if buffer is not None else None
 
     def get_guidelines_for_incident(self, incident_id: str) -> str:
         """
@@ -97,10 +166,12 @@ class SegnalazioneService:
         Eccezioni:
         - ValueError: Se la segnalazione non esiste o non è attiva.
         """
-        incident = get_segnalazione_by_id(incident_id)
+        return self._linee_guida(self._in_buffer(incident_id) or get_segnalazione_by_id(incident_id))
+
+    def _linee_guida(self, incident: dict | None) -> str:
+        """Restituisce le linee guida associate alla categoria della segnalazione; ValueError se non è attiva."""
         if not incident or incident["status"] == False:
             raise ValueError("Segnalazione non trovata")
-        
         guidelines = {
             "tamponamento" : "In caso di tamponamento, assicurati di accostare in sicurezza, accendi le luci di emergenza e posiziona il triangolo di segnalazione.",
             "collisione con ostacolo" : "In caso di collisione laterale, verifica le condizioni di tutti i coinvolti, chiama i soccorsi se necessario e scambia le informazioni con gli altri conducenti.",
@@ -114,7 +185,8 @@ class SegnalazioneService:
 
     def create_fast_report(self, user_id: str, report_data: SegnalazioneInput):
         """
-        Scopo: Crea rapidamente una segnalazione con gli stessi controlli della creazione manuale.
+        Scopo: Crea rapidamente una segnalazione con la stessa validazione della creazione manuale,
+        senza il controllo dei duplicati.
 
         Parametri:
         - user_id (str): ID dell'utente che effettua la segnalazione veloce.
@@ -127,22 +199,267 @@ class SegnalazioneService:
         - ValueError: Se la validazione del modello fallisce.
         - Exception: Eventuali errori propagati dallo strato di persistenza.
         """
+        return self._creata(create_segnalazione(self._modello(user_id, report_data)))
+
+    def accoda_segnalazione_veloce(self, user_id: str, report_data: SegnalazioneInput) -> SegnalazioneOutputDTO:
+        """
+        Scopo: Accetta una segnalazione veloce tramite il buffer write-behind, senza attendere MongoDB.
+
+        L'input è già validato da `SegnalazioneInput`: il documento viene costruito
+        direttamente nel formato di `IncidentModel.to_mongo()`, riceve l'ObjectId lato
+        server applicativo ed è durevole nel log locale quando il metodo ritorna; la
+        scrittura su `segnalazioni` avviene in lotti in background.
+
+        Parametri:
+        - user_id (str): ID dell'utente che effettua la segnalazione veloce.
+        - report_data (SegnalazioneInput): Dati minimi della segnalazione.
+
+        Valore di ritorno:
+        - SegnalazioneOutputDTO: Dati della segnalazione accettata con campi normalizzati.
+
+        Eccezioni:
+        - OSError: Se la scrittura sul log locale fallisce.
+        """
+        documento = report_data.model_dump()
+        documento["user_id"] = user_id
+        ora = documento.pop("incident_time") or datetime.now().time().replace(microsecond=0)
+        documento["incident_date"] = datetime.combine(documento["incident_date"] or date.today(), ora)
+        documento["status"] = True
+        documento.update(campi_orari(documento["incident_date"]))
+        documento["location"] = punto_geojson(documento["incident_longitude"], documento["incident_latitude"])
+
+        get_buffer_segnalazioni().accoda(documento)
+        indice_segnalazioni.aggiungi(documento)
+        self._annuncia(documento)
+        return self._output_dto(dict(documento))
+
+    # --- Logica comune alle varianti sincrone e asincrone: cambia solo l'accesso al repository ---
+
+    def _output_dto(self, segnalazione: dict) -> SegnalazioneOutputDTO:
+        """Converte ObjectId in stringa, separa data e ora e costruisce il DTO di output."""
+        segnalazione["_id"] = str(segnalazione.get("_id", ""))
+        if isinstance(segnalazione.get("incident_date"), datetime):
+            dt = segnalazione["incident_date"]
+            segnalazione["incident_date"] = dt.date()
+            segnalazione["incident_time"] = dt.time()
+        return SegnalazioneOutputDTO(**segnalazione)
+
+    def _modello(self, user_id: str, report_data: SegnalazioneInput) -> IncidentModel:
+        """Costruisce l'IncidentModel dai dati in ingresso; ValueError se la validazione fallisce."""
         segnalazione_dict = report_data.model_dump()
         segnalazione_dict["user_id"] = user_id
-        
-        # Converte dict in IncidentModel per il repository
         try:
-            segnalazione_model = IncidentModel(**segnalazione_dict)
+            return IncidentModel(**segnalazione_dict)
         except Exception as e:
             raise ValueError(f"Errore validazione segnalazione: {e}")
-        
-        segnalazione_data = create_segnalazione(segnalazione_model)
-        
-        # Converte ObjectId in stringa e separa datetime
-        segnalazione_data["_id"] = str(segnalazione_data.get("_id", ""))
-        if isinstance(segnalazione_data.get("incident_date"), datetime):
-            dt = segnalazione_data["incident_date"]
-            segnalazione_data["incident_date"] = dt.date()
-            segnalazione_data["incident_time"] = dt.time()
-        
-        return SegnalazioneOutputDTO(**segnalazione_data)
+
+    def _dettaglio(self, segnalazione: dict | None, include_storico: bool) -> SegnalazioneOutputDTO:
+        """Costruisce il DTO di dettaglio; ValueError se la segnalazione manca o non è attiva (salvo storico)."""
+        if not segnalazione or not (include_storico or segnalazione.get("status", False)):
+            raise ValueError("Segnalazione non trovata o non attiva")
+        return self._output_dto(segnalazione)
+
+    def _duplicato(self, report_data: SegnalazioneInput, esistente: dict | None) -> Optional[SegnalazioneOutputDTO]:
+        """Restituisce la segnalazione attiva vicina se è della stessa categoria (duplicato), altrimenti None."""
+        if esistente is not None and esistente.get("category") == report_data.category:
+            return self._output_dto(esistente)
+        return None
+
+    def _creata(self, segnalazione_data: dict) -> SegnalazioneOutputDTO:
+        """Indicizza e annuncia la segnalazione appena salvata e ne costruisce il DTO."""
+        # Precalcola le celle geohash del cerchio di allerta della nuova segnalazione
+        indice_segnalazioni.aggiungi(segnalazione_data)
+        self._annuncia(segnalazione_data)
+        return self._output_dto(segnalazione_data)
+
+    def _disattivata(self, incident_id: str) -> None:
+        """Toglie la segnalazione disattivata dall'indice geohash."""
+        indice_segnalazioni.rimuovi(incident_id)
+
+    # --- Varianti asincrone (driver MongoDB asincrono), usate dalle route `async def` ---
+
+    async def get_segnalazione_details_async(self, incident_id: str, include_storico: bool = False) -> SegnalazioneOutputDTO:
+        """
+        Scopo: Versione asincrona di `get_segnalazione_details`.
+
+        Parametri:
+        - incident_id (str): Identificativo univoco della segnalazione.
+        - include_storico (bool): Se True restituisce anche segnalazioni disattivate o archiviate.
+
+        Valore di ritorno:
+        - SegnalazioneOutputDTO: Dati normalizzati della segnalazione.
+
+        Eccezioni:
+        - ValueError: Se la segnalazione non esiste o non è attiva.
+        """
+        segnalazione = self._in_buffer(incident_id) or await async_segnalazione_repo.get_segnalazione_by_id(
+            incident_id, include_storico=include_storico)
+        return self._dettaglio(segnalazione, include_storico)
+
+    async def create_report_async(self, user_id: str, report_data: SegnalazioneInput) -> SegnalazioneOutputDTO:
+        """
+        Scopo: Versione asincrona di `create_report`.
+
+        Parametri:
+        - user_id (str): ID dell'utente che effettua la segnalazione.
+        - report_data (SegnalazioneInput): Dati della segnalazione da persistere.
+
+        Valore di ritorno:
+        - SegnalazioneOutputDTO: Dati della segnalazione appena creata con campi normalizzati.
+
+        Eccezioni:
+        - ValueError: Se la validazione del modello fallisce.
+        - Exception: Eventuali eccezioni propagate dallo strato di persistenza.
+        """
+        modello = self._modello(user_id, report_data)
+        tolleranza = _tolleranza_duplicati()
+        if tolleranza > 0:
+            duplicato = self._duplicato(report_data, await async_segnalazione_repo.get_segnalazione_by_position(
+                report_data.incident_longitude, report_data.incident_latitude, tolleranza))
+            if duplicato is not None:
+                return duplicato
+        return self._creata(await async_segnalazione_repo.create_segnalazione(modello))
+
+    async def create_fast_report_async(self, user_id: str, report_data: SegnalazioneInput) -> SegnalazioneOutputDTO:
+        """
+        Scopo: Crea una segnalazione veloce: tramite il buffer write-behind se abilitato
+        (SEGNALAZIONI_BUFFER), altrimenti scrivendola subito come `create_fast_report`. In
+        entrambi i casi senza il controllo dei duplicati (SEGNALAZIONI_DEDUP_METRI), che
+        richiederebbe una query geospaziale sul percorso sensibile alla latenza.
+
+        Parametri:
+        - user_id (str): ID dell'utente che effettua la segnalazione veloce.
+        - report_data (SegnalazioneInput): Dati minimi della segnalazione.
+
+        Valore di ritorno:
+        - SegnalazioneOutputDTO: Dati della segnalazione creata con campi normalizzati.
+
+        Eccezioni:
+        - ValueError: Se la validazione del modello fallisce (percorso senza buffer).
+        - OSError: Se la scrittura sul log locale fallisce.
+        """
+        if not buffer_abilitato():
+            return self._creata(await async_segnalazione_repo.create_segnalazione(self._modello(user_id, report_data)))
+        # L'fsync del log è bloccante: viene eseguito fuori dall'event loop
+        return await asyncio.to_thread(self.accoda_segnalazione_veloce, user_id, report_data)
+
+    async def get_segnalazioni_utente_async(self, user_id: str, include_storico: bool = False) -> List[SegnalazioneOutputDTO]:
+        """
+        Scopo: Versione asincrona di `get_segnalazioni_utente`.
+
+        Parametri:
+        - user_id (str): ID dell'utente.
+        - include_storico (bool): Se True include le segnalazioni disattivate e quelle archiviate.
+
+        Valore di ritorno:
+        - List[SegnalazioneOutputDTO]: Segnalazioni dell'utente con campi normalizzati.
+
+        Eccezioni:
+        - Exception: Eventuali errori propagati dal repository.
+        """
+        segnalazioni = await async_segnalazione_repo.get_segnalazione_by_user(user_id, include_storico=include_storico)
+        return [self._output_dto(s) for s in segnalazioni]
+
+    async def stream_segnalazioni_utente_async(self, user_id: str, include_storico: bool = False,
+                                               batch_size: int = BATCH_SIZE_DEFAULT) -> AsyncIterator[SegnalazioneOutputDTO]:
+        """
+        Scopo: Versione asincrona di `stream_segnalazioni_utente`, da consumare con `async for`.
+
+        Parametri:
+        - user_id (str): ID dell'utente.
+        - include_storico (bool): Se True include le segnalazioni disattivate e quelle archiviate.
+        - batch_size (int): Documenti letti dal database per ogni batch.
+
+        Valore di ritorno:
+        - AsyncIterator[SegnalazioneOutputDTO]: Segnalazioni dell'utente con campi normalizzati.
+
+        Eccezioni:
+        - Exception: Eventuali errori propagati dal repository durante l'iterazione.
+        """
+        async for s in async_segnalazione_repo.iter_segnalazione_by_user(user_id, include_storico=include_storico,
+                                                                          batch_size=batch_size):
+            yield self._output_dto(s)
+
+    async def get_segnalazione_attiva_vicina_async(self, longitudine: float, latitudine: float,
+                                                   tolleranza_metri: float = TOLLERANZA_POSIZIONE_METRI) -> Optional[SegnalazioneOutputDTO]:
+        """
+        Scopo: Versione asincrona di `get_segnalazione_attiva_vicina`.
+
+        Parametri:
+        - longitudine (float): Longitudine della posizione.
+        - latitudine (float): Latitudine della posizione.
+        - tolleranza_metri (float): Distanza massima in metri.
+
+        Valore di ritorno:
+        - SegnalazioneOutputDTO | None: La segnalazione attiva più vicina entro la tolleranza, None se assente.
+
+        Eccezioni:
+        - Exception: Eventuali errori propagati dal repository.
+        """
+        esistente = await async_segnalazione_repo.get_segnalazione_by_position(longitudine, latitudine, tolleranza_metri)
+        return self._output_dto(esistente) if esistente is not None else None
+
+    async def delete_segnalazione_async(self, incident_id: str) -> None:
+        """
+        Scopo: Versione asincrona di `delete_segnalazione`.
+
+        Parametri:
+        - incident_id (str): Identificativo della segnalazione da disattivare.
+
+        Valore di ritorno:
+        - None: Nessun valore restituito.
+
+        Eccezioni:
+        - Exception: Eventuali errori propagati dal repository durante l'operazione.
+        """
+        buffer = buffer_attivo()
+        # disattiva() può attendere il flush in corso: non blocca l'event loop
+        if (buffer is not None and await asyncio.to_thread(buffer.disattiva, incident_id)) \
+                or await async_segnalazione_repo.delete_segnalazione(incident_id):
+            self._disattivata(incident_id)
+
+    async def get_statistiche_async(self, dimensione: Optional[str] = None, dal: Optional[date] = None,
+                                    al: Optional[date] = None) -> dict:
+        """
+        Scopo: Restituisce le statistiche materializzate delle segnalazioni per le dashboard,
+        senza aggregazioni sulle segnalazioni (vedi `statistiche_repository`).
+
+        Parametri:
+        - dimensione (str, optional): "all", "category", "seriousness", "day" o "region"; None per tutte.
+        - dal (date, optional): Primo giorno incluso della dimensione "day".
+        - al (date, optional): Ultimo giorno incluso della dimensione "day".
+
+        Valore di ritorno:
+        - dict: Dimensione -> lista di {"value", "total", "active"}; i giorni in ordine
+          cronologico, le altre dimensioni dal valore più frequente.
+
+        Eccezioni:
+        - ValueError: Se la dimensione non è valida.
+        - Exception: Eventuali errori propagati dal repository.
+        """
+        risultato = {}
+        for voce in await async_statistiche_repo.get_statistiche(dimensione, dal, al):
+            risultato.setdefault(voce["dimension"], []).append(
+                {"value": voce["value"], "total": voce.get("total", 0), "active": voce.get("active", 0)})
+        for nome, voci in risultato.items():
+            if nome == "day":
+                voci.sort(key=lambda v: v["value"] or "")
+            else:
+                voci.sort(key=lambda v: v["total"], reverse=True)
+        return risultato
+
+    async def get_guidelines_for_incident_async(self, incident_id: str) -> str:
+        """
+        Scopo: Versione asincrona di `get_guidelines_for_incident`.
+
+        Parametri:
+        - incident_id (str): Identificativo della segnalazione da cui dedurre la categoria.
+
+        Valore di ritorno:
+        - str: Testo contenente le indicazioni di comportamento.
+
+        Eccezioni:
+        - ValueError: Se la segnalazione non esiste o non è attiva.
+        """
+        return self._linee_guida(self._in_buffer(incident_id)
+                                 or await async_segnalazione_repo.get_segnalazione_by_id(incident_id))
@@ -0,0 +1,69 @@
+import threading
+from typing import Dict, Type, TypeVar
+
+from notifications.notification_dispatcher import shutdown_notification_dispatcher
+from notifications.topic_geohash import shutdown_gestore_topic
+from services.buffer_segnalazioni import shutdown_buffer_segnalazioni
+from services.archiviatore_segnalazioni import shutdown_archiviatore
+from services.riconciliatore_statistiche import shutdown_riconciliatore
+from services.hash_password import shutdown_hasher_password
+from services.token_sessione import shutdown_gestore_token
+
+T = TypeVar("T")
+
+# Istanze dei service condivise dal processo, indicizzate per classe
+_servizi: Dict[type, object] = {}
+_servizi_lock = threading.Lock()
+
+
+def get_servizio(classe: Type[T], db) -> T:
+    """
+    Scopo: Restituisce l'istanza di processo di un service, creandola al primo uso.
+
+    I service sono privi di stato per-richiesta, quindi una sola istanza può servire
+    tutte le richieste; le dipendenze costose (dispatcher, adapter FCM) restano lazy.
+
+    Parametri:
+    - classe (Type[T]): Classe del service (es. MappaService).
+    - db: Handle al database passato al costruttore del service.
+
+    Valore di ritorno:
+    - T: Istanza condivisa del service.
+
+    Eccezioni:
+    - Exception: Errori di inizializzazione del service.
+    """
+    servizio = _servizi.get(classe)
+    if servizio is None:
+        with _servizi_lock:
+            servizio = _servizi.get(classe)
+            if servizio is None:
+                servizio = classe(db)
+                _servizi[classe] = servizio
+    return servizio
+
+
+def chiudi_servizi() -> None:
+    """
+    Scopo: Rilascia i service condivisi, scrive le segnalazioni rimaste nel buffer e ferma
+    archiviatore, riconciliatore delle statistiche, pool di hashing delle password, gestore dei token
+    di sessione e dispatcher delle notifiche (shutdown applicazione).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    with _servizi_lock:
+        _servizi.clear()
+    shutdown_buffer_segnalazioni()
+    shutdown_archiviatore()
+    shutdown_riconciliatore()
+    shutdown_hasher_password()
+    shutdown_gestore_token()
+    shutdown_gestore_topic()
+    shutdown_notification_dispatcher()
@@ -0,0 +1,311 @@
+"""Token di sessione firmati (access e refresh) verificati senza accessi al database.
+
+Al login il client riceve un access token di breve durata e un refresh token; le
+richieste successive presentano l'access token (`Authorization: Bearer`) invece di
+reinviare email e password. Un token è `<payload base64url>.<firma base64url>`, con
+payload JSON (utente, ruolo, tipo, emissione, scadenza, id univoco) firmato con
+HMAC-SHA256: la verifica è un calcolo in memoria.
+
+La revoca degli access token (logout) e degli utenti (eliminazione dell'account) usa una
+lista in memoria di dimensione limitata, le cui voci scadono con i token revocati.
+Le voci non scadute non vengono mai scartate: a lista piena il gestore revoca tutti i
+token emessi fino a quel momento (fail closed) e svuota la lista. La lista è locale al
+processo, quindi una revoca vale solo nel worker che l'ha ricevuta e la breve durata
+dell'access token limita la finestra residua. Per questo il rinnovo non si basa su di
+essa: `ProfiloUtenteService` controlla a ogni refresh che l'utente sia ancora attivo e
+registra rotazione e logout dei refresh token in MongoDB (`db.sessione_repository`).
+Il segreto di firma (SESSIONE_SEGRETO) deve invece essere lo stesso per tutti i worker ed
+è obbligatorio: senza, l'applicazione non si avvia.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from monitoring.metriche import Contatore
+
+TIPO_ACCESS = "access"
+TIPO_REFRESH = "refresh"
+
+_gestore: Optional["GestoreToken"] = None
+_gestore_lock = threading.Lock()
+
+
+class TokenNonValido(ValueError):
+    """Token malformato, con firma errata, scaduto, del tipo sbagliato o revocato."""
+
+
+def _b64(dati: bytes) -> str:
+    return base64.urlsafe_b64encode(dati).rstrip(b"=").decode("ascii")
+
+
+def _da_b64(testo: str) -> bytes:
+    return base64.urlsafe_b64decode(testo + "=" * (-len(testo) % 4))
+
+
+class GestoreToken:
+    """Emissione, verifica e revoca dei token di sessione."""
+
+    def __init__(self, segreto: bytes, durata_access: float = 900.0, durata_refresh: float = 7 * 86400.0,
+                 max_revocati: int = 10000, obbligatoria: bool = False):
+        """
+        Scopo: Configura la firma e le durate dei token.
+
+        Parametri:
+        - segreto (bytes): Chiave HMAC di firma.
+        - durata_access (float): Validità dell'access token in secondi.
+        - durata_refresh (float): Validità del refresh token in secondi.
+        - max_revocati (int): Voci massime della lista di revoca; oltre, vengono revocati tutti
+          i token già emessi.
+        - obbligatoria (bool): Se True le route protette rifiutano le richieste senza token.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - ValueError: Se il segreto è vuoto.
+        """
+        if not segreto:
+            raise ValueError("Il segreto di firma dei token non può essere vuoto")
+        self._segreto = segreto
+        self.durata_access = durata_access
+        self.durata_refresh = durata_refresh
+        self.max_revocati = max_revocati
+        self.obbligatoria = obbligatoria
+
+        self._lock = threading.Lock()
+        # jti -> scadenza del token revocato
+        self._revocati: "OrderedDict[str, float]" = OrderedDict()
+        # user_id -> istante di revoca + durata del refresh token (scadenza dell'ultimo token invalidato)
+        self._revocati_utente: "OrderedDict[str, float]" = OrderedDict()
+        # Istante prima del quale ogni token è revocato (lista di revoca traboccata)
+        self._revocati_prima = float("-inf")
+
+        self.emessi = Contatore()
+        self.verificati = Contatore()
+        self.rifiutati = Contatore()
+        self.revocati = Contatore()
+        self.azzeramenti = Contatore()  # volte in cui la lista piena ha revocato tutti i token
+
+    def _firma(self, corpo: str) -> str:
+        return _b64(hmac.new(self._segreto, corpo.encode("ascii"), hashlib.sha256).digest())
+
+    def _token(self, user_id: str, ruolo: str, tipo: str, durata: float, adesso: float) -> str:
+        payload = {"sub": user_id, "role": ruolo, "typ": tipo, "iat": adesso, "exp": adesso + durata,
+                   "jti": secrets.token_urlsafe(12)}
+        corpo = _b64(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        return f"{corpo}.{self._firma(corpo)}"
+
+    def emetti(self, user_id: str, ruolo: str = "user") -> dict:
+        """
+        Scopo: Emette una coppia di token per un utente autenticato.
+
+        Parametri:
+        - user_id (str): Identificativo dell'utente.
+        - ruolo (str): Ruolo dell'utente (es. "user", "admin").
+
+        Valore di ritorno:
+        - dict: `access_token`, `refresh_token`, `token_type` ("bearer") ed `expires_in` (secondi).
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        adesso = time.time()
+        self.emessi.incrementa()
+        return {
+            "access_token": self._token(user_id, ruolo, TIPO_ACCESS, self.durata_access, adesso),
+            "refresh_token": self._token(user_id, ruolo, TIPO_REFRESH, self.durata_refresh, adesso),
+            "token_type": "bearer",
+            "expires_in": int(self.durata_access),
+        }
+
+    def _decodifica(self, token: str) -> dict:
+        """Controlla la firma e restituisce il payload, senza verificare scadenza e revoca."""
+        try:
+            corpo, firma = token.split(".")
+        except (AttributeError, ValueError):
+            raise TokenNonValido("Token malformato")
+        if not hmac.compare_digest(firma, self._firma(corpo)):
+            raise TokenNonValido("Firma del token non valida")
+        try:
+            payload = json.loads(_da_b64(corpo))
+        except ValueError:
+            raise TokenNonValido("Token malformato")
+        if not isinstance(payload, dict) or not {"sub", "typ", "iat", "exp", "jti"} <= payload.keys():
+            raise TokenNonValido("Token malformato")
+        return payload
+
+    def verifica(self, token: str, tipo: str = TIPO_ACCESS) -> dict:
+        """
+        Scopo: Verifica firma, tipo, scadenza e revoca di un token (solo in memoria).
+
+        Parametri:
+        - token (str): Token presentato dal client.
+        - tipo (str): Tipo atteso (`TIPO_ACCESS` o `TIPO_REFRESH`).
+
+        Valore di ritorno:
+        - dict: Payload del token (`sub`, `role`, `typ`, `iat`, `exp`, `jti`).
+
+        Eccezioni:
+        - TokenNonValido: Se il token non è accettabile.
+        """
+        try:
+            payload = self._decodifica(token)
+            if payload["typ"] != tipo:
+                raise TokenNonValido("Tipo di token non valido")
+            if payload["exp"] <= time.time():
+                raise TokenNonValido("Token scaduto")
+            with self._lock:
+                revocato = payload["jti"] in self._revocati or payload["iat"] < self._revocati_prima or \
+                    payload["iat"] < self._revocati_utente.get(payload["sub"], float("-inf")) - self.durata_refresh
+            if revocato:
+                raise TokenNonValido("Token revocato")
+        except TokenNonValido:
+            self.rifiutati.incrementa()
+            raise
+        self.verificati.incrementa()
+        return payload
+
+    def _aggiungi(self, revocati: OrderedDict, chiave: str, scadenza: float) -> None:
+        """Registra una revoca eliminando prima le voci scadute. Una voce non scaduta non viene
+        mai scartata: se la lista è piena vengono revocati tutti i token emessi finora, che
+        comprendono quelli delle voci presenti, e le liste vengono svuotate."""
+        adesso = time.time()
+        with self._lock:
+            for vecchia in [k for k, s in revocati.items() if s <= adesso]:
+                del revocati[vecchia]
+            if chiave not in revocati and len(revocati) >= self.max_revocati:
+                self._revocati_prima = adesso
+                self._revocati.clear()
+                self._revocati_utente.clear()
+                self.azzeramenti.incrementa()
+                print("GestoreToken: lista di revoca piena, revocati tutti i token emessi finora")
+            else:
+                revocati[chiave] = max(scadenza, revocati.get(chiave, scadenza))
+                revocati.move_to_end(chiave)
+        self.revocati.incrementa()
+
+    def revoca(self, token: str) -> None:
+        """
+        Scopo: Revoca un token fino alla sua scadenza (logout).
+
+        Parametri:
+        - token (str): Access o refresh token.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - TokenNonValido: Se il token è malformato o la firma non è valida.
+        """
+        payload = self._decodifica(token)
+        if payload["exp"] > time.time():
+            self._aggiungi(self._revocati, payload["jti"], payload["exp"])
+
+    def revoca_utente(self, user_id: str) -> None:
+        """
+        Scopo: Invalida tutti i token già emessi per un utente (es. account eliminato).
+
+        Parametri:
+        - user_id (str): Identificativo dell'utente.
+
+        Valore di ritorno:
+        - None
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        # I token emessi fino a ora scadono al più tardi dopo la durata del refresh token
+        self._aggiungi(self._revocati_utente, user_id, time.time() + self.durata_refresh)
+
+    def metrics(self) -> dict:
+        """
+        Scopo: Espone durate e contatori dei token.
+
+        Parametri:
+        - Nessuno.
+
+        Valore di ritorno:
+        - dict: Token emessi, verifiche riuscite e rifiutate, revoche, dimensione delle liste di
+          revoca e revoche totali dovute alla lista piena.
+
+        Eccezioni:
+        - Nessuna eccezione prevista.
+        """
+        with self._lock:
+            revocati, revocati_utente = len(self._revocati), len(self._revocati_utente)
+        return {
+            "access_ttl_seconds": self.durata_access,
+            "refresh_ttl_seconds": self.durata_refresh,
+            "required": self.obbligatoria,
+            "issued": self.emessi.valore,
+            "verified": self.verificati.valore,
+            "rejected": self.rifiutati.valore,
+            "revocations": self.revocati.valore,
+            "revoked_tokens": revocati,
+            "revoked_users": revocati_utente,
+            "revoke_all": self.azzeramenti.valore,
+        }
+
+
+def get_gestore_token() -> GestoreToken:
+    """
+    Scopo: Restituisce il gestore dei token del processo, creandolo al primo uso.
+
+    Configurazione: SESSIONE_SEGRETO (chiave di firma condivisa dai worker, obbligatoria),
+    SESSIONE_ACCESS_SECONDI, SESSIONE_REFRESH_SECONDI, SESSIONE_MAX_REVOCATI e
+    SESSIONE_OBBLIGATORIA (1 per rifiutare le richieste senza token sulle route protette).
+    Il lifespan lo crea all'avvio, così una configurazione mancante blocca subito il processo.
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - GestoreToken: Istanza singleton.
+
+    Eccezioni:
+    - RuntimeError: Se SESSIONE_SEGRETO non è impostato (una chiave casuale per processo
+      farebbe fallire i token verificati da un worker diverso da quello che li ha emessi).
+    - ValueError: Se la configurazione d'ambiente non è valida.
+    """
+    global _gestore
+    if _gestore is None:
+        with _gestore_lock:
+            if _gestore is None:
+                segreto = os.environ.get("SESSIONE_SEGRETO")
+                if not segreto:
+                    raise RuntimeError("SESSIONE_SEGRETO non impostato: serve una chiave di firma "
+                                       "condivisa da tutti i worker")
+                _gestore = GestoreToken(
+                    segreto=segreto.encode("utf-8"),
+                    durata_access=float(os.environ.get("SESSIONE_ACCESS_SECONDI", "900")),
+                    durata_refresh=float(os.environ.get("SESSIONE_REFRESH_SECONDI", str(7 * 86400))),
+                    max_revocati=int(os.environ.get("SESSIONE_MAX_REVOCATI", "10000")),
+                    obbligatoria=os.environ.get("SESSIONE_OBBLIGATORIA", "0") == "1"
+                )
+    return _gestore
+
+
+def shutdown_gestore_token() -> None:
+    """
+    Scopo: Dimentica il gestore condiviso (le revoche in memoria vanno perse).
+
+    Parametri:
+    - Nessuno.
+
+    Valore di ritorno:
+    - None
+
+    Eccezioni:
+    - Nessuna eccezione prevista.
+    """
+    global _gestore
+    with _gestore_lock:
+        _gestore = None
@@ -1,9 +1,11 @@
 """
 Pytest configuration file per il progetto RoadGuardian-Server
-Configura il path per gli import dei moduli
+Configura il path per gli import dei moduli e l'ambiente minimo dell'applicazione
 """
 
+import os
 import sys
+import pytest
 from pathlib import Path
 
 # Aggiungi la directory app al path di Python
@@ -13,3 +15,12 @@ sys.path.insert(0, str(app_dir))
 # Aggiungi anche la directory root
 root_dir = Path(__file__).parent.parent
 sys.path.insert(0, str(root_dir))
+
+# Chiave di firma dei token di sessione, obbligatoria per l'applicazione
+os.environ.setdefault("SESSIONE_SEGRETO", "segreto-di-test")
+
+
+@pytest.fixture(autouse=True)
+def cartella_buffer(tmp_path, monkeypatch):
+    """I log del buffer write-behind finiscono nella cartella temporanea del test, non nel repository"""
+    monkeypatch.setenv("SEGNALAZIONI_BUFFER_DIR", str(tmp_path / "buffer"))
@@ -0,0 +1,96 @@
+"""
+Test Suite per la separazione tra segnalazioni attive e archivio
+
+- L'archiviazione sposta a lotti le segnalazioni disattivate e quelle oltre la retention
+- Le letture con include_storico interrogano entrambe le collection senza duplicati
+- Una segnalazione archiviata ancora attiva può essere cancellata
+- ArchiviatoreSegnalazioni esegue lotti finché ce ne sono
+"""
+
+import asyncio
+import datetime
+import pytest
+from app.db import connection
+from app.db import segnalazione_repository as repo
+from app.db import async_segnalazione_repository as async_repo
+from app.services.archiviatore_segnalazioni import ArchiviatoreSegnalazioni
+from app.models.incident_model import IncidentModel
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+    connection.chiudi_client()
+    yield connection.get_database()
+    connection.chiudi_client()
+
+
+def _crea(giorni_fa: int = 0, **campi) -> str:
+    quando = datetime.datetime.now() - datetime.timedelta(days=giorni_fa)
+    dati = {
+        "user_id": "user_1", "incident_date": quando.date(), "incident_time": quando.time().replace(microsecond=0),
+        "incident_longitude": 12.49, "incident_latitude": 41.89, "seriousness": "high", "category": "tamponamento",
+    }
+    dati.update(campi)
+    return repo.create_segnalazione(IncidentModel(**dati))["id"]
+
+
+def _cutoff(giorni: int = 30) -> datetime.datetime:
+    return datetime.datetime.now() - datetime.timedelta(days=giorni)
+
+
+class TestArchiviazione:
+    """Suite di test per segnalazione_repository.archivia_segnalazioni e le letture con storico"""
+
+    def test_sposta_inattive_e_scadute(self, memoria):
+        """Restano nella collection attiva solo le segnalazioni attive entro la retention"""
+        attiva = _crea()
+        cancellata = _crea()
+        repo.delete_segnalazione(cancellata)
+        vecchia = _crea(giorni_fa=60)
+
+        assert repo.archivia_segnalazioni(100, _cutoff()) == 2
+
+        assert [str(d["_id"]) for d in memoria["segnalazioni"].find({})] == [attiva]
+        assert memoria["segnalazioni_archive"].count_documents({}) == 2
+        assert repo.get_segnalazione_by_id(vecchia) is None
+        assert repo.get_segnalazione_by_id(vecchia, include_storico=True)["status"] is True
+
+    def test_letture_con_storico(self, memoria):
+        """Senza storico si vedono solo le attive; con storico tutte, anche se copiate in entrambe le collection"""
+        _crea()
+        cancellata = _crea()
+        repo.delete_segnalazione(cancellata)
+        repo.archivia_segnalazioni(100, _cutoff())
+        # Copia rimasta nella collection attiva, come dopo un'interruzione tra copia e cancellazione
+        memoria["segnalazioni"].insert_one(repo.get_segnalazione_by_id(cancellata, include_storico=True))
+
+        assert len(repo.get_segnalazione_by_user("user_1")) == 1
+        assert len(repo.get_segnalazione_by_user("user_1", include_storico=True)) == 2
+        assert len(repo.get_segnalazione_by_status(False, include_storico=True)) == 1
+        assert len(asyncio.run(async_repo.get_segnalazione_by_category("tamponamento", include_storico=True))) == 2
+
+    def test_cancellazione_di_archiviata_attiva(self, memoria):
+        """Una segnalazione ancora attiva ma archiviata per età può essere disattivata"""
+        vecchia = _crea(giorni_fa=60)
+        repo.archivia_segnalazioni(100, _cutoff())
+
+        assert repo.delete_segnalazione(vecchia) is True
+        assert repo.get_segnalazione_by_id(vecchia, include_storico=True)["status"] is False
+        assert repo.delete_segnalazione(vecchia) is False
+
+
+class TestArchiviatoreSegnalazioni:
+    """Suite di test per ArchiviatoreSegnalazioni"""
+
+    def test_ciclo_a_lotti(self, memoria):
+        """Un ciclo archivia tutti i lotti disponibili e aggiorna le metriche"""
+        for _ in range(5):
+            _crea(giorni_fa=45)
+        archiviatore = ArchiviatoreSegnalazioni(giorni_retention=30, dimensione_lotto=2, pausa_lotti=0)
+
+        assert archiviatore.archivia() == 5
+        assert archiviatore.archivia() == 0
+        assert archiviatore.metrics()["archived"] == 5
+        assert archiviatore.metrics()["runs"] == 2
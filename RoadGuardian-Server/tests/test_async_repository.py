@@ -0,0 +1,96 @@
+"""
+Test Suite per lo strato di accesso ai dati asincrono
+
+- I repository asincroni eseguono le stesse query di quelli sincroni, con `await`
+- ID non validi restituiscono None/False come nella versione sincrona
+- I service asincroni applicano le stesse regole di business (404/401/403, segnalazioni non attive)
+"""
+
+import asyncio
+import pytest
+from bson import ObjectId
+from pymongo import ReturnDocument
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import HTTPException
+from app.db import async_segnalazione_repository as repo
+from app.services.segnalazione_service import SegnalazioneService
+from app.services.profilo_utente_service import ProfiloUtenteService
+
+
+def _cursore(documenti):
+    cursore = MagicMock()
+    cursore.to_list = AsyncMock(return_value=documenti)
+    return cursore
+
+
+class TestRepositoryAsincrono:
+    """Suite di test per async_segnalazione_repository"""
+
+    @pytest.fixture
+    def collection(self):
+        with patch.object(repo, 'segnalazione_collection') as mock_collection:
+            yield mock_collection
+
+    def test_liste_con_to_list(self, collection):
+        """Le query a lista usano il cursore asincrono e applicano lo stesso filtro della versione sincrona"""
+        collection.find.return_value = _cursore([{"_id": 1}])
+
+        risultato = asyncio.run(repo.get_segnalazione_by_category("tamponamento"))
+
+        assert risultato == [{"_id": 1}]
+        collection.find.assert_called_once_with({"category": "tamponamento", "status": True})
+
+    def test_get_by_id_non_valido(self, collection):
+        """Un ID non valido restituisce None senza interrogare il DB"""
+        collection.find_one = AsyncMock()
+
+        assert asyncio.run(repo.get_segnalazione_by_id("non-un-id")) is None
+        collection.find_one.assert_not_called()
+
+    def test_delete_logica(self, collection):
+        """La cancellazione imposta status a False e riporta se il documento è stato modificato"""
+        oid = ObjectId()
+        collection.find_one_and_update = AsyncMock(return_value={"_id": oid, "status": True})
+
+        with patch.object(repo, 'registra_disattivata', AsyncMock()) as registra:
+            assert asyncio.run(repo.delete_segnalazione(str(oid))) is True
+
+        collection.find_one_and_update.assert_awaited_once_with({"_id": oid}, {"$set": {"status": False}},
+                                                                return_document=ReturnDocument.BEFORE)
+        registra.assert_awaited_once_with({"_id": oid, "status": True})
+
+
+class TestServiceAsincroni:
+    """Suite di test per le varianti asincrone dei service"""
+
+    def test_dettagli_segnalazione_non_attiva(self):
+        """Una segnalazione disattivata non viene restituita"""
+        with patch('app.services.segnalazione_service.async_segnalazione_repo') as mock_repo:
+            mock_repo.get_segnalazione_by_id = AsyncMock(return_value={"_id": "x", "status": False})
+
+            with pytest.raises(ValueError):
+                asyncio.run(SegnalazioneService(None).get_segnalazione_details_async("x"))
+
+    def test_linee_guida(self):
+        """Le linee guida dipendono dalla categoria come nella versione sincrona"""
+        with patch('app.services.segnalazione_service.async_segnalazione_repo') as mock_repo:
+            mock_repo.get_segnalazione_by_id = AsyncMock(return_value={"status": True, "category": "Tamponamento"})
+
+            testo = asyncio.run(SegnalazioneService(None).get_guidelines_for_incident_async("x"))
+
+        assert testo.startswith("In caso di tamponamento")
+
+    def test_login_password_errata(self):
+        """Il login asincrono rifiuta una password errata con 401"""
+        service = ProfiloUtenteService(None)
+        payload = MagicMock()
+        payload.model_dump.return_value = {"email": "a@b.it", "password": "sbagliata"}
+        with patch('app.services.profilo_utente_service.async_utente_repo') as mock_repo:
+            mock_repo.get_user_by_email = AsyncMock(return_value={
+                "_id": ObjectId(), "password": service.hash_password("giusta"), "is_active": True,
+            })
+
+            with pytest.raises(HTTPException) as exc:
+                asyncio.run(service.login_user_async(payload))
+
+        assert exc.value.status_code == 401
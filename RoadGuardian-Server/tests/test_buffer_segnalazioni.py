@@ -0,0 +1,193 @@
+"""
+Test Suite per il buffer write-behind delle segnalazioni veloci
+
+- Accodamento con ObjectId assegnato lato server e scrittura in lotti con insert_many
+- Ripresa dal log delle segnalazioni non confermate dopo un crash (anche con record troncato)
+- Un log per processo: i log dei processi terminati vengono adottati, quelli in uso no
+- Con MongoDB non disponibile le segnalazioni restano in attesa e l'accodamento non si blocca
+- Lettura delle proprie scritture e cancellazione di segnalazioni ancora nel buffer
+- Inserimento in blocco idempotente nel repository
+"""
+
+import asyncio
+import datetime
+import os
+import pytest
+from bson import ObjectId
+from unittest.mock import AsyncMock, MagicMock, patch
+from pymongo.errors import AutoReconnect
+from app.db import connection
+from app.db import segnalazione_repository as repo
+from app.services.buffer_segnalazioni import BufferSegnalazioni, percorso_log_processo
+from app.services.segnalazione_service import SegnalazioneService
+from app.schemas.segnalazione_schema import SegnalazioneInput
+
+
+def _documento(**campi) -> dict:
+    documento = {
+        "user_id": "user_1", "incident_date": datetime.datetime(2025, 3, 1, 14, 30),
+        "incident_longitude": 12.49, "incident_latitude": 41.89, "seriousness": "high",
+        "status": True, "category": "incidente stradale", "description": None, "img_url": None,
+    }
+    documento.update(campi)
+    return documento
+
+
+@pytest.fixture
+def percorso(tmp_path):
+    return str(tmp_path / "segnalazioni.log")
+
+
+class TestBufferSegnalazioni:
+    """Suite di test per BufferSegnalazioni"""
+
+    def test_accoda_e_flush_in_lotti(self, percorso):
+        """Le segnalazioni accodate vengono scritte in lotti di max_lotto e il log viene troncato"""
+        inserisci = MagicMock(side_effect=len)
+        buffer = BufferSegnalazioni(percorso, max_lotto=2, inserisci=inserisci)
+
+        documenti = [buffer.accoda(_documento()) for _ in range(3)]
+
+        assert all(isinstance(d["_id"], ObjectId) for d in documenti)
+        assert buffer.cerca(str(documenti[2]["_id"]))["user_id"] == "user_1"
+        assert (buffer.flush(), buffer.flush(), buffer.flush()) == (2, 1, 0)
+        assert [len(c.args[0]) for c in inserisci.call_args_list] == [2, 1]
+        assert buffer.metrics()["pending"] == 0
+        assert os.path.getsize(percorso) == 0
+        buffer.stop()
+
+    def test_ripresa_dopo_crash(self, percorso):
+        """Dopo un riavvio vengono riprese solo le segnalazioni non confermate, ignorando un record troncato"""
+        primo = BufferSegnalazioni(percorso, max_lotto=2, inserisci=MagicMock(side_effect=len))
+        documenti = [primo.accoda(_documento(category=f"c{i}")) for i in range(3)]
+        primo.flush()
+        with open(percorso, "ab") as f:
+            f.write(b"\x40\x00\x00\x00\x02op")  # record interrotto a metà dal crash
+        primo._log.close()  # crash: alla morte del processo il lock sul log viene rilasciato
+
+        inserisci = MagicMock(side_effect=len)
+        secondo = BufferSegnalazioni(percorso, inserisci=inserisci)
+
+        assert secondo.ripristina() == 1
+        secondo.flush()
+        ripresi = inserisci.call_args.args[0]
+        assert [d["_id"] for d in ripresi] == [documenti[2]["_id"]]
+        assert ripresi[0]["incident_date"] == datetime.datetime(2025, 3, 1, 14, 30)
+        secondo.stop()
+
+    def test_mongo_non_disponibile(self, percorso):
+        """Un flush fallito lascia il lotto in attesa e l'accodamento prosegue senza attendere MongoDB"""
+        inserisci = MagicMock(side_effect=AutoReconnect("timeout"))
+        buffer = BufferSegnalazioni(percorso, inserisci=inserisci)
+        buffer.accoda(_documento())
+
+        with pytest.raises(AutoReconnect):
+            buffer.flush()
+        buffer.accoda(_documento())
+
+        assert buffer.metrics()["pending"] == 2
+        inserisci.side_effect = len
+        assert buffer.flush() == 2
+        buffer.stop()
+
+    def test_disattiva_in_attesa(self, percorso):
+        """Una segnalazione cancellata prima del flush viene scritta come non attiva, anche dopo un riavvio"""
+        buffer = BufferSegnalazioni(percorso, inserisci=MagicMock(side_effect=len))
+        documento = buffer.accoda(_documento())
+
+        assert buffer.disattiva(str(documento["_id"])) is True
+        assert buffer.disattiva(str(ObjectId())) is False
+        buffer._log.close()  # crash
+
+        ripreso = BufferSegnalazioni(percorso)
+        ripreso.ripristina()
+        assert ripreso.cerca(documento["_id"])["status"] is False
+
+    def test_log_in_uso_da_altro_processo(self, percorso):
+        """Il log di un processo attivo non può essere aperto da un altro buffer"""
+        buffer = BufferSegnalazioni(percorso, inserisci=MagicMock(side_effect=len))
+
+        with pytest.raises(OSError):
+            BufferSegnalazioni(percorso)
+        buffer.stop()
+
+    def test_adozione_log_orfani(self, tmp_path):
+        """All'avvio vengono adottati solo i log dei processi terminati, poi eliminati"""
+        orfano = str(tmp_path / "segnalazioni_buffer.1.log")
+        attivo = str(tmp_path / "segnalazioni_buffer.2.log")
+        morto = BufferSegnalazioni(orfano, inserisci=MagicMock(side_effect=len))
+        persa = morto.accoda(_documento(category="orfana"))
+        morto._log.close()  # crash
+        vivo = BufferSegnalazioni(attivo, inserisci=MagicMock(side_effect=len))
+        vivo.accoda(_documento(category="attiva"))
+
+        inserisci = MagicMock(side_effect=len)
+        nuovo = BufferSegnalazioni(percorso_log_processo(str(tmp_path)), inserisci=inserisci)
+        assert nuovo.ripristina() == 1
+        assert not os.path.exists(orfano)
+        assert os.path.exists(attivo)
+
+        nuovo.flush()
+        assert [d["_id"] for d in inserisci.call_args.args[0]] == [persa["_id"]]
+        vivo.stop()
+        nuovo.stop()
+
+
+class TestSegnalazioneVeloceBufferizzata:
+    """Suite di test per il percorso veloce di SegnalazioneService"""
+
+    def test_accetta_e_legge_dal_buffer(self, percorso):
+        """La segnalazione accettata è subito leggibile anche se non è ancora su MongoDB"""
+        buffer = BufferSegnalazioni(percorso, inserisci=MagicMock(side_effect=len))
+        service = SegnalazioneService(None)
+        with patch('app.services.segnalazione_service.get_buffer_segnalazioni', return_value=buffer), \
+                patch('app.services.segnalazione_service.buffer_attivo', return_value=buffer), \
+                patch('app.services.segnalazione_service.get_segnalazione_by_id', return_value=None), \
+                patch('app.services.segnalazione_service.get_gestore_topic', return_value=None):
+            creata = service.accoda_segnalazione_veloce(
+                "user_1", SegnalazioneInput(incident_longitude=12.49, incident_latitude=41.89))
+            letta = service.get_segnalazione_details(creata.id)
+
+        assert letta.id == creata.id
+        assert letta.user_id == "user_1"
+        assert buffer.metrics()["pending"] == 1
+        buffer.stop()
+
+    def test_linee_guida_dal_buffer(self, percorso):
+        """Le linee guida di una segnalazione ancora nel buffer sono disponibili (sync e async)"""
+        buffer = BufferSegnalazioni(percorso, inserisci=MagicMock(side_effect=len))
+        service = SegnalazioneService(None)
+        with patch('app.services.segnalazione_service.get_buffer_segnalazioni', return_value=buffer), \
+                patch('app.services.segnalazione_service.buffer_attivo', return_value=buffer), \
+                patch('app.services.segnalazione_service.get_segnalazione_by_id', return_value=None), \
+                patch('app.services.segnalazione_service.async_segnalazione_repo') as async_repo, \
+                patch('app.services.segnalazione_service.get_gestore_topic', return_value=None):
+            async_repo.get_segnalazione_by_id = AsyncMock(return_value=None)
+            creata = service.accoda_segnalazione_veloce(
+                "user_1", SegnalazioneInput(incident_longitude=12.49, incident_latitude=41.89,
+                                            category="tamponamento"))
+
+            linee_guida = service.get_guidelines_for_incident(creata.id)
+            assert asyncio.run(service.get_guidelines_for_incident_async(creata.id)) == linee_guida
+
+        assert "tamponamento" in linee_guida
+        async_repo.get_segnalazione_by_id.assert_not_called()
+        buffer.stop()
+
+
+class TestInsertSegnalazioni:
+    """Suite di test per segnalazione_repository.insert_segnalazioni"""
+
+    def test_duplicati_ignorati(self, monkeypatch):
+        """Reinviare un lotto già scritto non solleva errori né duplica i documenti"""
+        monkeypatch.setenv("STORAGE_BACKEND", "memory")
+        monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+        connection.chiudi_client()
+        try:
+            lotto = [_documento(_id=ObjectId()), _documento(_id=ObjectId())]
+
+            assert repo.insert_segnalazioni([dict(d) for d in lotto[:1]]) == 1
+            assert repo.insert_segnalazioni([dict(d) for d in lotto]) == 1
+            assert len(repo.get_segnalazione_by_status(True)) == 2
+        finally:
+            connection.chiudi_client()
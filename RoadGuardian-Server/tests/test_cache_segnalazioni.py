@@ -0,0 +1,114 @@
+"""
+Test Suite per la cache LRU delle segnalazioni lette per ID
+
+- Espulsione della voce usata meno di recente, scadenza e copie indipendenti dei documenti
+- Una lettura concorrente a un'invalidazione non reinserisce il documento vecchio
+- get_segnalazione_by_id (sync e async) serve dalla cache e le scritture del repository la invalidano
+"""
+
+import asyncio
+import datetime
+import pytest
+from app.db import connection
+from app.db import segnalazione_repository as repo
+from app.db import async_segnalazione_repository as async_repo
+from app.db.cache_segnalazioni import CacheSegnalazioni
+from app.models.incident_model import IncidentModel
+
+
+class Orologio:
+    def __init__(self):
+        self.adesso = 0.0
+
+    def __call__(self) -> float:
+        return self.adesso
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+    connection.chiudi_client()
+    yield connection.get_database()
+    connection.chiudi_client()
+
+
+def _crea(giorni_fa: int = 0) -> str:
+    quando = datetime.datetime.now() - datetime.timedelta(days=giorni_fa)
+    return repo.create_segnalazione(IncidentModel(
+        user_id="user_1", incident_date=quando.date(), incident_time=quando.time().replace(microsecond=0),
+        incident_longitude=12.49, incident_latitude=41.89, seriousness="high", category="tamponamento"))["id"]
+
+
+class TestCacheSegnalazioni:
+    """Suite di test per CacheSegnalazioni"""
+
+    def test_lru_e_scadenza(self):
+        """Oltre max_voci esce la voce meno recente; dopo il TTL la voce non è più servita"""
+        orologio = Orologio()
+        cache = CacheSegnalazioni(max_voci=2, ttl=10, orologio=orologio)
+        for segnalazione_id in ("a", "b"):
+            cache.scrivi(segnalazione_id, {"_id": segnalazione_id}, cache.generazione())
+        cache.leggi("a")
+        cache.scrivi("c", {"_id": "c"}, cache.generazione())
+
+        assert cache.leggi("b") is None
+        assert cache.leggi("a") == {"_id": "a"}
+        orologio.adesso = 11
+        assert cache.leggi("c") is None
+        assert cache.metrics()["evicted"] == 1
+        assert cache.metrics()["expired"] == 1
+        assert cache.metrics()["hit_rate"] == 0.5
+
+    def test_copie_indipendenti(self):
+        """Modificare il documento letto o quello scritto non altera la cache"""
+        cache = CacheSegnalazioni()
+        documento = {"_id": "a", "location": {"coordinates": [1, 2]}}
+        cache.scrivi("a", documento, cache.generazione())
+        documento["location"]["coordinates"].append(3)
+        cache.leggi("a")["status"] = False
+
+        assert cache.leggi("a") == {"_id": "a", "location": {"coordinates": [1, 2]}}
+
+    def test_scrittura_dopo_invalidazione(self):
+        """Un documento letto prima di un'invalidazione non viene inserito"""
+        cache = CacheSegnalazioni()
+        generazione = cache.generazione()
+        cache.invalida("a")
+
+        assert cache.scrivi("a", {"_id": "a", "status": True}, generazione) is False
+        assert cache.leggi("a") is None
+
+
+class TestCacheNelRepository:
+    """Suite di test per get_segnalazione_by_id con la cache condivisa"""
+
+    def test_hit_e_cancellazione(self, memoria):
+        """La seconda lettura è un hit; dopo la cancellazione si legge lo stato aggiornato"""
+        segnalazione_id = _crea()
+
+        repo.get_segnalazione_by_id(segnalazione_id)
+        assert asyncio.run(async_repo.get_segnalazione_by_id(segnalazione_id))["status"] is True
+        assert repo.get_cache_segnalazioni().metrics()["hits"] == 1
+
+        assert asyncio.run(async_repo.delete_segnalazione(segnalazione_id)) is True
+        assert repo.get_segnalazione_by_id(segnalazione_id)["status"] is False
+
+    def test_archiviazione_invalida(self, memoria):
+        """Una segnalazione spostata nell'archivio non è più servita dalla cache della collection attiva"""
+        segnalazione_id = _crea(giorni_fa=60)
+        assert repo.get_segnalazione_by_id(segnalazione_id) is not None
+
+        repo.archivia_segnalazioni(100, datetime.datetime.now() - datetime.timedelta(days=30))
+
+        assert repo.get_segnalazione_by_id(segnalazione_id) is None
+        assert "archived_at" in repo.get_segnalazione_by_id(segnalazione_id, include_storico=True)
+
+    def test_cache_disattivata(self, memoria, monkeypatch):
+        """Con SEGNALAZIONI_CACHE_MAX=0 le letture vanno sempre al database"""
+        monkeypatch.setenv("SEGNALAZIONI_CACHE_MAX", "0")
+        connection.chiudi_client()
+        segnalazione_id = _crea()
+
+        assert repo.get_segnalazione_by_id(segnalazione_id)["_id"] is not None
+        assert repo.get_cache_segnalazioni() is None
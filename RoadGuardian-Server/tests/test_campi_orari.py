@@ -0,0 +1,80 @@
+"""
+Test Suite per i campi orari derivati delle segnalazioni
+
+- to_mongo valorizza minute_of_day e day_of_week
+- get_segnalazione_by_time usa l'uguaglianza sul campo indicizzato invece di $expr
+- Fasce orarie, anche a cavallo della mezzanotte e ristrette ad alcuni giorni
+- Backfill dei documenti scritti prima dell'introduzione dei campi
+"""
+
+import asyncio
+import datetime
+import pytest
+from app.db import connection
+from app.db import segnalazione_repository as repo
+from app.db import async_segnalazione_repository as async_repo
+from app.models.incident_model import IncidentModel
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+    connection.chiudi_client()
+    yield connection.get_database()
+    connection.chiudi_client()
+
+
+def _segnalazione(giorno: datetime.date, ora: datetime.time) -> IncidentModel:
+    return IncidentModel(user_id="user_1", incident_date=giorno, incident_time=ora, incident_longitude=12.49,
+                         incident_latitude=41.89, seriousness="high", category="tamponamento")
+
+
+# 2025-03-03 è un lunedì, 2025-03-08 un sabato
+LUNEDI, SABATO = datetime.date(2025, 3, 3), datetime.date(2025, 3, 8)
+
+
+class TestCampiOrari:
+    """Suite di test per le query su minute_of_day e day_of_week"""
+
+    def test_to_mongo(self):
+        """I campi derivati seguono data e ora della segnalazione"""
+        documento = _segnalazione(SABATO, datetime.time(8, 15)).to_mongo()
+
+        assert documento["minute_of_day"] == 495
+        assert documento["day_of_week"] == 6
+
+    def test_orario_con_indice(self, memoria):
+        """La ricerca per orario è una uguaglianza servita dall'indice (status, minute_of_day)"""
+        repo.ensure_indexes()
+        repo.create_segnalazione(_segnalazione(LUNEDI, datetime.time(8, 15, 40)))
+        repo.create_segnalazione(_segnalazione(LUNEDI, datetime.time(8, 16)))
+
+        assert len(repo.get_segnalazione_by_time(datetime.time(8, 15))) == 1
+        cursore = memoria["segnalazioni"].find({"status": True, "minute_of_day": 495})
+        cursore.to_list()
+        assert cursore.piano.startswith("IXSCAN")
+
+    def test_fasce_orarie(self, memoria):
+        """Le fasce includono gli estremi, attraversano la mezzanotte e filtrano i giorni della settimana"""
+        for giorno, ora in [(LUNEDI, datetime.time(7, 30)), (LUNEDI, datetime.time(23, 50)),
+                            (SABATO, datetime.time(0, 10)), (SABATO, datetime.time(8, 0))]:
+            repo.create_segnalazione(_segnalazione(giorno, ora))
+
+        punta = repo.get_segnalazione_by_fascia_oraria(datetime.time(7, 0), datetime.time(8, 0))
+        notte = repo.get_segnalazione_by_fascia_oraria(datetime.time(23, 0), datetime.time(1, 0))
+        feriali = asyncio.run(async_repo.get_segnalazione_by_fascia_oraria(
+            datetime.time(7, 0), datetime.time(8, 0), giorni_settimana=[1, 2, 3, 4, 5]))
+
+        assert len(punta) == 2
+        assert len(notte) == 2
+        assert [d["incident_date"].time() for d in feriali] == [datetime.time(7, 30)]
+
+    def test_backfill(self, memoria):
+        """Il backfill valorizza i documenti esistenti ed è idempotente"""
+        memoria["segnalazioni"].insert_one({"incident_date": datetime.datetime(2025, 3, 3, 18, 5), "status": True})
+        memoria["segnalazioni_archive"].insert_one({"incident_date": None, "status": False})
+
+        assert repo.backfill_campi_derivati(dimensione_lotto=1) == 2
+        assert repo.backfill_campi_derivati() == 0
+        assert len(repo.get_segnalazione_by_time(datetime.time(18, 5))) == 1
@@ -0,0 +1,85 @@
+"""
+Test Suite per CodaPrioritaNotifiche
+
+- Ordinamento per gravità e, a parità, per segnalazione più recente
+- Quote di worker per classe di priorità
+- Overflow: scarto della notifica meno urgente
+"""
+
+import queue
+import pytest
+from datetime import datetime, timedelta
+from app.notifications.coda_priorita import CodaPrioritaNotifiche, quote_default, SCARTATA_NUOVA, SCARTATA_IN_CODA
+from app.notifications.notification_dispatcher import NotificationDispatcher
+from app.schemas.notifica_schema import NotificaPush
+from tests.test_notification_dispatcher import FakeTransport
+
+
+def notifica(token: str) -> NotificaPush:
+    return NotificaPush(token=token, title="Titolo", body="Corpo")
+
+
+class TestCodaPriorita:
+    """Suite di test per la coda a priorità delle notifiche"""
+
+    def test_ordine_per_gravita_ed_eta(self):
+        """Escono prima le classi più gravi e, nella stessa classe, le segnalazioni più recenti"""
+        coda = CodaPrioritaNotifiche(10, {"high": 1, "medium": 1, "low": 1})
+        coda.put(notifica("low"), "low", incident_ts=300)
+        coda.put(notifica("high_vecchia"), "high", incident_ts=100)
+        coda.put(notifica("high_recente"), "high", incident_ts=200)
+
+        classe, lotto = coda.preleva_lotto(10, batch_window=0)
+        assert classe == "high"
+        assert [n.token for _, n in lotto] == ["high_recente", "high_vecchia"]
+
+    def test_quote_per_classe(self):
+        """Esaurita la quota di una classe, i worker liberi servono le altre"""
+        coda = CodaPrioritaNotifiche(10, {"high": 2, "medium": 1, "low": 1})
+        for i in range(2):
+            coda.put(notifica(f"low_{i}"), "low")
+        coda.put(notifica("medium"), "medium")
+
+        assert coda.preleva_lotto(1, batch_window=0)[0] == "medium"
+        assert coda.preleva_lotto(1, batch_window=0)[0] == "low"
+        # Quota 'low' esaurita: il terzo worker non preleva la seconda notifica low
+        assert coda.preleva_lotto(1, batch_window=0, timeout=0.01) == (None, [])
+        coda.task_done("low", 1)
+        assert coda.preleva_lotto(1, batch_window=0)[0] == "low"
+
+    def test_overflow_scarta_meno_urgente(self):
+        """A coda piena viene scartata la notifica di classe più bassa, o la nuova se meno urgente"""
+        coda = CodaPrioritaNotifiche(2, quote_default(4))
+        coda.put(notifica("low"), "low")
+        coda.put(notifica("medium"), "medium")
+
+        assert coda.put_sostituendo(notifica("high"), "high") == SCARTATA_IN_CODA
+        assert coda.qsize_per_classe() == {"high": 1, "medium": 1, "low": 0}
+        assert coda.put_sostituendo(notifica("low_2"), "low") == SCARTATA_NUOVA
+        with pytest.raises(queue.Full):
+            coda.put(notifica("altra"), "high", block=False)
+
+    def test_quote_default(self):
+        """Le classi media e bassa non possono occupare tutto il pool"""
+        quote = quote_default(4)
+        assert quote == {"high": 4, "medium": 2, "low": 1}
+        assert quote["medium"] + quote["low"] < 4
+
+    def test_dispatcher_invia_prima_le_gravi(self):
+        """A worker saturo le allerte 'high' accodate dopo le 'low' vengono inviate per prime"""
+        transport = FakeTransport(bloccato=True)
+        dispatcher = NotificationDispatcher(transport, workers=1, batch_size=1, batch_window=0)
+        dispatcher.enqueue(notifica("in_invio"), seriousness="low")
+        while dispatcher.metrics()["queue_depth"] != 0:
+            pass
+        adesso = datetime.now()
+        dispatcher.enqueue(notifica("low"), seriousness="low", incident_at=adesso)
+        dispatcher.enqueue(notifica("high_vecchia"), seriousness="high", incident_at=adesso - timedelta(hours=1))
+        dispatcher.enqueue(notifica("high"), seriousness="high", incident_at=adesso)
+
+        transport.sblocco.set()
+        dispatcher.join()
+        dispatcher.stop()
+
+        assert transport.ricevute == ["in_invio", "high", "high_vecchia", "low"]
+        assert dispatcher.metrics()["queue_wait_by_priority"]["high"]["count"] == 2
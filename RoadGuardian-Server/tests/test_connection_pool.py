@@ -0,0 +1,96 @@
+"""
+Test Suite per la configurazione del client MongoDB
+
+- Opzioni del pool lette dalle variabili d'ambiente MONGO_*
+- Write concern per collection
+- Collection risolte al primo accesso e di nuovo dopo la chiusura del client
+"""
+
+import pytest
+from unittest.mock import MagicMock, patch
+from pymongo import WriteConcern
+from app.db import connection
+
+
+class TestConfigurazionePool:
+    """Suite di test per le opzioni d'ambiente del client"""
+
+    def test_default(self, monkeypatch):
+        """Senza variabili d'ambiente si usano i default e nessun compressore"""
+        for nome in ("MONGO_MAX_POOL_SIZE", "MONGO_MIN_POOL_SIZE", "MONGO_COMPRESSORS",
+                     "MONGO_SOCKET_TIMEOUT_MS"):
+            monkeypatch.delenv(nome, raising=False)
+
+        opzioni = connection.opzioni_client()
+
+        assert opzioni["maxPoolSize"] == 100
+        assert opzioni["minPoolSize"] == 0
+        assert "compressors" not in opzioni
+        assert "socketTimeoutMS" not in opzioni
+
+    def test_da_ambiente(self, monkeypatch):
+        """Dimensioni, timeout e compressori vengono letti dall'ambiente"""
+        monkeypatch.setenv("MONGO_MAX_POOL_SIZE", "250")
+        monkeypatch.setenv("MONGO_MIN_POOL_SIZE", "20")
+        monkeypatch.setenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "2000")
+        monkeypatch.setenv("MONGO_COMPRESSORS", "zstd,zlib")
+
+        opzioni = connection.opzioni_client()
+
+        assert opzioni["maxPoolSize"] == 250
+        assert opzioni["minPoolSize"] == 20
+        assert opzioni["serverSelectionTimeoutMS"] == 2000
+        assert opzioni["compressors"] == "zstd,zlib"
+
+    def test_write_concern_per_collection(self, monkeypatch):
+        """Il write concern è configurabile per singola collection"""
+        monkeypatch.setenv("MONGO_WRITE_CONCERN_NOTIFICHE_OUTBOX", "majority,j")
+        monkeypatch.setenv("MONGO_WRITE_CONCERN_DISPOSITIVI", "1")
+        monkeypatch.delenv("MONGO_WRITE_CONCERN_SEGNALAZIONI", raising=False)
+
+        assert connection.write_concern_per("notifiche_outbox") == WriteConcern(w="majority", j=True)
+        assert connection.write_concern_per("dispositivi") == WriteConcern(w=1)
+        assert connection.write_concern_per("segnalazioni") is None
+
+
+class TestCollezioneLazy:
+    """Suite di test per CollezioneLazy"""
+
+    def _database(self, client):
+        database = MagicMock()
+        database.client = client
+        return database
+
+    def test_risoluzione_al_primo_accesso(self):
+        """La creazione del riferimento non interroga il database"""
+        fornitore = MagicMock()
+        collezione = connection.CollezioneLazy("segnalazioni", database=fornitore)
+        fornitore.assert_not_called()
+
+        collezione.find_one({"_id": 1})
+
+        fornitore.return_value.__getitem__.assert_called_once_with("segnalazioni")
+
+    def test_nuovo_client_dopo_chiusura(self):
+        """Dopo la sostituzione del client la collection viene risolta di nuovo"""
+        primo, secondo = self._database(object()), self._database(object())
+        fornitore = MagicMock(side_effect=[primo, primo, secondo])
+        collezione = connection.CollezioneLazy("utenti", database=fornitore)
+
+        collezione.find_one({})
+        collezione.find_one({})
+        collezione.find_one({})
+
+        assert primo.__getitem__.call_count == 1
+        assert secondo.__getitem__.call_count == 1
+
+    def test_write_concern_applicato(self, monkeypatch):
+        """Il write concern configurato viene applicato alla collection risolta"""
+        monkeypatch.setenv("MONGO_WRITE_CONCERN_DISPOSITIVI", "majority")
+        database = self._database(object())
+        collezione = connection.CollezioneLazy("dispositivi", database=lambda: database)
+
+        collezione.risolvi()
+
+        database.__getitem__.return_value.with_options.assert_called_once_with(
+            write_concern=WriteConcern(w="majority"))
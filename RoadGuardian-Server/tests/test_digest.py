@@ -0,0 +1,138 @@
+"""
+Test Suite per DigestNotifiche
+
+- Accorpamento delle allerte per dispositivo nella finestra
+- Notifica singola invariata e deduplicazione per segnalazione
+- Le allerte gravi non attendono la finestra e il riepilogo eredita la priorità più urgente
+- Integrazione con NotificationDispatcher
+"""
+
+import pytest
+from app.notifications.digest import DigestNotifiche
+from app.notifications.notification_dispatcher import NotificationDispatcher
+from app.schemas.notifica_schema import NotificaPush
+from tests.test_notification_dispatcher import FakeTransport
+
+
+class Orologio:
+    def __init__(self):
+        self.adesso = 0.0
+
+    def __call__(self):
+        return self.adesso
+
+
+def allerta(token: str, incident_id: str, priorita: str = "medium") -> NotificaPush:
+    return NotificaPush(token=token, title="Attenzione: Segnalazione vicina!",
+                        body="C'è un incidente a 1.0 km da te.", data={"incident_id": incident_id},
+                        priorita=priorita)
+
+
+class TestDigest:
+    """Suite di test per il digest delle notifiche"""
+
+    def test_accorpamento_nella_finestra(self):
+        """Tre allerte per lo stesso dispositivo diventano un unico riepilogo alla chiusura della finestra"""
+        orologio = Orologio()
+        digest = DigestNotifiche(finestra=2.0, orologio=orologio)
+
+        assert digest.filtra([allerta("tok", "a"), allerta("tok", "b")]) == []
+        orologio.adesso = 1.0
+        assert digest.filtra([allerta("tok", "c")]) == []
+
+        orologio.adesso = 2.0
+        inviate = digest.filtra([])
+        assert len(inviate) == 1
+        assert inviate[0].body == "3 segnalazioni entro 3 km da te."
+        data = dict(inviate[0].data)
+        assert data.pop("digest_id")
+        assert data == {"tipo": "digest", "incident_ids": "a,b,c", "count": "3"}
+        assert digest.metrics()["digests"] == 1
+
+    def test_allerta_singola_invariata(self):
+        """Con una sola allerta nella finestra la notifica originale viene inviata invariata"""
+        orologio = Orologio()
+        digest = DigestNotifiche(finestra=1.0, orologio=orologio)
+        originale = allerta("tok", "a")
+
+        digest.filtra([originale, allerta("altro", "a"), allerta("altro", "b")])
+        orologio.adesso = 1.0
+        inviate = digest.filtra([])
+
+        assert originale in inviate
+        assert len(inviate) == 2
+
+    def test_stessa_segnalazione_deduplicata(self):
+        """Allerte ripetute per la stessa segnalazione contano una sola volta"""
+        digest = DigestNotifiche(finestra=1.0, orologio=Orologio())
+        digest.filtra([allerta("tok", "a"), allerta("tok", "a"), allerta("tok", "b")])
+        inviate = digest.filtra([], forza=True)
+        assert inviate[0].data["incident_ids"] == "a,b"
+
+    def test_notifiche_senza_segnalazione_non_trattenute(self):
+        """Le notifiche prive di incident_id passano subito"""
+        digest = DigestNotifiche(finestra=1.0, orologio=Orologio())
+        notifica = NotificaPush(token="tok", title="T", body="B")
+        assert digest.filtra([notifica]) == [notifica]
+
+    def test_allerta_grave_immediata(self):
+        """Un'allerta 'high' chiude subito la finestra; il riepilogo ha la classe più urgente"""
+        digest = DigestNotifiche(finestra=60, orologio=Orologio())
+
+        assert digest.filtra([allerta("tok", "a", "low")]) == []
+        inviate = digest.filtra([allerta("tok", "b", "high"), allerta("altro", "c")])
+
+        assert len(inviate) == 1
+        assert inviate[0].data["incident_ids"] == "a,b"
+        assert inviate[0].priorita == "high"
+        assert digest.in_attesa() == 1
+
+    def test_riepilogo_priorita_piu_urgente(self):
+        """Senza allerte gravi il riepilogo prende la classe più urgente tra quelle accorpate"""
+        orologio = Orologio()
+        digest = DigestNotifiche(finestra=1.0, orologio=orologio)
+        digest.filtra([allerta("tok", "a", "low"), allerta("tok", "b", "medium")])
+
+        orologio.adesso = 1.0
+        assert [n.priorita for n in digest.filtra([])] == ["medium"]
+
+    def test_dispatcher_allerta_grave_senza_attesa(self):
+        """Con una finestra lunga, un'allerta 'high' accodata al dispatcher parte senza attendere"""
+        lotti = []
+
+        class BatchTransport(FakeTransport):
+            def send_batch(self, notifiche):
+                lotti.extend(notifiche)
+                return [None] * len(notifiche)
+
+        dispatcher = NotificationDispatcher(BatchTransport(), workers=1, batch_window=0,
+                                            digest=DigestNotifiche(finestra=60))
+        dispatcher.enqueue(allerta("tok", "a"), seriousness="high")
+        dispatcher._queue.join()
+
+        assert [n.data["incident_id"] for n in lotti] == ["a"]
+        dispatcher.stop()
+
+    def test_dispatcher_con_digest(self):
+        """Il dispatcher invia un solo riepilogo per le allerte ravvicinate di un dispositivo"""
+        lotti = []
+
+        class BatchTransport(FakeTransport):
+            def send_batch(self, notifiche):
+                lotti.extend(notifiche)
+                return [None] * len(notifiche)
+
+        dispatcher = NotificationDispatcher(BatchTransport(), workers=1, batch_window=0,
+                                            digest=DigestNotifiche(finestra=0.2))
+        for incident_id in ("a", "b", "c"):
+            dispatcher.enqueue(allerta("tok", incident_id))
+        dispatcher.join()
+        dispatcher.stop()
+
+        assert len(lotti) == 1
+        assert lotti[0].data["count"] == "3"
+
+    def test_finestra_non_valida(self):
+        """Una finestra non positiva solleva ValueError"""
+        with pytest.raises(ValueError):
+            DigestNotifiche(finestra=0)
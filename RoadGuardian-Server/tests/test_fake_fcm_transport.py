@@ -0,0 +1,72 @@
+"""
+Test Suite per FakeFCMTransport
+
+- Registrazione dei messaggi ricevuti tramite NotifyFCMAdapter
+- Iniezione di token non registrati ed errori transitori
+- Limite di throughput (QUOTA_EXCEEDED)
+"""
+
+import time
+import pytest
+from unittest.mock import MagicMock
+from app.notifications.fake_fcm_transport import FakeFCMTransport
+from app.notifications.notify_fcm_adapter import NotifyFCMAdapter
+from app.schemas.notifica_schema import NotificaPush
+
+
+def notifiche(n: int, prefisso: str = "t"):
+    return [NotificaPush(token=f"{prefisso}{i}", title="T", body="B", data={"incident_id": str(i)})
+            for i in range(n)]
+
+
+class TestFakeFCMTransport:
+    """Suite di test per il trasporto FCM simulato"""
+
+    def test_registra_messaggi_ricevuti(self):
+        """Ogni messaggio inviato dall'adapter viene registrato, una chiamata per blocco da 500"""
+        transport = FakeFCMTransport()
+        adapter = NotifyFCMAdapter(transport=transport)
+
+        esiti = adapter.send_batch(notifiche(600))
+
+        assert esiti == [None] * 600
+        assert transport.chiamate == 2
+        assert len(transport.ricevute) == 600
+        assert transport.ricevute[3]["data"] == {"incident_id": "3"}
+
+    def test_token_non_registrati_segnalati(self):
+        """I token configurati come non registrati producono UNREGISTERED e vengono segnalati"""
+        transport = FakeFCMTransport(token_non_registrati={"t1"})
+        callback = MagicMock()
+        adapter = NotifyFCMAdapter(transport=transport, on_invalid_tokens=callback)
+
+        assert adapter.send_batch(notifiche(3)) == [None, "UNREGISTERED", None]
+        assert adapter.send_notification("t1", "T", "B") is False
+        assert adapter.send_multicast_notification(["t0", "t1"], "T", "B") == ["t1"]
+        assert callback.call_count == 3
+
+    def test_error_rate(self):
+        """Con error_rate=1 tutti i messaggi falliscono con errore transitorio"""
+        adapter = NotifyFCMAdapter(transport=FakeFCMTransport(error_rate=1.0))
+        assert adapter.send_batch(notifiche(5)) == ["UNAVAILABLE"] * 5
+
+    def test_limite_throughput(self):
+        """Oltre il numero di messaggi al secondo FCM simulato risponde QUOTA_EXCEEDED"""
+        transport = FakeFCMTransport(max_messaggi_al_secondo=10)
+        esiti = NotifyFCMAdapter(transport=transport).send_batch(notifiche(15))
+
+        assert esiti.count(None) == 10
+        assert esiti.count("QUOTA_EXCEEDED") == 5
+        assert transport.statistiche()["errori"] == {"QuotaExceededError": 5}
+
+    def test_latenza_simulata(self):
+        """La latenza fissa viene applicata a ogni chiamata"""
+        transport = FakeFCMTransport(latenza_ms=20)
+        inizio = time.perf_counter()
+        transport.send_each([])
+        assert time.perf_counter() - inizio >= 0.02
+
+    def test_distribuzione_non_valida(self):
+        """Una distribuzione di latenza sconosciuta solleva ValueError"""
+        with pytest.raises(ValueError):
+            FakeFCMTransport(distribuzione="gaussiana")
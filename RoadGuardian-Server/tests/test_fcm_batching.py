@@ -0,0 +1,92 @@
+"""
+Test Suite per l'invio a lotti di NotifyFCMAdapter
+
+- send_batch suddivide i messaggi in blocchi da 500 (send_each)
+- send_multicast_notification usa send_each_for_multicast a blocchi
+- Gli errori per-token vengono ricondotti ai codici di NotificheAPI
+"""
+
+import pytest
+from unittest.mock import MagicMock, patch
+from firebase_admin import messaging
+from app.notifications.notify_fcm_adapter import NotifyFCMAdapter
+from app.schemas.notifica_schema import NotificaPush
+
+
+def risposta(successo: bool, eccezione=None):
+    resp = MagicMock()
+    resp.success = successo
+    resp.exception = eccezione
+    return resp
+
+
+def batch_response(responses):
+    batch = MagicMock()
+    batch.responses = responses
+    batch.failure_count = sum(1 for r in responses if not r.success)
+    return batch
+
+
+class TestFCMBatching:
+    """Suite di test per send_batch e send_multicast_notification"""
+
+    @pytest.fixture
+    def adapter(self):
+        with patch('app.notifications.notify_fcm_adapter.firebase_admin') as mock_firebase:
+            mock_firebase._apps = {"[DEFAULT]": object()}
+            yield NotifyFCMAdapter()
+
+    @patch('app.notifications.notify_fcm_adapter.messaging.send_each')
+    def test_send_batch_blocchi_da_500(self, mock_send_each, adapter):
+        """1200 notifiche producono 3 chiamate (500 + 500 + 200)"""
+        mock_send_each.side_effect = lambda messages: batch_response([risposta(True) for _ in messages])
+        notifiche = [NotificaPush(token=f"t{i}", title="T", body="B") for i in range(1200)]
+
+        esiti = adapter.send_batch(notifiche)
+
+        assert [len(c.args[0]) for c in mock_send_each.call_args_list] == [500, 500, 200]
+        assert esiti == [None] * 1200
+
+    @patch('app.notifications.notify_fcm_adapter.messaging.send_each')
+    def test_send_batch_mappa_errori(self, mock_send_each, adapter):
+        """Gli errori per-messaggio vengono tradotti nei codici NotificheAPI"""
+        mock_send_each.return_value = batch_response([
+            risposta(True),
+            risposta(False, messaging.UnregisteredError("non registrato")),
+            risposta(False, messaging.QuotaExceededError("quota")),
+        ])
+        notifiche = [NotificaPush(token=f"t{i}", title="T", body="B") for i in range(3)]
+
+        assert adapter.send_batch(notifiche) == [None, "UNREGISTERED", "QUOTA_EXCEEDED"]
+
+    @patch('app.notifications.notify_fcm_adapter.messaging.send_each_for_multicast')
+    def test_multicast_token_falliti(self, mock_multicast, adapter):
+        """I token falliti di ogni blocco vengono restituiti"""
+        def fake_multicast(message):
+            return batch_response([risposta(token != "t700") for token in message.tokens])
+        mock_multicast.side_effect = fake_multicast
+
+        falliti = adapter.send_multicast_notification([f"t{i}" for i in range(800)], "T", "B")
+
+        assert mock_multicast.call_count == 2
+        assert falliti == ["t700"]
+
+
+class TestFCMInizializzazioneLazy:
+    """Suite di test per l'inizializzazione lazy dell'app Firebase"""
+
+    @patch('app.notifications.notify_fcm_adapter.messaging.send_each')
+    def test_firebase_inizializzato_al_primo_invio(self, mock_send_each):
+        """La creazione dell'adapter non inizializza Firebase; il primo invio sì, una sola volta"""
+        mock_send_each.side_effect = lambda messages: batch_response([risposta(True) for _ in messages])
+        with patch('app.notifications.notify_fcm_adapter.firebase_admin') as mock_firebase:
+            mock_firebase._apps = {}
+            mock_firebase.initialize_app.side_effect = lambda *a: mock_firebase._apps.update({"[DEFAULT]": object()})
+
+            adapter = NotifyFCMAdapter(cred_path=None)
+            mock_firebase.initialize_app.assert_not_called()
+
+            adapter.send_batch([NotificaPush(token="t1", title="T", body="B")])
+            adapter.send_batch([NotificaPush(token="t2", title="T", body="B")])
+
+            mock_firebase.initialize_app.assert_called_once()
@@ -0,0 +1,101 @@
+"""
+Test Suite per l'indice geohash delle segnalazioni attive
+
+- Copertura del cerchio di allerta con celle geohash
+- Risoluzione dei candidati per la cella dell'utente
+- Rimozione dall'indice alla cancellazione logica
+- La data della segnalazione arriva dall'indice al dispatcher (priorità alle più recenti)
+"""
+
+import pytest
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+from app.schemas.mappa_schema import UserPositionUpdate
+from app.services.mappa_service import MappaService
+from app.services.geohash_index import (
+    GeohashIndex,
+    geohash_encode,
+    geohash_cover_circle,
+    haversine_km,
+)
+
+
+class TestGeohashIndex:
+    """Suite di test per GeohashIndex"""
+
+    @pytest.fixture
+    def segnalazione(self):
+        return {
+            "_id": "inc_roma",
+            "category": "tamponamento",
+            "seriousness": "high",
+            "incident_latitude": 41.9028,
+            "incident_longitude": 12.4964,
+            "status": True,
+        }
+
+    def test_geohash_encode_valore_noto(self):
+        """Il geohash di un punto noto coincide con il valore di riferimento"""
+        assert geohash_encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+
+    def test_cover_contiene_punti_entro_raggio(self, segnalazione):
+        """Ogni punto entro 3 km cade in una cella della copertura"""
+        celle = geohash_cover_circle(41.9028, 12.4964, 3.0, 6)
+        for dlat, dlon in [(0, 0), (0.02, 0), (0, 0.03), (-0.018, -0.018), (0.026, 0)]:
+            lat, lon = 41.9028 + dlat, 12.4964 + dlon
+            if haversine_km(41.9028, 12.4964, lat, lon) <= 3.0:
+                assert geohash_encode(lat, lon, 6) in celle
+
+    def test_candidati_vicino_e_lontano(self, segnalazione):
+        """Un utente vicino ottiene la segnalazione come candidata, uno lontano no"""
+        indice = GeohashIndex()
+        indice.carica([segnalazione])
+
+        vicini = indice.candidati(41.9030, 12.4965)
+        assert [c["_id"] for c in vicini] == ["inc_roma"]
+        assert indice.candidati(45.4642, 9.1900) == []
+
+    def test_segnalazioni_non_attive_ignorate(self, segnalazione):
+        """Le segnalazioni con status False non vengono indicizzate"""
+        segnalazione["status"] = False
+        indice = GeohashIndex()
+        indice.carica([segnalazione])
+        assert len(indice) == 0
+
+    def test_rimozione(self, segnalazione):
+        """Dopo la cancellazione la segnalazione non è più candidata"""
+        indice = GeohashIndex()
+        indice.aggiungi(segnalazione)
+        assert indice.rimuovi("inc_roma") is True
+        assert indice.candidati(41.9028, 12.4964) == []
+        assert indice.rimuovi("inc_roma") is False
+
+    def test_ricarica_solo_se_scaduto(self, segnalazione):
+        """Il loader viene invocato solo quando l'indice va ricaricato"""
+        indice = GeohashIndex(reload_interval=3600)
+        chiamate = []
+
+        def loader():
+            chiamate.append(1)
+            return [segnalazione]
+
+        indice.assicura_caricato(loader)
+        indice.assicura_caricato(loader)
+        assert len(chiamate) == 1
+
+    def test_data_segnalazione_al_dispatcher(self, segnalazione):
+        """process_user_position passa al dispatcher la data della segnalazione letta dall'indice"""
+        segnalazione["incident_date"] = datetime(2026, 3, 1, 8, 30)
+        dispatcher = MagicMock()
+        service = MappaService(db=None, notification_dispatcher=dispatcher)
+        service.segnalazione_facade = MagicMock()
+        service.segnalazione_facade.get_segnalazioni_attive_per_mappa.return_value = [segnalazione]
+
+        with patch('app.services.mappa_service.indice_segnalazioni', GeohashIndex()), \
+                patch('app.services.mappa_service.registro_dispositivi'), \
+                patch('app.services.mappa_service.get_gestore_topic', return_value=None):
+            service.process_user_position(UserPositionUpdate(latitudine=41.9030, longitudine=12.4965,
+                                                             fcm_token="tok"))
+
+        dispatcher.enqueue.assert_called_once()
+        assert dispatcher.enqueue.call_args.kwargs["incident_at"] == datetime(2026, 3, 1, 8, 30)
@@ -0,0 +1,133 @@
+"""
+Test Suite per l'hashing delle password con scrypt nel pool di processi
+
+- Formato dell'hash scrypt, salt casuale e verifica
+- Verifica degli hash SHA-256 legacy e individuazione degli hash da ricalcolare
+- Rifiuto delle richieste oltre la coda massima, con conteggio nelle metriche
+- Avvio anticipato del pool con processi forkserver (nessun fork del server)
+- Il login con un hash legacy lo sostituisce con uno scrypt
+- Il pool saturo viene esposto come 503
+"""
+
+import asyncio
+import hashlib
+import pytest
+from bson import ObjectId
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi import HTTPException
+from app.services.hash_password import CodaHashPiena, HasherPassword, calcola_hash, verifica_hash
+from app.services import profilo_utente_service as servizio
+from app.services.profilo_utente_service import ProfiloUtenteService
+
+# Costo ridotto per non rallentare la suite
+N, R, P = 2 ** 10, 8, 1
+
+
+@pytest.fixture
+def hasher():
+    hasher = HasherPassword(processi=1, max_in_coda=4, n=N, r=R, p=P)
+    yield hasher
+    hasher.stop()
+
+
+def _payload(email: str, password: str) -> MagicMock:
+    payload = MagicMock()
+    payload.model_dump.return_value = {"email": email, "password": password}
+    return payload
+
+
+class TestFunzioniHash:
+    """Suite di test per calcola_hash e verifica_hash"""
+
+    def test_formato_e_verifica(self):
+        """L'hash contiene i parametri, usa un salt diverso a ogni calcolo e verifica solo la password giusta"""
+        primo = calcola_hash("Segreta1!", N, R, P)
+        secondo = calcola_hash("Segreta1!", N, R, P)
+
+        assert primo.split("$")[:4] == ["scrypt", str(N), str(R), str(P)]
+        assert primo != secondo
+        assert verifica_hash("Segreta1!", primo)
+        assert not verifica_hash("Segreta2!", primo)
+        assert not verifica_hash("Segreta1!", "formato$sconosciuto")
+
+    def test_hash_legacy(self, hasher):
+        """Gli hash SHA-256 esistenti sono ancora validi ma vanno ricalcolati"""
+        legacy = hashlib.sha256("Segreta1!".encode("utf-8")).hexdigest()
+
+        assert verifica_hash("Segreta1!", legacy)
+        assert not verifica_hash("Segreta2!", legacy)
+        assert hasher.da_aggiornare(legacy)
+        assert hasher.da_aggiornare(calcola_hash("Segreta1!", N * 2, R, P))
+        assert not hasher.da_aggiornare(calcola_hash("Segreta1!", N, R, P))
+
+
+class TestHasherPassword:
+    """Suite di test per il pool di hashing"""
+
+    def test_hash_e_verifica_nel_pool(self, hasher):
+        """Hash e verifica, sincroni e asincroni, passano dal pool e vengono conteggiati"""
+        codificato = asyncio.run(hasher.hash_async("Segreta1!"))
+
+        assert hasher.verifica("Segreta1!", codificato)
+        assert not asyncio.run(hasher.verifica_async("Sbagliata1!", codificato))
+        metriche = hasher.metrics()
+        assert metriche["hashes"] == 1
+        assert metriche["verifications"] == 2
+        assert metriche["failed_verifications"] == 1
+        assert metriche["in_flight"] == 0
+        assert metriche["latency"]["count"] == 3
+
+    def test_coda_piena(self, hasher):
+        """Oltre processi + max_in_coda le richieste vengono rifiutate subito"""
+        hasher._in_corso = hasher.processi + hasher.max_in_coda
+
+        with pytest.raises(CodaHashPiena):
+            hasher.hash("Segreta1!")
+
+        assert hasher.metrics()["rejected"] == 1
+        assert hasher.metrics()["queued"] == hasher.max_in_coda
+
+    def test_avvio_anticipato_forkserver(self, hasher):
+        """avvia crea subito i processi del pool con forkserver; il primo hash li riusa"""
+        hasher.avvia()
+        executor = hasher._executor
+        processi = set(executor._processes)
+
+        assert executor._mp_context.get_start_method() == "forkserver"
+        assert len(processi) == hasher.processi
+        assert verifica_hash("Segreta1!", hasher.hash("Segreta1!"))
+        assert hasher._executor is executor and set(executor._processes) == processi
+
+
+class TestLoginConHash:
+    """Suite di test per l'uso del pool in ProfiloUtenteService"""
+
+    def test_login_ricalcola_hash_legacy(self, hasher):
+        """Un login riuscito con hash SHA-256 salva il nuovo hash scrypt"""
+        utente = {"_id": ObjectId(), "email": "a@b.it", "first_name": "A", "last_name": "B",
+                  "password": hashlib.sha256("Segreta1!".encode("utf-8")).hexdigest(),
+                  "num_tel": "+393331234567", "is_active": True}
+        with patch.object(servizio, "get_hasher_password", return_value=hasher), \
+                patch.object(servizio, "async_utente_repo") as mock_repo:
+            mock_repo.get_user_by_email = AsyncMock(return_value=dict(utente))
+            mock_repo.update_password = AsyncMock(return_value=True)
+
+            asyncio.run(ProfiloUtenteService(None).login_user_async(_payload("a@b.it", "Segreta1!")))
+
+        user_id, nuovo_hash = mock_repo.update_password.await_args.args
+        assert user_id == str(utente["_id"])
+        assert nuovo_hash.startswith("scrypt$") and verifica_hash("Segreta1!", nuovo_hash)
+
+    def test_pool_saturo_503(self):
+        """Se il pool rifiuta la richiesta il login risponde 503 invece di attendere"""
+        hasher = MagicMock()
+        hasher.verifica_async = AsyncMock(side_effect=servizio.CodaHashPiena("coda piena"))
+        with patch.object(servizio, "get_hasher_password", return_value=hasher), \
+                patch.object(servizio, "async_utente_repo") as mock_repo:
+            mock_repo.get_user_by_email = AsyncMock(return_value={"_id": ObjectId(), "password": "x",
+                                                                  "is_active": True})
+
+            with pytest.raises(HTTPException) as exc:
+                asyncio.run(ProfiloUtenteService(None).login_user_async(_payload("a@b.it", "Segreta1!")))
+
+        assert exc.value.status_code == 503
@@ -0,0 +1,127 @@
+"""
+Test Suite per il monitoraggio dei comandi MongoDB (monitoring/mongo_monitor.py)
+
+- Latenza e documenti restituiti raggruppati per comando e funzione del repository chiamante
+- Log delle query lente con la forma del filtro e senza i valori
+- Errori dei comandi conteggiati per chiamante
+- Route delle metriche e di debug
+"""
+
+from types import SimpleNamespace
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from app.monitoring.mongo_monitor import MonitorComandi, documenti_restituiti, forma_comando
+from app.monitoring.metriche import Istogramma
+from app.api import metriche_api
+
+
+def _avvio(nome: str, comando: dict, request_id: int = 1):
+    return SimpleNamespace(command_name=nome, command=comando, connection_id=("localhost", 27017),
+                           request_id=request_id)
+
+
+def _esito(nome: str, risposta: dict, durata_ms: float, request_id: int = 1):
+    return SimpleNamespace(command_name=nome, reply=risposta, duration_micros=int(durata_ms * 1000),
+                           connection_id=("localhost", 27017), request_id=request_id)
+
+
+def _repository_finto(monitor: MonitorComandi):
+    """Funzione definita in un modulo "*_repository" che avvia un comando tramite un helper interno."""
+    sorgente = (
+        "def _interno(monitor, evento):\n"
+        "    monitor.started(evento)\n"
+        "def get_segnalazione_by_user(monitor, evento):\n"
+        "    _interno(monitor, evento)\n"
+    )
+    spazio = {"__name__": "db.segnalazione_repository"}
+    exec(sorgente, spazio)
+    return spazio["get_segnalazione_by_user"]
+
+
+class TestMonitorComandi:
+    """Suite di test per MonitorComandi"""
+
+    def test_statistiche_per_chiamante(self):
+        """I comandi sono attribuiti alla funzione di repository più esterna, con latenza e documenti"""
+        monitor = MonitorComandi(soglia_lente_ms=1000)
+        chiama = _repository_finto(monitor)
+
+        chiama(monitor, _avvio("find", {"find": "segnalazioni", "filter": {"user_id": "u1", "status": True}}))
+        monitor.succeeded(_esito("find", {"cursor": {"firstBatch": [{}, {}, {}], "id": 0}}, durata_ms=4))
+        monitor.started(_avvio("count", {"count": "utenti", "query": {}}, request_id=2))
+        monitor.succeeded(_esito("count", {"n": 7}, durata_ms=1, request_id=2))
+
+        metriche = monitor.metrics()
+        assert [(c["command"], c["caller"], c["collection"]) for c in metriche["commands"]] == [
+            ("find", "segnalazione_repository.get_segnalazione_by_user", "segnalazioni"), ("count", "altro", "utenti")]
+        assert metriche["commands"][0]["documents"]["sum"] == 3
+        assert metriche["commands"][0]["latency"]["max_ms"] == 4
+        assert metriche["in_flight"] == 0
+        assert monitor.query_lente() == []
+
+    def test_query_lente_e_errori(self):
+        """Un comando oltre soglia va nel log con la sola forma del filtro; un errore è conteggiato"""
+        monitor = MonitorComandi(soglia_lente_ms=50)
+        monitor.started(_avvio("update", {"update": "segnalazioni", "updates": [
+            {"q": {"_id": "abc", "status": True}, "u": {"$set": {"status": False}}}]}))
+        monitor.succeeded(_esito("update", {"n": 1, "nModified": 1}, durata_ms=120))
+        monitor.started(_avvio("find", {"find": "segnalazioni", "filter": {}}, request_id=2))
+        monitor.failed(SimpleNamespace(command_name="find", duration_micros=2000, failure={},
+                                       connection_id=("localhost", 27017), request_id=2))
+
+        lente = monitor.query_lente()
+        assert lente == [{"command": "update", "caller": "altro", "collection": "segnalazioni",
+                          "shape": [{"_id": "str", "status": "bool"}], "duration_ms": 120.0, "documents": 1}]
+        assert monitor.metrics()["slow_commands"] == 1
+        assert {c["command"]: c["errors"] for c in monitor.metrics()["commands"]} == {"update": 0, "find": 1}
+
+    def test_comandi_ignorati(self):
+        """Handshake e ping non generano statistiche"""
+        monitor = MonitorComandi()
+        monitor.started(_avvio("hello", {"hello": 1}))
+        monitor.succeeded(_esito("hello", {"ok": 1}, durata_ms=500))
+
+        assert monitor.metrics()["commands"] == []
+
+    def test_forma_e_documenti(self):
+        """Forma del filtro per comando e documenti restituiti per tipo di risposta"""
+        assert forma_comando("aggregate", {"pipeline": [{"$match": {"status": True}}]}) == [{"$match": {"status": "bool"}}]
+        assert forma_comando("insert", {"documents": [{"a": 1}]}) is None
+        assert documenti_restituiti({"cursor": {"nextBatch": [{}]}}) == 1
+        assert documenti_restituiti({"value": None, "ok": 1}) == 0
+
+
+class TestIstogramma:
+    """Suite di test per Istogramma"""
+
+    def test_percentili_su_valori(self):
+        """I percentili restituiscono il limite superiore del bucket"""
+        istogramma = Istogramma([1, 10, 100])
+        for valore in (0, 5, 5, 50):
+            istogramma.osserva(valore)
+
+        riepilogo = istogramma.snapshot()
+        assert (riepilogo["count"], riepilogo["sum"], riepilogo["p50"], riepilogo["max"]) == (4, 60, 10, 50)
+
+
+class TestMetricheApi:
+    """Suite di test per le route di /metriche"""
+
+    def test_metriche_e_query_lente(self):
+        """Le route espongono le metriche del monitor e le ultime query lente"""
+        monitor = MonitorComandi(soglia_lente_ms=0)
+        for request_id in (1, 2):
+            monitor.started(_avvio("find", {"find": "utenti", "filter": {"email": "x"}}, request_id=request_id))
+            monitor.succeeded(_esito("find", {"cursor": {"firstBatch": []}}, durata_ms=request_id,
+                                     request_id=request_id))
+        app = FastAPI()
+        app.include_router(metriche_api.router)
+
+        with patch('app.api.metriche_api.get_monitor_comandi', return_value=monitor):
+            client = TestClient(app)
+            metriche = client.get("/metriche/mongo").json()
+            lente = client.get("/metriche/mongo/query-lente", params={"limite": 1}).json()
+
+        assert metriche["commands"][0]["latency"]["count"] == 2
+        assert [voce["duration_ms"] for voce in lente] == [2.0]
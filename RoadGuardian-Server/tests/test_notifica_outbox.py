@@ -0,0 +1,166 @@
+"""
+Test Suite per NotificaOutbox
+
+- Classificazione degli esiti: inviati, ritentativi con backoff, dead-letter
+- Elaborazione di un lotto reclamato dall'outbox
+- Le transizioni di stato di un claim scaduto e ripreso da un altro worker non hanno effetto
+- I worker del dispatcher persistono in blocco ogni lotto prelevato, anche le notifiche trattenute dal digest
+- Il claim delle notifiche trattenute viene prolungato, così l'outbox non le riprende
+"""
+
+import datetime
+import pytest
+from bson import ObjectId
+from unittest.mock import Mock, patch
+from app.db import connection
+from app.db import notifica_outbox_repository as outbox_repo
+from app.notifications.digest import DigestNotifiche
+from app.notifications.notifica_outbox import NotificaOutbox
+from app.notifications.notification_dispatcher import NotificationDispatcher
+from app.schemas.notifica_schema import NotificaPush
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+    connection.chiudi_client()
+    yield connection.get_database()
+    connection.chiudi_client()
+
+
+class TestNotificaOutbox:
+    """Suite di test per NotificaOutbox"""
+
+    @pytest.fixture
+    def adapter(self):
+        return Mock()
+
+    @pytest.fixture
+    def outbox(self, adapter):
+        return NotificaOutbox(adapter, max_attempts=3, base_delay=1.0, max_delay=10.0)
+
+    def test_backoff_limitato(self, outbox):
+        """Il ritardo con jitter non supera mai max_delay"""
+        for tentativi in range(1, 20):
+            assert 0 <= outbox.backoff(tentativi) <= 10.0
+
+    @patch('app.notifications.notifica_outbox.outbox_repo')
+    def test_registra_esiti(self, mock_repo, outbox):
+        """Successi, errori transitori e permanenti finiscono nello stato corretto"""
+        documenti = [
+            {"_id": "ok", "attempts": 0, "claim_token": "c"},
+            {"_id": "transitorio", "attempts": 0, "claim_token": "c"},
+            {"_id": "esaurito", "attempts": 2, "claim_token": "c"},
+            {"_id": "permanente", "attempts": 0, "claim_token": "c"},
+        ]
+        esiti = [None, "UNAVAILABLE", "UNAVAILABLE", "UNREGISTERED"]
+
+        outbox.registra_esiti(documenti, esiti)
+
+        mock_repo.mark_sent.assert_called_once_with([("ok", "c")])
+        retries = mock_repo.schedule_retry.call_args.args[0]
+        assert [r[:2] for r in retries] == [("transitorio", "c")]
+        assert retries[0][3] == "UNAVAILABLE"
+        mock_repo.mark_dead.assert_called_once_with([("esaurito", "c", "UNAVAILABLE"),
+                                                     ("permanente", "c", "UNREGISTERED")])
+        assert outbox.metrics() == {"persisted": 0, "retried": 1, "dead_lettered": 2}
+
+    @patch('app.notifications.notifica_outbox.outbox_repo')
+    def test_elabora_lotto(self, mock_repo, outbox, adapter):
+        """Un lotto reclamato viene inviato con send_batch e gli esiti registrati"""
+        mock_repo.claim_batch.return_value = [
+            {"_id": "a", "token": "t1", "title": "T", "body": "B", "data": {}, "attempts": 1, "claim_token": "c"},
+        ]
+        adapter.send_batch.return_value = [None]
+
+        assert outbox.elabora_lotto() == 1
+        assert adapter.send_batch.call_args.args[0][0].token == "t1"
+        mock_repo.mark_sent.assert_called_once_with([("a", "c")])
+
+    @patch('app.notifications.notifica_outbox.outbox_repo')
+    def test_elabora_lotto_vuoto(self, mock_repo, outbox, adapter):
+        """Senza documenti da reclamare non viene inviato nulla"""
+        mock_repo.claim_batch.return_value = []
+        assert outbox.elabora_lotto() == 0
+        adapter.send_batch.assert_not_called()
+
+    def test_claim_scaduto_ripreso(self, memoria, outbox):
+        """Dopo che un altro worker ha ripreso il documento, il vecchio proprietario non ne cambia lo stato"""
+        notifica = NotificaPush(token="t1", title="T", body="B")
+        outbox.persisti([notifica])
+        oid = outbox_repo.outbox_collection.find_one({})["_id"]
+        # Claim scaduto: un altro worker riprende il documento
+        outbox_repo.outbox_collection.update_one(
+            {"_id": oid}, {"$set": {"claimed_until": datetime.datetime.now(datetime.timezone.utc)
+                                    - datetime.timedelta(seconds=1)}})
+        ripresi = outbox_repo.claim_batch("altro-worker", 10)
+        assert [d["_id"] for d in ripresi] == [oid]
+
+        assert outbox.conferma([notifica]) == {}
+        assert outbox_repo.mark_sent([(oid, outbox.claim_token)]) == 0
+        assert outbox_repo.outbox_collection.find_one({"_id": oid})["claimed_by"] == "altro-worker"
+
+        assert outbox_repo.mark_sent([(oid, ripresi[0]["claim_token"])]) == 1
+        assert outbox_repo.outbox_collection.find_one({"_id": oid})["status"] == outbox_repo.STATO_SENT
+
+
+class TestDispatcherConOutbox:
+    """Suite di test per la persistenza delle notifiche prelevate dal dispatcher"""
+
+    def test_persistenza_in_blocco_fuori_dalla_richiesta(self):
+        """enqueue non scrive nell'outbox: il worker persiste l'intero lotto con una sola insert"""
+        adapter = Mock()
+        adapter.send_batch.side_effect = lambda notifiche: [None] * len(notifiche)
+        outbox = NotificaOutbox(adapter)
+        dispatcher = NotificationDispatcher(adapter, workers=1, outbox=outbox, batch_window=0.2)
+        with patch('app.notifications.notifica_outbox.outbox_repo') as mock_repo:
+            mock_repo.insert_notifiche.side_effect = lambda docs, **_: [{"_id": ObjectId()} for _ in docs]
+            mock_repo.rinnova_claim.return_value = []
+            for i in range(3):
+                dispatcher.enqueue(NotificaPush(token=f"t{i}", title="T", body="B"))
+            mock_repo.insert_notifiche.assert_not_called()
+            dispatcher._queue.join()
+            dispatcher.stop()
+
+        assert mock_repo.insert_notifiche.call_count == 1
+        assert sorted(d["token"] for d in mock_repo.insert_notifiche.call_args.args[0]) == ["t0", "t1", "t2"]
+
+    def test_claim_trattenute_rinnovato(self, memoria):
+        """Un'allerta ferma nel digest oltre il claim non viene ripresa e inviata dall'outbox"""
+        adapter = Mock()
+        outbox = NotificaOutbox(adapter)
+        digest = DigestNotifiche(finestra=60)
+        NotificationDispatcher(adapter, workers=1, outbox=outbox, digest=digest)
+        notifica = NotificaPush(token="t1", title="T", body="B", data={"incident_id": "s1"})
+        outbox.persisti([notifica])
+        digest.filtra([notifica])
+        # Claim scaduto mentre l'allerta è ancora nella finestra del digest
+        outbox_repo.outbox_collection.update_many(
+            {}, {"$set": {"claimed_until": datetime.datetime.now(datetime.timezone.utc)
+                          - datetime.timedelta(seconds=1)}})
+
+        assert outbox.rinnova_trattenute() == 1
+        assert outbox.elabora_lotto() == 0
+        adapter.send_batch.assert_not_called()
+
+    def test_persistenza_al_prelievo_e_digest(self, memoria):
+        """Le allerte trattenute dal digest sono già nell'outbox; il riepilogo le marca tutte inviate"""
+        adapter = Mock()
+        adapter.send_batch.side_effect = lambda notifiche: [None] * len(notifiche)
+        outbox = NotificaOutbox(adapter)
+        dispatcher = NotificationDispatcher(adapter, workers=1, outbox=outbox,
+                                            digest=DigestNotifiche(finestra=60))
+        for incident_id in ("s1", "s2"):
+            dispatcher.enqueue(NotificaPush(token="t1", title="T", body="B", data={"incident_id": incident_id}))
+        dispatcher._queue.join()
+
+        # Ancora trattenute nella finestra del digest, ma già persistite (e quindi recuperabili)
+        adapter.send_batch.assert_not_called()
+        assert outbox_repo.count_by_status() == {outbox_repo.STATO_IN_PROGRESS: 2}
+
+        dispatcher.stop()
+
+        inviate = adapter.send_batch.call_args.args[0]
+        assert [n.data["tipo"] for n in inviate] == ["digest"]
+        assert outbox_repo.count_by_status() == {outbox_repo.STATO_SENT: 2}
@@ -0,0 +1,117 @@
+"""
+Test Suite per NotificationDispatcher
+
+- Invio asincrono tramite worker pool
+- Politiche di overflow della coda limitata
+- Metriche di profondità coda e latenza
+"""
+
+import threading
+import pytest
+from app.notifications.notifiche_api import NotificheAPI
+from app.notifications.notification_dispatcher import NotificationDispatcher
+from app.schemas.notifica_schema import NotificaPush
+
+
+class FakeTransport(NotificheAPI):
+    """Trasporto FCM finto: registra le notifiche e può restare bloccato finché non viene sbloccato."""
+
+    def __init__(self, bloccato: bool = False):
+        self.ricevute = []
+        self.sblocco = threading.Event()
+        if not bloccato:
+            self.sblocco.set()
+
+    def send_notification(self, token, title, body, data=None):
+        self.sblocco.wait(5)
+        self.ricevute.append(token)
+        return token != "token_rifiutato"
+
+    def send_multicast_notification(self, tokens, title, body, data=None):
+        return []
+
+
+def notifica(token: str) -> NotificaPush:
+    return NotificaPush(token=token, title="Titolo", body="Corpo", data={"incident_id": "1"})
+
+
+class TestNotificationDispatcher:
+    """Suite di test per NotificationDispatcher"""
+
+    def test_invio_tramite_worker(self):
+        """Le notifiche accodate vengono inviate dai worker e contate"""
+        transport = FakeTransport()
+        dispatcher = NotificationDispatcher(transport, max_queue_size=10, workers=2)
+
+        for i in range(5):
+            assert dispatcher.enqueue(notifica(f"token_{i}")) is True
+        dispatcher.enqueue(notifica("token_rifiutato"))
+        dispatcher.join()
+        dispatcher.stop()
+
+        assert sorted(transport.ricevute)[:5] == [f"token_{i}" for i in range(5)]
+        metriche = dispatcher.metrics()
+        assert metriche["sent"] == 5
+        assert metriche["failed"] == 1
+        assert metriche["queue_depth"] == 0
+        assert metriche["send_latency"]["count"] == metriche["batches"]
+
+    def test_overflow_drop_newest(self):
+        """Con coda piena e politica drop_newest la nuova notifica viene rifiutata"""
+        transport = FakeTransport(bloccato=True)
+        dispatcher = NotificationDispatcher(transport, max_queue_size=1, workers=1,
+                                            overflow_policy="drop_newest", batch_window=0)
+        dispatcher.enqueue(notifica("in_invio"))
+        # Attende che il worker prelevi la prima notifica (bloccata nel trasporto)
+        while dispatcher.metrics()["queue_depth"] != 0:
+            pass
+        assert dispatcher.enqueue(notifica("in_coda")) is True
+        assert dispatcher.enqueue(notifica("scartata")) is False
+
+        transport.sblocco.set()
+        dispatcher.join()
+        dispatcher.stop()
+        assert "scartata" not in transport.ricevute
+        assert dispatcher.metrics()["dropped"] == 1
+
+    def test_overflow_drop_oldest(self):
+        """Con politica drop_oldest la notifica più vecchia in coda lascia il posto alla nuova"""
+        transport = FakeTransport(bloccato=True)
+        dispatcher = NotificationDispatcher(transport, max_queue_size=1, workers=1,
+                                            overflow_policy="drop_oldest", batch_window=0)
+        dispatcher.enqueue(notifica("in_invio"))
+        while dispatcher.metrics()["queue_depth"] != 0:
+            pass
+        dispatcher.enqueue(notifica("vecchia"))
+        assert dispatcher.enqueue(notifica("nuova")) is True
+
+        transport.sblocco.set()
+        dispatcher.join()
+        dispatcher.stop()
+        assert "vecchia" not in transport.ricevute
+        assert "nuova" in transport.ricevute
+
+    def test_invio_a_lotti(self):
+        """Le notifiche arrivate nella stessa finestra vengono inviate in un unico lotto"""
+        lotti = []
+
+        class BatchTransport(FakeTransport):
+            def send_batch(self, notifiche):
+                lotti.append([n.token for n in notifiche])
+                return [None] * len(notifiche)
+
+        dispatcher = NotificationDispatcher(BatchTransport(), max_queue_size=100, workers=1,
+                                            batch_window=0.5)
+        for i in range(20):
+            dispatcher.enqueue(notifica(f"token_{i}"))
+        dispatcher.join()
+        dispatcher.stop()
+
+        assert sum(len(lotto) for lotto in lotti) == 20
+        assert len(lotti) < 20
+        assert dispatcher.metrics()["sent"] == 20
+
+    def test_politica_non_valida(self):
+        """Una politica di overflow sconosciuta solleva ValueError"""
+        with pytest.raises(ValueError):
+            NotificationDispatcher(FakeTransport(), overflow_policy="ignora")
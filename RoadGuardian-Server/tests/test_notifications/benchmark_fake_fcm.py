@@ -0,0 +1,131 @@
+"""
+Benchmark offline del percorso di notifica: MappaService -> NotificationDispatcher ->
+NotifyFCMAdapter -> FakeFCMTransport (nessuna chiamata a Firebase, nessun MongoDB).
+
+Esempio:
+    python tests/test_notifications/benchmark_fake_fcm.py --utenti 5000 --latenza-ms 80 \
+        --distribuzione lognormal --error-rate 0.01 --unregistered-rate 0.02 --max-rps 2000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+from unittest.mock import MagicMock, patch
+
+# Configurazione path
+current_dir = os.path.dirname(__file__)
+parent_dir = os.path.abspath(os.path.join(current_dir, '..', '..'))
+app_dir = os.path.join(parent_dir, 'app')
+sys.path.insert(0, parent_dir)
+sys.path.insert(0, app_dir)
+
+# Il benchmark misura il fanout per dispositivo: il broadcast sui topic geohash resta disattivato
+os.environ.setdefault("NOTIFICHE_TOPIC_GEOHASH", "0")
+
+# Import senza prefisso `app.`, come nell'applicazione: `app.services.geohash_index` sarebbe
+# un'istanza di modulo diversa e l'indice caricato qui non sarebbe quello letto da MappaService
+from services.mappa_service import MappaService
+from services.geohash_index import indice_segnalazioni
+from schemas.mappa_schema import UserPositionUpdate
+from notifications.notify_fcm_adapter import NotifyFCMAdapter
+from notifications.notification_dispatcher import NotificationDispatcher
+from notifications.fake_fcm_transport import FakeFCMTransport
+
+# Centro di Roma: segnalazioni e utenti vengono generati entro ~5 km
+CENTRO_LAT, CENTRO_LON = 41.9028, 12.4964
+
+
+def genera_segnalazioni(n: int, rng: random.Random) -> list:
+    return [
+        {
+            "_id": f"bench_{i}",
+            "category": rng.choice(["incidente", "lavori", "traffico"]),
+            "seriousness": rng.choice(["low", "medium", "high"]),
+            "incident_latitude": CENTRO_LAT + rng.uniform(-0.04, 0.04),
+            "incident_longitude": CENTRO_LON + rng.uniform(-0.05, 0.05),
+            "status": True,
+        }
+        for i in range(n)
+    ]
+
+
+def esegui(args) -> dict:
+    rng = random.Random(args.seed)
+    segnalazioni = genera_segnalazioni(args.segnalazioni, rng)
+
+    transport = FakeFCMTransport(
+        latenza_ms=args.latenza_ms,
+        distribuzione=args.distribuzione,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        unregistered_rate=args.unregistered_rate,
+        max_messaggi_al_secondo=args.max_rps,
+        seed=args.seed,
+    )
+    adapter = NotifyFCMAdapter(transport=transport)
+    dispatcher = NotificationDispatcher(adapter, max_queue_size=args.coda, workers=args.workers,
+                                        overflow_policy="block", block_timeout=5.0)
+    service = MappaService(MagicMock(), notification_dispatcher=dispatcher)
+    service.segnalazione_facade = MagicMock()
+    # Se l'indice venisse ricaricato dal facade il benchmark fallirebbe: deve leggere quello caricato qui
+    service.segnalazione_facade.get_segnalazioni_attive_per_mappa.side_effect = AssertionError(
+        "l'indice delle segnalazioni non è stato caricato")
+    indice_segnalazioni.carica(segnalazioni)
+
+    aggiornamenti = [
+        UserPositionUpdate(
+            latitudine=CENTRO_LAT + rng.uniform(-0.05, 0.05),
+            longitudine=CENTRO_LON + rng.uniform(-0.06, 0.06),
+            fcm_token=f"bench_token_{i}",
+        )
+        for i in range(args.utenti)
+    ]
+
+    # Il registro dispositivi scriverebbe su MongoDB: nel benchmark viene escluso
+    with patch('services.mappa_service.registro_dispositivi'), \
+            contextlib.redirect_stdout(io.StringIO()):
+        inizio = time.perf_counter()
+        for aggiornamento in aggiornamenti:
+            service.process_user_position(aggiornamento)
+        fine_accodamento = time.perf_counter()
+        dispatcher.join()
+        fine = time.perf_counter()
+        dispatcher.stop()
+
+    metriche = dispatcher.metrics()
+    return {
+        "utenti": args.utenti,
+        "segnalazioni": args.segnalazioni,
+        "notifiche_accodate": metriche["enqueued"],
+        "tempo_accodamento_s": round(fine_accodamento - inizio, 3),
+        "tempo_totale_s": round(fine - inizio, 3),
+        "notifiche_al_secondo": round(metriche["enqueued"] / (fine - inizio), 1) if fine > inizio else None,
+        "dispatcher": {k: metriche[k] for k in ("sent", "failed", "dropped", "batches", "send_latency", "queue_wait")},
+        "fcm_simulato": transport.statistiche(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline delle notifiche di prossimità")
+    parser.add_argument("--utenti", type=int, default=2000)
+    parser.add_argument("--segnalazioni", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--coda", type=int, default=1000)
+    parser.add_argument("--latenza-ms", type=float, default=50.0)
+    parser.add_argument("--distribuzione", default="lognormal",
+                        choices=["fixed", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--unregistered-rate", type=float, default=0.0)
+    parser.add_argument("--max-rps", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=42)
+    print(json.dumps(esegui(parser.parse_args()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
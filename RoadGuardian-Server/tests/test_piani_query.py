@@ -0,0 +1,126 @@
+"""
+Test Suite per il harness di regressione dei piani di query (monitoring/piani_query.py)
+
+- Firma del piano, statistiche e violazioni a partire dall'output di explain
+- Ogni funzione dei repository che interroga una collection ha almeno un caso nel harness
+- Esecuzione completa sul motore in memoria con baseline e rilevamento dei cambi di piano
+- Esecuzione su MongoDB locale: nessun COLLSCAN né rapporto oltre soglia (saltato se MongoDB non è raggiungibile)
+"""
+
+import inspect
+import json
+import os
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+from app.monitoring import piani_query
+
+
+def _mongo_raggiungibile() -> bool:
+    try:
+        client = MongoClient(os.environ.get("MONGO_URI", "mongodb://localhost:27017/"), serverSelectionTimeoutMS=500)
+        try:
+            client.admin.command("ping")
+        finally:
+            client.close()
+        return True
+    except PyMongoError:
+        return False
+
+
+EXPLAIN_COLLSCAN = {
+    "queryPlanner": {"winningPlan": {"stage": "COLLSCAN", "direction": "forward"}},
+    "executionStats": {"nReturned": 2, "totalDocsExamined": 500, "totalKeysExamined": 0, "executionTimeMillis": 3},
+}
+EXPLAIN_OR = {
+    "queryPlanner": {"winningPlan": {"queryPlan": {"stage": "SUBPLAN", "inputStage": {"stage": "FETCH", "inputStage": {
+        "stage": "OR", "inputStages": [{"stage": "IXSCAN", "indexName": "status_1"},
+                                       {"stage": "IXSCAN", "indexName": "incident_date_1_status_1"}]}}}}},
+    "executionStats": {"nReturned": 10, "totalDocsExamined": 10, "totalKeysExamined": 12, "executionTimeMillis": 0},
+}
+
+
+class TestAnalisiPiani:
+    """Suite di test per firma_piano, analizza_explain, verifica e forma_query"""
+
+    def test_collscan_e_rapporto(self):
+        """Un COLLSCAN con molti documenti esaminati produce entrambe le violazioni"""
+        esito = piani_query.analizza_explain(EXPLAIN_COLLSCAN)
+
+        problemi = piani_query.verifica(esito, soglia_rapporto=10)
+
+        assert esito["piano"] == "COLLSCAN"
+        assert problemi[0] == "COLLSCAN"
+        assert "250.0" in problemi[1]
+        assert piani_query.verifica(esito, soglia_rapporto=1000, collscan_ammesso=True) == []
+
+    def test_piano_composto_e_baseline(self):
+        """Gli stadi con più input elencano i figli; un piano diverso dalla baseline è una violazione"""
+        esito = piani_query.analizza_explain(EXPLAIN_OR)
+
+        assert esito["piano"] == "SUBPLAN > FETCH > OR[IXSCAN(status_1), IXSCAN(incident_date_1_status_1)]"
+        assert piani_query.verifica(esito, 10, piano_baseline=esito["piano"]) == []
+        assert piani_query.verifica(esito, 10, piano_baseline="FETCH > IXSCAN(status_1)")[0].startswith("piano cambiato")
+
+    def test_forma_query(self):
+        """I valori diventano tipi, gli operatori restano"""
+        forma = piani_query.forma_query({"status": True, "day_of_week": {"$in": [1, 2, 3]},
+                                         "$or": [{"minute_of_day": {"$gte": 1380}}, {"minute_of_day": {"$lte": 60}}]})
+
+        assert forma == {"status": "bool", "day_of_week": {"$in": ["int"]},
+                         "$or": [{"minute_of_day": {"$gte": "int"}}, {"minute_of_day": {"$lte": "int"}}]}
+
+
+class TestHarnessPianiQuery:
+    """Suite di test per piani_query.esegui"""
+
+    def test_casi_per_ogni_funzione(self):
+        """Ogni funzione pubblica dei repository che esegue query ha almeno un caso"""
+        funzioni = {nome for modulo in (piani_query.segnalazioni_repo, piani_query.utenti_repo)
+                    for nome, oggetto in inspect.getmembers(modulo, inspect.isfunction)
+                    if oggetto.__module__ == modulo.__name__ and not nome.startswith("_")}
+        dataset = piani_query.genera_dataset(20, 5)
+        coperte = {nome.split("[")[0] for nome, _, _ in piani_query.casi_repository(dataset)}
+
+        assert funzioni - piani_query.FUNZIONI_SENZA_QUERY - coperte == set()
+
+    def test_memoria_con_baseline(self, monkeypatch, tmp_path):
+        """Sul motore in memoria il report copre tutte le query e un piano diverso dalla baseline fa fallire"""
+        monkeypatch.setenv("STORAGE_BACKEND", "memory")
+        monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+        baseline = str(tmp_path / "baseline.json")
+
+        report = piani_query.esegui(segnalazioni=300, utenti=20, baseline=baseline, aggiorna_baseline=True)
+
+        assert report["esito"] == "ok"
+        piani = {voce["query"]: voce["piano"] for voce in report["query"]}
+        assert piani["get_segnalazione_by_time#0"] == "IXSCAN status_1_minute_of_day_1"
+        assert piani["get_user_by_email#0"] == "IXSCAN email_1"
+
+        with open(baseline, encoding="utf-8") as f:
+            contenuto = json.load(f)
+        contenuto["memory"]["get_segnalazione_by_time#0"] = "IXSCAN status_1"
+        with open(baseline, "w", encoding="utf-8") as f:
+            json.dump(contenuto, f)
+
+        report = piani_query.esegui(segnalazioni=300, utenti=20, baseline=baseline)
+
+        assert report["esito"] == "fallito"
+        assert report["violazioni"] == ["get_segnalazione_by_time#0: piano cambiato: IXSCAN status_1 -> "
+                                        "IXSCAN status_1_minute_of_day_1"]
+
+    def test_database_applicativo_rifiutato(self, monkeypatch):
+        """Il harness non svuota il database dell'applicazione"""
+        monkeypatch.setenv("STORAGE_BACKEND", "memory")
+
+        with pytest.raises(ValueError):
+            piani_query.esegui(database=piani_query.connection.DB_NAME)
+
+    @pytest.mark.skipif(not _mongo_raggiungibile(), reason="MongoDB locale non raggiungibile")
+    def test_mongodb_senza_regressioni(self, monkeypatch):
+        """Su MongoDB tutte le query usano un indice con un rapporto esaminati/restituiti entro la soglia"""
+        monkeypatch.setenv("STORAGE_BACKEND", "mongo")
+
+        report = piani_query.esegui(segnalazioni=5000, utenti=500)
+
+        assert report["violazioni"] == []
@@ -0,0 +1,108 @@
+"""
+Test Suite per la ricerca di segnalazioni per posizione con tolleranza in metri
+
+- to_mongo valorizza il punto GeoJSON `location`
+- Ricerca della segnalazione attiva più vicina entro la tolleranza (sync e async)
+- Con SEGNALAZIONI_DEDUP_METRI la creazione restituisce la segnalazione già presente;
+  la segnalazione veloce non applica il controllo
+"""
+
+import asyncio
+import datetime
+import pytest
+from app.db import connection
+from app.db import segnalazione_repository as repo
+from app.db import async_segnalazione_repository as async_repo
+from app.models.incident_model import IncidentModel
+from app.schemas.segnalazione_schema import SegnalazioneInput
+from app.services.segnalazione_service import SegnalazioneService
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+    connection.chiudi_client()
+    repo.ensure_indexes()
+    yield connection.get_database()
+    connection.chiudi_client()
+
+
+def _crea(longitudine: float, latitudine: float, **campi) -> dict:
+    dati = {"user_id": "user_1", "incident_date": datetime.date(2025, 3, 1), "incident_time": datetime.time(9, 0),
+            "incident_longitude": longitudine, "incident_latitude": latitudine, "seriousness": "high",
+            "category": "tamponamento"}
+    dati.update(campi)
+    return repo.create_segnalazione(IncidentModel(**dati))
+
+
+# 0.0001 gradi di latitudine corrispondono a circa 11 metri
+LON, LAT = 12.4964, 41.9028
+
+
+class TestPosizioneConTolleranza:
+    """Suite di test per get_segnalazione_by_position e get_segnalazione_list_by_position"""
+
+    def test_location_in_to_mongo(self):
+        """Il documento salvato contiene il punto GeoJSON con longitudine e latitudine"""
+        modello = IncidentModel(user_id="u", incident_date=datetime.date(2025, 3, 1), incident_time=datetime.time(9, 0),
+                                incident_longitude=LON, incident_latitude=LAT, seriousness="high", category="x")
+
+        assert modello.to_mongo()["location"] == {"type": "Point", "coordinates": [LON, LAT]}
+
+    def test_entro_tolleranza(self, memoria):
+        """Una posizione GPS poco diversa trova la segnalazione; oltre la tolleranza no"""
+        creata = _crea(LON, LAT)
+
+        trovata = repo.get_segnalazione_by_position(LON, LAT + 0.0001, tolleranza_metri=30)
+
+        assert trovata["_id"] == creata["_id"]
+        assert repo.get_segnalazione_by_position(LON, LAT + 0.001, tolleranza_metri=30) is None
+
+    def test_lista_dalla_piu_vicina_e_solo_attive(self, memoria):
+        """La lista è ordinata per distanza ed esclude le segnalazioni disattivate"""
+        lontana = _crea(LON, LAT + 0.0003)
+        vicina = _crea(LON, LAT + 0.0001)
+        cancellata = _crea(LON, LAT)
+        repo.delete_segnalazione(cancellata["id"])
+
+        risultato = asyncio.run(async_repo.get_segnalazione_list_by_position(LON, LAT, tolleranza_metri=50))
+
+        assert [d["_id"] for d in risultato] == [vicina["_id"], lontana["_id"]]
+
+
+class TestSegnalazioniDuplicate:
+    """Suite di test per il controllo dei duplicati in creazione"""
+
+    def test_duplicato_restituisce_esistente(self, memoria, monkeypatch):
+        """Una seconda segnalazione della stessa categoria nello stesso punto non crea un nuovo documento"""
+        monkeypatch.setenv("SEGNALAZIONI_DEDUP_METRI", "30")
+        monkeypatch.setenv("NOTIFICHE_TOPIC_GEOHASH", "0")
+        service = SegnalazioneService(None)
+        prima = service.create_report("user_1", SegnalazioneInput(incident_longitude=LON, incident_latitude=LAT,
+                                                                  category="tamponamento"))
+
+        seconda = service.create_report("user_2", SegnalazioneInput(incident_longitude=LON,
+                                                                    incident_latitude=LAT + 0.0001,
+                                                                    category="tamponamento"))
+        altra_categoria = asyncio.run(service.create_report_async("user_2", SegnalazioneInput(
+            incident_longitude=LON, incident_latitude=LAT - 0.0002, category="incendio veicolo")))
+
+        assert seconda.id == prima.id
+        assert altra_categoria.id != prima.id
+        assert service.get_segnalazione_attiva_vicina(LON, LAT).id == prima.id
+
+    def test_segnalazione_veloce_senza_dedup(self, memoria, monkeypatch):
+        """Senza buffer la segnalazione veloce viene scritta subito, anche se ne esiste una vicina"""
+        monkeypatch.setenv("SEGNALAZIONI_DEDUP_METRI", "30")
+        monkeypatch.setenv("SEGNALAZIONI_BUFFER", "0")
+        monkeypatch.setenv("NOTIFICHE_TOPIC_GEOHASH", "0")
+        service = SegnalazioneService(None)
+        prima = service.create_report("user_1", SegnalazioneInput(incident_longitude=LON, incident_latitude=LAT,
+                                                                  category="tamponamento"))
+
+        veloce = asyncio.run(service.create_fast_report_async("user_2", SegnalazioneInput(
+            incident_longitude=LON, incident_latitude=LAT, category="tamponamento")))
+
+        assert veloce.id != prima.id
+        assert len(repo.get_segnalazione_list_by_position(LON, LAT)) == 2
@@ -0,0 +1,127 @@
+"""
+Test Suite per NotificationRateLimiter
+
+- Limiti per dispositivo, per segnalazione e globali (token bucket)
+- Differimento e rilascio delle notifiche oltre il limite
+- Accorpamento delle notifiche differite per dispositivo e segnalazione
+"""
+
+import pytest
+from app.notifications.rate_limiter import NotificationRateLimiter, TokenBucket
+from app.notifications.notification_dispatcher import NotificationDispatcher
+from app.schemas.notifica_schema import NotificaPush
+from tests.test_notification_dispatcher import FakeTransport
+
+
+class Orologio:
+    """Orologio manuale per rendere deterministici i token bucket."""
+
+    def __init__(self):
+        self.adesso = 0.0
+
+    def __call__(self):
+        return self.adesso
+
+
+def notifica(token: str, incident_id: str = "inc_1", body: str = "Corpo") -> NotificaPush:
+    return NotificaPush(token=token, title="Titolo", body=body, data={"incident_id": incident_id})
+
+
+class TestRateLimiter:
+    """Suite di test per il rate limiting delle notifiche"""
+
+    def test_token_bucket(self):
+        """Il bucket concede `capacity` gettoni e si ricarica al ritmo `rate`"""
+        bucket = TokenBucket(rate=2, capacity=2, adesso=0)
+        bucket.consuma(0)
+        bucket.consuma(0)
+        assert not bucket.disponibile(0)
+        assert bucket.attesa(0) == pytest.approx(0.5)
+        assert bucket.disponibile(0.5)
+
+    def test_limite_per_dispositivo_differisce(self):
+        """Oltre il burst del dispositivo le notifiche vengono differite, non scartate"""
+        orologio = Orologio()
+        limiter = NotificationRateLimiter(device_rate=1, device_burst=2, orologio=orologio)
+
+        inviate = limiter.filtra([notifica("tok", f"inc_{i}") for i in range(3)])
+
+        assert len(inviate) == 2
+        assert limiter.in_attesa() == 1
+        assert limiter.filtra([]) == []
+
+        orologio.adesso = 1.0
+        rilasciate = limiter.filtra([])
+        assert [n.data["incident_id"] for n in rilasciate] == ["inc_2"]
+        assert limiter.in_attesa() == 0
+
+    def test_accorpamento(self):
+        """Notifiche differite per lo stesso dispositivo e segnalazione vengono accorpate nella più recente"""
+        orologio = Orologio()
+        limiter = NotificationRateLimiter(device_rate=1, device_burst=1, orologio=orologio)
+
+        limiter.filtra([notifica("tok", body="prima")])
+        limiter.filtra([notifica("tok", body="seconda"), notifica("tok", body="terza")])
+        assert limiter.in_attesa() == 1
+
+        orologio.adesso = 1.0
+        rilasciate = limiter.filtra([])
+        assert [n.body for n in rilasciate] == ["terza"]
+        assert limiter.metrics()["coalesced"] == 1
+
+    def test_limite_per_segnalazione_e_globale(self):
+        """I bucket per segnalazione e globale limitano indipendentemente dal dispositivo"""
+        limiter = NotificationRateLimiter(incident_rate=1, incident_burst=2, orologio=Orologio())
+        inviate = limiter.filtra([notifica(f"tok_{i}", "inc_1") for i in range(5)])
+        assert len(inviate) == 2
+
+        limiter = NotificationRateLimiter(global_rate=1, global_burst=3, orologio=Orologio())
+        inviate = limiter.filtra([notifica(f"tok_{i}", f"inc_{i}") for i in range(5)])
+        assert len(inviate) == 3
+        assert limiter.metrics()["deferred"] == 2
+
+    def test_digest_differiti_non_accorpati(self):
+        """Due riepiloghi differiti per lo stesso dispositivo vengono rilasciati entrambi, con le loro segnalazioni"""
+        orologio = Orologio()
+        limiter = NotificationRateLimiter(device_rate=1, device_burst=1, orologio=orologio)
+
+        def riepilogo(digest_id: str, ids: str) -> NotificaPush:
+            return NotificaPush(token="tok", title="Titolo", body="Corpo",
+                                data={"tipo": "digest", "digest_id": digest_id, "incident_ids": ids})
+
+        limiter.filtra([notifica("tok")])
+        limiter.filtra([riepilogo("d1", "a,b"), riepilogo("d2", "c,d")])
+        assert limiter.in_attesa() == 2
+
+        rilasciate = []
+        for secondi in (1.0, 2.0):
+            orologio.adesso = secondi
+            rilasciate += limiter.filtra([])
+        assert [n.data["incident_ids"] for n in rilasciate] == ["a,b", "c,d"]
+        assert limiter.metrics()["coalesced"] == 0
+
+    def test_capacita_differite(self):
+        """Oltre `max_differite` viene scartata la notifica differita più vecchia"""
+        limiter = NotificationRateLimiter(global_rate=1, global_burst=1, max_differite=2, orologio=Orologio())
+        limiter.filtra([notifica(f"tok_{i}", f"inc_{i}") for i in range(4)])
+        assert limiter.in_attesa() == 2
+        assert limiter.metrics()["dropped"] == 1
+
+    def test_dispatcher_rilascia_differite(self):
+        """Il dispatcher invia le differite quando i bucket si ricaricano, anche a coda vuota"""
+        transport = FakeTransport()
+        limiter = NotificationRateLimiter(device_rate=20, device_burst=1)
+        dispatcher = NotificationDispatcher(transport, workers=1, batch_window=0, rate_limiter=limiter)
+
+        for i in range(3):
+            dispatcher.enqueue(notifica("tok", f"inc_{i}"))
+        dispatcher.join()
+        dispatcher.stop()
+
+        assert len(transport.ricevute) == 3
+        assert dispatcher.metrics()["rate_limit"]["pending"] == 0
+
+    def test_parametri_non_validi(self):
+        """Rate o burst non positivi sollevano ValueError"""
+        with pytest.raises(ValueError):
+            NotificationRateLimiter(device_rate=0)
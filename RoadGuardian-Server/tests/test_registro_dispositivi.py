@@ -0,0 +1,137 @@
+"""
+Test Suite per RegistroDispositivi
+
+- Scritture su DB limitate a una ogni `touch_interval` per token
+- Rimozione in blocco dei token non validi (cache e DB)
+- Segnalazione dei token rifiutati da FCM tramite `on_invalid_tokens`
+- Un INVALID_ARGUMENT dovuto al payload non rimuove i dispositivi del lotto
+- L'aggiornamento di posizione collega il dispositivo solo all'utente del token di sessione
+"""
+
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from firebase_admin import exceptions, messaging
+# Stesso modulo usato dalle route (import senza prefisso `app.`)
+from services.token_sessione import get_gestore_token
+from app.api import mappa_api
+from app.services.registro_dispositivi import RegistroDispositivi
+from app.notifications.notify_fcm_adapter import NotifyFCMAdapter
+from app.schemas.notifica_schema import NotificaPush
+
+
+class TestRegistroDispositivi:
+    """Suite di test per RegistroDispositivi"""
+
+    @pytest.fixture
+    def repo(self):
+        with patch('app.services.registro_dispositivi.dispositivo_repo') as mock_repo:
+            mock_repo.delete_tokens.side_effect = lambda tokens: len(tokens)
+            yield mock_repo
+
+    def test_scrittura_limitata(self, repo):
+        """Aggiornamenti ravvicinati dello stesso token producono una sola scrittura"""
+        registro = RegistroDispositivi(touch_interval=300)
+
+        assert registro.registra("tok_1", "user_1") is True
+        assert registro.registra("tok_1", "user_1") is False
+        assert registro.registra("tok_1", "user_1") is False
+
+        assert repo.upsert_dispositivi.call_count == 1
+        repo.ensure_indexes.assert_called_once()
+        assert "tok_1" in registro
+
+    def test_cambio_utente_forza_scrittura(self, repo):
+        """Se il token viene collegato a un altro utente la scrittura non viene rimandata"""
+        registro = RegistroDispositivi(touch_interval=300)
+        registro.registra("tok_1", "user_1")
+
+        assert registro.registra("tok_1", "user_2") is True
+        assert repo.upsert_dispositivi.call_args.args[0][0][1] == "user_2"
+
+    def test_rimozione_token_invalidi(self, repo):
+        """I token non validi vengono eliminati con un'unica operazione e rimossi dalla cache"""
+        registro = RegistroDispositivi()
+        registro.registra("tok_1")
+        registro.registra("tok_2")
+
+        eliminati = registro.rimuovi_token_invalidi(["tok_1", "tok_2", "tok_1"])
+
+        assert eliminati == 2
+        repo.delete_tokens.assert_called_once()
+        assert sorted(repo.delete_tokens.call_args.args[0]) == ["tok_1", "tok_2"]
+        assert "tok_1" not in registro
+
+    def test_errore_db_non_propagato(self, repo):
+        """Un errore del DB durante la rimozione viene loggato e non interrompe l'invio"""
+        repo.delete_tokens.side_effect = Exception("DB non raggiungibile")
+        registro = RegistroDispositivi()
+
+        assert registro.rimuovi_token_invalidi(["tok_1"]) == 0
+
+    @patch('app.notifications.notify_fcm_adapter.messaging.send_each')
+    def test_adapter_segnala_token_invalidi(self, mock_send_each):
+        """L'adapter FCM inoltra al registro solo i token non registrati o non validi"""
+        responses = []
+        for successo, eccezione in [(True, None),
+                                    (False, messaging.UnregisteredError("non registrato")),
+                                    (False, messaging.QuotaExceededError("quota"))]:
+            resp = MagicMock()
+            resp.success = successo
+            resp.exception = eccezione
+            responses.append(resp)
+        mock_send_each.return_value = MagicMock(responses=responses)
+        callback = MagicMock()
+
+        with patch('app.notifications.notify_fcm_adapter.firebase_admin') as mock_firebase:
+            mock_firebase._apps = {"[DEFAULT]": object()}
+            adapter = NotifyFCMAdapter(on_invalid_tokens=callback)
+            adapter.send_batch([NotificaPush(token=f"t{i}", title="T", body="B") for i in range(3)])
+
+        callback.assert_called_once_with(["t1"])
+
+    @patch('app.notifications.notify_fcm_adapter.messaging.send_each')
+    def test_argomento_non_valido_solo_se_token(self, mock_send_each, repo):
+        """INVALID_ARGUMENT rimuove il dispositivo solo se riferito al token, non al payload"""
+        errori = [exceptions.InvalidArgumentError("Message payload size limit exceeded"),
+                  exceptions.InvalidArgumentError("The registration token is not a valid FCM registration token")]
+        responses = []
+        for eccezione in errori:
+            resp = MagicMock()
+            resp.success = False
+            resp.exception = eccezione
+            responses.append(resp)
+        mock_send_each.return_value = MagicMock(responses=responses)
+        registro = RegistroDispositivi()
+        registro.registra("t0")
+        registro.registra("t1")
+
+        with patch('app.notifications.notify_fcm_adapter.firebase_admin') as mock_firebase:
+            mock_firebase._apps = {"[DEFAULT]": object()}
+            adapter = NotifyFCMAdapter(on_invalid_tokens=registro.rimuovi_token_invalidi)
+            esiti = adapter.send_batch([NotificaPush(token=f"t{i}", title="T", body="B") for i in range(2)])
+
+        assert esiti == ["INVALID_ARGUMENT", "INVALID_REGISTRATION_TOKEN"]
+        repo.delete_tokens.assert_called_once_with(["t1"])
+        assert "t0" in registro
+        assert "t1" not in registro
+
+
+class TestPosizioneAutenticata:
+    """Suite di test per l'utente collegato al dispositivo da POST /mappa/posizione"""
+
+    def test_utente_dalla_sessione(self):
+        """Lo user_id nel body viene ignorato: conta solo il token di sessione"""
+        service = MagicMock()
+        app = FastAPI()
+        app.include_router(mappa_api.router)
+        app.dependency_overrides[mappa_api.get_mappa_service] = lambda: service
+        client = TestClient(app)
+        corpo = {"latitudine": 41.9, "longitudine": 12.5, "fcm_token": "tok_1", "user_id": "vittima"}
+        token = get_gestore_token().emetti("user_1")["access_token"]
+
+        client.post("/mappa/posizione", json=corpo)
+        client.post("/mappa/posizione", json=corpo, headers={"Authorization": f"Bearer {token}"})
+
+        assert [c.args[1] for c in service.process_user_position.call_args_list] == [None, "user_1"]
@@ -0,0 +1,162 @@
+"""
+Test Suite per i token di sessione firmati
+
+- Emissione e verifica in memoria; firma alterata, scadenza e tipo errato vengono rifiutati
+- Il refresh token vale una sola volta (rotazione condivisa tra i worker tramite MongoDB)
+- Revoca di un token e di tutti i token di un utente; a lista di revoca piena vengono revocati tutti i token
+- Il refresh di un account eliminato viene rifiutato anche da un worker che non ne ha la revoca in memoria
+- Senza SESSIONE_SEGRETO il gestore non viene creato (niente chiavi casuali per processo)
+- Login, accesso alle route con user_id, refresh e logout via API
+- Eliminazione dell'account con il solo token di sessione
+"""
+
+import time
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.db import connection
+from app.services.token_sessione import (TIPO_REFRESH, GestoreToken, TokenNonValido, get_gestore_token,
+                                         shutdown_gestore_token)
+from app.api import profilo_utente_api, segnalazione_api
+
+
+@pytest.fixture
+def gestore():
+    return GestoreToken(segreto=b"segreto-di-test", durata_access=60, durata_refresh=600, max_revocati=3)
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+    connection.chiudi_client()
+    yield connection.get_database()
+    connection.chiudi_client()
+
+
+class TestGestoreToken:
+    """Suite di test per GestoreToken"""
+
+    def test_emissione_e_verifica(self, gestore):
+        """L'access token identifica utente e ruolo; firma, scadenza e tipo vengono controllati"""
+        token = gestore.emetti("user_1", "admin")
+
+        sessione = gestore.verifica(token["access_token"])
+        assert (sessione["sub"], sessione["role"]) == ("user_1", "admin")
+        assert gestore.verifica(token["refresh_token"], TIPO_REFRESH)["sub"] == "user_1"
+
+        corpo, firma = token["access_token"].split(".")
+        altro = GestoreToken(segreto=b"altro-segreto").emetti("user_2")["access_token"]
+        for non_valido in [corpo + "." + firma[::-1], altro.split(".")[0] + "." + firma, "malformato",
+                           token["refresh_token"]]:
+            with pytest.raises(TokenNonValido):
+                gestore.verifica(non_valido)
+
+        scaduto = GestoreToken(segreto=b"segreto-di-test", durata_access=-1).emetti("user_1")["access_token"]
+        with pytest.raises(TokenNonValido, match="scaduto"):
+            gestore.verifica(scaduto)
+        assert gestore.metrics()["rejected"] == 5
+
+    def test_revoca_token_e_utente(self, gestore):
+        """La revoca dell'utente invalida i token già emessi ma non quelli successivi"""
+        token = gestore.emetti("user_1")
+        gestore.revoca(token["access_token"])
+        with pytest.raises(TokenNonValido):
+            gestore.verifica(token["access_token"])
+
+        precedente = gestore.emetti("user_2")
+        gestore.revoca_utente("user_2")
+        time.sleep(0.001)
+        successivo = gestore.emetti("user_2")
+
+        with pytest.raises(TokenNonValido):
+            gestore.verifica(precedente["refresh_token"], TIPO_REFRESH)
+        assert gestore.verifica(successivo["access_token"])["sub"] == "user_2"
+
+    def test_lista_revoca_piena(self, gestore):
+        """A lista piena nessuna revoca viene persa: tutti i token emessi fino a quel momento sono revocati"""
+        non_revocato = gestore.emetti("user_2")["access_token"]
+        revocati = [gestore.emetti("user_1")["access_token"] for _ in range(5)]
+        for token in revocati:
+            gestore.revoca(token)
+        time.sleep(0.001)
+        successivo = gestore.emetti("user_1")["access_token"]
+
+        for token in revocati + [non_revocato]:
+            with pytest.raises(TokenNonValido, match="revocato"):
+                gestore.verifica(token)
+        assert gestore.verifica(successivo)["sub"] == "user_1"
+        assert gestore.metrics()["revoked_tokens"] <= gestore.max_revocati
+        assert gestore.metrics()["revoke_all"] == 1
+
+    def test_segreto_obbligatorio(self, monkeypatch):
+        """Senza SESSIONE_SEGRETO il gestore condiviso non viene creato"""
+        monkeypatch.delenv("SESSIONE_SEGRETO", raising=False)
+        shutdown_gestore_token()
+        try:
+            with pytest.raises(RuntimeError, match="SESSIONE_SEGRETO"):
+                get_gestore_token()
+        finally:
+            shutdown_gestore_token()
+
+
+class TestSessioneApi:
+    """Suite di test per le route di sessione e il controllo del chiamante"""
+
+    def test_login_accesso_refresh_logout(self, memoria):
+        """Il token del login identifica il chiamante senza credenziali; dopo il logout non vale più"""
+        app = FastAPI()
+        app.include_router(profilo_utente_api.router)
+        app.include_router(segnalazione_api.router)
+        client = TestClient(app)
+        creato = client.post("/profilo/", json={"email": "mario@example.com", "first_name": "Mario",
+                                                "last_name": "Rossi", "password": "Segreta1!",
+                                                "num_tel": "3331234567"})
+        assert creato.status_code == 201
+
+        login = client.post("/profilo/login", json={"email": "mario@example.com", "password": "Segreta1!"})
+
+        assert login.status_code == 200
+        sessione = login.json()
+        user_id = sessione["_id"]
+        intestazioni = {"Authorization": f"Bearer {sessione['access_token']}"}
+        assert client.get(f"/segnalazione/utente/{user_id}", headers=intestazioni).status_code == 200
+        assert client.get("/segnalazione/utente/altro_utente", headers=intestazioni).status_code == 403
+        assert client.get(f"/segnalazione/utente/{user_id}",
+                          headers={"Authorization": "Bearer non-valido"}).status_code == 401
+
+        rinnovo = client.post("/profilo/token/refresh", json={"refresh_token": sessione["refresh_token"]})
+        assert rinnovo.status_code == 200
+        shutdown_gestore_token()  # un altro worker: nessuna revoca in memoria
+        assert client.post("/profilo/token/refresh",
+                           json={"refresh_token": sessione["refresh_token"]}).status_code == 401
+
+        intestazioni = {"Authorization": f"Bearer {rinnovo.json()['access_token']}"}
+        assert client.post("/profilo/logout", headers=intestazioni,
+                           json={"refresh_token": rinnovo.json()["refresh_token"]}).status_code == 200
+        assert client.get(f"/segnalazione/utente/{user_id}", headers=intestazioni).status_code == 401
+        shutdown_gestore_token()
+        assert client.post("/profilo/token/refresh",
+                           json={"refresh_token": rinnovo.json()["refresh_token"]}).status_code == 401
+
+    def test_eliminazione_con_token(self, memoria):
+        """Con il token l'account del path viene eliminato senza credenziali nel body"""
+        app = FastAPI()
+        app.include_router(profilo_utente_api.router)
+        client = TestClient(app)
+        client.post("/profilo/", json={"email": "anna@example.com", "first_name": "Anna",
+                                       "last_name": "Bianchi", "password": "Segreta1!",
+                                       "num_tel": "3331234568"})
+        sessione = client.post("/profilo/login", json={"email": "anna@example.com",
+                                                       "password": "Segreta1!"}).json()
+        intestazioni = {"Authorization": f"Bearer {sessione['access_token']}"}
+
+        assert client.post("/profilo/delete/altro_utente", headers=intestazioni).status_code == 403
+        assert client.post(f"/profilo/delete/{sessione['_id']}").status_code == 422
+        eliminato = client.post(f"/profilo/delete/{sessione['_id']}", headers=intestazioni)
+
+        assert eliminato.status_code == 200
+        assert client.post(f"/profilo/delete/{sessione['_id']}", headers=intestazioni).status_code == 401
+        shutdown_gestore_token()  # un altro worker, che non ha ricevuto la revoca dell'utente
+        assert client.post("/profilo/token/refresh",
+                           json={"refresh_token": sessione["refresh_token"]}).status_code == 401
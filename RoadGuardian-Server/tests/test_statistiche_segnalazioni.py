@@ -0,0 +1,141 @@
+"""
+Test Suite per le statistiche materializzate delle segnalazioni (db/statistiche_repository.py)
+
+- Creazione e disattivazione aggiornano i contatori con $inc (sync, async e inserimento in blocco)
+- La riconciliazione con $merge ricalcola i contatori, include l'archivio e rimuove quelli obsoleti
+- Tutte le dimensioni sono ricalcolate con una sola scansione, da un solo processo (lease)
+- La route delle statistiche legge solo i contatori, con filtro per dimensione e giorni
+"""
+
+import asyncio
+import datetime
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.db import connection
+from app.db import segnalazione_repository as repo
+from app.db import async_segnalazione_repository as async_repo
+from app.db import statistiche_repository as statistiche_repo
+from app.models.incident_model import IncidentModel
+from app.api import segnalazione_api
+from app.services.riconciliatore_statistiche import RiconciliatoreStatistiche
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+    connection.chiudi_client()
+    yield connection.get_database()
+    connection.chiudi_client()
+
+
+def _modello(category: str = "tamponamento", giorno: int = 1, latitudine: float = 41.89) -> IncidentModel:
+    return IncidentModel(user_id="user_1", incident_date=datetime.date(2025, 3, giorno),
+                         incident_time=datetime.time(9, 0), incident_longitude=12.49,
+                         incident_latitude=latitudine, seriousness="high", category=category)
+
+
+def _contatori(dimensione: str) -> dict:
+    return {str(v["value"]): (v["total"], v["active"]) for v in statistiche_repo.get_statistiche(dimensione)}
+
+
+class TestIncrementi:
+    """Suite di test per gli aggiornamenti incrementali"""
+
+    def test_creazione_e_disattivazione(self, memoria):
+        """Ogni creazione incrementa totale e attive; la disattivazione decrementa le attive una sola volta"""
+        prima = repo.create_segnalazione(_modello())
+        repo.create_segnalazione(_modello(giorno=2))
+        asyncio.run(async_repo.create_segnalazione(_modello("incendio veicolo")))
+
+        assert repo.delete_segnalazione(prima["id"]) is True
+        assert asyncio.run(async_repo.delete_segnalazione(prima["id"])) is False
+
+        assert _contatori("category") == {"tamponamento": (2, 1), "incendio veicolo": (1, 1)}
+        assert _contatori("all") == {"None": (3, 2)}
+        assert _contatori("day") == {"2025-03-01": (2, 1), "2025-03-02": (1, 1)}
+        assert _contatori("region") == {str({"lat": 41.75, "lon": 12.25}): (3, 2)}
+
+    def test_inserimento_in_blocco(self, memoria):
+        """I duplicati non vengono contati e le segnalazioni già disattivate nel buffer non sono attive"""
+        documenti = [{**_modello().to_mongo(), "_id": ObjectId()} for _ in range(2)]
+        documenti[1]["status"] = False
+        repo.insert_segnalazioni([dict(documenti[0])])
+
+        assert repo.insert_segnalazioni([dict(d) for d in documenti]) == 1
+
+        assert _contatori("category") == {"tamponamento": (2, 1)}
+
+
+class TestRiconciliazione:
+    """Suite di test per statistiche_repository.riconcilia"""
+
+    def test_ricalcolo_e_pulizia(self, memoria):
+        """I contatori errati vengono corretti, quelli obsoleti rimossi e l'archivio incluso"""
+        repo.create_segnalazione(_modello())
+        cancellata = repo.create_segnalazione(_modello(latitudine=45.46))
+        repo.delete_segnalazione(cancellata["id"])
+        repo.archivia_segnalazioni(100, datetime.datetime(2024, 1, 1))
+        attese = {dimensione: _contatori(dimensione) for dimensione in statistiche_repo.DIMENSIONI}
+        memoria["segnalazioni_stats"].update_many({}, {"$inc": {"total": 5}})
+        memoria["segnalazioni_stats"].insert_one({"_id": {"dimension": "category", "value": "vecchia"},
+                                                  "dimension": "category", "value": "vecchia", "total": 1,
+                                                  "active": 1,
+                                                  "reconciled_at": datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)})
+
+        rimossi = statistiche_repo.riconcilia()
+
+        assert rimossi == 1
+        assert memoria["segnalazioni_archive"].count_documents({}) == 1
+        assert {dimensione: _contatori(dimensione) for dimensione in statistiche_repo.DIMENSIONI} == attese
+        assert _contatori("region") == {str({"lat": 41.75, "lon": 12.25}): (1, 1),
+                                        str({"lat": 45.25, "lon": 12.25}): (1, 0)}
+
+
+    def test_una_sola_scansione(self, memoria, monkeypatch):
+        """Una riconciliazione esegue una sola aggregazione per tutte le dimensioni"""
+        repo.create_segnalazione(_modello())
+        pipeline = []
+        aggregate = type(memoria["segnalazioni"]).aggregate
+        monkeypatch.setattr(type(memoria["segnalazioni"]), "aggregate",
+                            lambda self, p, **k: pipeline.append(p) or aggregate(self, p, **k))
+
+        statistiche_repo.riconcilia()
+
+        assert len(pipeline) == 1
+        assert {c["dimension"] for c in statistiche_repo.get_statistiche()} == set(statistiche_repo.DIMENSIONI)
+
+    def test_lease_un_solo_processo(self, memoria):
+        """Solo il titolare del lease riconcilia; al suo arresto subentra un altro processo"""
+        primo, secondo = RiconciliatoreStatistiche(intervallo=60), RiconciliatoreStatistiche(intervallo=60)
+
+        assert primo.esegui_se_titolare() is True
+        assert secondo.esegui_se_titolare() is False
+        assert primo.esegui_se_titolare() is True  # rinnovo
+        primo.stop()
+
+        assert secondo.esegui_se_titolare() is True
+        assert (primo.metrics()["runs"], secondo.metrics()["skipped"]) == (2, 1)
+
+
+class TestRouteStatistiche:
+    """Suite di test per GET /segnalazione/statistiche"""
+
+    def test_dimensione_e_intervallo(self, memoria):
+        """La route raggruppa per dimensione e limita i giorni all'intervallo richiesto"""
+        for giorno in (1, 2, 3):
+            repo.create_segnalazione(_modello(giorno=giorno))
+        app = FastAPI()
+        app.include_router(segnalazione_api.router)
+        client = TestClient(app)
+
+        giorni = client.get("/segnalazione/statistiche", params={"dimensione": "day", "dal": "2025-03-02"}).json()
+        tutte = client.get("/segnalazione/statistiche", params={"al": "2025-03-01"}).json()
+
+        assert giorni == {"day": [{"value": "2025-03-02", "total": 1, "active": 1},
+                                  {"value": "2025-03-03", "total": 1, "active": 1}]}
+        assert [v["value"] for v in tutte["day"]] == ["2025-03-01"]
+        assert tutte["category"] == [{"value": "tamponamento", "total": 3, "active": 3}]
+        assert client.get("/segnalazione/statistiche", params={"dimensione": "province"}).status_code == 422
@@ -0,0 +1,157 @@
+"""
+Test Suite per il backend di storage in memoria (STORAGE_BACKEND=memory)
+
+- I repository reali funzionano senza MongoDB, con le stesse query
+- Gli indici hash vengono usati per i filtri di uguaglianza
+- L'indice spaziale risponde a $geoWithin/$centerSphere e $near
+- Upsert, bulk_write e aggregate usati dagli altri repository
+- Persistenza su file della modalità embedded
+"""
+
+import asyncio
+import datetime
+import pytest
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.db import connection
+from app.db import segnalazione_repository as repo
+from app.db import async_segnalazione_repository as async_repo
+from app.db.memoria import DatabaseMemoria
+from app.models.incident_model import IncidentModel
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+    connection.chiudi_client()
+    yield connection.get_database()
+    connection.chiudi_client()
+
+
+def _segnalazione(**campi) -> IncidentModel:
+    dati = {
+        "user_id": "user_1", "incident_date": datetime.date(2025, 3, 1),
+        "incident_time": datetime.time(14, 30), "incident_longitude": 12.49,
+        "incident_latitude": 41.89, "seriousness": "high", "category": "tamponamento",
+    }
+    dati.update(campi)
+    return IncidentModel(**dati)
+
+
+class TestRepositoryInMemoria:
+    """Suite di test per segnalazione_repository sul motore in memoria"""
+
+    def test_crud_e_query(self, memoria):
+        """Le funzioni del repository restituiscono gli stessi risultati attesi da MongoDB"""
+        repo.ensure_indexes()
+        prima = repo.create_segnalazione(_segnalazione())
+        repo.create_segnalazione(_segnalazione(category="incendio veicolo", incident_time=datetime.time(9, 0)))
+
+        assert repo.get_segnalazione_by_id(prima["id"])["category"] == "tamponamento"
+        assert len(repo.get_segnalazione_by_category("tamponamento")) == 1
+        assert len(repo.get_segnalazione_by_time(datetime.time(9, 0))) == 1
+        assert len(repo.get_segnalazione_by_date(datetime.date(2025, 3, 1))) == 2
+        assert repo.get_segnalazione_by_position(12.49, 41.89) is not None
+
+        assert repo.delete_segnalazione(prima["id"]) is True
+        assert len(repo.get_segnalazione_by_status(True)) == 1
+        assert repo.delete_segnalazione(prima["id"]) is False
+
+    def test_copie_indipendenti(self, memoria):
+        """Modificare un documento letto non altera il database"""
+        creata = repo.create_segnalazione(_segnalazione())
+        letta = repo.get_segnalazione_by_id(creata["id"])
+        letta["category"] = "modificata"
+
+        assert repo.get_segnalazione_by_id(creata["id"])["category"] == "tamponamento"
+
+    def test_uso_indici_hash(self, memoria):
+        """Con gli indici creati i filtri di uguaglianza non scandiscono tutta la collection"""
+        repo.ensure_indexes()
+        repo.create_segnalazione(_segnalazione())
+        collection = memoria["segnalazioni"]
+
+        cursore = collection.find({"category": "tamponamento", "status": True})
+        assert len(cursore.to_list()) == 1
+        assert cursore.piano.startswith("IXSCAN")
+
+        cursore = collection.find({"description": None})
+        cursore.to_list()
+        assert cursore.piano == "COLLSCAN"
+
+    def test_repository_asincrono(self, memoria):
+        """I repository asincroni condividono i dati della vista sincrona"""
+        repo.create_segnalazione(_segnalazione())
+
+        risultato = asyncio.run(async_repo.get_segnalazione_by_category("tamponamento"))
+
+        assert len(risultato) == 1
+
+
+class TestMotoreInMemoria:
+    """Suite di test per le operazioni di CollezioneMemoria"""
+
+    def test_indice_spaziale(self):
+        """$geoWithin e $near restituiscono i punti entro il raggio, $near dal più vicino"""
+        collection = DatabaseMemoria("test")["punti"]
+        collection.create_index([("location", "2dsphere")])
+        for nome, lon, lat in [("vicino", 12.4960, 41.9030), ("medio", 12.5050, 41.9030), ("lontano", 12.60, 41.95)]:
+            collection.insert_one({"nome": nome, "location": {"type": "Point", "coordinates": [lon, lat]}})
+
+        entro = collection.find({"location": {"$geoWithin": {"$centerSphere": [[12.4964, 41.9028], 1.0 / 6371.0]}}})
+        assert sorted(d["nome"] for d in entro) == ["medio", "vicino"]
+        assert entro.piano == "IXSCAN location_2dsphere"
+
+        vicini = collection.find({"location": {"$near": {
+            "$geometry": {"type": "Point", "coordinates": [12.5050, 41.9030]}, "$maxDistance": 2000}}})
+        assert [d["nome"] for d in vicini] == ["medio", "vicino"]
+
+    def test_bulk_upsert_e_set_on_insert(self):
+        """bulk_write con upsert applica $setOnInsert solo alla creazione"""
+        collection = DatabaseMemoria("test")["dispositivi"]
+        op = lambda ts: UpdateOne({"_id": "tok"}, {"$set": {"last_seen": ts}, "$setOnInsert": {"created_at": ts}},
+                                  upsert=True)
+
+        primo = collection.bulk_write([op(1)])
+        secondo = collection.bulk_write([op(2)])
+
+        assert (primo.upserted_count, secondo.modified_count) == (1, 1)
+        assert collection.find_one({"_id": "tok"}) == {"_id": "tok", "last_seen": 2, "created_at": 1}
+
+    def test_find_one_and_update_e_unique(self):
+        """find_one_and_update restituisce il documento prima o dopo; gli indici unique rifiutano i duplicati"""
+        collection = DatabaseMemoria("test")["utenti"]
+        collection.create_index("email", unique=True)
+        collection.insert_one({"email": "a@b.it", "n": 1})
+
+        prima = collection.find_one_and_update({"email": "a@b.it"}, {"$inc": {"n": 1}})
+        dopo = collection.find_one_and_update({"email": "a@b.it"}, {"$inc": {"n": 1}},
+                                              return_document=ReturnDocument.AFTER)
+
+        assert (prima["n"], dopo["n"]) == (1, 3)
+        with pytest.raises(DuplicateKeyError):
+            collection.insert_one({"email": "a@b.it"})
+
+    def test_aggregate_group(self):
+        """aggregate supporta $match e $group con $sum"""
+        collection = DatabaseMemoria("test")["outbox"]
+        collection.insert_many([{"status": "sent"}, {"status": "sent"}, {"status": "dead"}])
+
+        conteggi = {d["_id"]: d["count"] for d in collection.aggregate(
+            [{"$match": {}}, {"$group": {"_id": "$status", "count": {"$sum": 1}}}])}
+
+        assert conteggi == {"sent": 2, "dead": 1}
+
+    def test_persistenza_su_file(self, tmp_path):
+        """Documenti e indici salvati vengono ricaricati alla creazione del database"""
+        percorso = str(tmp_path / "storage.bson")
+        database = DatabaseMemoria("test", percorso)
+        database["segnalazioni"].create_index([("category", 1), ("status", 1)])
+        database["segnalazioni"].insert_one({"category": "tamponamento", "status": True})
+        database.close()
+
+        ricaricato = DatabaseMemoria("test", percorso)
+
+        assert ricaricato["segnalazioni"].count_documents({"category": "tamponamento", "status": True}) == 1
+        assert "category_1_status_1" in ricaricato["segnalazioni"].index_information()
@@ -0,0 +1,133 @@
+"""
+Test Suite per le letture in streaming delle segnalazioni (iter_* dei repository)
+
+- I generatori leggono a batch e restituiscono i documenti uno alla volta, chiudendo il cursore
+- Con lo storico una segnalazione presente in entrambe le collection viene restituita una sola volta
+- Service e route NDJSON producono gli stessi DTO delle letture a lista
+"""
+
+import asyncio
+import datetime
+import json
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from unittest.mock import patch
+from app.db import connection
+from app.db import segnalazione_repository as repo
+from app.db import async_segnalazione_repository as async_repo
+from app.models.incident_model import IncidentModel
+from app.services.segnalazione_service import SegnalazioneService
+from app.api import mappa_api, segnalazione_api
+
+
+@pytest.fixture
+def memoria(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+    connection.chiudi_client()
+    yield connection.get_database()
+    connection.chiudi_client()
+
+
+def _crea(category: str = "tamponamento", user_id: str = "user_1") -> dict:
+    return repo.create_segnalazione(IncidentModel(
+        user_id=user_id, incident_date=datetime.date(2025, 3, 1), incident_time=datetime.time(9, 0),
+        incident_longitude=12.49, incident_latitude=41.89, seriousness="high", category=category))
+
+
+class CursoreFinto:
+    """Cursore che registra batch_size, documenti consumati e chiusura."""
+
+    def __init__(self, documenti):
+        self.documenti = documenti
+        self.letti = 0
+        self.batch = None
+        self.chiuso = False
+
+    def batch_size(self, n):
+        self.batch = n
+        return self
+
+    def __iter__(self):
+        for documento in self.documenti:
+            self.letti += 1
+            yield documento
+
+    def close(self):
+        self.chiuso = True
+
+
+class TestIteratoriRepository:
+    """Suite di test per i generatori iter_* dei repository"""
+
+    def test_lettura_pigra_e_chiusura(self):
+        """Il cursore viene consumato solo quanto richiesto e chiuso quando il generatore si interrompe"""
+        cursore = CursoreFinto([{"_id": i} for i in range(1000)])
+        collezione = type("CollezioneFinta", (), {"find": lambda self, filtro: cursore})()
+
+        with patch.object(repo, "segnalazione_collection", collezione):
+            documenti = repo.iter_segnalazione_by_category("tamponamento", batch_size=50)
+            primo = next(documenti)
+            documenti.close()
+
+        assert primo == {"_id": 0}
+        assert cursore.batch == 50
+        assert cursore.letti == 1
+        assert cursore.chiuso
+
+    def test_stessi_risultati_delle_liste(self, memoria):
+        """Sync e async restituiscono le stesse segnalazioni delle funzioni a lista"""
+        for categoria in ("tamponamento", "tamponamento", "incendio veicolo"):
+            _crea(categoria)
+
+        async def raccogli():
+            return [d async for d in async_repo.iter_segnalazione_by_category("tamponamento", batch_size=1)]
+
+        attese = [d["_id"] for d in repo.get_segnalazione_by_category("tamponamento")]
+        assert [d["_id"] for d in repo.iter_segnalazione_by_category("tamponamento", batch_size=1)] == attese
+        assert [d["_id"] for d in asyncio.run(raccogli())] == attese
+        assert len(attese) == 2
+
+    def test_storico_senza_duplicati(self, memoria):
+        """Una segnalazione copiata nell'archivio ma non ancora rimossa viene restituita una volta"""
+        attiva = _crea()
+        cancellata = _crea()
+        repo.delete_segnalazione(cancellata["id"])
+        memoria["segnalazioni_archive"].insert_one(repo.get_segnalazione_by_id(attiva["id"]))
+
+        trovate = [d["_id"] for d in repo.iter_segnalazione_by_user("user_1", include_storico=True)]
+
+        assert sorted(map(str, trovate)) == sorted([attiva["id"], cancellata["id"]])
+
+
+class TestRouteStreaming:
+    """Suite di test per service e route NDJSON"""
+
+    def test_service_utente(self, memoria):
+        """stream_segnalazioni_utente_async produce gli stessi DTO di get_segnalazioni_utente_async"""
+        _crea()
+        _crea()
+        service = SegnalazioneService(None)
+
+        async def raccogli():
+            return [dto async for dto in service.stream_segnalazioni_utente_async("user_1", batch_size=1)]
+
+        assert asyncio.run(raccogli()) == asyncio.run(service.get_segnalazioni_utente_async("user_1"))
+
+    def test_route_ndjson(self, memoria):
+        """Le route /stream restituiscono un oggetto JSON per riga con gli alias dei DTO"""
+        creata = _crea("tamponamento")
+        _crea("incendio veicolo", user_id="user_2")
+        app = FastAPI()
+        app.include_router(mappa_api.router)
+        app.include_router(segnalazione_api.router)
+        client = TestClient(app)
+
+        mappa = client.get("/mappa/segnalazioni/stream", params={"tipi_incidente": ["tamponamento"]})
+        utente = client.get("/segnalazione/utente/user_2/stream", params={"batch_size": 10})
+
+        assert mappa.headers["content-type"].startswith("application/x-ndjson")
+        righe = [json.loads(riga) for riga in mappa.text.splitlines()]
+        assert [riga["_id"] for riga in righe] == [creata["id"]]
+        assert [json.loads(riga)["category"] for riga in utente.text.splitlines()] == ["incendio veicolo"]
@@ -0,0 +1,189 @@
+"""
+Test Suite per GestoreTopicGeohash
+
+- Iscrizione a blocchi al topic della cella geohash e reiscrizione al cambio cella
+- Broadcast di una nuova segnalazione: un messaggio per cella coperta
+- Soppressione della notifica per dispositivo già raggiunta dal topic, solo dopo un invio
+  riuscito e solo per i dispositivi iscritti alla cella al momento dell'invio
+- Gli annunci ricevuti sono letti dal registro `dispositivi`: valgono anche dopo un riavvio
+- I messaggi topic consumano la quota del rate limiter
+"""
+
+import datetime
+import pytest
+from unittest.mock import patch
+from app.db import connection
+from app.db import dispositivo_repository
+from app.notifications.fake_fcm_transport import FakeFCMTransport
+from app.notifications.rate_limiter import NotificationRateLimiter
+from app.notifications.notify_fcm_adapter import NotifyFCMAdapter
+from app.notifications.topic_geohash import GestoreTopicGeohash, topic_per_cella
+from app.services.geohash_index import geohash_cover_circle
+
+ROMA = (41.9028, 12.4964)
+MILANO = (45.4642, 9.1900)
+
+
+class TestTopicGeohash:
+    """Suite di test per il broadcast tramite topic geohash"""
+
+    @pytest.fixture
+    def repo(self):
+        with patch('app.notifications.topic_geohash.dispositivo_repo') as mock_repo:
+            mock_repo.get_topic_celle.return_value = {}
+            yield mock_repo
+
+    @pytest.fixture
+    def transport(self):
+        return FakeFCMTransport()
+
+    @pytest.fixture
+    def gestore(self, transport, repo):
+        gestore = GestoreTopicGeohash(NotifyFCMAdapter(transport=transport))
+        # Il thread in background non serve: i test chiamano `sincronizza` direttamente
+        gestore._avvia = lambda: None
+        return gestore
+
+    def test_iscrizione_a_blocchi(self, gestore, transport, repo):
+        """I dispositivi nella stessa cella vengono iscritti con un'unica chiamata"""
+        for i in range(3):
+            assert gestore.aggiorna_posizione(f"tok_{i}", *ROMA) is True
+        assert gestore.aggiorna_posizione("tok_0", *ROMA) is False
+
+        gestore.sincronizza()
+
+        topic = topic_per_cella(gestore.cella_di(*ROMA))
+        assert transport.iscrizioni[topic] == {"tok_0", "tok_1", "tok_2"}
+        assert transport.chiamate == 1
+        repo.set_topic_celle.assert_called_once()
+
+    def test_cambio_cella(self, gestore, transport):
+        """Al cambio cella il dispositivo passa dal vecchio al nuovo topic"""
+        gestore.aggiorna_posizione("tok", *ROMA)
+        gestore.sincronizza()
+        gestore.aggiorna_posizione("tok", *MILANO)
+        gestore.sincronizza()
+
+        assert "tok" not in transport.iscrizioni[topic_per_cella(gestore.cella_di(*ROMA))]
+        assert "tok" in transport.iscrizioni[topic_per_cella(gestore.cella_di(*MILANO))]
+        assert gestore.metrics()["unsubscribed"] == 1
+
+    def test_cella_precedente_dal_registro(self, gestore, transport, repo):
+        """Dopo un riavvio la cella precedente viene letta dal registro per la disiscrizione"""
+        cella_roma = gestore.cella_di(*ROMA)
+        repo.get_topic_celle.return_value = {"tok": cella_roma}
+
+        gestore.aggiorna_posizione("tok", *MILANO)
+        gestore.sincronizza()
+
+        repo.get_topic_celle.assert_called_once_with(["tok"])
+        assert gestore.metrics()["unsubscribed"] == 1
+
+    def test_broadcast_un_messaggio_per_cella(self, gestore, transport):
+        """Una nuova segnalazione genera un messaggio per ogni cella del cerchio di allerta"""
+        segnalazione = {"_id": "inc_1", "category": "tamponamento",
+                        "incident_latitude": ROMA[0], "incident_longitude": ROMA[1]}
+
+        celle = gestore.annuncia_segnalazione(segnalazione)
+        gestore.sincronizza()
+
+        assert celle == geohash_cover_circle(*ROMA, 3.0, 5)
+        assert sorted(r["topic"] for r in transport.ricevute) == sorted(topic_per_cella(c) for c in celle)
+        assert all(r["data"]["incident_id"] == "inc_1" for r in transport.ricevute)
+        assert gestore.metrics()["topic_messages"] == len(celle)
+
+    def test_token_non_registrato(self, transport, repo):
+        """Un token rifiutato in fase di iscrizione non viene considerato iscritto ed è segnalato"""
+        segnalati = []
+        transport.token_non_registrati.add("tok_morto")
+        gestore = GestoreTopicGeohash(NotifyFCMAdapter(transport=transport, on_invalid_tokens=segnalati.extend))
+        gestore._avvia = lambda: None
+
+        gestore.aggiorna_posizione("tok_morto", *ROMA)
+        gestore.sincronizza()
+
+        assert segnalati == ["tok_morto"]
+        assert gestore.metrics()["devices"] == 0
+
+
+class TestAnnunciNelRegistro:
+    """Suite di test per la deduplica tramite la collezione `dispositivi`"""
+
+    @pytest.fixture
+    def memoria(self, monkeypatch):
+        monkeypatch.setenv("STORAGE_BACKEND", "memory")
+        monkeypatch.delenv("STORAGE_MEMORIA_FILE", raising=False)
+        connection.chiudi_client()
+        yield connection.get_database()
+        connection.chiudi_client()
+
+    @pytest.fixture
+    def transport(self):
+        return FakeFCMTransport()
+
+    def _gestore(self, transport, **kwargs):
+        gestore = GestoreTopicGeohash(NotifyFCMAdapter(transport=transport), **kwargs)
+        gestore._avvia = lambda: None
+        return gestore
+
+    def _registra(self, *tokens):
+        dispositivo_repository.upsert_dispositivi([(t, None, datetime.datetime.now(datetime.timezone.utc))
+                                                   for t in tokens])
+
+    def test_annunciata_anche_dopo_riavvio(self, memoria, transport):
+        """Un dispositivo iscritto a una cella annunciata risulta raggiunto, anche per un altro processo"""
+        self._registra("tok", "altro_tok")
+        gestore = self._gestore(transport)
+        gestore.aggiorna_posizione("tok", *ROMA)
+        gestore.sincronizza()
+        gestore.annuncia_segnalazione({"_id": "inc_1", "incident_latitude": ROMA[0],
+                                       "incident_longitude": ROMA[1]})
+        assert gestore.annunciate("tok") == set()
+        gestore.sincronizza()
+
+        riavviato = self._gestore(transport)
+        assert riavviato.annunciate("tok") == {"inc_1"}
+        assert riavviato.annunciate("altro_tok") == set()
+
+    def test_annuncio_fallito_non_conta(self, memoria, transport):
+        """Se l'invio al topic fallisce la cella non risulta annunciata"""
+        self._registra("tok")
+        gestore = self._gestore(transport)
+        gestore.aggiorna_posizione("tok", *ROMA)
+        gestore.sincronizza()
+        gestore.adapter.send_topic_notification = lambda *args: False
+
+        gestore.annuncia_segnalazione({"_id": "inc_1", "incident_latitude": ROMA[0],
+                                       "incident_longitude": ROMA[1]})
+        gestore.sincronizza()
+
+        assert gestore.annunciate("tok") == set()
+        assert gestore.metrics()["errors"] == len(geohash_cover_circle(*ROMA, 3.0, 5))
+
+    def test_iscritto_dopo_annuncio(self, memoria, transport):
+        """Un dispositivo entrato nella cella dopo l'invio dell'annuncio riceve comunque la notifica"""
+        self._registra("tok", "nuovo_tok")
+        gestore = self._gestore(transport)
+        gestore.aggiorna_posizione("tok", *ROMA)
+        gestore.sincronizza()
+        gestore.annuncia_segnalazione({"_id": "inc_1", "incident_latitude": ROMA[0],
+                                       "incident_longitude": ROMA[1]})
+        gestore.sincronizza()
+
+        gestore.aggiorna_posizione("nuovo_tok", *ROMA)
+        gestore.sincronizza()
+
+        assert gestore.annunciate("tok") == {"inc_1"}
+        assert gestore.annunciate("nuovo_tok") == set()
+
+    def test_annunci_limitati_dal_rate_limiter(self, memoria, transport):
+        """Oltre la quota globale gli annunci vengono rimandati, non inviati né persi"""
+        limiter = NotificationRateLimiter(global_rate=0.001, global_burst=2)
+        gestore = self._gestore(transport, rate_limiter=limiter)
+        celle = gestore.annuncia_segnalazione({"_id": "inc_1", "incident_latitude": ROMA[0],
+                                               "incident_longitude": ROMA[1]})
+
+        assert gestore.sincronizza() == 2
+        assert len(transport.ricevute) == 2
+        assert gestore.metrics()["pending_broadcasts"] == len(celle) - 2
+        assert gestore.metrics()["rate_limited"] == len(celle) - 2